@@ -0,0 +1,169 @@
+"""
+Case-Context Prefill for Document Generation
+
+Maps document template variables to values already in the synced case
+cache — cached_cases, cached_clients, cached_docket_entries — and the courts
+registry, so document chat only asks the model (or the user) for what the
+case record doesn't have.
+
+Resolution is deterministic: no LLM calls, a fixed handful of indexed
+queries per case.
+
+Usage:
+    from case_prefill import find_case_number, resolve_case_prefill
+
+    values = resolve_case_prefill("jcs_law", 12345, ["defendant_name", "case_number", "county"])
+    # {"defendant_name": "John Smith", "case_number": "26JE-CR00123", "county": "Jefferson"}
+"""
+import logging
+import re
+from datetime import date, datetime
+from typing import Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Missouri case numbers: 24SL-CR00123, 22JE-CC00191-01
+CASE_NUMBER_RE = re.compile(r"\b\d{2}[A-Z]{2,3}-[A-Z]{2,3}\d{3,}(?:-\d{1,2})?\b", re.IGNORECASE)
+
+# Template variable names that all mean "our client"
+PARTY_NAME_VARS = ("defendant_name", "petitioner_name", "client_name")
+
+
+def find_case_number(text: str) -> Optional[str]:
+    """First Missouri-style case number in ``text``, upper-cased, or None."""
+    match = CASE_NUMBER_RE.search(text or "")
+    return match.group(0).upper() if match else None
+
+
+def _as_date(value) -> date:
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, str):
+        return datetime.fromisoformat(value[:10]).date()
+    return value
+
+
+def _long_date(value) -> str:
+    value = _as_date(value)
+    return f"{value:%B} {value.day}, {value.year}"
+
+
+def _clean_county(county: str) -> str:
+    return re.sub(r"\s+county\s*$", "", county or "", flags=re.IGNORECASE).strip()
+
+
+def build_case_values(case: Dict, clients: List[Dict], docket_entries: List[Dict] = None,
+                      court=None, today: date = None) -> Dict[str, str]:
+    """All variable values derivable from a case record (empty values omitted).
+
+    Args:
+        case: cached_cases row
+        clients: cached_clients rows for the case, primary client first
+        docket_entries: cached_docket_entries rows for the case
+        court: courts_db.Court for the case, if known
+    """
+    today = today or date.today()
+    values: Dict[str, str] = {}
+
+    case_number = (case.get("case_number") or "").strip()
+    if case_number:
+        values["case_number"] = case_number
+        values["docket_number"] = case_number
+
+    client = clients[0] if clients else None
+    if client:
+        name = " ".join(p for p in (client.get("first_name"), client.get("last_name")) if p)
+        name = name or client.get("name") or ""
+        if name:
+            for var in PARTY_NAME_VARS:
+                values[var] = name
+        if client.get("first_name"):
+            values["client_first_name"] = client["first_name"]
+        if client.get("last_name"):
+            values["client_last_name"] = client["last_name"]
+        street = ", ".join(p for p in (client.get("address1"), client.get("address2")) if p)
+        if street:
+            values["client_address"] = street
+        if client.get("city") and client.get("state"):
+            values["client_city_state_zip"] = (
+                f"{client['city']}, {client['state']} {client.get('zip_code') or ''}".strip())
+        if client.get("email"):
+            values["client_email"] = client["email"]
+        phone = client.get("cell_phone") or client.get("home_phone") or client.get("work_phone")
+        if phone:
+            values["client_phone"] = phone
+        if client.get("birthdate"):
+            values["dob"] = _as_date(client["birthdate"]).strftime("%m/%d/%Y")
+
+    if court is not None:
+        values["court_name"] = court.name
+        county = _clean_county(court.county or "")
+        if county:
+            values["county"] = county
+        if court.prosecutor_name:
+            values["prosecutor_name"] = court.prosecutor_name
+        if court.prosecutor_address:
+            values["prosecutor_address"] = court.prosecutor_address
+
+    upcoming = [
+        e for e in docket_entries or []
+        if e.get("scheduled_date") and _as_date(e["scheduled_date"]) >= today
+    ]
+    if upcoming:
+        hearing = min(upcoming, key=lambda e: _as_date(e["scheduled_date"]))
+        values["hearing_date"] = _long_date(hearing["scheduled_date"])
+        if hearing.get("scheduled_time"):
+            values["hearing_time"] = hearing["scheduled_time"]
+        if hearing.get("judge"):
+            values["judge_name"] = hearing["judge"]
+
+    return values
+
+
+def _resolve_court(case_number: str, docket_entries: List[Dict]):
+    """Court for a case: by case-number format, else by the latest docket location."""
+    from courts_db import get_courts_db
+
+    courts = get_courts_db()
+    court = courts.find_court_for_case_number(case_number) if case_number else None
+    if court is None:
+        for entry in docket_entries:
+            if entry.get("location"):
+                court = courts.get_court_by_name(entry["location"])
+                if court is not None:
+                    break
+    return court
+
+
+def resolve_case_prefill(firm_id: str, case_id: int,
+                         variable_names: Optional[Iterable[str]] = None) -> Dict[str, str]:
+    """Values for ``variable_names`` (or every known variable) from cached case data.
+
+    Returns {} if the case isn't in this firm's cache.
+    """
+    from db.case_bundle import load_case_bundle
+
+    bundle = load_case_bundle(firm_id, case_id, include=("clients", "docket_entries"))
+    if bundle is None:
+        return {}
+
+    court = None
+    try:
+        court = _resolve_court(bundle.case.get("case_number") or "", bundle.docket_entries)
+    except Exception as e:
+        logger.warning("Court lookup failed for case %s: %s", case_id, e)
+
+    values = build_case_values(bundle.case, bundle.clients, bundle.docket_entries, court)
+    if variable_names is not None:
+        wanted = set(variable_names)
+        values = {k: v for k, v in values.items() if k in wanted}
+    return values
+
+
+def find_case_id(firm_id: str, text: str) -> Optional[int]:
+    """Cached case ID for the first case number mentioned in ``text``."""
+    case_number = find_case_number(text)
+    if not case_number:
+        return None
+    from db.cache import get_case_id_by_number
+    return get_case_id_by_number(firm_id, case_number)
@@ -120,6 +120,26 @@ app.conf.update(
             "schedule": crontab(hour=3, minute=0, day_of_week="sunday"),
             "options": {"queue": "default"},
         },
+        "purge-skill-memos": {
+            "task": "tasks.purge_skill_memos",
+            "schedule": crontab(hour=3, minute=30),
+            "options": {"queue": "default"},
+        },
+        "purge-doc-sessions": {
+            "task": "tasks.purge_doc_sessions",
+            "schedule": 3600.0,
+            "options": {"queue": "default"},
+        },
+        "purge-llm-telemetry": {
+            "task": "tasks.purge_llm_telemetry",
+            "schedule": crontab(hour=3, minute=45),
+            "options": {"queue": "default"},
+        },
+        "purge-document-batches": {
+            "task": "tasks.purge_document_batches",
+            "schedule": 3600.0,
+            "options": {"queue": "default"},
+        },
     },
 )
 
@@ -380,3 +380,28 @@ def collections_test_email(stage: int, to_email: str):
         console.print("\nMake sure you have email configured in .env:")
         console.print("  - SMTP_USER and SMTP_PASS for Gmail")
         console.print("  - Or SENDGRID_API_KEY for SendGrid")
+
+
+@collections.command("rebuild-queue")
+@click.option("--firm", "firm_id", default=None, help="Only rebuild this firm's queue (default: every firm)")
+def collections_rebuild_queue(firm_id):
+    """Rebuild the dunning queue table from cached invoices.
+
+    Triggers keep the queue current as data changes; this reconciles it
+    (run daily, or after restoring data with triggers disabled).
+    """
+    from db.dunning_queue import (
+        ensure_dunning_queue_tables, refresh_all_dunning_queues, refresh_dunning_queue,
+    )
+
+    ensure_dunning_queue_tables()
+    if firm_id:
+        rows = refresh_dunning_queue(firm_id)
+        console.print(f"[green]Dunning queue rebuilt: {rows} open invoices (firm: {firm_id})[/green]")
+        return
+
+    counts = refresh_all_dunning_queues()
+    for fid, rows in counts.items():
+        console.print(f"  {fid}: {rows} open invoices")
+    console.print(f"[green]Dunning queue rebuilt: {sum(counts.values())} open invoices "
+                  f"across {len(counts)} firms[/green]")
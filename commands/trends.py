@@ -40,7 +40,11 @@ def trends_record():
     db_trends.record_snapshot(firm_id, "total_ar", getattr(kpis, 'total_ar_balance', 0) or 0)
     db_trends.record_snapshot(firm_id, "overdue_tasks", getattr(kpis, 'delinquent_accounts', 0) or 0)
 
+    # Per-attorney series for attorney-scoped trend views
+    attorney_rows = db_trends.record_attorney_snapshots(firm_id)
+
     console.print("[green]KPI snapshot recorded to PostgreSQL[/green]")
+    console.print(f"[green]{attorney_rows} per-attorney metric values recorded[/green]")
 
 
 @trends.command("report")
@@ -169,7 +169,7 @@ def trust_report(firm_id, export_csv, attorney, phase, limit):
     # Export
     if export_csv:
         filepath = f"reports/trust_transfer_{datetime.now().strftime('%Y%m%d')}.csv"
-        export_trust_report_csv(report, filepath)
+        export_trust_report_csv(report["lines"], filepath)
         console.print(f"\n[green]Exported to {filepath}[/green]")
 
     console.print()
@@ -268,6 +268,20 @@ class CourtsDatabase:
             row = cursor.fetchone()
             return self._row_to_court(row) if row else None
 
+    def find_court_for_case_number(self, case_number: str) -> Optional[Court]:
+        """Court whose case_number_format (a regex) matches ``case_number``."""
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT * FROM courts
+                WHERE COALESCE(case_number_format, '') <> ''
+                  AND %s ~* case_number_format
+                ORDER BY court_type = 'circuit' DESC, name ASC
+                LIMIT 1
+            """, (case_number,))
+            row = cursor.fetchone()
+            return self._row_to_court(row) if row else None
+
     def search_courts(self, query: str, limit: int = 20) -> List[Court]:
         """Full-text search for courts using PostgreSQL tsvector."""
         with get_connection() as conn:
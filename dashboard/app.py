@@ -33,12 +33,36 @@ app = FastAPI(
 async def _close_sse_connections() -> None:
     """Push shutdown sentinels to every open SSE connection so long-lived
     event generators exit cleanly. Without this, systemctl stop hangs for
-    ~90s waiting on /api/phone/events/stream and then SIGKILLs the worker."""
+    ~90s waiting on /api/phone/events/stream (and /api/sync/events) and then
+    SIGKILLs the worker."""
     try:
         from phone.delivery import get_registry
         await get_registry().close_all()
     except Exception as e:  # noqa: BLE001
         logger.warning("close_all failed during shutdown: %s", e)
+    try:
+        from dashboard.sync_events import get_sync_event_hub
+        await get_sync_event_hub().close_all()
+    except Exception as e:  # noqa: BLE001
+        logger.warning("sync event hub close_all failed during shutdown: %s", e)
+
+
+@app.on_event("shutdown")
+async def _close_llm_client() -> None:
+    """Release the shared async LLM client's pooled connections and write
+    any buffered call telemetry."""
+    try:
+        from skills.llm import close_async_client, flush_llm_telemetry
+        await close_async_client()
+        flush_llm_telemetry()
+    except Exception as e:  # noqa: BLE001
+        logger.warning("LLM client close failed during shutdown: %s", e)
+
+# ETags, 304s and gzip/brotli for HTML/JSON responses. Registered BEFORE
+# SessionMiddleware so it runs inside it and can scope ETags to the session
+# (Starlette middleware is LIFO — last added runs first)
+from dashboard.middleware import HTTPCacheMiddleware
+app.add_middleware(HTTPCacheMiddleware)
 
 # Session middleware for login state
 app.add_middleware(
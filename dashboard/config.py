@@ -2,6 +2,7 @@
 Dashboard Configuration
 """
 import os
+import time
 from pathlib import Path
 
 # Base paths
@@ -32,3 +33,45 @@ if not ADMIN_PASSWORD_HASH:
 # Application settings
 APP_NAME = "MyCase Legal Dashboard"
 APP_VERSION = "1.0.0"
+
+
+def _git_revision() -> str | None:
+    """Commit checked out at the repo root, if it's a git checkout."""
+    git_dir = BASE_DIR / ".git"
+    try:
+        head = (git_dir / "HEAD").read_text().strip()
+        if not head.startswith("ref: "):
+            return head
+        ref = head[5:]
+        if (git_dir / ref).exists():
+            return (git_dir / ref).read_text().strip()
+        for line in (git_dir / "packed-refs").read_text().splitlines():
+            if line.endswith(" " + ref):
+                return line.split()[0]
+    except OSError:
+        pass
+    return None
+
+
+# Identifies the deployed code; part of every HTTP ETag so a deploy never
+# answers a revalidation with 304 and stale HTML. Set APP_BUILD in the
+# deploy environment; otherwise the git commit, else the process start time.
+APP_BUILD = os.getenv("APP_BUILD") or _git_revision() or str(int(time.time()))
+
+# HTTP caching and compression (see dashboard/middleware.py)
+HTTP_COMPRESS_MIN_BYTES = int(os.getenv("HTTP_COMPRESS_MIN_BYTES", "1024"))
+SYNC_GENERATION_TTL_SECONDS = float(os.getenv("SYNC_GENERATION_TTL_SECONDS", "5"))
+SYNC_GENERATION_CACHE_MAX = int(os.getenv("SYNC_GENERATION_CACHE_MAX", "1024"))
+
+# Lazy-loaded page panels (see dashboard/panels.py)
+PANEL_TIMEOUT_SECONDS = float(os.getenv("PANEL_TIMEOUT_SECONDS", "8"))
+PANEL_CACHE_TTL_SECONDS = float(os.getenv("PANEL_CACHE_TTL_SECONDS", "120"))
+PANEL_CACHE_MAX_ENTRIES = int(os.getenv("PANEL_CACHE_MAX_ENTRIES", "512"))
+PANEL_WORKERS = int(os.getenv("PANEL_WORKERS", "8"))
+
+# Document chat sessions (see dashboard/doc_sessions.py); state persists in
+# Postgres for DOC_SESSION_TTL_SECONDS, these bound each worker's local copies
+DOC_SESSION_MAX_LOCAL = int(os.getenv("DOC_SESSION_MAX_LOCAL", "200"))
+DOC_SESSION_MAX_BYTES = int(os.getenv("DOC_SESSION_MAX_BYTES", str(64 * 1024 * 1024)))
+DOC_SESSION_IDLE_SECONDS = float(os.getenv("DOC_SESSION_IDLE_SECONDS", "1800"))
+DOC_TEMPLATE_CACHE_BYTES = int(os.getenv("DOC_TEMPLATE_CACHE_BYTES", str(64 * 1024 * 1024)))
@@ -0,0 +1,244 @@
+"""
+Document chat session store.
+
+DocumentChatEngine state lives in Postgres (db/doc_sessions.py), so any web
+worker can continue a conversation. Each worker keeps a bounded local copy
+of recently used engines:
+
+- LRU with an entry cap (DOC_SESSION_MAX_LOCAL), an idle TTL
+  (DOC_SESSION_IDLE_SECONDS) and a memory ceiling (DOC_SESSION_MAX_BYTES,
+  estimated from drafts and conversation text).
+- Freshness: every get() compares the local copy's version with the stored
+  one, so a turn handled by another worker is picked up.
+- Template bytes are referenced by SHA-256, never copied into session state.
+  One shared LRU (DOC_TEMPLATE_CACHE_BYTES) holds each template once, however
+  many sessions use it; on a miss the template is reloaded by template_id.
+- Generated draft .docx bytes are stored once, content-addressed.
+
+If Postgres is unavailable the store degrades to the local copies.
+"""
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+import dashboard.config as config
+from db.doc_sessions import (
+    blob_hash, get_blob, get_doc_session_version, load_doc_session, put_blob, save_doc_session,
+)
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _Entry:
+    engine: object
+    firm_id: str
+    version: int            # 0 = not persisted yet
+    size: int
+    last_used: float
+    draft_hash: Optional[str] = None
+
+
+def _engine_size(engine) -> int:
+    """Approximate bytes held by an engine, excluding shared template bytes."""
+    size = 1024
+    for session in engine.sessions.values():
+        size += len(session.draft_document or b"") + len(session.draft_content or "")
+        size += sum(len(m.get("content", "")) for m in session.messages)
+    return size
+
+
+class DocSessionStore:
+    """Per-worker LRU of DocumentChatEngine objects backed by Postgres."""
+
+    def __init__(self, max_entries: int = None, max_bytes: int = None,
+                 idle_seconds: float = None, template_cache_bytes: int = None):
+        self.max_entries = max_entries or config.DOC_SESSION_MAX_LOCAL
+        self.max_bytes = max_bytes or config.DOC_SESSION_MAX_BYTES
+        self.idle_seconds = idle_seconds or config.DOC_SESSION_IDLE_SECONDS
+        self.template_cache_bytes = template_cache_bytes or config.DOC_TEMPLATE_CACHE_BYTES
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._bytes = 0
+        self._templates: "OrderedDict[str, bytes]" = OrderedDict()   # sha256 -> bytes
+        self._template_bytes = 0
+        self._lock = threading.Lock()
+
+    # ------------------------------------------------------------------
+    # Public API (blocking; call from a worker thread)
+    # ------------------------------------------------------------------
+
+    def create(self, firm_id: str, attorney_id: int = None,
+               attorney_name_override: str = None) -> Tuple[object, str]:
+        """Start a new engine/session. Persisted on the first save()."""
+        from document_chat import DocumentChatEngine
+
+        engine = DocumentChatEngine(
+            firm_id=firm_id,
+            attorney_id=attorney_id,
+            attorney_name_override=attorney_name_override,
+        )
+        session_id = f"doc_{uuid.uuid4().hex}"
+        with self._lock:
+            self._put_locked(session_id, _Entry(engine, firm_id, 0, _engine_size(engine), time.monotonic()))
+        return engine, session_id
+
+    def get(self, session_id: str, firm_id: str):
+        """Return the engine for ``session_id`` in ``firm_id``, or None if unknown/expired."""
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is not None and entry.firm_id != firm_id:
+                return None
+            if entry is not None and time.monotonic() - entry.last_used > self.idle_seconds:
+                self._drop_locked(session_id)
+                entry = None
+            if entry is not None:
+                entry.last_used = time.monotonic()
+                self._entries.move_to_end(session_id)
+                if entry.version == 0:
+                    return entry.engine
+
+        try:
+            stored_version = get_doc_session_version(session_id, firm_id)
+        except Exception as e:
+            logger.warning("Document session lookup failed, using local copy: %s", e)
+            return entry.engine if entry is not None else None
+
+        if stored_version is None:
+            with self._lock:
+                self._drop_locked(session_id)
+            return None
+        if entry is not None and entry.version == stored_version:
+            return entry.engine
+        return self._restore(session_id, firm_id)
+
+    def save(self, session_id: str, engine, username: str = None):
+        """Persist the engine's current session state (call after each turn)."""
+        session = engine.get_session()
+        template_hash = None
+        if session.template_content:
+            session.template_content, template_hash = self._intern_template(session.template_content)
+
+        with self._lock:
+            entry = self._entries.get(session_id)
+            known_draft = entry.draft_hash if entry else None
+
+        try:
+            draft_hash = None
+            if session.draft_document:
+                draft_hash = blob_hash(session.draft_document)
+                if draft_hash != known_draft:
+                    put_blob(session.draft_document)
+            state = {
+                "attorney_id": engine.attorney_id,
+                "attorney_name_override": engine.attorney_name_override,
+                "session": session.to_state(),
+            }
+            version = save_doc_session(session_id, engine.firm_id, username, state,
+                                       template_hash, draft_hash)
+        except PermissionError:
+            raise
+        except Exception as e:
+            logger.warning("Could not persist document session %s: %s", session_id, e)
+            version, draft_hash = (entry.version if entry else 0), known_draft
+
+        with self._lock:
+            self._put_locked(session_id, _Entry(engine, engine.firm_id, version, _engine_size(engine),
+                                                time.monotonic(), draft_hash))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "sessions": len(self._entries),
+                "session_bytes": self._bytes,
+                "templates": len(self._templates),
+                "template_bytes": self._template_bytes,
+            }
+
+    # ------------------------------------------------------------------
+    # Internals
+    # ------------------------------------------------------------------
+
+    def _restore(self, session_id: str, firm_id: str):
+        from document_chat import DocumentChatEngine, DocumentSession
+
+        row = load_doc_session(session_id, firm_id)
+        if row is None:
+            return None
+        state = row["state"]
+        engine = DocumentChatEngine(
+            firm_id=firm_id,
+            attorney_id=state.get("attorney_id"),
+            attorney_name_override=state.get("attorney_name_override"),
+        )
+        session_state = state["session"]
+        template = None
+        if session_state.get("template_id") and row["template_hash"]:
+            template = self._load_template(engine, session_state["template_id"], row["template_hash"])
+        draft = get_blob(row["draft_hash"]) if row["draft_hash"] else None
+
+        session = DocumentSession.from_state(session_state, template, draft)
+        engine.sessions[session.session_id] = session
+        engine.current_session_id = session.session_id
+
+        with self._lock:
+            self._put_locked(session_id, _Entry(engine, firm_id, row["version"], _engine_size(engine),
+                                                time.monotonic(), row["draft_hash"]))
+        return engine
+
+    def _load_template(self, engine, template_id: int, digest: str) -> Optional[bytes]:
+        with self._lock:
+            cached = self._templates.get(digest)
+            if cached is not None:
+                self._templates.move_to_end(digest)
+                return cached
+        content = engine._load_template_content(template_id)
+        if content is None:
+            return None
+        content, loaded_digest = self._intern_template(content)
+        if loaded_digest != digest:
+            logger.info("Template %s changed since the session started; using current version", template_id)
+        return content
+
+    def _intern_template(self, content: bytes) -> Tuple[bytes, str]:
+        """Return the shared copy of ``content`` (one per distinct template) and its hash."""
+        digest = blob_hash(content)
+        with self._lock:
+            cached = self._templates.get(digest)
+            if cached is not None:
+                self._templates.move_to_end(digest)
+                return cached, digest
+            self._templates[digest] = content
+            self._template_bytes += len(content)
+            while self._template_bytes > self.template_cache_bytes and len(self._templates) > 1:
+                _, evicted = self._templates.popitem(last=False)
+                self._template_bytes -= len(evicted)
+        return content, digest
+
+    def _put_locked(self, session_id: str, entry: _Entry):
+        self._drop_locked(session_id)
+        self._entries[session_id] = entry
+        self._bytes += entry.size
+        now = time.monotonic()
+        for sid in [s for s, e in self._entries.items() if now - e.last_used > self.idle_seconds]:
+            self._drop_locked(sid)
+        while len(self._entries) > 1 and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            self._drop_locked(next(iter(self._entries)))
+
+    def _drop_locked(self, session_id: str):
+        entry = self._entries.pop(session_id, None)
+        if entry is not None:
+            self._bytes -= entry.size
+
+
+_store: Optional[DocSessionStore] = None
+
+
+def get_doc_session_store() -> DocSessionStore:
+    global _store
+    if _store is None:
+        _store = DocSessionStore()
+    return _store
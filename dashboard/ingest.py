@@ -0,0 +1,236 @@
+"""
+Spreadsheet parsing for staged uploads (aging reports, trust ledgers).
+
+Reads CSV or XLSX uploads row by row and feeds normalized tuples to
+db.ingest.copy_staging_rows, which COPYs them into staging in chunks. The
+file is never fully decoded into memory; XLSX (requires the optional
+``openpyxl`` package) is opened in read-only mode.
+
+Row filtering (blank invoice numbers, zero trust balances) and case matching
+happen in the set-based merge in db/ingest.py.
+"""
+import csv
+import io
+import re
+from datetime import date, datetime
+from typing import Iterator, List, Optional, Tuple
+
+from db.ingest import copy_staging_rows
+
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None
+
+UPLOAD_EXTENSIONS = (".csv", ".xlsx")
+
+
+class UploadError(ValueError):
+    """The uploaded file can't be read (bad type, no headers, bad encoding)."""
+
+
+# ============================================================================
+# Value parsing
+# ============================================================================
+
+def _parse_currency(val):
+    """Parse currency string like '$1,234.56' to float."""
+    if val is None:
+        return None
+    if isinstance(val, (int, float)):
+        return float(val)
+    s = str(val).strip()
+    if not s:
+        return None
+    # Remove $, commas, spaces
+    s = re.sub(r'[$,\s]', '', s)
+    try:
+        return float(s)
+    except (ValueError, TypeError):
+        return None
+
+
+def _parse_date(val):
+    """Parse date string in various formats to YYYY-MM-DD."""
+    if val is None:
+        return None
+    if isinstance(val, (datetime, date)):
+        return val.strftime('%Y-%m-%d')
+    s = str(val).strip()
+    if not s:
+        return None
+    for fmt in ('%m/%d/%Y', '%Y-%m-%d', '%m-%d-%Y', '%m/%d/%y', '%Y/%m/%d'):
+        try:
+            return datetime.strptime(s, fmt).strftime('%Y-%m-%d')
+        except ValueError:
+            continue
+    return None
+
+
+def _parse_int(val):
+    """Parse a whole number ('30', 30, 30.0); None otherwise."""
+    if val is None:
+        return None
+    if isinstance(val, (int, float)):
+        return int(val)
+    s = str(val).strip()
+    return int(s) if s.isdigit() else None
+
+
+def _text(val) -> str:
+    return '' if val is None else str(val).strip()
+
+
+# ============================================================================
+# Header normalization
+# ============================================================================
+
+def _normalize_header(h):
+    """Normalize aging report header to a standard key."""
+    h = h.strip().lower().replace(' ', '_')
+    mapping = {
+        'invoice_number': 'invoice_number',
+        'invoice': 'invoice_number',
+        'inv_number': 'invoice_number',
+        'inv_#': 'invoice_number',
+        'inv': 'invoice_number',
+        'client': 'client_name',
+        'client_name': 'client_name',
+        'case': 'case_name',
+        'case_name': 'case_name',
+        'matter': 'case_name',
+        'amount_overdue': 'amount_overdue',
+        'amount_due': 'amount_overdue',
+        'overdue': 'amount_overdue',
+        'balance': 'amount_overdue',
+        'balance_due': 'amount_overdue',
+        'invoice_total': 'invoice_total',
+        'total': 'invoice_total',
+        'total_amount': 'invoice_total',
+        'amount_paid': 'amount_paid',
+        'paid': 'amount_paid',
+        'paid_amount': 'amount_paid',
+        'due_date': 'due_date',
+        'due': 'due_date',
+        'status': 'status',
+        'days_aging': 'days_aging',
+        'days': 'days_aging',
+        'dpd': 'days_aging',
+        'days_overdue': 'days_aging',
+        'aging': 'days_aging',
+    }
+    return mapping.get(h, h)
+
+
+def _normalize_trust_header(h: str) -> str:
+    """Map various trust ledger column names to internal names."""
+    h = h.strip().lower().replace(' ', '_').replace('-', '_')
+    mapping = {
+        'case': 'case_number',
+        'case_no': 'case_number',
+        'case_num': 'case_number',
+        'case_number': 'case_number',
+        'matter': 'case_name',
+        'matter_name': 'case_name',
+        'case_name': 'case_name',
+        'case_description': 'case_name',
+        'client': 'client_name',
+        'client_name': 'client_name',
+        'contact': 'client_name',
+        'contact_name': 'client_name',
+        'balance': 'trust_balance',
+        'trust_balance': 'trust_balance',
+        'trust': 'trust_balance',
+        'trust_amount': 'trust_balance',
+        'amount': 'trust_balance',
+        'current_balance': 'trust_balance',
+        'account_balance': 'trust_balance',
+        'total': 'trust_balance',
+        'total_balance': 'trust_balance',
+    }
+    return mapping.get(h, h)
+
+
+# ============================================================================
+# Row mapping (order matches db.ingest.STAGING_COLUMNS)
+# ============================================================================
+
+def _aging_row(m: dict) -> tuple:
+    return (
+        _text(m.get('invoice_number')),
+        _text(m.get('client_name')),
+        _text(m.get('case_name')),
+        _parse_currency(m.get('amount_overdue')),
+        _parse_currency(m.get('invoice_total')),
+        _parse_currency(m.get('amount_paid')),
+        _parse_date(m.get('due_date')),
+        _text(m.get('status')),
+        _parse_int(m.get('days_aging')),
+    )
+
+
+def _trust_row(m: dict) -> tuple:
+    return (
+        _text(m.get('case_number')),
+        _text(m.get('case_name')),
+        _text(m.get('client_name')),
+        _parse_currency(m.get('trust_balance')),
+    )
+
+
+UPLOAD_KINDS = {
+    "aging": (_normalize_header, _aging_row),
+    "trust": (_normalize_trust_header, _trust_row),
+}
+
+
+# ============================================================================
+# Reading
+# ============================================================================
+
+def read_upload(fileobj, filename: str) -> Tuple[List[str], Iterator[dict]]:
+    """Return (headers, lazy iterator of row dicts keyed by header) for a CSV/XLSX file."""
+    name = (filename or '').lower()
+    if name.endswith('.xlsx'):
+        if openpyxl is None:
+            raise UploadError("XLSX uploads require openpyxl; upload a CSV instead")
+        wb = openpyxl.load_workbook(fileobj, read_only=True, data_only=True)
+        rows = wb.active.iter_rows(values_only=True)
+        headers = [_text(h) for h in next(rows, ())]
+
+        def records():
+            try:
+                for values in rows:
+                    if values and any(v not in (None, '') for v in values):
+                        yield dict(zip(headers, values))
+            finally:
+                wb.close()
+        return headers, records()
+
+    if not name.endswith('.csv'):
+        raise UploadError("Please upload a CSV or XLSX file")
+    text = io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline='')  # Handle BOM
+    reader = csv.DictReader(text)
+    try:
+        headers = reader.fieldnames or []
+    except UnicodeDecodeError:
+        raise UploadError("File is not a valid CSV (encoding error)")
+    return headers, iter(reader)
+
+
+def stage_upload(job_id: str, kind: str, fileobj, filename: str) -> int:
+    """Parse an upload and COPY it into the job's staging table. Returns rows staged."""
+    normalize, to_row = UPLOAD_KINDS[kind]
+    headers, records = read_upload(fileobj, filename)
+    if not headers:
+        raise UploadError("File has no headers")
+    header_map = {h: normalize(h) for h in headers if h}
+
+    def rows():
+        for record in records:
+            yield to_row({header_map.get(k, k): v for k, v in record.items() if k})
+
+    try:
+        return copy_staging_rows(job_id, kind, rows())
+    except UnicodeDecodeError:
+        raise UploadError("File is not a valid CSV (encoding error)")
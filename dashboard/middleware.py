@@ -1,20 +1,44 @@
 """
-Subdomain Resolution Middleware
+Dashboard Middleware
 
-Extracts firm_id from the Host header subdomain for multi-tenant routing.
-Each firm gets a branded URL: jcs.lawmetrics.ai, smith.lawmetrics.ai, etc.
+Subdomain resolution:
+    Extracts firm_id from the Host header subdomain for multi-tenant routing.
+    Each firm gets a branded URL: jcs.lawmetrics.ai, smith.lawmetrics.ai, etc.
 
-The middleware sets request.state.firm_id_from_subdomain which the login
-route uses to auto-fill firm_id (so users don't have to type it).
+    The middleware sets request.state.firm_id_from_subdomain which the login
+    route uses to auto-fill firm_id (so users don't have to type it).
 
-Reserved subdomains (www, app, api) are skipped — no firm context.
-Local development (localhost, 127.0.0.1) is skipped entirely.
+    Reserved subdomains (www, app, api) are skipped — no firm context.
+    Local development (localhost, 127.0.0.1) is skipped entirely.
+
+HTTP caching and compression:
+    Adds ETags to complete HTML/JSON responses, answers matching
+    If-None-Match requests with 304, and gzip/brotli-encodes bodies above
+    HTTP_COMPRESS_MIN_BYTES. Pages computed only from the sync cache get an
+    ETag keyed by the firm's sync generation, so a revalidation skips the
+    route handler entirely. Sync ETags include config.APP_BUILD, so a deploy
+    invalidates them (content ETags change with the body anyway).
 """
 import os
+import gzip
+import time
+import hashlib
 import logging
+import threading
+from collections import OrderedDict
+from datetime import date
 
+from starlette.concurrency import run_in_threadpool
 from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.requests import Request
+from starlette.responses import Response
+
+import dashboard.config as config
+
+try:
+    import brotli
+except ImportError:  # Optional — gzip is used when brotli isn't installed
+    brotli = None
 
 logger = logging.getLogger(__name__)
 
@@ -98,3 +122,173 @@ def _resolve_firm_id(subdomain: str) -> str | None:
     except Exception as e:
         logger.error("Subdomain resolution error for '%s': %s", subdomain, e)
         return None
+
+
+# ============================================================================
+# HTTP caching and compression
+# ============================================================================
+
+# GET endpoints whose output depends only on the sync cache (plus the date and
+# the user's scope). Their ETag is known before the handler runs. Endpoints fed
+# by webhooks or local writes (phone stats, payment links, promises, ...) get a
+# content-hash ETag instead, which still avoids resending unchanged bodies.
+SYNC_VERSIONED_PATHS = frozenset({
+    "/api/stats",
+    "/api/ar-aging",
+    "/revenue",
+    "/payments",
+})
+
+COMPRESSIBLE_TYPES = ("text/html", "application/json", "text/css", "application/javascript")
+
+CACHE_CONTROL = "private, no-cache"
+
+# firm_id -> (expires_at, generation), least recently used first; at most
+# SYNC_GENERATION_CACHE_MAX firms
+_generation_cache: OrderedDict = OrderedDict()
+_generation_lock = threading.Lock()
+
+
+def cached_sync_generation(firm_id: str) -> int | None:
+    """Sync generation for a firm, cached briefly so polling doesn't hit the DB."""
+    now = time.monotonic()
+    with _generation_lock:
+        cached = _generation_cache.get(firm_id)
+        if cached and cached[0] > now:
+            _generation_cache.move_to_end(firm_id)
+            return cached[1]
+    try:
+        from db.cache import get_sync_generation
+        generation = get_sync_generation(firm_id)
+    except Exception as e:
+        logger.warning("Sync generation lookup failed for %s: %s", firm_id, e)
+        return None
+    with _generation_lock:
+        _generation_cache[firm_id] = (now + config.SYNC_GENERATION_TTL_SECONDS, generation)
+        _generation_cache.move_to_end(firm_id)
+        while len(_generation_cache) > config.SYNC_GENERATION_CACHE_MAX:
+            _generation_cache.popitem(last=False)
+    return generation
+
+
+def invalidate_sync_generation(firm_id: str):
+    """Forget a firm's cached generation (a sync just finished)."""
+    with _generation_lock:
+        _generation_cache.pop(firm_id, None)
+
+
+def _sync_etag(request: Request, session: dict, generation: int) -> str:
+    """ETag for a sync-versioned page: same build + generation + viewer + URL."""
+    key = "|".join([
+        config.APP_BUILD,
+        str(generation),
+        date.today().isoformat(),  # aging buckets and DPD move with the calendar
+        session.get("firm_id") or "",
+        session.get("username") or "",
+        session.get("role") or "",
+        session.get("attorney_name") or "",
+        request.url.path,
+        request.url.query,
+    ])
+    return f'W/"g{hashlib.sha1(key.encode()).hexdigest()[:32]}"'
+
+
+def _content_etag(body: bytes) -> str:
+    return f'W/"c{hashlib.sha1(body).hexdigest()[:32]}"'
+
+
+def _etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """Weak comparison per RFC 9110 — W/ prefixes are ignored."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    wanted = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == wanted for tag in if_none_match.split(","))
+
+
+def _choose_encoding(accept_encoding: str) -> str | None:
+    """Pick br or gzip from Accept-Encoding, honouring q=0 exclusions."""
+    accepted = set()
+    for part in accept_encoding.lower().split(","):
+        token, _, params = part.strip().partition(";")
+        if params.replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        accepted.add(token)
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+def _not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={
+        "ETag": etag,
+        "Cache-Control": CACHE_CONTROL,
+        "Vary": "Accept-Encoding, Cookie",
+    })
+
+
+class HTTPCacheMiddleware(BaseHTTPMiddleware):
+    """
+    Conditional GET and response compression for dashboard pages and JSON APIs.
+
+    Only complete (Content-Length) HTML/JSON 200 responses are buffered, so
+    SSE streams and file downloads pass through untouched. Must run inside
+    SessionMiddleware because sync ETags are scoped to the logged-in user.
+    """
+
+    async def dispatch(self, request: Request, call_next):
+        if request.method not in ("GET", "HEAD"):
+            return await call_next(request)
+
+        if_none_match = request.headers.get("if-none-match")
+        session = request.scope.get("session") or {}
+
+        etag = None
+        if (request.url.path in SYNC_VERSIONED_PATHS
+                and session.get("logged_in") and session.get("firm_id")):
+            generation = await run_in_threadpool(cached_sync_generation, session["firm_id"])
+            if generation is not None:
+                etag = _sync_etag(request, session, generation)
+                if _etag_matches(if_none_match, etag):
+                    return _not_modified(etag)
+
+        response = await call_next(request)
+        if request.method == "HEAD":
+            return response
+
+        content_type = response.headers.get("content-type", "")
+        if (response.status_code != 200
+                or "content-length" not in response.headers
+                or "content-encoding" in response.headers
+                or not content_type.startswith(COMPRESSIBLE_TYPES)):
+            return response
+
+        body = b"".join([chunk async for chunk in response.body_iterator])
+        etag = etag or _content_etag(body)
+        if _etag_matches(if_none_match, etag):
+            return _not_modified(etag)
+
+        encoding = None
+        if len(body) >= config.HTTP_COMPRESS_MIN_BYTES:
+            encoding = _choose_encoding(request.headers.get("accept-encoding", ""))
+        if encoding == "br":
+            body = brotli.compress(body, quality=5)
+        elif encoding == "gzip":
+            body = gzip.compress(body, compresslevel=6)
+
+        new_response = Response(content=body, status_code=response.status_code,
+                                background=response.background)
+        new_response.raw_headers = [
+            (k, v) for k, v in response.raw_headers if k.lower() != b"content-length"
+        ]
+        headers = new_response.headers
+        headers["Content-Length"] = str(len(body))
+        headers["ETag"] = etag
+        headers.setdefault("Cache-Control", CACHE_CONTROL)
+        headers["Vary"] = "Accept-Encoding, Cookie"
+        if encoding:
+            headers["Content-Encoding"] = encoding
+        return new_response
@@ -1,15 +1,22 @@
 """
 A/R and Collections Data Access
 """
+import re
 from datetime import date, datetime
-from typing import Dict, List
+from typing import Dict, Iterator, List
 
 from db.connection import get_connection
+from db.dunning_queue import STAGE_SQL as DUNNING_STAGE_SQL, refresh_if_stale
+from db.pagination import Page, clamp_page_size, paginate
+from db.streaming import stream_rows
 
 
 class ARDataMixin:
     """Mixin providing A/R, collections, aging, dunning, payment plans, and NOIW data methods."""
 
+    INVOICE_EXPORT_HEADER = ['Invoice', 'Invoice Date', 'Due Date', 'Case', 'Attorney',
+                             'Client', 'Status', 'Billed', 'Paid', 'Balance Due', 'Days Overdue']
+
     def get_daily_collections_summary(self, target_date: date = None, year: int = None) -> Dict:
         """Get daily collections summary from cached invoices for specified year."""
         target_date = target_date or date.today()
@@ -260,51 +267,67 @@ class ARDataMixin:
         except Exception:
             return {'active_count': 0, 'active_total': 0, 'delinquent_count': 0, 'completed_month': 0}
 
+    NOIW_PIPELINE_ORDER = [("COALESCE(days_delinquent, 0)", "ASC"),
+                           ("COALESCE(balance_due, 0)", "DESC"), ("id", "DESC")]
+
+    def _noiw_pipeline_query(self, status_filter: str = None) -> tuple:
+        """Return (sql, params) for NOIW tracking rows, unordered."""
+        if status_filter:
+            status_sql, params = "AND status = %s", (self.firm_id, status_filter)
+        else:
+            status_sql, params = "AND status NOT IN ('resolved', 'withdrawn')", (self.firm_id,)
+        return f"""
+            SELECT case_id, case_name, contact_name, invoice_id, balance_due,
+                   days_delinquent, status, assigned_to, warning_sent_date,
+                   final_notice_date, created_at, updated_at, id
+            FROM noiw_tracking
+            WHERE firm_id = %s
+              {status_sql}
+        """, params
+
+    @staticmethod
+    def _noiw_pipeline_row(row) -> Dict:
+        return {
+            'case_id': row[0],
+            'case_name': row[1],
+            'contact_name': row[2],
+            'invoice_id': row[3],
+            'balance_due': row[4],
+            'days_delinquent': row[5],
+            'status': row[6],
+            'assigned_to': row[7],
+            'warning_sent_date': row[8],
+            'final_notice_date': row[9],
+            'created_at': row[10],
+            'updated_at': row[11],
+        }
+
     def get_noiw_pipeline(self, status_filter: str = None) -> List[Dict]:
         """Get NOIW pipeline cases from local database."""
         try:
             with get_connection() as conn:
                 cursor = self._cursor(conn)
-
-                if status_filter:
-                    cursor.execute("""
-                        SELECT case_id, case_name, contact_name, invoice_id, balance_due,
-                               days_delinquent, status, assigned_to, warning_sent_date,
-                               final_notice_date, created_at, updated_at
-                        FROM noiw_tracking
-                        WHERE firm_id = %s
-                          AND status = %s
-                        ORDER BY days_delinquent ASC, balance_due DESC
-                    """, (self.firm_id, status_filter))
-                else:
-                    cursor.execute("""
-                        SELECT case_id, case_name, contact_name, invoice_id, balance_due,
-                               days_delinquent, status, assigned_to, warning_sent_date,
-                               final_notice_date, created_at, updated_at
-                        FROM noiw_tracking
-                        WHERE firm_id = %s
-                          AND status NOT IN ('resolved', 'withdrawn')
-                        ORDER BY days_delinquent ASC, balance_due DESC
-                    """, (self.firm_id,))
-
-                rows = cursor.fetchall()
-                return [{
-                    'case_id': row[0],
-                    'case_name': row[1],
-                    'contact_name': row[2],
-                    'invoice_id': row[3],
-                    'balance_due': row[4],
-                    'days_delinquent': row[5],
-                    'status': row[6],
-                    'assigned_to': row[7],
-                    'warning_sent_date': row[8],
-                    'final_notice_date': row[9],
-                    'created_at': row[10],
-                    'updated_at': row[11],
-                } for row in rows]
+                sql, params = self._noiw_pipeline_query(status_filter)
+                cursor.execute(sql + " ORDER BY days_delinquent ASC, balance_due DESC", params)
+                return [self._noiw_pipeline_row(row) for row in cursor.fetchall()]
         except Exception:
             return []
 
+    def get_noiw_pipeline_page(self, status_filter: str = None, cursor: str = None,
+                               page_size: int = None) -> Page:
+        """One keyset page of get_noiw_pipeline()."""
+        try:
+            with get_connection() as conn:
+                cur = self._cursor(conn)
+                sql, params = self._noiw_pipeline_query(status_filter)
+                page = paginate(cur, sql, params, self.NOIW_PIPELINE_ORDER,
+                                cursor=cursor, page_size=page_size)
+                page.items = [self._noiw_pipeline_row(row) for row in page.items]
+                return page
+        except Exception as e:
+            print(f"[noiw] ERROR in get_noiw_pipeline_page: {e}")
+            return Page(page_size=clamp_page_size(page_size))
+
     def get_noiw_summary(self) -> Dict:
         """Get NOIW pipeline summary statistics."""
         try:
@@ -388,7 +411,7 @@ class ARDataMixin:
         """Map days overdue to dunning stage (1-4).
 
         Stage 4 (NOIW) requires 60+ days AND an open case.
-        Closed cases cap at Stage 3.
+        Closed cases cap at Stage 3. SQL twin: db.dunning_queue.STAGE_SQL.
         """
         if days_overdue >= 60 and case_status == 'open':
             return 4
@@ -400,147 +423,176 @@ class ARDataMixin:
             return 1
         return 0  # Not yet in dunning
 
+    def _refresh_stale_dunning_queue(self):
+        """Rebuild this firm's queue first if a trigger refresh failed (db/dunning_queue.py)."""
+        try:
+            refresh_if_stale(self.firm_id)
+        except Exception as e:
+            print(f"[dunning] stale queue check failed: {e}")
+
+    # Most overdue first. Stored columns, so idx_dq_firm_page serves every page
+    DUNNING_QUEUE_ORDER = [("due_date", "ASC"), ("balance_due", "DESC"), ("invoice_id", "DESC")]
+
+    def _dunning_queue_query(self, stage: int = None, include_sent: bool = True) -> tuple:
+        """Return (sql, params) for the dunning queue, unordered.
+
+        Reads the incrementally maintained dunning_queue table (see
+        db/dunning_queue.py); the stage is derived from due_date at read time.
+        Stage and already-sent filtering happen in SQL so the queue can be
+        paged without short pages.
+        """
+        filters, params = [], [self.firm_id]
+        if stage:
+            filters.append("AND stage = %s")
+            params.append(stage)
+        if not include_sent:
+            filters.append("AND NOT already_sent")
+        return f"""
+            SELECT * FROM (
+                SELECT
+                    q.invoice_id,
+                    q.invoice_number,
+                    q.case_name,
+                    q.lead_attorney_name,
+                    q.contact_name,
+                    q.balance_due,
+                    (CURRENT_DATE - q.due_date) as days_overdue,
+                    q.due_date,
+                    q.contact_email,
+                    q.aging_amount_due,
+                    q.aging_invoice_total,
+                    q.last_notice_level as sent_notice_level,
+                    q.last_notice_at as sent_at,
+                    q.case_status,
+                    {DUNNING_STAGE_SQL} as stage,
+                    COALESCE(q.last_notice_level >= {DUNNING_STAGE_SQL}, FALSE) as already_sent
+                FROM dunning_queue q
+                WHERE q.firm_id = %s
+                  AND q.due_date <= CURRENT_DATE - 5
+            ) queue
+            WHERE stage > 0
+              {' '.join(filters)}
+        """, tuple(params)
+
+    @staticmethod
+    def _dunning_queue_row(r) -> Dict:
+        raw_days = r[6]
+        days = raw_days if isinstance(raw_days, int) else (raw_days.days if hasattr(raw_days, 'days') else int(raw_days or 0))
+        balance_due = r[5] or 0
+        aging_amount = float(r[9]) if r[9] is not None else None
+        sent_at = r[12]  # latest dunning_notices.sent_at
+        return {
+            'invoice_id': r[1] or str(r[0]),
+            'invoice_db_id': r[0],  # numeric DB id for recording
+            'case_name': r[2] or '',
+            'attorney': r[3] or 'Unassigned',
+            'contact_name': r[4] or '',
+            'balance_due': balance_due,
+            'amount_now_due': aging_amount,  # None if no aging data
+            'total_remaining_balance': balance_due,
+            'days_delinquent': days,
+            'stage': r[14],
+            'last_notice_date': str(r[7]) if r[7] else '',
+            'contact_email': r[8] or '',
+            'already_sent': bool(r[15]),  # notice already sent at this stage level
+            'sent_at': str(sent_at) if sent_at else None,
+        }
+
     def get_dunning_preview(self, stage: int = None, include_sent: bool = True) -> List[Dict]:
-        """Get dunning queue computed live from cached_invoices.
+        """Get the dunning queue from the maintained dunning_queue table.
 
         All open invoices with balance > 0 and 5+ days overdue, across ALL years,
         dynamically assigned to dunning stages based on days overdue.
-        LEFT JOINs with aging_invoice_uploads (latest batch) to get amount_now_due.
-        LEFT JOINs with dunning_notices to detect already-sent notices per stage.
+        Each row carries amount_now_due from the latest aging upload and the
+        last dunning notice sent, so already-sent notices are flagged per stage.
 
         Args:
             stage: Filter to specific dunning stage (1-4). None = all stages.
             include_sent: If True, include already-sent notices (with flag). If False, exclude them.
         """
+        self._refresh_stale_dunning_queue()
         try:
             with get_connection() as conn:
                 cursor = self._cursor(conn)
-                cursor.execute("""
-                    WITH latest_aging_batch AS (
-                        SELECT upload_batch_id
-                        FROM aging_invoice_uploads
-                        WHERE firm_id = %s
-                        GROUP BY upload_batch_id
-                        ORDER BY MIN(uploaded_at) DESC
-                        LIMIT 1
-                    )
-                    SELECT
-                        i.id as invoice_id,
-                        i.invoice_number,
-                        c.name as case_name,
-                        c.lead_attorney_name,
-                        COALESCE(cl.first_name || ' ' || cl.last_name, ct.name) as contact_name,
-                        i.balance_due,
-                        (CURRENT_DATE - i.due_date::date) as days_overdue,
-                        i.due_date,
-                        COALESCE(cl.email, ct.email) as contact_email,
-                        ag.amount_overdue as aging_amount_due,
-                        ag.invoice_total as aging_invoice_total,
-                        dn.notice_level as sent_notice_level,
-                        dn.sent_at as sent_at,
-                        COALESCE(c.status, 'open') as case_status
-                    FROM cached_invoices i
-                    LEFT JOIN cached_cases c ON i.case_id = c.id AND i.firm_id = c.firm_id
-                    LEFT JOIN cached_clients cl
-                        ON cl.id = (c.data_json::jsonb -> 'billing_contact' ->> 'id')::integer
-                        AND cl.firm_id = i.firm_id
-                    LEFT JOIN cached_contacts ct ON i.contact_id = ct.id AND i.firm_id = ct.firm_id
-                    LEFT JOIN aging_invoice_uploads ag
-                        ON ag.firm_id = i.firm_id
-                        AND ag.invoice_number = i.invoice_number
-                        AND ag.upload_batch_id = (SELECT upload_batch_id FROM latest_aging_batch)
-                    LEFT JOIN LATERAL (
-                        SELECT MAX(notice_level) AS notice_level, MAX(sent_at) AS sent_at
-                        FROM dunning_notices
-                        WHERE firm_id = i.firm_id AND invoice_id = i.id
-                    ) dn ON true
-                    WHERE i.firm_id = %s
-                      AND i.balance_due > 0
-                      AND (CURRENT_DATE - i.due_date::date) >= 5
-                    ORDER BY (CURRENT_DATE - i.due_date::date) DESC, i.balance_due DESC
-                """, (self.firm_id, self.firm_id))
-
-                results = []
-                for r in cursor.fetchall():
-                    raw_days = r[6]
-                    days = raw_days if isinstance(raw_days, int) else (raw_days.days if hasattr(raw_days, 'days') else int(raw_days or 0))
-                    case_status = (r[13] or 'open').lower()  # col 13 = case_status
-                    s = self._compute_dunning_stage(days, case_status=case_status)
-                    if s == 0:
-                        continue
-                    if stage and s != stage:
-                        continue
-                    balance_due = r[5] or 0
-                    aging_amount = float(r[9]) if r[9] is not None else None
-
-                    # Check if notice was already sent at this stage level
-                    sent_level = r[11]  # notice_level from dunning_notices
-                    sent_at = r[12]     # sent_at timestamp
-                    already_sent = (sent_level is not None and sent_level >= s)
-
-                    if not include_sent and already_sent:
-                        continue
-
-                    results.append({
-                        'invoice_id': r[1] or str(r[0]),
-                        'invoice_db_id': r[0],  # numeric DB id for recording
-                        'case_name': r[2] or '',
-                        'attorney': r[3] or 'Unassigned',
-                        'contact_name': r[4] or '',
-                        'balance_due': balance_due,
-                        'amount_now_due': aging_amount,  # None if no aging data
-                        'total_remaining_balance': balance_due,
-                        'days_delinquent': days,
-                        'stage': s,
-                        'last_notice_date': str(r[7]) if r[7] else '',
-                        'contact_email': r[8] or '',
-                        'already_sent': already_sent,
-                        'sent_at': str(sent_at) if sent_at else None,
-                    })
-                return results
+                sql, params = self._dunning_queue_query(stage, include_sent)
+                order = ", ".join(f"{col} {d}" for col, d in self.DUNNING_QUEUE_ORDER)
+                cursor.execute(f"{sql} ORDER BY {order}", params)
+                return [self._dunning_queue_row(r) for r in cursor.fetchall()]
         except Exception as e:
             print(f"[dunning] ERROR in get_dunning_preview: {e}")
             import traceback
             traceback.print_exc()
             return []
 
+    def get_dunning_page(self, stage: int = None, include_sent: bool = True,
+                         cursor: str = None, page_size: int = None) -> Page:
+        """One keyset page of get_dunning_preview()."""
+        self._refresh_stale_dunning_queue()
+        try:
+            with get_connection() as conn:
+                cur = self._cursor(conn)
+                sql, params = self._dunning_queue_query(stage, include_sent)
+                page = paginate(cur, sql, params, self.DUNNING_QUEUE_ORDER,
+                                cursor=cursor, page_size=page_size)
+                page.items = [self._dunning_queue_row(r) for r in page.items]
+                return page
+        except Exception as e:
+            print(f"[dunning] ERROR in get_dunning_page: {e}")
+            return Page(page_size=clamp_page_size(page_size))
+
+    def iter_dunning_queue(self, stage: int = None, include_sent: bool = True) -> Iterator[Dict]:
+        """Stream get_dunning_preview() rows from a server-side cursor (for exports)."""
+        self._refresh_stale_dunning_queue()
+        sql, params = self._dunning_queue_query(stage, include_sent)
+        order = ", ".join(f"{col} {d}" for col, d in self.DUNNING_QUEUE_ORDER)
+        for r in stream_rows(f"{sql} ORDER BY {order}", params):
+            yield self._dunning_queue_row(r)
+
+    def get_dunning_queue_counts(self, stage: int = None) -> Dict:
+        """Total, already-sent and pending counts for the dunning queue."""
+        self._refresh_stale_dunning_queue()
+        try:
+            with get_connection() as conn:
+                cursor = self._cursor(conn)
+                sql, params = self._dunning_queue_query(stage)
+                cursor.execute(f"""
+                    SELECT COUNT(*), COUNT(*) FILTER (WHERE already_sent)
+                    FROM ({sql}) q
+                """, params)
+                total, sent = cursor.fetchone()
+                total, sent = total or 0, sent or 0
+                return {'total': total, 'sent': sent, 'unsent': total - sent}
+        except Exception:
+            return {'total': 0, 'sent': 0, 'unsent': 0}
+
     def get_dunning_summary(self) -> Dict:
-        """Get dunning summary computed live from cached_invoices.
+        """Get dunning summary by stage from the maintained dunning_queue table.
 
-        Dynamically computes stage counts from all open invoices across all years.
         Stage 4 (NOIW) only counts open cases with 60+ days overdue.
         """
+        self._refresh_stale_dunning_queue()
         try:
             with get_connection() as conn:
                 cursor = self._cursor(conn)
 
-                cursor.execute("""
-                    SELECT
-                        (CURRENT_DATE - i.due_date::date) as days_overdue,
-                        i.balance_due,
-                        COALESCE(c.status, 'open') as case_status
-                    FROM cached_invoices i
-                    LEFT JOIN cached_cases c ON i.case_id = c.id AND i.firm_id = c.firm_id
-                    WHERE i.firm_id = %s
-                      AND i.balance_due > 0
-                      AND (CURRENT_DATE - i.due_date::date) >= 5
+                cursor.execute(f"""
+                    SELECT stage, COUNT(*), COALESCE(SUM(balance_due), 0)
+                    FROM (
+                        SELECT {DUNNING_STAGE_SQL} as stage, q.balance_due
+                        FROM dunning_queue q
+                        WHERE q.firm_id = %s
+                          AND q.due_date <= CURRENT_DATE - 5
+                    ) staged
+                    WHERE stage > 0
+                    GROUP BY stage
                 """, (self.firm_id,))
 
                 by_stage = {}
                 total_count = 0
                 total_amount = 0
-                for r in cursor.fetchall():
-                    days = r[0] if isinstance(r[0], int) else (r[0].days if hasattr(r[0], 'days') else int(r[0] or 0))
-                    balance = r[1] or 0
-                    case_status = (r[2] or 'open').lower()
-                    s = self._compute_dunning_stage(days, case_status=case_status)
-                    if s == 0:
-                        continue
-                    if s not in by_stage:
-                        by_stage[s] = {'count': 0, 'total': 0}
-                    by_stage[s]['count'] += 1
-                    by_stage[s]['total'] += balance
-                    total_count += 1
+                for s, count, balance in cursor.fetchall():
+                    by_stage[s] = {'count': count, 'total': balance}
+                    total_count += count
                     total_amount += balance
 
                 return {
@@ -893,64 +945,188 @@ class ARDataMixin:
                 'aging_over_60_pct': 0, 'delinquent_accounts': 0,
             }
 
+    # Most overdue first. Stored columns, so idx_ci_open_page serves every page
+    OPEN_INVOICES_ORDER = [("due_date", "ASC"), ("balance_due", "DESC"), ("invoice_id", "DESC")]
+
+    # Aging filter values used by the /ar and /noiw tables -> inclusive
+    # (min, max) days overdue; None is unbounded
+    OPEN_INVOICE_AGING = {
+        'current': (None, 0),
+        '1-30': (1, 30), '31-60': (31, 60), '61-90': (61, 90), '91-180': (91, 180), '181+': (181, None),
+        '30-60': (30, 59), '60-90': (60, 89), '90-180': (90, 179), '180+': (180, None),
+    }
+
+    def _open_invoices_query(self, min_days_overdue: int = 0, search: str = None,
+                             aging: str = None) -> tuple:
+        """Return (sql, params) for open invoices with balance due, unordered.
+
+        ``search`` matches client, case or attorney names (case-insensitive);
+        ``aging`` is a key of OPEN_INVOICE_AGING.
+        """
+        conditions, params = [], [self.firm_id, min_days_overdue]
+        if search and search.strip():
+            conditions.append(
+                "(COALESCE(cl.first_name || ' ' || cl.last_name, ct.name, 'Unknown') || ' ' || "
+                "COALESCE(c.name, '') || ' ' || COALESCE(c.lead_attorney_name, 'Unassigned')) ILIKE %s"
+            )
+            params.append("%" + re.sub(r"([\\%_])", r"\\\1", search.strip()) + "%")
+        low, high = self.OPEN_INVOICE_AGING.get(aging, (None, None))
+        if low is not None:
+            conditions.append("i.due_date <= CURRENT_DATE - %s")
+            params.append(low)
+        if high is not None:
+            conditions.append("i.due_date >= CURRENT_DATE - %s")
+            params.append(high)
+        filters = "".join(f" AND {c}" for c in conditions)
+        return """
+            SELECT
+                i.id as invoice_id,
+                i.invoice_number,
+                c.name as case_name,
+                c.lead_attorney_name,
+                COALESCE(cl.first_name || ' ' || cl.last_name, ct.name) as contact_name,
+                i.total_amount,
+                i.paid_amount,
+                i.balance_due,
+                i.due_date,
+                i.invoice_date,
+                (CURRENT_DATE - i.due_date) as days_overdue,
+                EXTRACT(YEAR FROM i.invoice_date) as invoice_year,
+                c.practice_area,
+                c.status as case_status,
+                COALESCE(cl.email, ct.email) as contact_email
+            FROM cached_invoices i
+            LEFT JOIN cached_cases c ON i.case_id = c.id AND i.firm_id = c.firm_id
+            LEFT JOIN cached_clients cl
+                ON cl.id = (c.data_json::jsonb -> 'billing_contact' ->> 'id')::integer
+                AND cl.firm_id = i.firm_id
+            LEFT JOIN cached_contacts ct ON i.contact_id = ct.id AND i.firm_id = ct.firm_id
+            WHERE i.firm_id = %s
+              AND i.balance_due > 0
+              AND i.due_date <= CURRENT_DATE - %s
+        """ + filters, tuple(params)
+
+    @staticmethod
+    def _open_invoice_row(r) -> Dict:
+        return {
+            'invoice_id': r[0],
+            'invoice_number': r[1],
+            'case_name': r[2],
+            'attorney': r[3] or 'Unassigned',
+            'contact_name': r[4] or 'Unknown',
+            'total_amount': r[5] or 0,
+            'paid_amount': r[6] or 0,
+            'balance_due': r[7] or 0,
+            'due_date': str(r[8]) if r[8] else '',
+            'invoice_date': str(r[9]) if r[9] else '',
+            'days_overdue': r[10] or 0,
+            'invoice_year': int(r[11]) if r[11] else 0,
+            'practice_area': r[12] or 'Unknown',
+            'case_status': r[13] or 'Unknown',
+            'contact_email': r[14] or '',
+        }
+
     def get_open_invoices_list(self, min_days_overdue: int = 0) -> List[Dict]:
         """Get all open invoices with balance due across ALL years.
 
         Returns individual invoice rows with case, client, attorney, balance,
         and aging info. No year filter — shows everything still unpaid.
+        List pages should use get_open_invoices_page() instead.
         """
         try:
             with get_connection() as conn:
                 cursor = self._cursor(conn)
-                cursor.execute("""
-                    SELECT
-                        i.id as invoice_id,
-                        i.invoice_number,
-                        c.name as case_name,
-                        c.lead_attorney_name,
-                        COALESCE(cl.first_name || ' ' || cl.last_name, ct.name) as contact_name,
-                        i.total_amount,
-                        i.paid_amount,
-                        i.balance_due,
-                        i.due_date,
-                        i.invoice_date,
-                        (CURRENT_DATE - i.due_date) as days_overdue,
-                        EXTRACT(YEAR FROM i.invoice_date) as invoice_year,
-                        c.practice_area,
-                        c.status as case_status,
-                        COALESCE(cl.email, ct.email) as contact_email
-                    FROM cached_invoices i
-                    LEFT JOIN cached_cases c ON i.case_id = c.id AND i.firm_id = c.firm_id
-                    LEFT JOIN cached_clients cl
-                        ON cl.id = (c.data_json::jsonb -> 'billing_contact' ->> 'id')::integer
-                        AND cl.firm_id = i.firm_id
-                    LEFT JOIN cached_contacts ct ON i.contact_id = ct.id AND i.firm_id = ct.firm_id
-                    WHERE i.firm_id = %s
-                      AND i.balance_due > 0
-                      AND (CURRENT_DATE - i.due_date) >= %s
-                    ORDER BY (CURRENT_DATE - i.due_date) DESC, i.balance_due DESC
-                """, (self.firm_id, min_days_overdue))
-                rows = cursor.fetchall()
-                return [{
-                    'invoice_id': r[0],
-                    'invoice_number': r[1],
-                    'case_name': r[2],
-                    'attorney': r[3] or 'Unassigned',
-                    'contact_name': r[4] or 'Unknown',
-                    'total_amount': r[5] or 0,
-                    'paid_amount': r[6] or 0,
-                    'balance_due': r[7] or 0,
-                    'due_date': str(r[8]) if r[8] else '',
-                    'invoice_date': str(r[9]) if r[9] else '',
-                    'days_overdue': r[10] or 0,
-                    'invoice_year': int(r[11]) if r[11] else 0,
-                    'practice_area': r[12] or 'Unknown',
-                    'case_status': r[13] or 'Unknown',
-                    'contact_email': r[14] or '',
-                } for r in rows]
+                sql, params = self._open_invoices_query(min_days_overdue)
+                order = ", ".join(f"{col} {d}" for col, d in self.OPEN_INVOICES_ORDER)
+                cursor.execute(f"SELECT * FROM ({sql}) q ORDER BY {order}", params)
+                return [self._open_invoice_row(r) for r in cursor.fetchall()]
         except Exception:
             return []
 
+    def get_open_invoices_page(self, min_days_overdue: int = 0, cursor: str = None,
+                               page_size: int = None, search: str = None,
+                               aging: str = None) -> Page:
+        """One keyset page of get_open_invoices_list(), oldest and largest first.
+
+        ``search`` and ``aging`` filter in SQL (see _open_invoices_query), so
+        they apply across all pages.
+        """
+        try:
+            with get_connection() as conn:
+                cur = self._cursor(conn)
+                sql, params = self._open_invoices_query(min_days_overdue, search, aging)
+                page = paginate(cur, sql, params, self.OPEN_INVOICES_ORDER,
+                                cursor=cursor, page_size=page_size)
+                page.items = [self._open_invoice_row(r) for r in page.items]
+                return page
+        except Exception as e:
+            print(f"[ar] ERROR in get_open_invoices_page: {e}")
+            return Page(page_size=clamp_page_size(page_size))
+
+    def get_open_invoices_totals(self, min_days_overdue: int = 0) -> Dict:
+        """Count/balance totals and aging buckets for open invoices.
+
+        Lets list pages show firm-wide totals while rendering only one page.
+        """
+        try:
+            with get_connection() as conn:
+                cursor = self._cursor(conn)
+                sql, params = self._open_invoices_query(min_days_overdue)
+                cursor.execute(f"""
+                    SELECT COUNT(*),
+                           COALESCE(SUM(balance_due), 0),
+                           COUNT(*) FILTER (WHERE days_overdue > 0),
+                           COUNT(*) FILTER (WHERE days_overdue >= 30 AND days_overdue < 60),
+                           COUNT(*) FILTER (WHERE days_overdue >= 60 AND days_overdue < 90),
+                           COUNT(*) FILTER (WHERE days_overdue >= 90 AND days_overdue < 180),
+                           COUNT(*) FILTER (WHERE days_overdue >= 180)
+                    FROM ({sql}) q
+                """, params)
+                r = cursor.fetchone()
+                return {
+                    'count': r[0] or 0,
+                    'total_balance': r[1] or 0,
+                    'past_due_count': r[2] or 0,
+                    'bucket_30_60': r[3] or 0,
+                    'bucket_60_90': r[4] or 0,
+                    'bucket_90_180': r[5] or 0,
+                    'bucket_180_plus': r[6] or 0,
+                }
+        except Exception:
+            return {'count': 0, 'total_balance': 0, 'past_due_count': 0,
+                    'bucket_30_60': 0, 'bucket_60_90': 0,
+                    'bucket_90_180': 0, 'bucket_180_plus': 0}
+
+    def iter_invoice_history(self, open_only: bool = False) -> Iterator[tuple]:
+        """Stream every invoice (all years) as export rows, newest first.
+
+        Rows match INVOICE_EXPORT_HEADER. Uses a server-side cursor so a
+        firm's full history never sits in memory.
+        """
+        yield from stream_rows("""
+            SELECT
+                i.invoice_number,
+                i.invoice_date,
+                i.due_date,
+                c.name,
+                COALESCE(c.lead_attorney_name, 'Unassigned'),
+                COALESCE(cl.first_name || ' ' || cl.last_name, ct.name, ''),
+                i.status,
+                COALESCE(i.total_amount, 0),
+                COALESCE(i.paid_amount, 0),
+                COALESCE(i.balance_due, 0),
+                GREATEST(CURRENT_DATE - i.due_date, 0)
+            FROM cached_invoices i
+            LEFT JOIN cached_cases c ON i.case_id = c.id AND i.firm_id = c.firm_id
+            LEFT JOIN cached_clients cl
+                ON cl.id = (c.data_json::jsonb -> 'billing_contact' ->> 'id')::integer
+                AND cl.firm_id = i.firm_id
+            LEFT JOIN cached_contacts ct ON i.contact_id = ct.id AND i.firm_id = ct.firm_id
+            WHERE i.firm_id = %s
+              AND (NOT %s OR i.balance_due > 0)
+            ORDER BY i.invoice_date DESC NULLS LAST, i.id DESC
+        """, (self.firm_id, open_only))
+
     def get_open_invoices_by_attorney(self) -> List[Dict]:
         """Get open invoice summary grouped by attorney.
 
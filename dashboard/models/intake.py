@@ -16,6 +16,7 @@ from typing import Dict, List, Optional
 from db.intake import (
     get_pipeline_board,
     get_leads_list,
+    get_leads_page,
     get_lead,
     create_lead,
     update_lead,
@@ -72,6 +73,15 @@ class IntakeDataMixin:
             assigned_to=assigned_to, search=search, limit=limit
         )
 
+    def get_intake_leads_page(self, stage: str = None, source: str = None,
+                              assigned_to: str = None, search: str = None,
+                              cursor: str = None, page_size: int = None):
+        """Get one keyset page of filtered leads, newest first."""
+        return get_leads_page(
+            self.firm_id, stage=stage, source=source, assigned_to=assigned_to,
+            search=search, cursor=cursor, page_size=page_size
+        )
+
     def get_intake_lead(self, lead_id: int) -> Optional[Dict]:
         """Get a single lead with details."""
         return get_lead(self.firm_id, lead_id)
@@ -10,6 +10,7 @@ Reads from PostgreSQL tables:
 from typing import Dict, List
 
 from db.connection import get_connection
+from db.pagination import Page, clamp_page_size, paginate
 
 
 class PhasesDataMixin:
@@ -94,6 +95,37 @@ class PhasesDataMixin:
         except Exception:
             return {'phases': [], 'total_cases': 0}
 
+    # Longest-stalled first. entered_at (not days_in_phase) is the key because
+    # it doesn't drift with the clock between page requests.
+    STALLED_ORDER = [("entered_at", "ASC"), ("case_id", "ASC")]
+
+    def _stalled_cases_query(self, threshold: int) -> tuple:
+        """Return (sql, params) for open cases stalled >= threshold days, unordered."""
+        af_sql, af_params = self._attorney_case_filter("c")
+        return f"""
+            WITH latest AS (
+                SELECT DISTINCT ON (cph.case_id)
+                       cph.case_id, cph.case_name, cph.phase_name,
+                       cph.entered_at, cph.firm_id
+                FROM case_phase_history cph
+                WHERE cph.firm_id = %s
+                ORDER BY cph.case_id, cph.entered_at DESC
+            )
+            SELECT lp.case_id, c.name as case_name, lp.phase_name,
+                   lp.entered_at,
+                   EXTRACT(EPOCH FROM (CURRENT_TIMESTAMP - lp.entered_at)) / 86400.0 as days_in_phase
+            FROM latest lp
+            JOIN cached_cases c ON lp.case_id = c.id AND lp.firm_id = c.firm_id
+            WHERE c.status = 'open'
+              AND EXTRACT(EPOCH FROM (CURRENT_TIMESTAMP - lp.entered_at)) / 86400.0 >= %s
+              {af_sql}
+        """, (self.firm_id, threshold, *af_params)
+
+    @staticmethod
+    def _stalled_case_row(r) -> Dict:
+        return {'case_id': r[0], 'case_name': r[1], 'phase': r[2],
+                'entered': r[3], 'days_in_phase': int(r[4])}
+
     def get_stalled_cases(self, days_in_phase: int = 30, threshold_days: int = None) -> List[Dict]:
         """Get cases stalled in current phase.
 
@@ -105,35 +137,26 @@ class PhasesDataMixin:
         try:
             with get_connection() as conn:
                 cursor = self._cursor(conn)
-
-                af_sql, af_params = self._attorney_case_filter("c")
-                cursor.execute(f"""
-                    WITH latest AS (
-                        SELECT DISTINCT ON (cph.case_id)
-                               cph.case_id, cph.case_name, cph.phase_name,
-                               cph.entered_at, cph.firm_id
-                        FROM case_phase_history cph
-                        WHERE cph.firm_id = %s
-                        ORDER BY cph.case_id, cph.entered_at DESC
-                    )
-                    SELECT lp.case_id, c.name as case_name, lp.phase_name,
-                           lp.entered_at,
-                           EXTRACT(EPOCH FROM (CURRENT_TIMESTAMP - lp.entered_at)) / 86400.0 as days_in_phase
-                    FROM latest lp
-                    JOIN cached_cases c ON lp.case_id = c.id AND lp.firm_id = c.firm_id
-                    WHERE c.status = 'open'
-                      AND EXTRACT(EPOCH FROM (CURRENT_TIMESTAMP - lp.entered_at)) / 86400.0 >= %s
-                      {af_sql}
-                    ORDER BY days_in_phase DESC
-                    LIMIT 50
-                """, (self.firm_id, threshold, *af_params))
-
-                return [{'case_id': r[0], 'case_name': r[1], 'phase': r[2],
-                         'entered': r[3], 'days_in_phase': int(r[4])}
-                        for r in cursor.fetchall()]
+                sql, params = self._stalled_cases_query(threshold)
+                cursor.execute(sql + " ORDER BY days_in_phase DESC LIMIT 50", params)
+                return [self._stalled_case_row(r) for r in cursor.fetchall()]
         except Exception:
             return []
 
+    def get_stalled_cases_page(self, threshold_days: int = 30, cursor: str = None,
+                               page_size: int = None) -> Page:
+        """One keyset page of stalled cases, longest-stalled first (no 50-row cap)."""
+        try:
+            with get_connection() as conn:
+                cur = self._cursor(conn)
+                sql, params = self._stalled_cases_query(threshold_days)
+                page = paginate(cur, sql, params, self.STALLED_ORDER,
+                                cursor=cursor, page_size=page_size)
+                page.items = [self._stalled_case_row(r) for r in page.items]
+                return page
+        except Exception:
+            return Page(page_size=clamp_page_size(page_size))
+
     def get_phase_velocity(self) -> List[Dict]:
         """Get average days spent in each phase (from case_phase_history where exited)."""
         try:
@@ -10,13 +10,31 @@ from db.connection import get_connection
 class TrendsDataMixin:
     """Mixin providing KPI trend analysis and payment promises data methods."""
 
+    # ---- Snapshot source selection ----
+
+    def _snapshot_scope(self, alias: str = None) -> tuple:
+        """Return (table, sql_fragment, params) for the KPI snapshot series of this view.
+
+        Firm-wide views read kpi_snapshots. Attorney-scoped views read the
+        per-attorney series written nightly by db.trends.record_attorney_snapshots().
+
+        Usage:
+            table, scope_sql, scope_params = self._snapshot_scope()
+            cursor.execute(f"SELECT ... FROM {table} WHERE firm_id = %s {scope_sql}",
+                           (self.firm_id, *scope_params))
+        """
+        if self.attorney_name:
+            column = f"{alias}.attorney_name" if alias else "attorney_name"
+            return "attorney_kpi_snapshots", f" AND {column} = %s", (self.attorney_name,)
+        return "kpi_snapshots", "", ()
+
     # ---- Attorney-scoped live metric computation ----
 
     def _compute_attorney_metrics(self) -> List[Dict]:
         """Compute KPI metrics live from underlying tables for an attorney-scoped view.
 
-        Since kpi_snapshots are firm-wide aggregates, attorneys get live values
-        computed from their own cases/invoices. No historical trend data is available.
+        Fallback for attorneys with no rows in attorney_kpi_snapshots yet (e.g.
+        before the first nightly snapshot). No historical trend data is available.
         """
         metrics = []
         today = str(date.today())
@@ -90,25 +108,23 @@ class TrendsDataMixin:
             pass
         return metrics
 
-    # ---- Firm-wide KPI snapshot methods ----
+    # ---- KPI snapshot methods (firm-wide or per-attorney) ----
 
     def get_kpi_trends(self, metric_name: str, days_back: int = 90) -> List[Dict]:
         """Get KPI trends for a specific metric over time."""
-        # No historical per-attorney data available
-        if self.attorney_name:
-            return []
+        table, scope_sql, scope_params = self._snapshot_scope()
         try:
             with get_connection() as conn:
                 cursor = self._cursor(conn)
 
-                cursor.execute("""
+                cursor.execute(f"""
                     SELECT snapshot_date, metric_value
-                    FROM kpi_snapshots
-                    WHERE firm_id = %s
+                    FROM {table}
+                    WHERE firm_id = %s {scope_sql}
                       AND metric_name = %s
                       AND snapshot_date >= CURRENT_DATE - INTERVAL %s
                     ORDER BY snapshot_date
-                """, (self.firm_id, metric_name, f'{days_back} days'))
+                """, (self.firm_id, *scope_params, metric_name, f'{days_back} days'))
 
                 return [{'date': str(r[0]), 'value': r[1]} for r in cursor.fetchall()]
         except Exception:
@@ -116,42 +132,33 @@ class TrendsDataMixin:
 
     def get_trends_summary(self) -> Dict:
         """Get summary of all tracked KPI metrics with latest values and direction."""
-        # Attorney-scoped: compute live from underlying data
-        if self.attorney_name:
-            metrics = self._compute_attorney_metrics()
-            return {'metrics': metrics, 'total_metrics': len(metrics)}
-
+        table, s_scope_sql, scope_params = self._snapshot_scope("s")
+        _, p_scope_sql, _ = self._snapshot_scope("p")
         try:
             with get_connection() as conn:
                 cursor = self._cursor(conn)
 
-                # Get distinct metric names with their latest snapshot
-                cursor.execute("""
-                    SELECT DISTINCT ON (metric_name)
-                           metric_name, metric_value, snapshot_date
-                    FROM kpi_snapshots
-                    WHERE firm_id = %s
-                    ORDER BY metric_name, snapshot_date DESC
-                """, (self.firm_id,))
+                # Latest snapshot per metric, plus the value from 7 days before
+                # for trend direction, in one pass over the series index
+                cursor.execute(f"""
+                    SELECT DISTINCT ON (s.metric_name)
+                           s.metric_name, s.metric_value, s.snapshot_date,
+                           (SELECT p.metric_value
+                            FROM {table} p
+                            WHERE p.firm_id = s.firm_id {p_scope_sql}
+                              AND p.metric_name = s.metric_name
+                              AND p.snapshot_date <= CURRENT_DATE - INTERVAL '7 days'
+                            ORDER BY p.snapshot_date DESC
+                            LIMIT 1) AS previous_value
+                    FROM {table} s
+                    WHERE s.firm_id = %s {s_scope_sql}
+                    ORDER BY s.metric_name, s.snapshot_date DESC
+                """, (*scope_params, self.firm_id, *scope_params))
 
                 metrics = []
                 for r in cursor.fetchall():
-                    metric_name = r[0]
                     current_value = r[1]
-                    snapshot_date = r[2]
-
-                    # Get the value from 7 days ago for trend direction
-                    cursor.execute("""
-                        SELECT metric_value
-                        FROM kpi_snapshots
-                        WHERE firm_id = %s
-                          AND metric_name = %s
-                          AND snapshot_date <= CURRENT_DATE - INTERVAL '7 days'
-                        ORDER BY snapshot_date DESC
-                        LIMIT 1
-                    """, (self.firm_id, metric_name))
-                    prev_row = cursor.fetchone()
-                    prev_value = prev_row[0] if prev_row else None
+                    prev_value = r[3]
 
                     direction = 'stable'
                     if prev_value is not None and current_value is not None:
@@ -161,37 +168,38 @@ class TrendsDataMixin:
                             direction = 'down'
 
                     metrics.append({
-                        'name': metric_name,
+                        'name': r[0],
                         'value': current_value,
-                        'date': str(snapshot_date),
+                        'date': str(r[2]),
                         'previous_value': prev_value,
                         'direction': direction,
                     })
-
-                return {
-                    'metrics': metrics,
-                    'total_metrics': len(metrics),
-                }
         except Exception:
-            return {'metrics': [], 'total_metrics': 0}
+            metrics = []
+
+        # Attorney not yet covered by a nightly snapshot: compute live
+        if not metrics and self.attorney_name:
+            metrics = self._compute_attorney_metrics()
+
+        return {
+            'metrics': metrics,
+            'total_metrics': len(metrics),
+        }
 
     def get_metric_comparison(self, metric: str) -> Dict:
         """Get week-over-week and month-over-month comparison for a metric."""
-        # No historical per-attorney data for comparisons
-        if self.attorney_name:
-            return {}
-
+        table, scope_sql, scope_params = self._snapshot_scope()
         try:
             with get_connection() as conn:
                 cursor = self._cursor(conn)
 
                 # Latest value
-                cursor.execute("""
+                cursor.execute(f"""
                     SELECT metric_value, snapshot_date
-                    FROM kpi_snapshots
-                    WHERE firm_id = %s AND metric_name = %s
+                    FROM {table}
+                    WHERE firm_id = %s {scope_sql} AND metric_name = %s
                     ORDER BY snapshot_date DESC LIMIT 1
-                """, (self.firm_id, metric))
+                """, (self.firm_id, *scope_params, metric))
                 latest = cursor.fetchone()
                 if not latest:
                     return {}
@@ -200,22 +208,22 @@ class TrendsDataMixin:
                 current_date = latest[1]
 
                 # 7 days ago
-                cursor.execute("""
-                    SELECT metric_value FROM kpi_snapshots
-                    WHERE firm_id = %s AND metric_name = %s
+                cursor.execute(f"""
+                    SELECT metric_value FROM {table}
+                    WHERE firm_id = %s {scope_sql} AND metric_name = %s
                       AND snapshot_date <= CURRENT_DATE - INTERVAL '7 days'
                     ORDER BY snapshot_date DESC LIMIT 1
-                """, (self.firm_id, metric))
+                """, (self.firm_id, *scope_params, metric))
                 wow_row = cursor.fetchone()
                 wow_value = wow_row[0] if wow_row else None
 
                 # 30 days ago
-                cursor.execute("""
-                    SELECT metric_value FROM kpi_snapshots
-                    WHERE firm_id = %s AND metric_name = %s
+                cursor.execute(f"""
+                    SELECT metric_value FROM {table}
+                    WHERE firm_id = %s {scope_sql} AND metric_name = %s
                       AND snapshot_date <= CURRENT_DATE - INTERVAL '30 days'
                     ORDER BY snapshot_date DESC LIMIT 1
-                """, (self.firm_id, metric))
+                """, (self.firm_id, *scope_params, metric))
                 mom_row = cursor.fetchone()
                 mom_value = mom_row[0] if mom_row else None
 
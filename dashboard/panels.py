@@ -0,0 +1,183 @@
+"""
+Lazy-Loaded Page Panels
+
+Heavy pages render an empty shell straight away; each expensive section is a
+*panel* fetched separately from ``/panels/{page}/{name}`` and swapped into
+place by components/panel_loader.html. A slow aggregate then only delays its
+own panel instead of the whole page.
+
+Registering a panel (next to the page route that shows it):
+
+    @panel("home", "sop", "panels/home_sop.html", deny_roles=("attorney", "collections"))
+    def _home_sop(data, params):
+        return {"ty_sop": data.get_ty_sop_data(), ...}
+
+The loader receives the request's DashboardData and query parameters and
+returns the template context. Each panel has its own timeout and cache TTL:
+
+- Loaders run on a dedicated thread pool. If one overruns its timeout the
+  client gets a "still loading" fragment that retries; the loader keeps
+  running and a retry picks up its result from the cache (or joins it if it
+  is still in flight) instead of starting the query again.
+- Rendered HTML is cached per firm, viewer, page query and sync generation,
+  so a completed sync invalidates every panel without explicit purging.
+"""
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import date
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple
+
+from fastapi.templating import Jinja2Templates
+
+import dashboard.config as config
+
+logger = logging.getLogger(__name__)
+
+templates = Jinja2Templates(directory=Path(__file__).parent / "templates")
+
+
+@dataclass
+class Panel:
+    """A lazily rendered section of a dashboard page."""
+    page: str
+    name: str
+    template: str
+    loader: Callable[..., Dict]
+    timeout: float
+    ttl: float
+    deny_roles: Tuple[str, ...] = ()
+
+
+# (page, name) -> Panel
+PANELS: Dict[Tuple[str, str], Panel] = {}
+
+
+def panel(page: str, name: str, template: str, timeout: float = None,
+          ttl: float = None, deny_roles: Tuple[str, ...] = ()):
+    """Decorator registering ``loader(data, params) -> context`` as a panel."""
+    def decorator(loader):
+        PANELS[(page, name)] = Panel(
+            page=page,
+            name=name,
+            template=template,
+            loader=loader,
+            timeout=config.PANEL_TIMEOUT_SECONDS if timeout is None else timeout,
+            ttl=config.PANEL_CACHE_TTL_SECONDS if ttl is None else ttl,
+            deny_roles=tuple(deny_roles),
+        )
+        return loader
+    return decorator
+
+
+def get_panel(page: str, name: str) -> Optional[Panel]:
+    return PANELS.get((page, name))
+
+
+def int_param(params: Dict, key: str, default: int = None) -> Optional[int]:
+    """Read an integer query parameter, falling back to ``default`` when absent or malformed."""
+    try:
+        value = params.get(key)
+        return int(value) if value not in (None, "") else default
+    except (TypeError, ValueError):
+        return default
+
+
+# ============================================================
+# Rendered-fragment cache
+# ============================================================
+
+_executor = ThreadPoolExecutor(max_workers=config.PANEL_WORKERS, thread_name_prefix="panel")
+_lock = threading.Lock()
+_cache: "OrderedDict[tuple, Tuple[float, str]]" = OrderedDict()  # key -> (expires_at, html)
+_inflight: Dict[tuple, Future] = {}
+
+
+def cache_key(p: Panel, session: dict, params: Dict, generation) -> tuple:
+    """Everything a panel's HTML can depend on."""
+    return (
+        p.page,
+        p.name,
+        session.get("firm_id") or "",
+        session.get("username") or "",
+        session.get("role") or "",
+        session.get("attorney_name") or "",
+        tuple(sorted(params.items())),
+        generation,
+        date.today().isoformat(),  # aging buckets move with the calendar
+    )
+
+
+def _cache_get(key: tuple) -> Optional[str]:
+    with _lock:
+        entry = _cache.get(key)
+        if not entry:
+            return None
+        if entry[0] <= time.monotonic():
+            del _cache[key]
+            return None
+        _cache.move_to_end(key)
+        return entry[1]
+
+
+def _cache_put(key: tuple, html: str, ttl: float):
+    if ttl <= 0:
+        return
+    with _lock:
+        _cache[key] = (time.monotonic() + ttl, html)
+        _cache.move_to_end(key)
+        while len(_cache) > config.PANEL_CACHE_MAX_ENTRIES:
+            _cache.popitem(last=False)
+
+
+def clear_panel_cache():
+    """Drop every cached fragment (tests, manual refresh)."""
+    with _lock:
+        _cache.clear()
+
+
+def _build(p: Panel, key: tuple, data, params: Dict, base_context: Dict) -> str:
+    """Run the loader and render the fragment (worker thread)."""
+    started = time.monotonic()
+    try:
+        context = dict(base_context)
+        context.update(p.loader(data, params) or {})
+        html = templates.get_template(p.template).render(context)
+        _cache_put(key, html, p.ttl)
+        return html
+    finally:
+        with _lock:
+            _inflight.pop(key, None)
+        logger.debug("panel %s/%s built in %.2fs", p.page, p.name, time.monotonic() - started)
+
+
+async def render_panel(p: Panel, key: tuple, data, params: Dict, base_context: Dict) -> Tuple[str, str]:
+    """Render a panel within its timeout.
+
+    Returns ``(status, html)`` where status is "ok", "timeout" or "error". On
+    timeout the build keeps running in the background and fills the cache.
+    """
+    html = _cache_get(key)
+    if html is not None:
+        return "ok", html
+
+    with _lock:
+        future = _inflight.get(key)
+        if future is None:
+            future = _executor.submit(_build, p, key, data, params, base_context)
+            _inflight[key] = future
+
+    try:
+        html = await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), timeout=p.timeout)
+        return "ok", html
+    except asyncio.TimeoutError:
+        logger.warning("panel %s/%s exceeded %.1fs; continuing in background", p.page, p.name, p.timeout)
+        return "timeout", ""
+    except Exception as e:
+        logger.exception("panel %s/%s failed: %s", p.page, p.name, e)
+        return "error", ""
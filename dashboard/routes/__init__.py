@@ -9,6 +9,7 @@ Routes are organized by domain:
 - trends: KPI trends
 - noiw: NOIW pipeline
 - api: JSON API endpoints (chat, docket, documents, sync)
+- panels: Lazy-loaded page sections (HTML fragments)
 """
 
 from fastapi import FastAPI
@@ -30,6 +31,7 @@ def register_routes(app: FastAPI):
     from .phone import router as phone_router
     from .revenue import router as revenue_router
     from .intake import router as intake_router
+    from .panels import router as panels_router
 
     app.include_router(main_router)
     app.include_router(ar_router)
@@ -45,3 +47,4 @@ def register_routes(app: FastAPI):
     app.include_router(phone_router)
     app.include_router(revenue_router)
     app.include_router(intake_router)
+    app.include_router(panels_router)
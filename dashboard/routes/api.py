@@ -1,34 +1,35 @@
 """
 JSON API endpoints: Chat, docket management, document generation, sync, etc.
 """
+import asyncio
+import hashlib
 import threading
 import json
+import logging
 import os
 import io
-import csv as csv_mod
 import re
 import uuid
 from datetime import datetime
 from pathlib import Path
 
-import anthropic
 from fastapi import APIRouter, Request, BackgroundTasks, UploadFile, File
 from fastapi.responses import JSONResponse, HTMLResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
+from starlette.concurrency import run_in_threadpool
 
-from dashboard.auth import is_authenticated, get_data, get_current_role, get_current_attorney_name
+from dashboard.auth import is_authenticated, get_data, get_current_role, get_current_attorney_name, get_current_firm_id
+from dashboard.exports import export_response
 from db.connection import get_connection
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter()
 templates = Jinja2Templates(directory=Path(__file__).parent.parent / "templates")
 
 # Track sync status
 _sync_status = {"running": False, "last_result": None, "error": None}
 
-# Store active document chat sessions
-_doc_sessions = {}
-
-
 # ============================================================================
 # Dashboard Stats API
 # ============================================================================
@@ -61,7 +62,7 @@ async def api_ar_aging(request: Request, year: int = None):
 # Sync Management API
 # ============================================================================
 
-def _run_sync():
+def _run_sync(firm_id: str = None):
     """Run the sync in background thread."""
     global _sync_status
     try:
@@ -88,6 +89,8 @@ def _run_sync():
         }
     except Exception as e:
         _sync_status["error"] = str(e)
+        from db.sync_events import publish_sync_event
+        publish_sync_event(firm_id, "failed", error=str(e))
     finally:
         _sync_status["running"] = False
 
@@ -102,7 +105,7 @@ async def api_start_sync(request: Request, background_tasks: BackgroundTasks):
         return JSONResponse({"status": "already_running"})
 
     # Start sync in background thread
-    thread = threading.Thread(target=_run_sync, daemon=True)
+    thread = threading.Thread(target=_run_sync, args=(get_current_firm_id(request),), daemon=True)
     thread.start()
 
     return JSONResponse({"status": "started"})
@@ -121,6 +124,61 @@ async def api_sync_status(request: Request):
     })
 
 
+@router.get("/api/sync/events")
+async def api_sync_events(request: Request):
+    """
+    Server-Sent Events stream of sync progress for the current firm.
+
+    Replaces polling /api/sync/status: the first event is a "status"
+    snapshot, then started/entity/completed/failed events arrive as sync
+    runs publish them (see db/sync_events.py), from any worker or Celery.
+    """
+    if not is_authenticated(request):
+        return JSONResponse({"error": "Unauthorized"}, status_code=401)
+
+    firm_id = get_current_firm_id(request)
+    if not firm_id:
+        return JSONResponse({"error": "Missing session data"}, status_code=400)
+
+    from dashboard.sync_events import get_sync_event_hub
+    from phone.delivery import format_sse_event
+
+    hub = get_sync_event_hub()
+    queue = hub.subscribe(firm_id)
+
+    async def event_generator():
+        try:
+            yield format_sse_event({
+                "running": _sync_status["running"],
+                "last_result": _sync_status["last_result"],
+                "error": _sync_status["error"],
+                "latest": hub.latest(firm_id),
+            }, event_type="status")
+
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=30.0)
+                    if event.get("event") == "_shutdown":
+                        break
+                    yield format_sse_event(event, event_type=event["event"])
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                except asyncio.CancelledError:
+                    break
+        finally:
+            hub.unsubscribe(firm_id, queue)
+
+    return StreamingResponse(
+        event_generator(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no",
+        },
+    )
+
+
 # ============================================================================
 # Dunning Actions API
 # ============================================================================
@@ -517,22 +575,15 @@ async def api_dunning_mark_sent(request: Request):
 
 
 @router.get("/api/dunning/export")
-async def api_dunning_export(request: Request, stage: int = None):
-    """Export dunning queue to CSV."""
+async def api_dunning_export(request: Request, stage: int = None, format: str = "csv"):
+    """Export dunning queue to CSV (or XLSX), streamed from a server-side cursor."""
     if not is_authenticated(request):
         return JSONResponse({"error": "Unauthorized"}, status_code=401)
 
-    import csv as csv_mod
-
     data = get_data(request)
-    queue = data.get_dunning_queue(stage=stage)
-
-    output = io.StringIO()
-    writer = csv_mod.writer(output)
-    writer.writerow(['Invoice', 'Case', 'Client Name', 'Client Email', 'Attorney', 'Balance Due', 'Days Overdue', 'Stage', 'Due Date'])
-
-    for inv in queue:
-        writer.writerow([
+    header = ['Invoice', 'Case', 'Client Name', 'Client Email', 'Attorney', 'Balance Due', 'Days Overdue', 'Stage', 'Due Date']
+    rows = (
+        [
             inv.get('invoice_id', ''),
             inv.get('case_name', ''),
             inv.get('contact_name', ''),
@@ -542,17 +593,29 @@ async def api_dunning_export(request: Request, stage: int = None):
             inv.get('days_delinquent', 0),
             inv.get('stage', ''),
             inv.get('last_notice_date', ''),
-        ])
+        ]
+        for inv in data.iter_dunning_queue(stage=stage)
+    )
 
-    output.seek(0)
     today = datetime.now().strftime('%Y-%m-%d')
-    filename = f"dunning_queue_{today}.csv"
+    return export_response(header, rows, f"dunning_queue_{today}", fmt=format,
+                           sheet_name="Dunning Queue")
 
-    return StreamingResponse(
-        iter([output.getvalue()]),
-        media_type="text/csv",
-        headers={"Content-Disposition": f"attachment; filename={filename}"}
-    )
+
+@router.get("/api/invoices/export")
+async def api_invoices_export(request: Request, open_only: bool = False, format: str = "csv"):
+    """Export the firm's full invoice history (all years), streamed."""
+    if not is_authenticated(request):
+        return JSONResponse({"error": "Unauthorized"}, status_code=401)
+
+    if get_current_role(request) == 'attorney':
+        return JSONResponse({"error": "Forbidden"}, status_code=403)
+
+    data = get_data(request)
+    today = datetime.now().strftime('%Y-%m-%d')
+    name = "open_invoices" if open_only else "invoice_history"
+    return export_response(data.INVOICE_EXPORT_HEADER, data.iter_invoice_history(open_only=open_only),
+                           f"{name}_{today}", fmt=format, sheet_name="Invoices")
 
 
 # ============================================================================
@@ -664,147 +727,64 @@ async def payment_link_stats(request: Request):
 # Aging Invoice Upload API
 # ============================================================================
 
-def _parse_currency(val):
-    """Parse currency string like '$1,234.56' to float."""
-    if val is None:
-        return None
-    s = str(val).strip()
-    if not s:
-        return None
-    # Remove $, commas, spaces
-    s = re.sub(r'[$,\s]', '', s)
-    try:
-        return float(s)
-    except (ValueError, TypeError):
-        return None
-
-
-def _parse_date(val):
-    """Parse date string in various formats to YYYY-MM-DD."""
-    if val is None:
-        return None
-    s = str(val).strip()
-    if not s:
-        return None
-    for fmt in ('%m/%d/%Y', '%Y-%m-%d', '%m-%d-%Y', '%m/%d/%y', '%Y/%m/%d'):
-        try:
-            return datetime.strptime(s, fmt).strftime('%Y-%m-%d')
-        except ValueError:
-            continue
-    return None
-
+async def _start_staged_upload(request: Request, file: UploadFile, kind: str,
+                               background_tasks: BackgroundTasks):
+    """Stage an upload with COPY, then merge it after the response is sent.
 
-def _normalize_header(h):
-    """Normalize CSV header to a standard key."""
-    h = h.strip().lower().replace(' ', '_')
-    mapping = {
-        'invoice_number': 'invoice_number',
-        'invoice': 'invoice_number',
-        'inv_number': 'invoice_number',
-        'inv_#': 'invoice_number',
-        'inv': 'invoice_number',
-        'client': 'client_name',
-        'client_name': 'client_name',
-        'case': 'case_name',
-        'case_name': 'case_name',
-        'matter': 'case_name',
-        'amount_overdue': 'amount_overdue',
-        'amount_due': 'amount_overdue',
-        'overdue': 'amount_overdue',
-        'balance': 'amount_overdue',
-        'balance_due': 'amount_overdue',
-        'invoice_total': 'invoice_total',
-        'total': 'invoice_total',
-        'total_amount': 'invoice_total',
-        'amount_paid': 'amount_paid',
-        'paid': 'amount_paid',
-        'paid_amount': 'amount_paid',
-        'due_date': 'due_date',
-        'due': 'due_date',
-        'status': 'status',
-        'days_aging': 'days_aging',
-        'days': 'days_aging',
-        'dpd': 'days_aging',
-        'days_overdue': 'days_aging',
-        'aging': 'days_aging',
-    }
-    return mapping.get(h, h)
-
-
-@router.post("/api/aging-upload")
-async def api_aging_upload(request: Request, file: UploadFile = File(...)):
-    """Upload an aging invoice report CSV."""
-    if not is_authenticated(request):
-        return JSONResponse({"error": "Unauthorized"}, status_code=401)
+    Returns 202 with a job_id; poll /api/uploads/{job_id} for progress.
+    """
+    from db.ingest import create_upload_job, update_upload_job, discard_staging_rows, merge_upload_job
+    from dashboard.ingest import stage_upload, UploadError
 
     firm_id = request.session.get("firm_id")
     if not firm_id:
         return JSONResponse({"error": "No firm_id in session"}, status_code=400)
 
+    job_id = None
     try:
-        content = await file.read()
-        text = content.decode('utf-8-sig')  # Handle BOM
-        reader = csv_mod.DictReader(io.StringIO(text))
+        job_id = create_upload_job(firm_id, kind, file.filename, request.session.get("username"))
+        rows_staged = await run_in_threadpool(stage_upload, job_id, kind, file.file, file.filename)
+    except Exception as e:
+        if job_id:
+            update_upload_job(job_id, status="failed", error=str(e)[:500])
+            discard_staging_rows(job_id, kind)
+        if isinstance(e, UploadError):
+            return JSONResponse({"error": str(e)}, status_code=400)
+        return JSONResponse({"error": f"Upload failed: {str(e)}"}, status_code=500)
 
-        # Normalize headers
-        if not reader.fieldnames:
-            return JSONResponse({"error": "CSV file has no headers"}, status_code=400)
+    background_tasks.add_task(merge_upload_job, job_id)
+    return JSONResponse({
+        "success": True,
+        "job_id": job_id,
+        "status": "staged",
+        "rows_staged": rows_staged,
+        "filename": file.filename,
+    }, status_code=202)
 
-        header_map = {}
-        for h in reader.fieldnames:
-            header_map[h] = _normalize_header(h)
 
-        batch_id = str(uuid.uuid4())
-        rows_imported = 0
+@router.get("/api/uploads/{job_id}")
+async def api_upload_job(request: Request, job_id: str):
+    """Progress of a staged aging/trust upload."""
+    if not is_authenticated(request):
+        return JSONResponse({"error": "Unauthorized"}, status_code=401)
 
-        with get_connection() as conn:
-            cursor = conn.cursor()
+    from db.ingest import get_upload_job
+    job = await run_in_threadpool(get_upload_job, request.session.get("firm_id"), job_id)
+    if not job:
+        return JSONResponse({"error": "Upload not found"}, status_code=404)
+    job["created_at"] = job["created_at"].isoformat() if job["created_at"] else None
+    job["updated_at"] = job["updated_at"].isoformat() if job["updated_at"] else None
+    return JSONResponse(job)
 
-            for row in reader:
-                # Map to normalized keys
-                mapped = {}
-                for orig_key, val in row.items():
-                    norm_key = header_map.get(orig_key, orig_key)
-                    mapped[norm_key] = val
-
-                invoice_number = (mapped.get('invoice_number') or '').strip()
-                if not invoice_number:
-                    continue
-
-                cursor.execute("""
-                    INSERT INTO aging_invoice_uploads
-                        (firm_id, invoice_number, client_name, case_name,
-                         amount_overdue, invoice_total, amount_paid,
-                         due_date, status, days_aging, upload_batch_id)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                """, (
-                    firm_id,
-                    invoice_number,
-                    (mapped.get('client_name') or '').strip(),
-                    (mapped.get('case_name') or '').strip(),
-                    _parse_currency(mapped.get('amount_overdue')),
-                    _parse_currency(mapped.get('invoice_total')),
-                    _parse_currency(mapped.get('amount_paid')),
-                    _parse_date(mapped.get('due_date')),
-                    (mapped.get('status') or '').strip(),
-                    int(mapped['days_aging']) if mapped.get('days_aging') and str(mapped['days_aging']).strip().isdigit() else None,
-                    batch_id,
-                ))
-                rows_imported += 1
-
-            conn.commit()
 
-        return JSONResponse({
-            "success": True,
-            "rows_imported": rows_imported,
-            "batch_id": batch_id,
-            "filename": file.filename,
-        })
+@router.post("/api/aging-upload")
+async def api_aging_upload(request: Request, background_tasks: BackgroundTasks,
+                           file: UploadFile = File(...)):
+    """Upload an aging invoice report (CSV or XLSX)."""
+    if not is_authenticated(request):
+        return JSONResponse({"error": "Unauthorized"}, status_code=401)
 
-    except UnicodeDecodeError:
-        return JSONResponse({"error": "File is not a valid CSV (encoding error)"}, status_code=400)
-    except Exception as e:
-        return JSONResponse({"error": f"Upload failed: {str(e)}"}, status_code=500)
+    return await _start_staged_upload(request, file, "aging", background_tasks)
 
 
 @router.get("/api/aging-upload/history")
@@ -845,38 +825,10 @@ async def api_aging_upload_history(request: Request):
 # Trust Ledger Upload
 # ============================================================================
 
-def _normalize_trust_header(h: str) -> str:
-    """Map various trust ledger CSV column names to internal names."""
-    h = h.strip().lower().replace(' ', '_').replace('-', '_')
-    mapping = {
-        'case': 'case_number',
-        'case_no': 'case_number',
-        'case_num': 'case_number',
-        'case_number': 'case_number',
-        'matter': 'case_name',
-        'matter_name': 'case_name',
-        'case_name': 'case_name',
-        'case_description': 'case_name',
-        'client': 'client_name',
-        'client_name': 'client_name',
-        'contact': 'client_name',
-        'contact_name': 'client_name',
-        'balance': 'trust_balance',
-        'trust_balance': 'trust_balance',
-        'trust': 'trust_balance',
-        'trust_amount': 'trust_balance',
-        'amount': 'trust_balance',
-        'current_balance': 'trust_balance',
-        'account_balance': 'trust_balance',
-        'total': 'trust_balance',
-        'total_balance': 'trust_balance',
-    }
-    return mapping.get(h, h)
-
-
 @router.post("/api/trust-upload")
-async def api_trust_upload(request: Request, file: UploadFile = File(...)):
-    """Upload a trust account ledger CSV."""
+async def api_trust_upload(request: Request, background_tasks: BackgroundTasks,
+                           file: UploadFile = File(...)):
+    """Upload a trust account ledger (CSV or XLSX)."""
     if not is_authenticated(request):
         return JSONResponse({"error": "Unauthorized"}, status_code=401)
 
@@ -884,109 +836,7 @@ async def api_trust_upload(request: Request, file: UploadFile = File(...)):
     if role != 'admin':
         return JSONResponse({"error": "Admin only"}, status_code=403)
 
-    firm_id = request.session.get("firm_id")
-    if not firm_id:
-        return JSONResponse({"error": "No firm_id in session"}, status_code=400)
-
-    try:
-        content = await file.read()
-        text = content.decode('utf-8-sig')
-        reader = csv_mod.DictReader(io.StringIO(text))
-
-        if not reader.fieldnames:
-            return JSONResponse({"error": "CSV file has no headers"}, status_code=400)
-
-        header_map = {}
-        for h in reader.fieldnames:
-            header_map[h] = _normalize_trust_header(h)
-
-        batch_id = str(uuid.uuid4())
-        rows_imported = 0
-        rows_matched = 0
-
-        with get_connection() as conn:
-            cursor = conn.cursor()
-
-            # Build a lookup for matching: case_number -> case_id, name -> case_id
-            cursor.execute("""
-                SELECT id, case_number, name FROM cached_cases
-                WHERE firm_id = %s AND status = 'open'
-            """, (firm_id,))
-            case_by_number = {}
-            case_by_name = {}
-            for r in cursor.fetchall():
-                r = dict(r)
-                if r["case_number"]:
-                    case_by_number[r["case_number"].strip().lower()] = r["id"]
-                if r["name"]:
-                    case_by_name[r["name"].strip().lower()] = r["id"]
-
-            for row in reader:
-                mapped = {}
-                for orig_key, val in row.items():
-                    norm_key = header_map.get(orig_key, orig_key)
-                    mapped[norm_key] = val
-
-                trust_balance = _parse_currency(mapped.get('trust_balance'))
-                case_number = (mapped.get('case_number') or '').strip()
-                case_name = (mapped.get('case_name') or '').strip()
-                client_name = (mapped.get('client_name') or '').strip()
-
-                # Skip rows with no balance
-                if trust_balance is None or trust_balance == 0:
-                    continue
-
-                # Try to match to a case
-                case_id = None
-                match_method = None
-
-                if case_number:
-                    case_id = case_by_number.get(case_number.lower())
-                    if case_id:
-                        match_method = 'case_number'
-
-                if not case_id and case_name:
-                    case_id = case_by_name.get(case_name.lower())
-                    if case_id:
-                        match_method = 'case_name'
-
-                # Fuzzy match by client name in case name
-                if not case_id and client_name:
-                    client_lower = client_name.lower()
-                    for name, cid in case_by_name.items():
-                        if client_lower in name:
-                            case_id = cid
-                            match_method = 'client_name_fuzzy'
-                            break
-
-                cursor.execute("""
-                    INSERT INTO trust_ledger_uploads
-                        (firm_id, upload_batch_id, case_id, case_number,
-                         case_name, client_name, trust_balance, match_method)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                """, (
-                    firm_id, batch_id, case_id, case_number or None,
-                    case_name or None, client_name or None,
-                    trust_balance, match_method,
-                ))
-                rows_imported += 1
-                if case_id:
-                    rows_matched += 1
-
-            conn.commit()
-
-        return JSONResponse({
-            "success": True,
-            "rows_imported": rows_imported,
-            "rows_matched": rows_matched,
-            "batch_id": batch_id,
-            "filename": file.filename,
-        })
-
-    except UnicodeDecodeError:
-        return JSONResponse({"error": "File is not a valid CSV (encoding error)"}, status_code=400)
-    except Exception as e:
-        return JSONResponse({"error": f"Upload failed: {str(e)}"}, status_code=500)
+    return await _start_staged_upload(request, file, "trust", background_tasks)
 
 
 @router.get("/api/trust-upload/history")
@@ -1196,35 +1046,61 @@ Example - user asks "Show billing by attorney":
 """
 
 
-def execute_chat_query(sql: str) -> tuple[list[dict], str | None]:
-    """Execute a SQL query against the PostgreSQL MyCase cache database."""
+def execute_chat_query(sql: str, firm_id: str | None) -> tuple[list[dict], str | None, bool]:
+    """Execute chat-generated SQL in the read-only, firm-scoped sandbox (db/chat_sandbox.py).
+
+    Returns (rows, error, truncated); truncated means the sandbox capped the rows.
+    """
+    from db.chat_sandbox import run_chat_query
+
     try:
-        # Bypass connection pool to get a plain tuple cursor
-        # (pool sets RealDictCursor which causes dict iteration issues)
-        import psycopg2
-        import os
-        raw_conn = psycopg2.connect(os.environ.get("DATABASE_URL", ""))
-        try:
-            cursor = raw_conn.cursor()
-            cursor.execute(sql)
+        rows, truncated = run_chat_query(sql, firm_id)
+        return rows, None, truncated
+    except Exception as e:
+        return [], str(e), False
 
-            # Get column names from cursor description
-            column_names = [desc[0] for desc in cursor.description]
 
-            # Fetch all rows as plain tuples, zip with column names
-            rows = []
-            for row in cursor.fetchall():
-                rows.append(dict(zip(column_names, row)))
+def _cached_chat_answer(firm_id: str, question: str) -> tuple[str | None, int | None]:
+    """Answer ``question`` from the chat cache if possible. Returns (response, sync generation)."""
+    from dashboard.middleware import cached_sync_generation
+    from db.chat_cache import lookup_chat_answer, refresh_chat_answer
 
-            return rows, None
-        finally:
-            raw_conn.close()
+    generation = cached_sync_generation(firm_id)
+    try:
+        hit = lookup_chat_answer(firm_id, question)
+    except Exception as e:
+        logger.warning("Chat cache lookup failed: %s", e)
+        return None, generation
+    if hit is None:
+        return None, generation
+    if not hit["sql"] or (generation is not None and hit["sync_generation"] == generation):
+        return hit["response"], generation
+
+    rows, error, truncated = execute_chat_query(hit["sql"], firm_id)
+    if error:
+        return None, generation
+    response = format_query_results(rows, hit["explanation"] or "", truncated)
+    try:
+        refresh_chat_answer(hit["id"], response, generation)
     except Exception as e:
-        return [], str(e)
+        logger.warning("Chat cache refresh failed: %s", e)
+    return response, generation
 
 
-def format_query_results(rows: list[dict], explanation: str) -> str:
-    """Format query results as a markdown response."""
+def _store_chat_answer(firm_id, question, response, generation, sql=None, explanation=None):
+    from db.chat_cache import store_chat_answer
+    try:
+        store_chat_answer(firm_id, question, response, generation, sql, explanation)
+    except Exception as e:
+        logger.warning("Chat cache store failed: %s", e)
+
+
+def format_query_results(rows: list[dict], explanation: str, truncated: bool = False) -> str:
+    """Format query results as a markdown response.
+
+    ``truncated`` marks results the sandbox capped (CHAT_QUERY_MAX_ROWS or
+    the size limit); the response says so.
+    """
     if not rows:
         return "No results found."
 
@@ -1290,7 +1166,9 @@ def format_query_results(rows: list[dict], explanation: str) -> str:
                 formatted_values.append(str(val))
         result += "| " + " | ".join(formatted_values) + " |\n"
 
-    if len(rows) == 20:
+    if truncated:
+        result += f"\n*Results capped at {len(rows):,} rows — narrow the question to see the rest*"
+    elif len(rows) == 20:
         result += "\n*Results limited to 20 rows*"
 
     return result
@@ -1310,21 +1188,15 @@ async def api_chat(request: Request):
         if not user_message:
             return JSONResponse({"error": "No message provided"})
 
-        # Initialize Claude client (Bedrock by default; ANTHROPIC_API_KEY direct
-        # path available via LLM_PROVIDER=claude). See skills/base.py for the
-        # shared client factory + model map.
-        from skills.base import get_claude_client, resolve_bedrock_model
-        try:
-            client = get_claude_client()
-        except RuntimeError as exc:
-            return JSONResponse({"error": f"AI service not configured: {exc}"})
-
-        model_short = "claude-opus-4-7"
-        model_id = (
-            resolve_bedrock_model(model_short)
-            if isinstance(client, anthropic.AnthropicBedrock)
-            else model_short
-        )
+        # Context-free questions can be answered from the firm's answer cache
+        # (db/chat_cache.py): same data -> stored answer, newer sync -> re-run its SQL
+        firm_id = get_current_firm_id(request)
+        cacheable = bool(firm_id) and not history
+        generation = None
+        if cacheable:
+            cached, generation = await run_in_threadpool(_cached_chat_answer, firm_id, user_message)
+            if cached is not None:
+                return JSONResponse({"response": cached, "cached": True})
 
         # Build messages list with conversation history for context
         messages = []
@@ -1336,16 +1208,18 @@ async def api_chat(request: Request):
                     messages.append({"role": role, "content": content})
         messages.append({"role": "user", "content": user_message})
 
-        # Call Claude to interpret the query
-        response = client.messages.create(
-            model=model_id,
-            max_tokens=1024,
-            system=CHAT_SYSTEM_PROMPT,
-            messages=messages,
-        )
-
-        # Parse Claude's response
-        assistant_text = response.content[0].text
+        # Call Claude to interpret the query. The shared async client
+        # (skills/llm.py; Bedrock by default, LLM_PROVIDER=claude for the
+        # direct API) keeps the event loop free while the model runs.
+        from skills.llm import LLMBusy, acomplete
+        try:
+            assistant_text = await acomplete(
+                firm_id, messages, system=CHAT_SYSTEM_PROMPT, max_tokens=1024, feature="chat",
+            )
+        except LLMBusy as exc:
+            return JSONResponse({"error": str(exc)}, status_code=429)
+        except RuntimeError as exc:
+            return JSONResponse({"error": f"AI service not configured: {exc}"})
 
         # Try to parse as JSON
         try:
@@ -1363,19 +1237,26 @@ async def api_chat(request: Request):
                 sql = parsed.get("sql", "")
                 explanation = parsed.get("explanation", "")
 
-                rows, error = execute_chat_query(sql)
+                rows, error, truncated = await run_in_threadpool(
+                    execute_chat_query, sql, get_current_firm_id(request))
 
                 if error:
                     return JSONResponse({
                         "response": f"**Query Error:** {error}\n\nPlease try rephrasing your question."
                     })
 
-                formatted = format_query_results(rows, explanation)
+                formatted = format_query_results(rows, explanation, truncated)
+                if cacheable:
+                    await run_in_threadpool(_store_chat_answer, firm_id, user_message, formatted,
+                                            generation, sql, explanation)
                 return JSONResponse({"response": formatted})
 
             else:
                 # Text response
-                return JSONResponse({"response": parsed.get("response", assistant_text)})
+                text = parsed.get("response", assistant_text)
+                if cacheable:
+                    await run_in_threadpool(_store_chat_answer, firm_id, user_message, text, generation)
+                return JSONResponse({"response": text})
 
         except json.JSONDecodeError:
             # JSON parsing failed - try to extract and execute SQL if present
@@ -1401,14 +1282,15 @@ async def api_chat(request: Request):
 
             if sql_match:
                 # Found SQL - execute it
-                rows, error = execute_chat_query(sql_match)
+                rows, error, truncated = await run_in_threadpool(
+                    execute_chat_query, sql_match, get_current_firm_id(request))
 
                 if error:
                     return JSONResponse({
                         "response": f"**Query Error:** {error}\n\nPlease try rephrasing your question."
                     })
 
-                formatted = format_query_results(rows, "")
+                formatted = format_query_results(rows, "", truncated)
                 return JSONResponse({"response": formatted})
 
             # No SQL found - return the text response but clean it up
@@ -1426,6 +1308,46 @@ async def api_chat(request: Request):
         return JSONResponse({"error": f"Chat error: {str(e)}"})
 
 
+@router.get("/api/llm/stats")
+async def api_llm_stats(request: Request):
+    """The logged-in firm's LLM usage and prompt cache hit rates per feature (this worker process)."""
+    if not is_authenticated(request):
+        return JSONResponse({"error": "Unauthorized"}, status_code=401)
+    if get_current_role(request) != 'admin':
+        return JSONResponse({"error": "Admin only"}, status_code=403)
+    firm_id = request.session.get("firm_id")
+    if not firm_id:
+        return JSONResponse({"error": "No firm_id in session"}, status_code=400)
+
+    from skills.llm import get_llm_stats
+    return JSONResponse({"pid": os.getpid(), "features": get_llm_stats(firm_id)})
+
+
+@router.get("/api/llm/usage")
+async def api_llm_usage(request: Request, days: int = 7, daily: bool = False):
+    """The logged-in firm's LLM calls, tokens, latency and estimated cost.
+
+    Totals per feature/model (costliest first), or with ?daily=1 the
+    per-day rollup.
+    """
+    if not is_authenticated(request):
+        return JSONResponse({"error": "Unauthorized"}, status_code=401)
+    if get_current_role(request) != 'admin':
+        return JSONResponse({"error": "Admin only"}, status_code=403)
+
+    from fastapi.encoders import jsonable_encoder
+    from db.llm_telemetry import get_llm_usage, get_llm_usage_daily
+
+    firm_id = request.session.get("firm_id")
+    if not firm_id:
+        return JSONResponse({"error": "No firm_id in session"}, status_code=400)
+    if daily:
+        rows = await run_in_threadpool(get_llm_usage_daily, firm_id, days)
+    else:
+        rows = await run_in_threadpool(get_llm_usage, days, firm_id)
+    return JSONResponse(jsonable_encoder({"days": days, "rows": rows}))
+
+
 # ============================================================================
 # Docket Management API
 # ============================================================================
@@ -1518,57 +1440,19 @@ async def case_detail(request: Request, case_id: int):
         return RedirectResponse(url="/login", status_code=303)
 
     try:
-        # Get case info from cache using db functions
-        with get_connection() as conn:
-            cursor = conn.cursor()
-
-            # Get case details
-            cursor.execute(
-                "SELECT * FROM cached_cases WHERE id = %s",
-                (case_id,)
-            )
-            case_row = cursor.fetchone()
-
-            if not case_row:
-                return HTMLResponse("<h1>Case not found</h1>", status_code=404)
-
-            # Convert to dict
-            case_info = {}
-            if case_row:
-                column_names = [desc[0] for desc in cursor.description]
-                case_info = dict(zip(column_names, case_row))
-
-            # Get docket entries
-            cursor.execute(
-                """SELECT * FROM cached_docket_entries
-                   WHERE case_id = %s
-                   ORDER BY entry_date DESC, id DESC""",
-                (case_id,)
-            )
-            docket_rows = cursor.fetchall()
-            docket_column_names = [desc[0] for desc in cursor.description]
-            docket_entries = [dict(zip(docket_column_names, row)) for row in docket_rows]
-
-            # Get documents
-            cursor.execute(
-                """SELECT * FROM cached_documents
-                   WHERE case_id = %s
-                   ORDER BY created_at DESC""",
-                (case_id,)
-            )
-            doc_rows = cursor.fetchall()
-            doc_column_names = [desc[0] for desc in cursor.description]
-            documents = [dict(zip(doc_column_names, row)) for row in doc_rows]
+        from db.case_bundle import load_case_bundle
+        bundle = load_case_bundle(get_current_firm_id(request), case_id)
 
-        if not case_info:
+        if bundle is None:
             return HTMLResponse("<h1>Case not found</h1>", status_code=404)
 
         return templates.TemplateResponse("case_detail.html", {
             "request": request,
             "username": request.session.get("username"),
-            "case": case_info,
-            "docket_entries": docket_entries,
-            "documents": documents,
+            "case": bundle.case,
+            "bundle": bundle,
+            "docket_entries": bundle.docket_entries,
+            "documents": bundle.documents,
         })
     except Exception as e:
         return HTMLResponse(f"<h1>Error loading case</h1><p>{str(e)}</p>", status_code=500)
@@ -1597,9 +1481,71 @@ async def documents_page(request: Request):
     })
 
 
+def _get_doc_chat_engine(request: Request, session_id: str = None):
+    """Return (engine, session_id), creating an engine for a new session.
+
+    Sessions live in the shared store (dashboard/doc_sessions.py), so a
+    conversation can continue on any worker. Blocking; run in a threadpool.
+    """
+    from dashboard.doc_sessions import get_doc_session_store
+
+    store = get_doc_session_store()
+    firm_id = request.session.get("firm_id", "jcs_law")
+    if session_id:
+        chat_engine = store.get(session_id, firm_id)
+        if chat_engine is not None:
+            return chat_engine, session_id
+
+    # Create new session — use session firm_id and attorney profile
+    attorney_id, attorney_name_override = _session_attorney(request, firm_id)
+    return store.create(firm_id, attorney_id, attorney_name_override)
+
+
+def _session_attorney(request: Request, firm_id: str):
+    """(attorney_id, attorney_name_override) for documents signed by the logged-in user."""
+    attorney_id = None
+    attorney_name_override = None
+
+    # If logged-in user is an attorney, auto-set them as signing attorney
+    attorney_name = request.session.get("attorney_name")
+    if attorney_name:
+        try:
+            from attorney_profiles import get_attorney_by_name
+            atty = get_attorney_by_name(firm_id, attorney_name)
+            if atty and atty.id:
+                attorney_id = atty.id
+            else:
+                # Attorney has no profile — use primary for firm details
+                # but override the name for signing
+                attorney_name_override = attorney_name
+        except Exception:
+            attorney_name_override = attorney_name
+
+    return attorney_id, attorney_name_override
+
+
+def _save_doc_chat_engine(request: Request, session_id: str, chat_engine):
+    """Persist the engine after a turn so other workers see it."""
+    from dashboard.doc_sessions import get_doc_session_store
+
+    get_doc_session_store().save(session_id, chat_engine, request.session.get("username"))
+
+
+def _doc_chat_download_url(chat_engine, session_id: str):
+    """Download link for the session's document, served from any worker."""
+    session = chat_engine.get_session()
+    if session.output_path and (session.output_path.exists() or session.draft_document):
+        return f"/api/documents/download/{session_id}"
+    return None
+
+
 @router.post("/api/documents/chat")
 async def api_documents_chat(request: Request):
-    """Document generation chat API endpoint."""
+    """Document generation chat API endpoint.
+
+    Body: {"message", "session_id"?, "case_id"?}. With case_id, template
+    variables are prefilled from the cached case before asking the user.
+    """
     if not is_authenticated(request):
         return JSONResponse({"error": "Unauthorized"}, status_code=401)
 
@@ -1610,60 +1556,31 @@ async def api_documents_chat(request: Request):
 
         if not user_message:
             return JSONResponse({"error": "No message provided"})
+        case_id = body.get("case_id")
+        if case_id:
+            try:
+                case_id = int(case_id)
+            except (TypeError, ValueError):
+                return JSONResponse({"error": "case_id must be an integer"}, status_code=400)
 
-        # Import document chat engine
+        # Get or create session
         try:
-            from document_chat import DocumentChatEngine
+            chat_engine, session_id = await run_in_threadpool(_get_doc_chat_engine, request, session_id)
         except ImportError as e:
             return JSONResponse({"error": f"Document system not available: {e}"})
 
-        # Get or create session
-        if session_id and session_id in _doc_sessions:
-            chat_engine = _doc_sessions[session_id]
-        else:
-            # Create new session — use session firm_id and attorney profile
-            firm_id = request.session.get("firm_id", "jcs_law")
-            attorney_id = None
-            attorney_name_override = None
-
-            # If logged-in user is an attorney, auto-set them as signing attorney
-            attorney_name = request.session.get("attorney_name")
-            if attorney_name:
-                try:
-                    from attorney_profiles import get_attorney_by_name
-                    atty = get_attorney_by_name(firm_id, attorney_name)
-                    if atty and atty.id:
-                        attorney_id = atty.id
-                    else:
-                        # Attorney has no profile — use primary for firm details
-                        # but override the name for signing
-                        attorney_name_override = attorney_name
-                except Exception:
-                    attorney_name_override = attorney_name
-
-            chat_engine = DocumentChatEngine(
-                firm_id=firm_id,
-                attorney_id=attorney_id,
-                attorney_name_override=attorney_name_override,
-            )
-            session_id = f"doc_{datetime.now().strftime('%Y%m%d%H%M%S')}_{id(chat_engine)}"
-            _doc_sessions[session_id] = chat_engine
-
-        # Get response from document chat
-        response_text = chat_engine.chat(user_message)
+        # Optional case the document is for — variables prefill from it
+        if case_id:
+            chat_engine.select_case(case_id)
 
-        # Check if a document was generated
-        download_url = None
-        session = chat_engine.get_session()
-        if session.output_path and session.output_path.exists():
-            # Create download URL using the filename
-            filename = session.output_path.name
-            download_url = f"/api/documents/download-file/{filename}"
+        # The engine makes blocking LLM calls; keep them off the event loop
+        response_text = await run_in_threadpool(chat_engine.chat, user_message)
+        await run_in_threadpool(_save_doc_chat_engine, request, session_id, chat_engine)
 
         return JSONResponse({
             "response": response_text,
             "session_id": session_id,
-            "download_url": download_url
+            "download_url": _doc_chat_download_url(chat_engine, session_id),
         })
 
     except Exception as e:
@@ -1672,25 +1589,108 @@ async def api_documents_chat(request: Request):
         return JSONResponse({"error": str(e)})
 
 
+@router.post("/api/documents/chat/stream")
+async def api_documents_chat_stream(request: Request):
+    """
+    Document generation chat over Server-Sent Events.
+
+    Same request body as /api/documents/chat. Emits "delta" events with
+    draft text as the model writes it, then one "done" event carrying the
+    same fields /api/documents/chat returns (or an "error" event).
+    """
+    if not is_authenticated(request):
+        return JSONResponse({"error": "Unauthorized"}, status_code=401)
+
+    body = await request.json()
+    user_message = body.get("message", "").strip()
+    if not user_message:
+        return JSONResponse({"error": "No message provided"})
+    case_id = body.get("case_id")
+    if case_id:
+        try:
+            case_id = int(case_id)
+        except (TypeError, ValueError):
+            return JSONResponse({"error": "case_id must be an integer"}, status_code=400)
+
+    try:
+        chat_engine, session_id = await run_in_threadpool(
+            _get_doc_chat_engine, request, body.get("session_id"))
+    except ImportError as e:
+        return JSONResponse({"error": f"Document system not available: {e}"})
+    except Exception as e:
+        return JSONResponse({"error": str(e)})
+
+    if case_id:
+        chat_engine.select_case(case_id)
+
+    from phone.delivery import format_sse_event
+
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+
+    def on_text(chunk: str):
+        loop.call_soon_threadsafe(queue.put_nowait, ("delta", {"text": chunk}))
+
+    def run_chat():
+        response_text = chat_engine.chat(user_message, on_text=on_text)
+        _save_doc_chat_engine(request, session_id, chat_engine)
+        return response_text
+
+    async def event_generator():
+        task = asyncio.ensure_future(run_in_threadpool(run_chat))
+        task.add_done_callback(lambda _: queue.put_nowait(("_end", None)))
+        while True:
+            kind, data = await queue.get()
+            if kind == "_end":
+                break
+            yield format_sse_event(data, event_type=kind)
+        try:
+            response_text = task.result()
+        except Exception as e:
+            yield format_sse_event({"error": str(e)}, event_type="error")
+            return
+        yield format_sse_event({
+            "response": response_text,
+            "session_id": session_id,
+            "download_url": _doc_chat_download_url(chat_engine, session_id),
+        }, event_type="done")
+
+    return StreamingResponse(
+        event_generator(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+        },
+    )
+
+
 @router.get("/api/documents/download/{session_id}")
 async def api_documents_download(request: Request, session_id: str):
     """Download generated document by session ID."""
     if not is_authenticated(request):
         return JSONResponse({"error": "Unauthorized"}, status_code=401)
 
-    if session_id not in _doc_sessions:
+    from dashboard.doc_sessions import get_doc_session_store
+
+    chat_engine = await run_in_threadpool(
+        get_doc_session_store().get, session_id, request.session.get("firm_id", "jcs_law"))
+    if chat_engine is None:
         return JSONResponse({"error": "Session not found"}, status_code=404)
 
-    chat_engine = _doc_sessions[session_id]
     session = chat_engine.get_session()
 
-    if not session.output_path or not session.output_path.exists():
+    # Prefer the file on disk; fall back to the persisted draft bytes when
+    # the session was restored on a worker that didn't write the file
+    if session.output_path and session.output_path.exists():
+        content = session.output_path.read_bytes()
+        filename = session.output_path.name
+    elif session.draft_document and session.output_path:
+        content = session.draft_document
+        filename = session.output_path.name
+    else:
         return JSONResponse({"error": "No document generated"}, status_code=404)
 
-    # Read file and return as download
-    content = session.output_path.read_bytes()
-    filename = session.output_path.name
-
     return StreamingResponse(
         io.BytesIO(content),
         media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
@@ -1727,3 +1727,137 @@ async def api_documents_download_file(request: Request, filename: str):
         media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
         headers={"Content-Disposition": f"attachment; filename={file_path.name}"}
     )
+
+
+DOC_BATCH_MAX_CASES = 2000
+
+
+def _doc_batch_firm_tag(firm_id: str) -> str:
+    return hashlib.sha256(firm_id.encode()).hexdigest()[:16]
+
+
+def _doc_batch_task_id(firm_id: str) -> str:
+    """Task id carrying a tag of the owning firm.
+
+    A failed task's result is just the exception, so ownership has to be
+    checkable from the id itself.
+    """
+    return f"{uuid.uuid4().hex}-{_doc_batch_firm_tag(firm_id)}"
+
+
+def _doc_batch_owned(task_id: str, firm_id: str) -> bool:
+    return task_id.endswith(f"-{_doc_batch_firm_tag(firm_id)}")
+
+
+@router.post("/api/documents/batch")
+async def api_documents_batch(request: Request):
+    """Queue one template to be filled for many cases.
+
+    Body: {"template_id", "case_ids": [...], "values"?: {...}}. ``values``
+    apply to every case on top of its cached record. Returns the task_id to
+    poll at /api/documents/batch/{task_id}.
+    """
+    if not is_authenticated(request):
+        return JSONResponse({"error": "Unauthorized"}, status_code=401)
+
+    body = await request.json()
+    try:
+        template_id = int(body.get("template_id"))
+        case_ids = [int(c) for c in body.get("case_ids") or []]
+    except (TypeError, ValueError):
+        return JSONResponse({"error": "template_id and case_ids must be integers"}, status_code=400)
+    values = body.get("values") or {}
+    if not case_ids:
+        return JSONResponse({"error": "No case_ids provided"}, status_code=400)
+    if len(case_ids) > DOC_BATCH_MAX_CASES:
+        return JSONResponse({"error": f"At most {DOC_BATCH_MAX_CASES} cases per batch"}, status_code=400)
+    if not isinstance(values, dict):
+        return JSONResponse({"error": "values must be an object"}, status_code=400)
+
+    from celery_app import app as celery_app
+
+    firm_id = request.session.get("firm_id", "jcs_law")
+    attorney_id, attorney_name_override = await run_in_threadpool(_session_attorney, request, firm_id)
+    try:
+        task = await run_in_threadpool(
+            celery_app.send_task, "tasks.generate_document_batch",
+            task_id=_doc_batch_task_id(firm_id),
+            kwargs={
+                "firm_id": firm_id,
+                "template_id": template_id,
+                "case_ids": case_ids,
+                "values": {str(k): str(v) for k, v in values.items()},
+                "attorney_id": attorney_id,
+                "attorney_name_override": attorney_name_override,
+                "username": request.session.get("username"),
+            },
+        )
+    except Exception as e:
+        return JSONResponse({"error": f"Could not queue batch: {e}"}, status_code=503)
+    return {"task_id": task.id, "cases": len(case_ids)}
+
+
+def _doc_batch_result(task_id: str):
+    """(state, info) of a batch task. Blocking; run in a threadpool."""
+    from celery.result import AsyncResult
+    from celery_app import app as celery_app
+
+    result = AsyncResult(task_id, app=celery_app)
+    return result.state, result.info
+
+
+@router.get("/api/documents/batch/{task_id}")
+async def api_documents_batch_status(request: Request, task_id: str):
+    """Progress of a batch: PENDING, PROGRESS (done/total), SUCCESS or FAILURE."""
+    if not is_authenticated(request):
+        return JSONResponse({"error": "Unauthorized"}, status_code=401)
+
+    firm_id = request.session.get("firm_id", "jcs_law")
+    if not _doc_batch_owned(task_id, firm_id):
+        return JSONResponse({"error": "Batch not found"}, status_code=404)
+    state, info = await run_in_threadpool(_doc_batch_result, task_id)
+    if isinstance(info, dict) and info.get("firm_id") not in (None, firm_id):
+        return JSONResponse({"error": "Batch not found"}, status_code=404)
+
+    response = {"task_id": task_id, "state": state}
+    if state == "PROGRESS":
+        response.update(done=info.get("done"), total=info.get("total"))
+    elif state == "SUCCESS":
+        response.update(
+            documents=info["documents"],
+            failed=info["failed"],
+            seconds=info["seconds"],
+            download_url=f"/api/documents/batch/{task_id}/download",
+        )
+    elif state == "FAILURE":
+        response["error"] = str(info)
+    return response
+
+
+@router.get("/api/documents/batch/{task_id}/download")
+async def api_documents_batch_download(request: Request, task_id: str):
+    """Download a finished batch as a .zip of .docx files."""
+    if not is_authenticated(request):
+        return JSONResponse({"error": "Unauthorized"}, status_code=401)
+
+    firm_id = request.session.get("firm_id", "jcs_law")
+    if not _doc_batch_owned(task_id, firm_id):
+        return JSONResponse({"error": "Batch not found"}, status_code=404)
+    state, info = await run_in_threadpool(_doc_batch_result, task_id)
+    if state != "SUCCESS" or info.get("firm_id") != firm_id:
+        return JSONResponse({"error": "Batch not found"}, status_code=404)
+
+    file_path = Path(info["path"])
+    if not file_path.exists():
+        return JSONResponse({"error": "Batch archive has expired"}, status_code=404)
+
+    def chunks():
+        with open(file_path, "rb") as f:
+            while chunk := f.read(1024 * 1024):
+                yield chunk
+
+    return StreamingResponse(
+        chunks(),
+        media_type="application/zip",
+        headers={"Content-Disposition": f"attachment; filename={file_path.name}"}
+    )
@@ -8,13 +8,15 @@ from fastapi.templating import Jinja2Templates
 from pathlib import Path
 
 from dashboard.auth import is_authenticated, get_data, get_current_role
+from dashboard.panels import panel, int_param
 
 router = APIRouter()
 templates = Jinja2Templates(directory=Path(__file__).parent.parent / "templates")
 
 
 @router.get("/ar", response_class=HTMLResponse)
-async def ar_dashboard(request: Request, year: int = None, view: str = None):
+async def ar_dashboard(request: Request, year: int = None, view: str = None,
+                       cursor: str = None, page_size: int = None):
     """AR/Collections dashboard."""
     if not is_authenticated(request):
         return RedirectResponse(url="/login", status_code=303)
@@ -23,49 +25,18 @@ async def ar_dashboard(request: Request, year: int = None, view: str = None):
     if role == 'attorney':
         return RedirectResponse(url="/attorneys", status_code=303)
 
-    data = get_data(request)
     current_year = datetime.now().year
     available_years = [2025, 2026]
 
     # View modes: None/year-based, "combined", "rolling6"
-    if view == "combined":
-        summary = data.get_combined_years_summary([2025, 2026])
-        year = None  # signal combined mode
-        ar_aging = {
-            'Collected': summary.get('total_collected', 0),
-            'Current': summary.get('ar_current', 0),
-            '0-30 days': summary.get('ar_0_30', 0),
-            '31-60 days': summary.get('ar_31_60', 0),
-            '61-90 days': summary.get('ar_61_90', 0),
-            '90+ days': summary.get('ar_90_plus', 0),
-        }
-        rolling = None
-    elif view == "rolling6":
-        rolling = data.get_rolling_6month_summary()
-        summary = rolling  # rolling has all the summary fields
-        ar_aging = {
-            'Current Outstanding': rolling.get('total_outstanding', 0),
-            '0-30 days': rolling.get('ar_0_30', 0),
-            '31-60 days': rolling.get('ar_31_60', 0),
-            '61-90 days': rolling.get('ar_61_90', 0),
-            '90+ days': rolling.get('ar_90_plus', 0),
-        }
-        year = None
+    if view in ("combined", "rolling6"):
+        year = None  # signal combined/rolling mode
     else:
+        view = None
         if year is None:
             year = current_year
-        summary = data.get_daily_collections_summary(year=year)
-        ar_aging = data.get_ar_aging_breakdown(year=year)
-        rolling = None
-
-    trend = data.get_collections_trend(days_back=30)
-    plans = data.get_payment_plans_summary()
 
-    # All open invoices with balance due — across ALL years, no year filter
-    open_invoices = data.get_open_invoices_list(min_days_overdue=0)
-    total_open_balance = sum(inv['balance_due'] for inv in open_invoices)
-    past_due_invoices = [inv for inv in open_invoices if inv['days_overdue'] > 0]
-    attorney_summary = data.get_open_invoices_by_attorney()
+    page_params = {k: v for k, v in request.query_params.items() if k != 'cursor'}
 
     return templates.TemplateResponse("ar.html", {
         "request": request,
@@ -73,20 +44,61 @@ async def ar_dashboard(request: Request, year: int = None, view: str = None):
         "view": view,
         "current_year": current_year,
         "available_years": available_years,
-        "summary": summary,
-        "ar_aging": ar_aging,
-        "trend": trend,
-        "plans": plans,
-        "rolling": rolling,
-        "open_invoices": open_invoices,
-        "past_due_invoices": past_due_invoices,
-        "total_open_balance": total_open_balance,
-        "attorney_summary": attorney_summary,
+        "panel_params": {"year": year, "view": view},
+        "invoice_params": dict(page_params, cursor=cursor),
         "username": request.session.get("username"),
         "role": role,
     })
 
 
+@panel("ar", "summary", "panels/ar_summary.html", deny_roles=("attorney",))
+def _ar_summary(data, params):
+    """Headline A/R stats for the selected period (lazy panel for /ar)."""
+    view = params.get("view")
+    rolling = None
+    if view == "combined":
+        summary = data.get_combined_years_summary([2025, 2026])
+    elif view == "rolling6":
+        rolling = data.get_rolling_6month_summary()
+        summary = rolling  # rolling has all the summary fields
+    else:
+        view = None
+        year = int_param(params, "year", datetime.now().year)
+        summary = data.get_daily_collections_summary(year=year)
+
+    return {
+        "view": view,
+        "summary": summary,
+        "rolling": rolling,
+        "plans": data.get_payment_plans_summary(),
+    }
+
+
+@panel("ar", "open_invoices", "panels/ar_open_invoices.html", deny_roles=("attorney",))
+def _ar_open_invoices(data, params):
+    """All open invoices with balance due — across ALL years, no year filter.
+
+    Totals come from one aggregate; the table renders a page at a time,
+    filtered server-side by ?q= (client/case/attorney) and ?aging=.
+    """
+    invoice_totals = data.get_open_invoices_totals(min_days_overdue=0)
+    invoice_page = data.get_open_invoices_page(min_days_overdue=0,
+                                               cursor=params.get("cursor"),
+                                               page_size=int_param(params, "page_size"),
+                                               search=params.get("q"),
+                                               aging=params.get("aging"))
+    return {
+        "search": params.get("q") or "",
+        "aging": params.get("aging") or "all",
+        "open_invoices": invoice_page.items,
+        "invoice_page": invoice_page,
+        "invoice_totals": invoice_totals,
+        "total_open_balance": invoice_totals['total_balance'],
+        "page_params": {k: v for k, v in params.items() if k != 'cursor'},
+        "attorney_summary": data.get_open_invoices_by_attorney(),
+    }
+
+
 @router.get("/wonky", response_class=HTMLResponse)
 async def wonky_invoices(request: Request):
     """Wonky invoices page."""
@@ -126,7 +138,8 @@ async def aging_upload_page(request: Request):
 
 
 @router.get("/dunning", response_class=HTMLResponse)
-async def dunning_preview(request: Request, stage: int = None):
+async def dunning_preview(request: Request, stage: int = None,
+                          cursor: str = None, page_size: int = None):
     """Dunning notices preview and approval dashboard."""
     if not is_authenticated(request):
         return RedirectResponse(url="/login", status_code=303)
@@ -137,7 +150,8 @@ async def dunning_preview(request: Request, stage: int = None):
 
     data = get_data(request)
     raw = data.get_dunning_summary()
-    raw_queue = data.get_dunning_queue(stage=stage)
+    queue_page = data.get_dunning_page(stage=stage, cursor=cursor, page_size=page_size)
+    queue_counts = data.get_dunning_queue_counts(stage=stage)
     history = data.get_dunning_history(limit=20)
 
     # Reshape summary keys to match template expectations
@@ -162,9 +176,7 @@ async def dunning_preview(request: Request, stage: int = None):
 
     # Reshape queue items to match template field names
     queue = []
-    sent_count = 0
-    unsent_count = 0
-    for inv in raw_queue:
+    for inv in queue_page.items:
         s = inv.get('stage', 1) or 1
         balance_due = inv.get('balance_due', 0) or 0
         amount_now_due = inv.get('amount_now_due')  # from aging report
@@ -172,10 +184,6 @@ async def dunning_preview(request: Request, stage: int = None):
         if amount_now_due is None:
             amount_now_due = balance_due  # fallback if no aging data
         already_sent = inv.get('already_sent', False)
-        if already_sent:
-            sent_count += 1
-        else:
-            unsent_count += 1
         queue.append({
             'invoice_number': inv.get('invoice_id', ''),
             'invoice_db_id': inv.get('invoice_db_id', 0),
@@ -198,10 +206,13 @@ async def dunning_preview(request: Request, stage: int = None):
         "request": request,
         "summary": summary,
         "queue": queue,
+        "queue_page": queue_page,
+        "queue_total": queue_counts['total'],
         "history": history,
         "current_stage": stage,
-        "sent_count": sent_count,
-        "unsent_count": unsent_count,
+        "sent_count": queue_counts['sent'],
+        "unsent_count": queue_counts['unsent'],
+        "page_params": {k: v for k, v in request.query_params.items() if k != 'cursor'},
         "username": request.session.get("username"),
         "role": role,
     })
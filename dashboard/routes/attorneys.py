@@ -11,6 +11,7 @@ from fastapi.templating import Jinja2Templates
 from pathlib import Path
 
 from dashboard.auth import is_authenticated, get_data, get_current_role, get_current_attorney_name
+from dashboard.panels import panel, int_param
 
 router = APIRouter()
 templates = Jinja2Templates(directory=Path(__file__).parent.parent / "templates")
@@ -37,22 +38,43 @@ async def attorneys_dashboard(request: Request, year: int = None, view: str = No
         if attorney_name:
             return RedirectResponse(url=f"/attorney/{attorney_name}", status_code=303)
 
-    data = get_data(request)
     current_year = datetime.now().year
     available_years = [2025, 2026]
 
     # View modes: None/year-based, "combined", "rolling6"
+    if view in ("combined", "rolling6"):
+        year = None
+    else:
+        view = None
+        if year is None:
+            year = current_year
+
+    return templates.TemplateResponse("attorneys.html", {
+        "request": request,
+        "year": year,
+        "view": view,
+        "current_year": current_year,
+        "available_years": available_years,
+        "panel_params": {"year": year, "view": view},
+        "username": request.session.get("username"),
+        "role": get_current_role(request),
+    })
+
+
+@panel("attorneys", "table", "panels/attorneys_table.html", deny_roles=("collections",))
+def _attorneys_table(data, params):
+    """Productivity rows with invoice aging merged in (lazy panel for /attorneys)."""
+    view = params.get("view")
+    year = None
     if view == "combined":
         productivity = data.get_attorney_productivity_combined([2025, 2026])
         aging = data.get_attorney_invoice_aging_combined([2025, 2026])
-        year = None
     elif view == "rolling6":
         productivity = data.get_attorney_productivity_rolling(months=6)
         aging = data.get_attorney_invoice_aging_rolling(months=6)
-        year = None
     else:
-        if year is None:
-            year = current_year
+        view = None
+        year = int_param(params, "year", datetime.now().year)
         productivity = data.get_attorney_productivity_data(year=year)
         aging = data.get_attorney_invoice_aging(year=year)
 
@@ -82,16 +104,7 @@ async def attorneys_dashboard(request: Request, year: int = None, view: str = No
             a.setdefault(k, v)
         p['aging'] = a
 
-    return templates.TemplateResponse("attorneys.html", {
-        "request": request,
-        "year": year,
-        "view": view,
-        "current_year": current_year,
-        "available_years": available_years,
-        "attorneys": productivity,
-        "username": request.session.get("username"),
-        "role": get_current_role(request),
-    })
+    return {"attorneys": productivity, "year": year, "view": view}
 
 
 @router.get("/attorney/{attorney_name}", response_class=HTMLResponse)
@@ -4,6 +4,7 @@ Intake & CRM Pipeline routes — admin and collections roles.
 Provides:
 - /intake — Kanban pipeline board with drag-and-drop
 - /intake/leads — List view with filters
+- /api/intake/leads — Keyset-paginated leads list (JSON)
 - /intake/lead/<id> — Lead detail with activity timeline
 - /intake/settings — Form builder, follow-up rules, availability
 - /api/intake/* — JSON API for board interactions
@@ -291,6 +292,28 @@ async def api_book_consultation(request: Request, lead_id: int):
     return JSONResponse({"id": consult_id, "success": True})
 
 
+@router.get("/api/intake/leads")
+async def api_list_leads(request: Request, stage: str = None, source: str = None,
+                         assigned_to: str = None, search: str = None,
+                         cursor: str = None, page_size: int = None):
+    """Keyset-paginated leads list. Pass next_cursor back as ?cursor= for the next page."""
+    result, role = _check_intake_access(request)
+    if isinstance(result, RedirectResponse):
+        return JSONResponse({"error": "Unauthorized"}, status_code=401)
+    data = result
+
+    page = data.get_intake_leads_page(
+        stage=stage, source=source, assigned_to=assigned_to, search=search,
+        cursor=cursor, page_size=page_size,
+    )
+    for lead in page.items:
+        for k, v in lead.items():
+            if isinstance(v, (datetime, date)):
+                lead[k] = v.isoformat()
+
+    return JSONResponse({"leads": page.items, "count": len(page.items), **page.to_dict()})
+
+
 @router.get("/api/intake/slots")
 async def api_get_slots(request: Request, date: str = Query(...),
                         attorney: str = Query(None)):
@@ -11,15 +11,51 @@ from dashboard.auth import (
     login_user, logout_user, is_authenticated, get_data, get_current_role,
     get_user, get_current_firm_id, validate_password, update_user_password,
 )
+from dashboard.panels import panel, int_param
 from werkzeug.security import check_password_hash
 
 router = APIRouter()
 templates = Jinja2Templates(directory=Path(__file__).parent.parent / "templates")
 
 
+HOME_DENY_ROLES = ("attorney", "collections")
+
+# Staff widgets on the home page: (first name for SOP tasks, full name for caseload)
+HOME_STAFF = [
+    ("tiffany_personal", "Tiffany", "tiffany", "Tiffany Willis"),
+    ("alison", "Alison", "alison", "Alison Ehrhard"),
+    ("cole", "Cole", "cole", "Cole Chadderdon"),
+    ("heidi", "Heidi", "heidi", "Heidi Leopold"),
+    ("anthony", "Anthony", "anthony", "Anthony Muhlenkamp"),
+    ("melinda", "Melinda", "melinda", "Melinda Gorman"),
+    ("john", "John", "john", "John Schleiffarth"),
+    ("leigh", "Leigh", "leigh", "Leigh Hawk"),
+    ("jen", "Jen", "jen", "Jen Kusmer"),
+    ("ethan", "Ethan", "ethan", "Ethan Dwyer"),
+]
+
+
+def _home_period(params: dict):
+    """Model kwargs and display year for the ?year= / ?view= tabs.
+
+    Returns (kwargs, year, view); year is None for the combined and rolling views.
+    """
+    view = params.get("view")
+    if view == "combined":
+        return {"years": [2025, 2026]}, None, view
+    if view == "rolling6":
+        return {"rolling_months": 6}, None, view
+    year = int_param(params, "year", datetime.now().year)
+    return {"year": year}, year, None
+
+
 @router.get("/", response_class=HTMLResponse)
 async def index(request: Request, year: int = None, view: str = None):
-    """Dashboard home page."""
+    """Dashboard home page.
+
+    Renders the page shell only; the widgets are lazy panels (see the
+    ``@panel("home", ...)`` loaders below).
+    """
     if not is_authenticated(request):
         return RedirectResponse(url="/login", status_code=303)
 
@@ -36,55 +72,12 @@ async def index(request: Request, year: int = None, view: str = None):
     data = get_data(request)
 
     # View modes: None/year-based, "combined", "rolling6"
-    if view == "combined":
-        stats = data.get_dashboard_stats(years=[2025, 2026])
-        ar_aging = data.get_ar_aging_breakdown(years=[2025, 2026])
-        melissa_sop = data.get_melissa_sop_data(years=[2025, 2026])
-        attorney_summary = data.get_attorney_summary(years=[2025, 2026])
-        year = None  # signal combined mode
-    elif view == "rolling6":
-        stats = data.get_dashboard_stats(rolling_months=6)
-        ar_aging = data.get_ar_aging_breakdown(rolling_months=6)
-        melissa_sop = data.get_melissa_sop_data(rolling_months=6)
-        attorney_summary = data.get_attorney_summary(rolling_months=6)
-        year = None
+    if view in ("combined", "rolling6"):
+        year = None  # signal combined/rolling mode
     else:
+        view = None
         if year is None:
             year = current_year
-        stats = data.get_dashboard_stats(year=year)
-        ar_aging = data.get_ar_aging_breakdown(year=year)
-        melissa_sop = data.get_melissa_sop_data(year=year)
-        attorney_summary = data.get_attorney_summary(year=year)
-
-    recent_reports = data.get_recent_reports(limit=5)
-
-    # SOP widget data (not year-dependent)
-    ty_sop = data.get_ty_sop_data()
-    tiffany_sop = data.get_tiffany_sop_data()
-    alison_sop = data.get_legal_assistant_sop_data("Alison")
-    cole_sop = data.get_legal_assistant_sop_data("Cole")
-
-    # Additional staff with overdue tasks
-    heidi_sop = data.get_legal_assistant_sop_data("Heidi")
-    anthony_sop = data.get_legal_assistant_sop_data("Anthony")
-    melinda_sop = data.get_legal_assistant_sop_data("Melinda")
-    tiffany_personal_sop = data.get_legal_assistant_sop_data("Tiffany")
-    john_sop = data.get_legal_assistant_sop_data("John")
-    leigh_sop = data.get_legal_assistant_sop_data("Leigh")
-    jen_sop = data.get_legal_assistant_sop_data("Jen")
-    ethan_sop = data.get_legal_assistant_sop_data("Ethan")
-
-    # Staff caseload data
-    tiffany_caseload = data.get_staff_caseload_data("Tiffany Willis")
-    alison_caseload = data.get_staff_caseload_data("Alison Ehrhard")
-    cole_caseload = data.get_staff_caseload_data("Cole Chadderdon")
-    heidi_caseload = data.get_staff_caseload_data("Heidi Leopold")
-    anthony_caseload = data.get_staff_caseload_data("Anthony Muhlenkamp")
-    melinda_caseload = data.get_staff_caseload_data("Melinda Gorman")
-    john_caseload = data.get_staff_caseload_data("John Schleiffarth")
-    leigh_caseload = data.get_staff_caseload_data("Leigh Hawk")
-    jen_caseload = data.get_staff_caseload_data("Jen Kusmer")
-    ethan_caseload = data.get_staff_caseload_data("Ethan Dwyer")
 
     return templates.TemplateResponse("dashboard.html", {
         "request": request,
@@ -92,38 +85,54 @@ async def index(request: Request, year: int = None, view: str = None):
         "view": view,
         "current_year": current_year,
         "available_years": available_years,
-        "stats": stats,
-        "ar_aging": ar_aging,
-        "recent_reports": recent_reports,
-        "melissa_sop": melissa_sop,
-        "ty_sop": ty_sop,
-        "tiffany_sop": tiffany_sop,
-        "alison_sop": alison_sop,
-        "cole_sop": cole_sop,
-        "heidi_sop": heidi_sop,
-        "anthony_sop": anthony_sop,
-        "melinda_sop": melinda_sop,
-        "tiffany_personal_sop": tiffany_personal_sop,
-        "john_sop": john_sop,
-        "leigh_sop": leigh_sop,
-        "jen_sop": jen_sop,
-        "ethan_sop": ethan_sop,
-        "attorney_summary": attorney_summary,
-        "tiffany_caseload": tiffany_caseload,
-        "alison_caseload": alison_caseload,
-        "cole_caseload": cole_caseload,
-        "heidi_caseload": heidi_caseload,
-        "anthony_caseload": anthony_caseload,
-        "melinda_caseload": melinda_caseload,
-        "john_caseload": john_caseload,
-        "leigh_caseload": leigh_caseload,
-        "jen_caseload": jen_caseload,
-        "ethan_caseload": ethan_caseload,
+        "panel_params": {"year": year, "view": view},
+        "last_sync": data.get_last_sync_time(),
+        "recent_reports": data.get_recent_reports(limit=5),
         "username": request.session.get("username"),
         "role": role,
     })
 
 
+@panel("home", "ar_collections", "panels/home_ar_collections.html", deny_roles=HOME_DENY_ROLES)
+def _home_ar_collections(data, params):
+    kwargs, year, view = _home_period(params)
+    return {
+        "melissa_sop": data.get_melissa_sop_data(**kwargs),
+        "year": year,
+        "view": view,
+        "current_year": datetime.now().year,
+    }
+
+
+@panel("home", "sop", "panels/home_sop.html", deny_roles=HOME_DENY_ROLES)
+def _home_sop(data, params):
+    kwargs, year, view = _home_period(params)
+    context = {
+        "year": year,
+        "view": view,
+        "ty_sop": data.get_ty_sop_data(),
+        "attorney_summary": data.get_attorney_summary(**kwargs),
+    }
+    for sop_key, sop_name, caseload_key, full_name in HOME_STAFF:
+        if caseload_key == "melinda" and not (year == 2025 or view == "combined"):
+            continue  # no longer with the firm; widget only shows for 2025
+        context[f"{sop_key}_sop"] = data.get_legal_assistant_sop_data(sop_name)
+        context[f"{caseload_key}_caseload"] = data.get_staff_caseload_data(full_name)
+    return context
+
+
+@panel("home", "key_metrics", "panels/home_key_metrics.html", deny_roles=HOME_DENY_ROLES)
+def _home_key_metrics(data, params):
+    kwargs, _, _ = _home_period(params)
+    return {"stats": data.get_dashboard_stats(**kwargs)}
+
+
+@panel("home", "aging", "panels/home_aging.html", deny_roles=HOME_DENY_ROLES)
+def _home_aging(data, params):
+    kwargs, _, _ = _home_period(params)
+    return {"ar_aging": data.get_ar_aging_breakdown(**kwargs)}
+
+
 @router.get("/login", response_class=HTMLResponse)
 async def login_page(request: Request):
     """Login page.
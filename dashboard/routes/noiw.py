@@ -16,11 +16,14 @@ templates = Jinja2Templates(directory=Path(__file__).parent.parent / "templates"
 
 
 @router.get("/noiw", response_class=HTMLResponse)
-async def noiw_pipeline(request: Request, status: str = None):
+async def noiw_pipeline(request: Request, status: str = None, cursor: str = None,
+                        pipeline_cursor: str = None, page_size: int = None,
+                        q: str = None, aging: str = None):
     """NOIW Pipeline page.
 
     Shows all open invoices 30+ days past due (all years) from cached_invoices,
-    plus formal NOIW tracking status from noiw_tracking table.
+    plus formal NOIW tracking status from noiw_tracking table. The invoice
+    table is filtered server-side by ?q= (client/case/attorney) and ?aging=.
     """
     if not is_authenticated(request):
         return RedirectResponse(url="/login", status_code=303)
@@ -32,21 +35,25 @@ async def noiw_pipeline(request: Request, status: str = None):
     data = get_data(request)
 
     # Get formal NOIW pipeline (for status tracking)
-    pipeline = data.get_noiw_pipeline(status_filter=status)
+    pipeline_page = data.get_noiw_pipeline_page(status_filter=status, cursor=pipeline_cursor,
+                                                page_size=page_size)
     summary = data.get_noiw_summary()
 
-    # Also get ALL open invoices 30+ days past due from cached_invoices (all years)
-    all_past_due = data.get_open_invoices_list(min_days_overdue=30)
-    total_past_due_balance = sum(inv['balance_due'] for inv in all_past_due)
+    # Also get ALL open invoices 30+ days past due from cached_invoices (all years),
+    # one page at a time; totals and buckets come from a single aggregate.
+    past_due_page = data.get_open_invoices_page(min_days_overdue=30, cursor=cursor,
+                                                page_size=page_size, search=q, aging=aging)
+    totals = data.get_open_invoices_totals(min_days_overdue=30)
+    total_past_due_balance = totals['total_balance']
 
     # Build aging buckets from the live invoice data
     live_summary = {
-        'total_active': len(all_past_due),
+        'total_active': totals['count'],
         'total_balance': total_past_due_balance,
-        'bucket_30_60': len([i for i in all_past_due if 30 <= i['days_overdue'] < 60]),
-        'bucket_60_90': len([i for i in all_past_due if 60 <= i['days_overdue'] < 90]),
-        'bucket_90_180': len([i for i in all_past_due if 90 <= i['days_overdue'] < 180]),
-        'bucket_180_plus': len([i for i in all_past_due if i['days_overdue'] >= 180]),
+        'bucket_30_60': totals['bucket_30_60'],
+        'bucket_60_90': totals['bucket_60_90'],
+        'bucket_90_180': totals['bucket_90_180'],
+        'bucket_180_plus': totals['bucket_180_plus'],
     }
 
     # Use live invoice data as the summary if it has more cases than noiw_tracking
@@ -55,9 +62,17 @@ async def noiw_pipeline(request: Request, status: str = None):
 
     return templates.TemplateResponse("noiw.html", {
         "request": request,
-        "pipeline": pipeline,
-        "all_past_due": all_past_due,
+        "pipeline": pipeline_page.items,
+        "pipeline_page": pipeline_page,
+        "all_past_due": past_due_page.items,
+        "past_due_page": past_due_page,
+        "past_due_count": totals['count'],
+        "search": q or "",
+        "aging": aging or "all",
         "total_past_due_balance": total_past_due_balance,
+        # Each table's pager keeps the other table's position
+        "past_due_params": {k: v for k, v in request.query_params.items() if k != 'cursor'},
+        "pipeline_params": {k: v for k, v in request.query_params.items() if k != 'pipeline_cursor'},
         "summary": summary,
         "current_filter": status,
         "username": request.session.get("username"),
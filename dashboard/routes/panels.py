@@ -0,0 +1,50 @@
+"""
+Lazy panel endpoints: /panels/{page}/{name}
+
+Returns the HTML fragment for one registered panel (see dashboard/panels.py).
+The page shells load these in parallel after first paint.
+"""
+from fastapi import APIRouter, Request
+from fastapi.responses import HTMLResponse
+from starlette.concurrency import run_in_threadpool
+
+from dashboard.auth import is_authenticated, get_data, get_current_role
+from dashboard.middleware import cached_sync_generation
+from dashboard.panels import get_panel, cache_key, render_panel, templates
+
+router = APIRouter()
+
+
+@router.get("/panels/{page}/{name}", response_class=HTMLResponse)
+async def panel_fragment(request: Request, page: str, name: str):
+    """Render one lazily loaded page panel."""
+    if not is_authenticated(request):
+        return HTMLResponse("", status_code=401)
+
+    p = get_panel(page, name)
+    if p is None:
+        return HTMLResponse("", status_code=404)
+
+    role = get_current_role(request)
+    if role in p.deny_roles:
+        return HTMLResponse("", status_code=403)
+
+    session = request.session
+    params = dict(request.query_params)
+    generation = await run_in_threadpool(cached_sync_generation, session.get("firm_id"))
+    key = cache_key(p, session, params, generation)
+
+    status, html = await render_panel(p, key, get_data(request), params, {
+        "request": request,
+        "role": role,
+        "username": session.get("username"),
+    })
+    if status == "ok":
+        return HTMLResponse(html)
+
+    # "Still loading" / "failed" placeholders; the loader script retries the first.
+    fragment = templates.get_template("components/panel_status.html").render(
+        status=status, page=page, name=name,
+    )
+    return HTMLResponse(fragment, status_code=200 if status == "timeout" else 500,
+                        headers={"Cache-Control": "no-store"})
@@ -39,7 +39,7 @@ def _get_phase_meta(phase_name):
 
 
 @router.get("/phases", response_class=HTMLResponse)
-async def phases_dashboard(request: Request, phase: str = None):
+async def phases_dashboard(request: Request, phase: str = None, cursor: str = None):
     """Case Phases dashboard showing phase distribution and stalled cases."""
     if not is_authenticated(request):
         return RedirectResponse(url="/login", status_code=303)
@@ -50,7 +50,7 @@ async def phases_dashboard(request: Request, phase: str = None):
 
     data = get_data(request)
     raw_summary = data.get_phases_summary()
-    raw_stalled = data.get_stalled_cases(threshold_days=30)
+    stalled_page = data.get_stalled_cases_page(threshold_days=30, cursor=cursor, page_size=20)
     raw_velocity = data.get_phase_velocity()
     raw_by_case_type = data.get_phase_by_case_type()
 
@@ -76,7 +76,7 @@ async def phases_dashboard(request: Request, phase: str = None):
     # Reshape stalled: model returns {case_name, phase, entered, days_in_phase}
     # Template expects {case_name, current_phase, short_name, days_in_phase, phase_entered_at}
     stalled = []
-    for s in raw_stalled:
+    for s in stalled_page.items:
         meta = _get_phase_meta(s.get('phase'))
         stalled.append({
             'case_name': s.get('case_name'),
@@ -132,6 +132,8 @@ async def phases_dashboard(request: Request, phase: str = None):
         "request": request,
         "summary": summary,
         "stalled": stalled,
+        "stalled_page": stalled_page,
+        "page_params": {k: v for k, v in request.query_params.items() if k != 'cursor'},
         "velocity": velocity,
         "by_case_type": by_case_type,
         "current_phase": phase,
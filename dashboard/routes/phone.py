@@ -352,8 +352,15 @@ async def phone_stats(request: Request):
 
 
 @router.get("/api/phone/events")
-async def phone_events_list(request: Request, limit: int = 50, offset: int = 0):
-    """Get recent call events for the current firm."""
+async def phone_events_list(request: Request, cursor: str = None, limit: int = 50,
+                            offset: int = None):
+    """Get recent call events for the current firm, newest first.
+
+    Keyset-paginated: pass the returned next_cursor back as ?cursor= to get
+    the following page. ?offset= is still honoured for existing callers but
+    deprecated (the response carries a Deprecation header); it can't be
+    combined with ?cursor=.
+    """
     if not is_authenticated(request):
         return JSONResponse({"error": "Not authenticated"}, status_code=401)
 
@@ -363,8 +370,17 @@ async def phone_events_list(request: Request, limit: int = 50, offset: int = 0):
 
     firm_id = get_current_firm_id(request)
 
-    from db.phone import get_call_events
-    events = get_call_events(firm_id, limit=min(limit, 200), offset=offset)
+    if offset is not None and cursor:
+        return JSONResponse({"error": "Pass either cursor or offset, not both"}, status_code=400)
+    if offset is not None:
+        from db.phone import get_call_events
+        events = get_call_events(firm_id, limit=max(1, min(limit, 200)), offset=max(0, offset))
+        page_fields, headers = {}, {"Deprecation": "true"}
+    else:
+        from db.phone import get_call_events_page
+        page = get_call_events_page(firm_id, cursor=cursor, page_size=limit)
+        events = page.items
+        page_fields, headers = page.to_dict(), None
 
     # Serialize datetimes
     for e in events:
@@ -372,7 +388,7 @@ async def phone_events_list(request: Request, limit: int = 50, offset: int = 0):
             if isinstance(v, datetime):
                 e[k] = v.isoformat()
 
-    return JSONResponse({"events": events, "count": len(events)})
+    return JSONResponse({"events": events, "count": len(events), **page_fields}, headers=headers)
 
 
 # ---------------------------------------------------------------------------
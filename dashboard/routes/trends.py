@@ -6,7 +6,8 @@ from fastapi.responses import HTMLResponse, RedirectResponse
 from fastapi.templating import Jinja2Templates
 from pathlib import Path
 
-from dashboard.auth import is_authenticated, get_data, get_current_role
+from dashboard.auth import is_authenticated, get_current_role
+from dashboard.panels import panel
 
 router = APIRouter()
 templates = Jinja2Templates(directory=Path(__file__).parent.parent / "templates")
@@ -37,6 +38,12 @@ METRIC_CONFIG = {
         'target_fn': lambda v: v < 10,
         'direction_good': 'down',
     },
+    'total_billed_30d': {
+        'display_name': 'Billed (Last 30 Days)',
+        'target': None,
+        'target_fn': None,
+        'direction_good': 'up',
+    },
 }
 
 
@@ -93,7 +100,17 @@ async def trends_dashboard(request: Request, metric: str = None):
     if role == 'collections':
         return RedirectResponse(url="/ar", status_code=303)
 
-    data = get_data(request)
+    return templates.TemplateResponse("trends.html", {
+        "request": request,
+        "current_metric": metric,
+        "username": request.session.get("username"),
+        "role": get_current_role(request),
+    })
+
+
+@panel("trends", "overview", "panels/trends_overview.html", deny_roles=("collections",))
+def _trends_overview(data, params):
+    """All tracked metrics with direction and target status."""
     raw_summary = data.get_trends_summary()
 
     # Reshape metrics for template
@@ -102,20 +119,17 @@ async def trends_dashboard(request: Request, metric: str = None):
         'metrics': reshaped_metrics,
         'total_metrics': len(reshaped_metrics),
     }
+    return {"summary": summary, "current_metric": params.get("metric")}
 
-    # If a specific metric is selected, get detailed comparison
-    metric_detail = None
-    metric_history = []
-    if metric:
-        metric_detail = data.get_metric_comparison(metric)
-        metric_history = data.get_trend_data(metric, days_back=30)
 
-    return templates.TemplateResponse("trends.html", {
-        "request": request,
-        "summary": summary,
+@panel("trends", "metric", "panels/trends_metric.html", deny_roles=("collections",))
+def _trends_metric(data, params):
+    """Detailed comparison and 30-day history for the selected metric."""
+    metric = params.get("metric")
+    if not metric:
+        return {"current_metric": None}
+    return {
         "current_metric": metric,
-        "metric_detail": metric_detail,
-        "metric_history": metric_history,
-        "username": request.session.get("username"),
-        "role": get_current_role(request),
-    })
+        "metric_detail": data.get_metric_comparison(metric),
+        "metric_history": data.get_trend_data(metric, days_back=30),
+    }
@@ -3,15 +3,17 @@ Trust-to-Operating Transfer Report route.
 """
 from datetime import datetime
 from fastapi import APIRouter, Request
-from fastapi.responses import HTMLResponse, RedirectResponse, StreamingResponse
+from fastapi.responses import HTMLResponse, RedirectResponse
 from fastapi.templating import Jinja2Templates
 from pathlib import Path
-import io
-import csv
 
 from dashboard.auth import is_authenticated, get_data, get_current_role
+from dashboard.exports import export_response
 from trust_transfer import (
     generate_trust_transfer_report,
+    iter_trust_transfer_lines,
+    trust_line_csv_row,
+    TRUST_EXPORT_HEADER,
     PHASE_ORDER,
     PHASE_LABELS,
 )
@@ -106,8 +108,8 @@ async def trust_report_page(request: Request, attorney: str = None, phase: str =
 
 
 @router.get("/trust/export")
-async def trust_export_csv(request: Request):
-    """Export trust transfer report as CSV."""
+async def trust_export_csv(request: Request, format: str = "csv"):
+    """Export trust transfer report as CSV (or XLSX), streamed row by row."""
     if not is_authenticated(request):
         return RedirectResponse(url="/login", status_code=303)
 
@@ -119,8 +121,6 @@ async def trust_export_csv(request: Request):
     if not firm_id:
         return RedirectResponse(url="/login", status_code=303)
 
-    report = generate_trust_transfer_report(firm_id)
-
     # Load trust balances
     try:
         from db.trust import get_latest_trust_balances
@@ -128,39 +128,21 @@ async def trust_export_csv(request: Request):
     except Exception:
         trust_balances = {}
 
-    output = io.StringIO()
-    writer = csv.writer(output)
-    headers = [
-        "Case ID", "Case Name", "Client", "Lead Attorney", "Case Type",
-        "Schedule", "Current Phase",
-        "Total Fee", "Earned (Received)", "% Earned", "Pace Target %",
-        "Behind Pace", "Outstanding",
-    ]
+    headers = list(TRUST_EXPORT_HEADER)
     if trust_balances:
         headers.extend(["Trust Balance", "Transferable"])
-    writer.writerow(headers)
-
-    for l in report["lines"]:
-        row = [
-            l.case_id, l.case_name, l.client_name, l.lead_attorney,
-            l.case_type, l.schedule_label, l.phase_label,
-            f"${l.total_fee:,.2f}", f"${l.paid_to_date:,.2f}",
-            f"{l.pct_paid:.1f}%", f"{l.phase_target_pct}%",
-            f"${l.billing_gap:,.2f}", f"${l.outstanding_balance:,.2f}",
-        ]
-        if trust_balances:
-            tb = trust_balances.get(l.case_id)
-            if tb:
-                row.append(f"${tb['trust_balance']:,.2f}")
-                row.append(f"${min(tb['trust_balance'], l.paid_to_date):,.2f}")
-            else:
-                row.extend(["", ""])
-        writer.writerow(row)
-
-    output.seek(0)
-    filename = f"trust_transfer_{datetime.now().strftime('%Y%m%d')}.csv"
-    return StreamingResponse(
-        io.BytesIO(output.getvalue().encode()),
-        media_type="text/csv",
-        headers={"Content-Disposition": f"attachment; filename={filename}"}
-    )
+
+    def rows():
+        for l in iter_trust_transfer_lines(firm_id):
+            row = trust_line_csv_row(l)
+            if trust_balances:
+                tb = trust_balances.get(l.case_id)
+                if tb:
+                    row.append(f"${tb['trust_balance']:,.2f}")
+                    row.append(f"${min(tb['trust_balance'], l.paid_to_date):,.2f}")
+                else:
+                    row.extend(["", ""])
+            yield row
+
+    filename = f"trust_transfer_{datetime.now().strftime('%Y%m%d')}"
+    return export_response(headers, rows(), filename, fmt=format, sheet_name="Trust Transfer")
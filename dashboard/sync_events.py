@@ -0,0 +1,101 @@
+"""
+Sync event fan-out for the dashboard.
+
+Each web worker runs one db.sync_events.SyncEventListener thread (started on
+the first subscriber) and relays every notification to the asyncio queues of
+that firm's open /api/sync/events streams. The latest event per firm is kept
+so a tab opened mid-sync renders progress immediately.
+
+Completed syncs also drop the firm's cached sync generation so the next
+request revalidates ETags and panel caches against fresh data instead of
+waiting out SYNC_GENERATION_TTL_SECONDS.
+"""
+import asyncio
+import logging
+import threading
+from collections import defaultdict
+from typing import Optional
+
+from db.sync_events import SyncEventListener
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_EVENTS = ("completed", "failed")
+
+
+class SyncEventHub:
+    """Per-worker registry of sync event subscribers, keyed by firm_id."""
+
+    def __init__(self):
+        # {firm_id: set(asyncio.Queue)} — only touched on the event loop
+        self._subscribers: dict[str, set[asyncio.Queue]] = defaultdict(set)
+        self._latest: dict[str, dict] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._listener: Optional[SyncEventListener] = None
+        self._lock = threading.Lock()
+
+    def subscribe(self, firm_id: str) -> asyncio.Queue:
+        """Register a stream for ``firm_id`` (call from the event loop)."""
+        self._loop = asyncio.get_running_loop()
+        self._ensure_listener()
+        queue = asyncio.Queue(maxsize=100)
+        self._subscribers[firm_id].add(queue)
+        return queue
+
+    def unsubscribe(self, firm_id: str, queue: asyncio.Queue):
+        queues = self._subscribers.get(firm_id)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self._subscribers[firm_id]
+
+    def latest(self, firm_id: str) -> Optional[dict]:
+        """Most recent event seen for ``firm_id`` by this worker."""
+        return self._latest.get(firm_id)
+
+    def _ensure_listener(self):
+        with self._lock:
+            if self._listener is None or not self._listener.is_alive():
+                self._listener = SyncEventListener(self.handle_event)
+                self._listener.start()
+
+    def handle_event(self, event: dict):
+        """Listener-thread callback: record, invalidate, hand off to the loop."""
+        firm_id = event["firm_id"]
+        self._latest[firm_id] = event
+        if event["event"] in TERMINAL_EVENTS:
+            from dashboard.middleware import invalidate_sync_generation
+            invalidate_sync_generation(firm_id)
+        loop = self._loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._dispatch, firm_id, event)
+
+    def _dispatch(self, firm_id: str, event: dict):
+        for queue in list(self._subscribers.get(firm_id, ())):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                logger.warning("Sync event queue full for %s, dropping %s", firm_id, event["event"])
+
+    async def close_all(self):
+        """Stop the listener and end every open stream (app shutdown)."""
+        with self._lock:
+            if self._listener is not None:
+                self._listener.stop()
+                self._listener = None
+        for queues in list(self._subscribers.values()):
+            for queue in list(queues):
+                try:
+                    queue.put_nowait({"event": "_shutdown"})
+                except asyncio.QueueFull:
+                    pass
+
+
+_hub: Optional[SyncEventHub] = None
+
+
+def get_sync_event_hub() -> SyncEventHub:
+    global _hub
+    if _hub is None:
+        _hub = SyncEventHub()
+    return _hub
@@ -12,8 +12,13 @@ Usage:
     from db.promises import ensure_promises_tables, add_promise
     from db.trends import ensure_trends_tables, record_snapshot
     from db.collections import ensure_collections_tables, upsert_noiw_case
+    from db.dunning_queue import ensure_dunning_queue_tables, refresh_dunning_queue
     from db.documents import ensure_documents_tables, search_templates
     from db.attorneys import ensure_attorneys_tables, get_primary_attorney
+    from db.ingest import ensure_ingest_tables, create_upload_job
+    from db.skill_memo import ensure_skill_memo_tables, get_memo
+    from db.doc_sessions import ensure_doc_sessions_tables, load_doc_session
+    from db.llm_telemetry import ensure_llm_telemetry_tables, get_llm_usage
 
 Connection pool is initialized on first use from DATABASE_URL env var.
 """
@@ -32,6 +37,13 @@ def ensure_all_tables():
     from db.documents import ensure_documents_tables
     from db.attorneys import ensure_attorneys_tables
     from db.phone import ensure_phone_tables
+    from db.dunning_queue import ensure_dunning_queue_tables
+    from db.ingest import ensure_ingest_tables
+    from db.chat_sandbox import ensure_chat_sandbox
+    from db.chat_cache import ensure_chat_cache_tables
+    from db.skill_memo import ensure_skill_memo_tables
+    from db.doc_sessions import ensure_doc_sessions_tables
+    from db.llm_telemetry import ensure_llm_telemetry_tables
 
     ensure_firms_tables()
     ensure_cache_tables()
@@ -43,6 +55,13 @@ def ensure_all_tables():
     ensure_documents_tables()
     ensure_attorneys_tables()
     ensure_phone_tables()
+    ensure_dunning_queue_tables()  # triggers need cache + tracking tables
+    ensure_ingest_tables()
+    ensure_chat_cache_tables()
+    ensure_skill_memo_tables()
+    ensure_doc_sessions_tables()
+    ensure_llm_telemetry_tables()
+    ensure_chat_sandbox()  # best-effort: needs CREATEROLE
 
 
 __all__ = [
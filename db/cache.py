@@ -58,6 +58,7 @@ CREATE TABLE IF NOT EXISTS cached_cases (
 );
 CREATE INDEX IF NOT EXISTS idx_cc_updated ON cached_cases(firm_id, updated_at);
 CREATE INDEX IF NOT EXISTS idx_cc_status ON cached_cases(firm_id, status);
+CREATE INDEX IF NOT EXISTS idx_cc_case_number ON cached_cases(firm_id, UPPER(case_number));
 
 CREATE TABLE IF NOT EXISTS cached_contacts (
     firm_id VARCHAR(36) NOT NULL,
@@ -124,6 +125,9 @@ CREATE TABLE IF NOT EXISTS cached_invoices (
 CREATE INDEX IF NOT EXISTS idx_ci_updated ON cached_invoices(firm_id, updated_at);
 CREATE INDEX IF NOT EXISTS idx_ci_status ON cached_invoices(firm_id, status);
 CREATE INDEX IF NOT EXISTS idx_ci_case ON cached_invoices(firm_id, case_id);
+-- Open invoices in DashboardData.OPEN_INVOICES_ORDER (keyset pages on /ar, /noiw)
+CREATE INDEX IF NOT EXISTS idx_ci_open_page
+    ON cached_invoices(firm_id, due_date, balance_due DESC, id DESC) WHERE balance_due > 0;
 
 CREATE TABLE IF NOT EXISTS cached_events (
     firm_id VARCHAR(36) NOT NULL,
@@ -449,6 +453,29 @@ def update_sync_status(
             )
 
 
+def get_sync_generation(firm_id: str) -> int:
+    """Return a token that advances every time any entity sync completes for a firm.
+
+    Derived from sync_metadata (written by both the single-tenant and the
+    multi-tenant sync paths), so no extra bookkeeping is needed on the write
+    side. Returns 0 for a firm that has never synced.
+    """
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            """
+            SELECT COALESCE(
+                (EXTRACT(EPOCH FROM MAX(GREATEST(last_full_sync, last_incremental_sync)))
+                 * 1000000)::BIGINT, 0) AS generation
+            FROM sync_metadata
+            WHERE firm_id = %s
+            """,
+            (firm_id,),
+        )
+        row = cur.fetchone()
+        return int(row["generation"]) if row else 0
+
+
 # ============================================================
 # Cache Query Helpers
 # ============================================================
@@ -964,6 +991,23 @@ def get_cases(firm_id: str, status: str = None) -> List[Dict]:
         return [dict(r) for r in cur.fetchall()]
 
 
+def get_case_id_by_number(firm_id: str, case_number: str) -> Optional[int]:
+    """Cached case ID for a court case number (case-insensitive), or None."""
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            """
+            SELECT id FROM cached_cases
+            WHERE firm_id = %s AND UPPER(case_number) = UPPER(%s)
+            ORDER BY updated_at DESC NULLS LAST
+            LIMIT 1
+            """,
+            (firm_id, case_number.strip()),
+        )
+        row = cur.fetchone()
+        return row["id"] if row else None
+
+
 def get_invoices(firm_id: str, status: str = None) -> List[Dict]:
     with get_connection() as conn:
         cur = conn.cursor()
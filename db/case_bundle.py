@@ -0,0 +1,214 @@
+"""
+Case Bundles — PostgreSQL Multi-Tenant
+
+Load a case together with everything hanging off it (clients, invoices,
+payments, tasks, events, documents, docket entries, phase history, NOIW
+tracking) for one or many cases in a fixed number of set-based queries on a
+single pooled connection: one ``= ANY(%s)`` query per related entity,
+regardless of how many cases are requested.
+
+Usage:
+    from db.case_bundle import load_case_bundle, load_case_bundles
+
+    bundle = load_case_bundle(firm_id, case_id)
+    bundle.invoices, bundle.current_phase, bundle.balance_due
+
+    bundles = load_case_bundles(firm_id, case_ids, include=("invoices", "payments"))
+
+Adding a related entity is one entry in RELATIONS plus a field on CaseBundle.
+"""
+import json
+import logging
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional
+
+from db.connection import get_connection
+
+logger = logging.getLogger(__name__)
+
+
+# Each query takes (firm_id, case_ids) and must return a case_id column.
+RELATIONS: Dict[str, str] = {
+    "invoices": """
+        SELECT id, case_id, invoice_number, status, total_amount, paid_amount,
+               balance_due, invoice_date, due_date
+        FROM cached_invoices
+        WHERE firm_id = %s AND case_id = ANY(%s)
+        ORDER BY invoice_date DESC NULLS LAST, id DESC
+    """,
+    "payments": """
+        SELECT p.id, i.case_id, p.invoice_id, p.amount, p.payment_date,
+               p.payment_method, p.created_at
+        FROM cached_payments p
+        JOIN cached_invoices i ON i.firm_id = p.firm_id AND i.id = p.invoice_id
+        WHERE p.firm_id = %s AND i.case_id = ANY(%s)
+        ORDER BY p.created_at DESC NULLS LAST, p.id DESC
+    """,
+    "tasks": """
+        SELECT id, case_id, name, description, due_date, completed, completed_at,
+               priority, assignee_id, assignee_name
+        FROM cached_tasks
+        WHERE firm_id = %s AND case_id = ANY(%s)
+        ORDER BY completed, due_date NULLS LAST, id
+    """,
+    "events": """
+        SELECT id, case_id, name, description, event_type, start_at, end_at,
+               all_day, location
+        FROM cached_events
+        WHERE firm_id = %s AND case_id = ANY(%s)
+        ORDER BY start_at DESC NULLS LAST, id DESC
+    """,
+    "documents": """
+        SELECT id, case_id, name, description, content_type, file_size,
+               contact_id, created_at, updated_at
+        FROM cached_documents
+        WHERE firm_id = %s AND case_id = ANY(%s)
+        ORDER BY created_at DESC NULLS LAST, id DESC
+    """,
+    "docket_entries": """
+        SELECT *
+        FROM cached_docket_entries
+        WHERE firm_id = %s AND case_id = ANY(%s)
+        ORDER BY entry_date DESC, id DESC
+    """,
+    "phase_history": """
+        SELECT id, case_id, phase_code, phase_name, mycase_stage_name,
+               entered_at, exited_at, duration_days, notes
+        FROM case_phase_history
+        WHERE firm_id = %s AND case_id = ANY(%s)
+        ORDER BY entered_at, id
+    """,
+    "noiw": """
+        SELECT id, case_id, invoice_id, contact_id, contact_name, balance_due,
+               days_delinquent, status, warning_sent_date, final_notice_date,
+               attorney_review_date, resolution_date, assigned_to, notes, updated_at
+        FROM noiw_tracking
+        WHERE firm_id = %s AND case_id = ANY(%s)
+        ORDER BY updated_at DESC NULLS LAST, id DESC
+    """,
+}
+
+CASE_SQL = """
+    SELECT id, name, case_number, status, case_type, practice_area,
+           date_opened, date_closed, lead_attorney_id, lead_attorney_name,
+           stage, created_at, updated_at, data_json
+    FROM cached_cases
+    WHERE firm_id = %s AND id = ANY(%s)
+"""
+
+CLIENTS_SQL = """
+    SELECT id, first_name, last_name,
+           COALESCE(first_name || ' ' || last_name, first_name, last_name) AS name,
+           email, cell_phone, work_phone, home_phone,
+           address1, address2, city, state, zip_code, birthdate
+    FROM cached_clients
+    WHERE firm_id = %s AND id = ANY(%s)
+"""
+
+
+@dataclass
+class CaseBundle:
+    """A cached case and its related records, each list newest-first unless noted."""
+    case: Dict
+    clients: List[Dict] = field(default_factory=list)
+    invoices: List[Dict] = field(default_factory=list)
+    payments: List[Dict] = field(default_factory=list)
+    tasks: List[Dict] = field(default_factory=list)
+    events: List[Dict] = field(default_factory=list)
+    documents: List[Dict] = field(default_factory=list)
+    docket_entries: List[Dict] = field(default_factory=list)
+    phase_history: List[Dict] = field(default_factory=list)  # oldest first
+    noiw: List[Dict] = field(default_factory=list)
+
+    @property
+    def id(self) -> int:
+        return self.case["id"]
+
+    @property
+    def current_phase(self) -> Optional[str]:
+        for row in reversed(self.phase_history):
+            if row.get("exited_at") is None:
+                return row.get("phase_name") or row.get("phase_code")
+        return None
+
+    @property
+    def balance_due(self) -> float:
+        return sum(float(i.get("balance_due") or 0) for i in self.invoices
+                   if (i.get("balance_due") or 0) > 0)
+
+    @property
+    def last_payment(self) -> Optional[Dict]:
+        return self.payments[0] if self.payments else None
+
+    @property
+    def noiw_status(self) -> Optional[str]:
+        return self.noiw[0]["status"] if self.noiw else None
+
+
+def case_client_ids(case: Dict) -> List[int]:
+    """Client/billing-contact IDs referenced by a cached case's data_json."""
+    try:
+        data = json.loads(case.get("data_json") or "{}")
+    except (TypeError, ValueError):
+        return []
+    ids = [c.get("id") for c in data.get("clients") or [] if isinstance(c, dict)]
+    billing = data.get("billing_contact")
+    if isinstance(billing, dict):
+        ids.append(billing.get("id"))
+    seen = []
+    for i in ids:
+        if isinstance(i, int) and i not in seen:
+            seen.append(i)
+    return seen
+
+
+def load_case_bundles(
+    firm_id: str,
+    case_ids: Iterable[int],
+    include: Optional[Iterable[str]] = None,
+) -> Dict[int, CaseBundle]:
+    """Load bundles for ``case_ids``, keyed by case ID (missing cases are omitted).
+
+    Args:
+        include: Relation names to load (RELATIONS keys plus "clients");
+            default is everything.
+    """
+    case_ids = list(dict.fromkeys(int(c) for c in case_ids))
+    if not case_ids:
+        return {}
+    wanted = set(RELATIONS) | {"clients"} if include is None else set(include)
+    unknown = wanted - set(RELATIONS) - {"clients"}
+    if unknown:
+        raise ValueError(f"Unknown case bundle relations: {sorted(unknown)}")
+
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(CASE_SQL, (firm_id, case_ids))
+        bundles = {row["id"]: CaseBundle(case=dict(row)) for row in cur.fetchall()}
+        if not bundles:
+            return {}
+        found = list(bundles)
+
+        for name, sql in RELATIONS.items():
+            if name not in wanted:
+                continue
+            cur.execute(sql, (firm_id, found))
+            for row in cur.fetchall():
+                getattr(bundles[row["case_id"]], name).append(dict(row))
+
+        if "clients" in wanted:
+            refs = {b.id: case_client_ids(b.case) for b in bundles.values()}
+            all_ids = sorted({i for ids in refs.values() for i in ids})
+            if all_ids:
+                cur.execute(CLIENTS_SQL, (firm_id, all_ids))
+                by_id = {row["id"]: dict(row) for row in cur.fetchall()}
+                for case_id, ids in refs.items():
+                    bundles[case_id].clients = [by_id[i] for i in ids if i in by_id]
+
+    return bundles
+
+
+def load_case_bundle(firm_id: str, case_id: int,
+                     include: Optional[Iterable[str]] = None) -> Optional[CaseBundle]:
+    """Load a single case bundle, or None if the case isn't cached for this firm."""
+    return load_case_bundles(firm_id, [case_id], include).get(int(case_id))
@@ -0,0 +1,200 @@
+"""
+Chat Answer Cache — PostgreSQL Multi-Tenant
+
+Remembers, per firm, what the dashboard chat did with a question: the SQL
+the model wrote and the formatted answer. A repeat question ("what's our
+AR over 90 days?") skips the LLM entirely:
+
+- same sync generation  -> the stored answer is returned as-is
+- newer sync generation -> the stored SQL is re-run against fresh data
+
+Questions match on normalized text, or on a near-duplicate of it: a
+bag-of-words cosine similarity >= NEAR_DUPLICATE_THRESHOLD, and only when
+both questions contain exactly the same numbers (so "over 60 days" never
+answers "over 90 days") and ask for the same shape of answer: a count
+("how many"), a total ("how much", "sum") or a list ("show", "list").
+
+The table is shared by all web workers, so one staff member's question
+warms the cache for the rest of the firm.
+"""
+import logging
+import math
+import re
+from collections import Counter
+from typing import Dict, Optional
+
+from db.connection import get_connection
+
+logger = logging.getLogger(__name__)
+
+NEAR_DUPLICATE_THRESHOLD = 0.92
+CANDIDATE_LIMIT = 200          # most recently used entries scanned for near-duplicates
+MAX_AGE_DAYS = 30              # entries unused this long are ignored and pruned
+NORMALIZATION_VERSION = 2      # entries normalized by an older version are ignored
+
+
+CHAT_CACHE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS chat_answer_cache (
+    id SERIAL PRIMARY KEY,
+    firm_id VARCHAR(36) NOT NULL,
+    question_norm TEXT NOT NULL,
+    question TEXT,
+    sql TEXT,
+    explanation TEXT,
+    response TEXT NOT NULL,
+    sync_generation BIGINT,
+    norm_version INTEGER,
+    hits INTEGER DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    last_used_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE(firm_id, question_norm)
+);
+CREATE INDEX IF NOT EXISTS idx_chat_cache_recent ON chat_answer_cache(firm_id, last_used_at DESC);
+"""
+
+
+def ensure_chat_cache_tables():
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(CHAT_CACHE_SCHEMA)
+        cur.execute("ALTER TABLE chat_answer_cache ADD COLUMN IF NOT EXISTS norm_version INTEGER")
+
+
+# ============================================================
+# Question normalization
+# ============================================================
+
+_STOPWORDS = {
+    "a", "an", "the", "please", "can", "you", "could", "would", "me",
+    "tell", "give", "what", "whats", "what's", "is", "are", "our", "my",
+    "we", "us", "of", "for", "to", "in", "on", "do", "does", "how",
+    "i", "want", "see", "get", "all", "currently", "current", "right", "now",
+}
+# Question-shape words fold into one token per kind of answer
+_INTENTS = {
+    "many": "count", "count": "count",
+    "much": "total", "sum": "total", "total": "total", "totals": "total",
+    "list": "list", "show": "list", "which": "list", "who": "list",
+}
+_SYNONYMS = {
+    "a/r": "ar", "receivable": "ar", "receivables": "ar", "accounts": "",
+    "attorneys": "attorney", "lawyers": "attorney", "lawyer": "attorney",
+    "invoices": "invoice", "cases": "case", "clients": "client", "tasks": "task",
+    "dollars": "", "$": "", "greater": "over", "more": "over", "above": "over",
+    "older": "over", "than": "",
+}
+_TOKEN_RE = re.compile(r"[a-z0-9/$']+")
+
+
+def _tokens(question: str) -> list:
+    tokens = []
+    for tok in _TOKEN_RE.findall((question or "").lower()):
+        tok = tok.strip("'")
+        tok = _INTENTS.get(tok) or _SYNONYMS.get(tok, tok)
+        if tok and tok not in _STOPWORDS:
+            tokens.append(tok)
+    return tokens
+
+
+def normalize_question(question: str) -> str:
+    """Canonical form of a question: lowercased, stopwords/synonyms folded."""
+    return " ".join(_tokens(question))
+
+
+def _numbers(norm: str) -> set:
+    return {t for t in norm.split() if any(ch.isdigit() for ch in t)}
+
+
+def _intents(norm: str) -> set:
+    return {t for t in norm.split() if t in ("count", "total", "list")}
+
+
+def question_similarity(a_norm: str, b_norm: str) -> float:
+    """Cosine similarity of two normalized questions (0 when their numbers or shapes differ)."""
+    if _numbers(a_norm) != _numbers(b_norm) or _intents(a_norm) != _intents(b_norm):
+        return 0.0
+    a, b = Counter(a_norm.split()), Counter(b_norm.split())
+    if not a or not b:
+        return 0.0
+    dot = sum(a[t] * b[t] for t in a)
+    return dot / (math.sqrt(sum(v * v for v in a.values())) * math.sqrt(sum(v * v for v in b.values())))
+
+
+# ============================================================
+# Lookup / store
+# ============================================================
+
+def lookup_chat_answer(firm_id: str, question: str) -> Optional[Dict]:
+    """Find a cached answer for ``question``; exact normalized match first, then near-duplicates."""
+    norm = normalize_question(question)
+    if not norm:
+        return None
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT id, question_norm, sql, explanation, response, sync_generation
+            FROM chat_answer_cache
+            WHERE firm_id = %s AND question_norm = %s AND norm_version = %s
+        """, (firm_id, norm, NORMALIZATION_VERSION))
+        row = cur.fetchone()
+        if row is None:
+            cur.execute("""
+                SELECT id, question_norm, sql, explanation, response, sync_generation
+                FROM chat_answer_cache
+                WHERE firm_id = %s AND norm_version = %s
+                  AND last_used_at > CURRENT_TIMESTAMP - make_interval(days => %s)
+                ORDER BY last_used_at DESC
+                LIMIT %s
+            """, (firm_id, NORMALIZATION_VERSION, MAX_AGE_DAYS, CANDIDATE_LIMIT))
+            best, best_score = None, NEAR_DUPLICATE_THRESHOLD
+            for candidate in cur.fetchall():
+                score = question_similarity(norm, candidate["question_norm"])
+                if score >= best_score:
+                    best, best_score = candidate, score
+            row = best
+        if row is None:
+            return None
+        cur.execute("""
+            UPDATE chat_answer_cache SET hits = hits + 1, last_used_at = CURRENT_TIMESTAMP
+            WHERE id = %s
+        """, (row["id"],))
+        return dict(row)
+
+
+def store_chat_answer(firm_id: str, question: str, response: str, sync_generation: Optional[int],
+                      sql: str = None, explanation: str = None):
+    """Cache (or refresh) the answer to ``question``. Text answers pass sql=None."""
+    norm = normalize_question(question)
+    if not norm:
+        return
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            INSERT INTO chat_answer_cache
+                (firm_id, question_norm, question, sql, explanation, response, sync_generation,
+                 norm_version)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+            ON CONFLICT (firm_id, question_norm) DO UPDATE SET
+                question = EXCLUDED.question,
+                sql = EXCLUDED.sql,
+                explanation = EXCLUDED.explanation,
+                response = EXCLUDED.response,
+                sync_generation = EXCLUDED.sync_generation,
+                norm_version = EXCLUDED.norm_version,
+                last_used_at = CURRENT_TIMESTAMP
+        """, (firm_id, norm, question, sql, explanation, response, sync_generation,
+              NORMALIZATION_VERSION))
+        cur.execute("""
+            DELETE FROM chat_answer_cache
+            WHERE firm_id = %s AND last_used_at < CURRENT_TIMESTAMP - make_interval(days => %s)
+        """, (firm_id, MAX_AGE_DAYS))
+
+
+def refresh_chat_answer(entry_id: int, response: str, sync_generation: Optional[int]):
+    """Replace a cached answer after re-running its SQL on newer data."""
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            UPDATE chat_answer_cache SET response = %s, sync_generation = %s
+            WHERE id = %s
+        """, (response, sync_generation, entry_id))
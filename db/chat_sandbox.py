@@ -0,0 +1,263 @@
+"""
+Sandboxed Execution for Chat-Generated SQL
+
+The AI chat turns questions into SQL written by a language model. That SQL
+runs here, never on the shared application pool:
+
+- Dedicated pool: at most CHAT_QUERY_POOL_MAX connections (default 3), so
+  chat can never starve dashboard requests of connections.
+- Read-only: every query runs in a READ ONLY transaction that is always
+  rolled back, as the SELECT-only role CHAT_QUERY_ROLE.
+- Tenant isolation: row-level security policies on the cached_* tables only
+  show the chat role rows whose firm_id matches ``app.firm_id``, which is
+  set per transaction from the session's firm. Queries that touch settings
+  or catalog functions (set_config, current_setting, pg_*) are refused, so
+  the SQL can't change that setting itself.
+- Bounded: a statement timeout, an EXPLAIN cost ceiling checked before
+  execution, and row/byte caps enforced while fetching from a server-side
+  cursor (results are never fully materialized).
+
+Only tables in CHAT_TABLES are granted to the role; anything else (users,
+credentials, firm settings) fails with "permission denied".
+
+Setup (once, by a role that can create roles; ensure_all_tables() tries):
+    from db.chat_sandbox import ensure_chat_sandbox
+    ensure_chat_sandbox()
+
+Environment:
+    CHAT_QUERY_DATABASE_URL   DSN for the chat pool (default DATABASE_URL)
+    CHAT_QUERY_ROLE           Role to SET for chat queries (default chat_readonly)
+    CHAT_QUERY_POOL_MAX       Max chat connections per process (default 3)
+    CHAT_QUERY_TIMEOUT_MS     statement_timeout (default 5000)
+    CHAT_QUERY_MAX_COST       EXPLAIN total cost ceiling (default 500000)
+    CHAT_QUERY_MAX_ROWS       Rows returned at most (default 500)
+    CHAT_QUERY_MAX_BYTES      Approximate result size cap (default 1 MB)
+"""
+import json
+import logging
+import os
+import re
+import threading
+import uuid
+from contextlib import contextmanager
+from typing import List, Optional, Tuple
+
+import psycopg2
+import psycopg2.extensions
+from psycopg2 import errors as pg_errors
+from psycopg2 import sql as pgsql
+from psycopg2.pool import ThreadedConnectionPool
+
+from db.connection import get_connection, _get_database_url, _is_connection_error, _validate_connection
+
+logger = logging.getLogger(__name__)
+
+CHAT_QUERY_ROLE = os.environ.get("CHAT_QUERY_ROLE", "chat_readonly")
+CHAT_QUERY_POOL_MAX = int(os.environ.get("CHAT_QUERY_POOL_MAX", "3"))
+CHAT_QUERY_TIMEOUT_MS = int(os.environ.get("CHAT_QUERY_TIMEOUT_MS", "5000"))
+CHAT_QUERY_MAX_COST = float(os.environ.get("CHAT_QUERY_MAX_COST", "500000"))
+CHAT_QUERY_MAX_ROWS = int(os.environ.get("CHAT_QUERY_MAX_ROWS", "500"))
+CHAT_QUERY_MAX_BYTES = int(os.environ.get("CHAT_QUERY_MAX_BYTES", str(1024 * 1024)))
+
+# Tables the chat may read (see MYCASE_SCHEMA in dashboard/routes/api.py)
+CHAT_TABLES = (
+    "cached_cases", "cached_contacts", "cached_clients", "cached_invoices",
+    "cached_tasks", "cached_staff", "cached_events", "cached_payments",
+    "cached_time_entries",
+)
+
+# Names chat SQL may not mention: anything that could read or change
+# app.firm_id (set_config, current_setting, the pg_settings view) or reach
+# other pg_* catalog functions. Unicode-escaped identifiers (U&"...") could
+# spell these without matching, so they're refused too.
+_FORBIDDEN_SQL_RE = re.compile(r'\b(?:set_config|current_setting|pg_\w*)\b|\bu&["\']', re.IGNORECASE)
+
+_pool: Optional[ThreadedConnectionPool] = None
+_pool_lock = threading.Lock()
+
+
+class ChatQueryRejected(Exception):
+    """The query was refused before or during execution; the message is user-facing."""
+
+
+# ============================================================
+# Setup
+# ============================================================
+
+def ensure_chat_sandbox(role: str = CHAT_QUERY_ROLE) -> bool:
+    """Create the read-only chat role, grants and per-firm RLS policies.
+
+    Idempotent. Returns False (and logs) if the current user lacks the
+    privileges to create roles or policies.
+    """
+    ident = pgsql.Identifier(role)
+    try:
+        with get_connection() as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT 1 FROM pg_roles WHERE rolname = %s", (role,))
+            if not cur.fetchone():
+                cur.execute(pgsql.SQL("CREATE ROLE {} NOLOGIN").format(ident))
+            cur.execute(pgsql.SQL("GRANT {} TO CURRENT_USER").format(ident))
+            cur.execute(pgsql.SQL("GRANT USAGE ON SCHEMA public TO {}").format(ident))
+
+            for table in CHAT_TABLES:
+                t = pgsql.Identifier(table)
+                cur.execute(pgsql.SQL("GRANT SELECT ON {} TO {}").format(t, ident))
+                cur.execute(pgsql.SQL("ALTER TABLE {} ENABLE ROW LEVEL SECURITY").format(t))
+                cur.execute(
+                    "SELECT policyname FROM pg_policies WHERE tablename = %s AND policyname IN %s",
+                    (table, ("chat_firm_isolation", "app_full_access")),
+                )
+                existing = {r["policyname"] for r in cur.fetchall()}
+                if "chat_firm_isolation" not in existing:
+                    cur.execute(pgsql.SQL(
+                        "CREATE POLICY chat_firm_isolation ON {} FOR SELECT TO {} "
+                        "USING (firm_id = current_setting('app.firm_id', true))"
+                    ).format(t, ident))
+                if "app_full_access" not in existing:
+                    # Keep the application role unrestricted even if it isn't the owner
+                    cur.execute(pgsql.SQL(
+                        "CREATE POLICY app_full_access ON {} TO CURRENT_USER USING (true) WITH CHECK (true)"
+                    ).format(t))
+        logger.info("Chat query sandbox ensured (role=%s)", role)
+        return True
+    except Exception as e:
+        logger.warning("Could not set up chat query sandbox role %s: %s", role, e)
+        return False
+
+
+# ============================================================
+# Pool
+# ============================================================
+
+def _get_pool() -> ThreadedConnectionPool:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            dsn = os.environ.get("CHAT_QUERY_DATABASE_URL") or _get_database_url()
+            _pool = ThreadedConnectionPool(minconn=0, maxconn=CHAT_QUERY_POOL_MAX, dsn=dsn)
+            logger.info("Chat query pool initialized (max=%d)", CHAT_QUERY_POOL_MAX)
+        return _pool
+
+
+def close_chat_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+
+
+@contextmanager
+def _sandbox_connection():
+    """Borrow a chat connection; the transaction is always rolled back."""
+    pool = _get_pool()
+    try:
+        conn = pool.getconn()
+    except psycopg2.pool.PoolError:
+        raise ChatQueryRejected("The query service is busy. Please try again in a moment.")
+    if not _validate_connection(conn):
+        pool.putconn(conn, close=True)
+        conn = pool.getconn()
+    broken = False
+    try:
+        yield conn
+    except Exception as e:
+        broken = _is_connection_error(e)
+        raise
+    finally:
+        try:
+            conn.rollback()
+        except Exception:
+            broken = True
+        pool.putconn(conn, close=broken)
+
+
+# ============================================================
+# Execution
+# ============================================================
+
+def normalize_chat_sql(sql: str) -> str:
+    """Return a single SELECT/WITH statement or raise ChatQueryRejected."""
+    sql = (sql or "").strip().rstrip(";").strip()
+    if not sql:
+        raise ChatQueryRejected("No query to run.")
+    if ";" in sql:
+        raise ChatQueryRejected("Only a single SELECT statement is allowed.")
+    if sql.split(None, 1)[0].lower() not in ("select", "with"):
+        raise ChatQueryRejected("Only SELECT queries are allowed.")
+    if _FORBIDDEN_SQL_RE.search(sql):
+        raise ChatQueryRejected("That query uses functions the chat isn't allowed to call.")
+    return sql
+
+
+def _explain_cost(cur, sql: str) -> float:
+    cur.execute("EXPLAIN (FORMAT JSON) " + sql)
+    plan = cur.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return float(plan[0]["Plan"]["Total Cost"])
+
+
+def run_chat_query(
+    sql: str,
+    firm_id: str,
+    max_rows: int = CHAT_QUERY_MAX_ROWS,
+    max_bytes: int = CHAT_QUERY_MAX_BYTES,
+) -> Tuple[List[dict], bool]:
+    """Run chat SQL for ``firm_id`` inside the sandbox.
+
+    Returns (rows, truncated). Raises ChatQueryRejected for refused or
+    timed-out queries and psycopg2 errors for invalid SQL.
+    """
+    if not firm_id:
+        raise ChatQueryRejected("No firm context for this query.")
+    sql = normalize_chat_sql(sql)
+
+    with _sandbox_connection() as conn:
+        cur = conn.cursor(cursor_factory=psycopg2.extensions.cursor)
+        cur.execute("SET TRANSACTION READ ONLY")
+        cur.execute(pgsql.SQL("SET LOCAL ROLE {}").format(pgsql.Identifier(CHAT_QUERY_ROLE)))
+        cur.execute("SELECT set_config('app.firm_id', %s, true)", (firm_id,))
+        cur.execute("SELECT set_config('statement_timeout', %s, true)", (str(CHAT_QUERY_TIMEOUT_MS),))
+
+        cost = _explain_cost(cur, sql)
+        if cost > CHAT_QUERY_MAX_COST:
+            logger.warning("Chat query rejected for %s: cost %.0f > %.0f", firm_id, cost, CHAT_QUERY_MAX_COST)
+            raise ChatQueryRejected(
+                "That question needs too much data to answer at once. "
+                "Try narrowing it (a date range, an attorney, or fewer columns)."
+            )
+
+        stream = conn.cursor(name=f"chat_{uuid.uuid4().hex[:12]}",
+                             cursor_factory=psycopg2.extensions.cursor)
+        stream.itersize = min(max_rows, 200)
+        try:
+            stream.execute(sql)
+            rows, size, truncated = [], 0, False
+            columns = None
+            while True:
+                batch = stream.fetchmany(stream.itersize)
+                if columns is None and stream.description:
+                    columns = [d[0] for d in stream.description]
+                if not batch:
+                    break
+                for row in batch:
+                    size += sum(len(str(v)) for v in row)
+                    if len(rows) >= max_rows or size > max_bytes:
+                        truncated = True
+                        break
+                    rows.append(dict(zip(columns, row)))
+                if truncated:
+                    break
+            return rows, truncated
+        except pg_errors.QueryCanceled:
+            raise ChatQueryRejected(
+                f"The query took longer than {CHAT_QUERY_TIMEOUT_MS / 1000:g}s and was stopped. "
+                "Try a narrower question."
+            )
+        finally:
+            try:
+                stream.close()
+            except Exception:
+                pass
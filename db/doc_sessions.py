@@ -0,0 +1,168 @@
+"""
+Document Chat Sessions — PostgreSQL Multi-Tenant
+
+Persists document chat conversations (DocumentChatEngine state) so any web
+worker can continue a session and restarts don't lose drafts.
+
+- doc_chat_sessions: one row per session with its JSON state, the hashes of
+  the template and draft .docx it references, a version for cross-worker
+  freshness checks, and a sliding expiry.
+- doc_chat_blobs: content-addressed bytes (SHA-256), stored once no matter
+  how many sessions reference them. Templates are not copied here — they
+  already live in the templates tables and are reloaded by template_id.
+
+Usage:
+    from db.doc_sessions import save_doc_session, load_doc_session, put_blob
+
+    draft_hash = put_blob(docx_bytes)
+    version = save_doc_session(sid, firm_id, username, state, template_hash, draft_hash)
+"""
+import hashlib
+import json
+import logging
+import os
+from typing import Dict, Optional
+
+import psycopg2
+
+from db.connection import get_connection
+
+logger = logging.getLogger(__name__)
+
+DOC_SESSION_TTL_SECONDS = int(os.environ.get("DOC_SESSION_TTL_SECONDS", str(4 * 3600)))
+
+
+DOC_SESSIONS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS doc_chat_sessions (
+    id VARCHAR(64) PRIMARY KEY,
+    firm_id VARCHAR(36) NOT NULL,
+    username TEXT,
+    state JSONB NOT NULL,
+    template_hash CHAR(64),
+    draft_hash CHAR(64),
+    version INTEGER NOT NULL DEFAULT 1,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    expires_at TIMESTAMP NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_doc_chat_sessions_expires ON doc_chat_sessions(expires_at);
+
+CREATE TABLE IF NOT EXISTS doc_chat_blobs (
+    hash CHAR(64) PRIMARY KEY,
+    content BYTEA NOT NULL,
+    size INTEGER NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+
+def ensure_doc_sessions_tables():
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(DOC_SESSIONS_SCHEMA)
+
+
+def blob_hash(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+# ============================================================
+# Blobs
+# ============================================================
+
+def put_blob(content: bytes) -> str:
+    """Store ``content`` once under its SHA-256 and return the hash."""
+    digest = blob_hash(content)
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            INSERT INTO doc_chat_blobs (hash, content, size) VALUES (%s, %s, %s)
+            ON CONFLICT (hash) DO NOTHING
+        """, (digest, psycopg2.Binary(content), len(content)))
+    return digest
+
+
+def get_blob(digest: str) -> Optional[bytes]:
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT content FROM doc_chat_blobs WHERE hash = %s", (digest,))
+        row = cur.fetchone()
+    return bytes(row["content"]) if row else None
+
+
+# ============================================================
+# Sessions
+# ============================================================
+
+def save_doc_session(session_id: str, firm_id: str, username: Optional[str], state: Dict,
+                     template_hash: Optional[str] = None, draft_hash: Optional[str] = None,
+                     ttl_seconds: int = DOC_SESSION_TTL_SECONDS) -> int:
+    """Insert or update a session, extending its expiry. Returns the new version."""
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            INSERT INTO doc_chat_sessions
+                (id, firm_id, username, state, template_hash, draft_hash, expires_at)
+            VALUES (%s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP + make_interval(secs => %s))
+            ON CONFLICT (id) DO UPDATE SET
+                state = EXCLUDED.state,
+                template_hash = EXCLUDED.template_hash,
+                draft_hash = EXCLUDED.draft_hash,
+                version = doc_chat_sessions.version + 1,
+                updated_at = CURRENT_TIMESTAMP,
+                expires_at = EXCLUDED.expires_at
+            WHERE doc_chat_sessions.firm_id = EXCLUDED.firm_id
+            RETURNING version
+        """, (session_id, firm_id, username, json.dumps(state, default=str),
+              template_hash, draft_hash, ttl_seconds))
+        row = cur.fetchone()
+    if row is None:
+        raise PermissionError(f"Document session {session_id} belongs to another firm")
+    return row["version"]
+
+
+def load_doc_session(session_id: str, firm_id: str) -> Optional[Dict]:
+    """Return the live session row for ``firm_id`` (state, hashes, version) or None."""
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT id, username, state, template_hash, draft_hash, version
+            FROM doc_chat_sessions
+            WHERE id = %s AND firm_id = %s AND expires_at > CURRENT_TIMESTAMP
+        """, (session_id, firm_id))
+        row = cur.fetchone()
+    if row is None:
+        return None
+    row = dict(row)
+    if isinstance(row["state"], str):
+        row["state"] = json.loads(row["state"])
+    return row
+
+
+def get_doc_session_version(session_id: str, firm_id: str) -> Optional[int]:
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT version FROM doc_chat_sessions
+            WHERE id = %s AND firm_id = %s AND expires_at > CURRENT_TIMESTAMP
+        """, (session_id, firm_id))
+        row = cur.fetchone()
+    return row["version"] if row else None
+
+
+def purge_expired_doc_sessions() -> Dict[str, int]:
+    """Delete expired sessions, then blobs no live session references."""
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("DELETE FROM doc_chat_sessions WHERE expires_at <= CURRENT_TIMESTAMP")
+        sessions = cur.rowcount
+        cur.execute("""
+            DELETE FROM doc_chat_blobs b
+            WHERE b.created_at < CURRENT_TIMESTAMP - INTERVAL '1 hour'
+              AND NOT EXISTS (
+                  SELECT 1 FROM doc_chat_sessions s
+                  WHERE s.draft_hash = b.hash OR s.template_hash = b.hash
+              )
+        """)
+        blobs = cur.rowcount
+    return {"sessions": sessions, "blobs": blobs}
@@ -5,7 +5,7 @@ Firms, templates (with full-text search via tsvector), and
 generated document history.
 """
 import logging
-from typing import List, Dict, Optional
+from typing import Iterator, List, Dict, Optional, Tuple
 
 from db.connection import get_connection
 
@@ -37,6 +37,13 @@ CREATE TABLE IF NOT EXISTS templates (
     last_used TIMESTAMP,
     usage_count INTEGER DEFAULT 0,
     search_vector TSVECTOR,
+    variable_analysis JSONB,
+    variable_analysis_key TEXT,
+    compiled_template JSONB,
+    compiled_key TEXT,
+    preprocessed_key TEXT,
+    minhash JSONB,
+    minhash_key TEXT,
     UNIQUE(firm_id, name)
 );
 
@@ -99,6 +106,33 @@ def ensure_documents_tables():
             ALTER TABLE templates ADD COLUMN IF NOT EXISTS search_vector TSVECTOR
         """)
 
+        # Cached variable analysis (document_chat), valid while
+        # variable_analysis_key == file_hash || ':' || <analysis version>
+        cur.execute("""
+            ALTER TABLE templates ADD COLUMN IF NOT EXISTS variable_analysis JSONB;
+            ALTER TABLE templates ADD COLUMN IF NOT EXISTS variable_analysis_key TEXT;
+        """)
+
+        # Compiled fill form (template_compiler), valid while
+        # compiled_key == file_hash || ':' || <compiler version>
+        cur.execute("""
+            ALTER TABLE templates ADD COLUMN IF NOT EXISTS compiled_template JSONB;
+            ALTER TABLE templates ADD COLUMN IF NOT EXISTS compiled_key TEXT;
+        """)
+
+        # Placeholder preprocessing (template_preprocessor, preprocess_templates_pg),
+        # done while preprocessed_key == file_hash || ':' || <preprocessor version>
+        cur.execute("""
+            ALTER TABLE templates ADD COLUMN IF NOT EXISTS preprocessed_key TEXT;
+        """)
+
+        # Near-duplicate signature (template_dedup), valid while
+        # minhash_key == file_hash || ':' || <minhash version>
+        cur.execute("""
+            ALTER TABLE templates ADD COLUMN IF NOT EXISTS minhash JSONB;
+            ALTER TABLE templates ADD COLUMN IF NOT EXISTS minhash_key TEXT;
+        """)
+
         # Backfill any rows with NULL search_vector (e.g., after column was just added)
         cur.execute("""
             UPDATE templates SET search_vector =
@@ -192,6 +226,27 @@ def get_template(template_id: int) -> Optional[Dict]:
         return dict(row) if row else None
 
 
+def get_template_meta(template_id: int) -> Optional[Dict]:
+    """Template row without its content or stored analyses."""
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            "SELECT id, firm_id, name, category, file_hash, is_active FROM templates WHERE id = %s",
+            (template_id,),
+        )
+        row = cur.fetchone()
+        return dict(row) if row else None
+
+
+def get_template_file_hash(template_id: int) -> Optional[str]:
+    """Current file_hash of a template, without fetching its content."""
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT file_hash FROM templates WHERE id = %s", (template_id,))
+        row = cur.fetchone()
+        return row["file_hash"] if row else None
+
+
 def get_templates(firm_id: str, category: str = None, active_only: bool = True) -> List[Dict]:
     with get_connection() as conn:
         cur = conn.cursor()
@@ -250,6 +305,29 @@ _SYNONYMS = {
 }
 
 
+def get_template_signature(firm_id: str) -> str:
+    """Digest of a firm's active template ids, names and tags; changes when any do."""
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            """
+            SELECT COUNT(*) || ':' || COALESCE(md5(string_agg(
+                       id || ':' || name || ':' || COALESCE(tags, ''), ',' ORDER BY id)), '') AS signature
+            FROM templates
+            WHERE firm_id = %s AND is_active = TRUE
+            """,
+            (firm_id,),
+        )
+        return cur.fetchone()["signature"]
+
+
+# Search results carry the near-duplicate signature (template_dedup) so clones
+# can be collapsed; NULL if it was computed for an older file
+_CURRENT_MINHASH = (
+    "CASE WHEN split_part(minhash_key, ':', 1) = file_hash THEN minhash END AS minhash"
+)
+
+
 def search_templates(firm_id: str, query: str, limit: int = 10) -> List[Dict]:
     """Search templates using PostgreSQL full-text search with synonym expansion."""
     # Apply synonym mappings
@@ -271,10 +349,11 @@ def search_templates(firm_id: str, query: str, limit: int = 10) -> List[Dict]:
             # Try tsvector search with OR logic
             tsquery = " | ".join(words)
             cur.execute(
-                """
+                f"""
                 SELECT id, firm_id, name, original_filename, category, subcategory,
                        court_type, jurisdiction, case_types, variables, tags,
                        file_hash, file_size, is_active, upload_date, last_used, usage_count,
+                       {_CURRENT_MINHASH},
                        ts_rank(search_vector, to_tsquery('english', %s)) AS rank
                 FROM templates
                 WHERE firm_id = %s AND is_active = TRUE
@@ -290,10 +369,11 @@ def search_templates(firm_id: str, query: str, limit: int = 10) -> List[Dict]:
 
         # Fallback: ILIKE search on name
         cur.execute(
-            """
+            f"""
             SELECT id, firm_id, name, original_filename, category, subcategory,
                    court_type, jurisdiction, case_types, variables, tags,
-                   file_hash, file_size, is_active, upload_date, last_used, usage_count
+                   file_hash, file_size, is_active, upload_date, last_used, usage_count,
+                   {_CURRENT_MINHASH}
             FROM templates
             WHERE firm_id = %s AND is_active = TRUE
               AND name ILIKE %s
@@ -318,6 +398,344 @@ def increment_template_usage(template_id: int):
         )
 
 
+# ── Variable Analysis ─────────────────────────────────────────
+# The variable analysis for a template version is stored on its row and
+# keyed by "<file_hash>:<analysis version>", so replacing the file or
+# changing the analysis prompt invalidates it without a separate purge.
+
+def get_variable_analysis(template_id: int, version: str) -> Optional[List[Dict]]:
+    """Return the stored analysis if it matches the template's current file_hash."""
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            """
+            SELECT variable_analysis FROM templates
+            WHERE id = %s AND variable_analysis_key = file_hash || ':' || %s
+            """,
+            (template_id, version),
+        )
+        row = cur.fetchone()
+    if row is None or row["variable_analysis"] is None:
+        return None
+    analysis = row["variable_analysis"]
+    if isinstance(analysis, str):
+        import json
+        analysis = json.loads(analysis)
+    return analysis
+
+
+def save_variable_analysis(template_id: int, file_hash: str, version: str,
+                           variables: List[Dict]) -> bool:
+    """Store an analysis computed from the file with ``file_hash``.
+
+    No-op (returns False) if the template's file changed in the meantime.
+    Rows imported before file_hash was tracked get it filled in here.
+    """
+    import json
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            """
+            UPDATE templates
+            SET variable_analysis = %s, variable_analysis_key = %s,
+                file_hash = COALESCE(file_hash, %s)
+            WHERE id = %s AND (file_hash = %s OR file_hash IS NULL)
+            """,
+            (json.dumps(variables), f"{file_hash}:{version}", file_hash, template_id, file_hash),
+        )
+        return cur.rowcount > 0
+
+
+def get_templates_needing_analysis(version: str, firm_id: str = None,
+                                   template_ids: List[int] = None, limit: int = None) -> List[Dict]:
+    """Active templates whose stored analysis is missing or stale."""
+    conditions = [
+        "is_active = TRUE",
+        "file_content IS NOT NULL",
+        "variable_analysis_key IS DISTINCT FROM file_hash || ':' || %s",
+    ]
+    params: list = [version]
+    if firm_id:
+        conditions.append("firm_id = %s")
+        params.append(firm_id)
+    if template_ids:
+        conditions.append("id = ANY(%s)")
+        params.append(list(template_ids))
+    query = (
+        "SELECT id, firm_id, name, category, file_content, file_hash FROM templates "
+        f"WHERE {' AND '.join(conditions)} ORDER BY id"
+    )
+    if limit:
+        query += " LIMIT %s"
+        params.append(limit)
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(query, params)
+        return [dict(r) for r in cur.fetchall()]
+
+
+# The compiled fill form (template_compiler) follows the same scheme,
+# keyed by "<file_hash>:<compiler version>".
+
+def get_compiled_template(template_id: int, version: str) -> Optional[Dict]:
+    """Return the stored compiled form if it matches the template's current file_hash."""
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            """
+            SELECT compiled_template FROM templates
+            WHERE id = %s AND compiled_key = file_hash || ':' || %s
+            """,
+            (template_id, version),
+        )
+        row = cur.fetchone()
+    if row is None or row["compiled_template"] is None:
+        return None
+    compiled = row["compiled_template"]
+    if isinstance(compiled, str):
+        import json
+        compiled = json.loads(compiled)
+    return compiled
+
+
+def save_compiled_template(template_id: int, file_hash: str, version: str, compiled: Dict) -> bool:
+    """Store a compiled form built from the file with ``file_hash``.
+
+    No-op (returns False) if the template's file changed in the meantime.
+    """
+    import json
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            """
+            UPDATE templates
+            SET compiled_template = %s, compiled_key = %s,
+                file_hash = COALESCE(file_hash, %s)
+            WHERE id = %s AND (file_hash = %s OR file_hash IS NULL)
+            """,
+            (json.dumps(compiled), f"{file_hash}:{version}", file_hash, template_id, file_hash),
+        )
+        return cur.rowcount > 0
+
+
+def get_templates_needing_compile(version: str, firm_id: str = None,
+                                  template_ids: List[int] = None, limit: int = None) -> List[Dict]:
+    """Active templates whose stored compiled form is missing or stale."""
+    conditions = [
+        "is_active = TRUE",
+        "file_content IS NOT NULL",
+        "compiled_key IS DISTINCT FROM file_hash || ':' || %s",
+    ]
+    params: list = [version]
+    if firm_id:
+        conditions.append("firm_id = %s")
+        params.append(firm_id)
+    if template_ids:
+        conditions.append("id = ANY(%s)")
+        params.append(list(template_ids))
+    query = (
+        "SELECT id, firm_id, name, file_content, file_hash FROM templates "
+        f"WHERE {' AND '.join(conditions)} ORDER BY id"
+    )
+    if limit:
+        query += " LIMIT %s"
+        params.append(limit)
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(query, params)
+        return [dict(r) for r in cur.fetchall()]
+
+
+# Placeholder preprocessing records "<file_hash>:<preprocessor version>" in
+# preprocessed_key, so re-runs only read templates that changed since.
+
+# Templates per server-side cursor fetch; each row carries its .docx
+PREPROCESS_STREAM_BATCH = 20
+
+
+def _preprocess_conditions(version: str, firm_id: str = None, template_ids: List[int] = None,
+                           force: bool = False) -> Tuple[List[str], list]:
+    conditions = ["is_active = TRUE", "file_content IS NOT NULL"]
+    params: list = []
+    if not force:
+        conditions.append("preprocessed_key IS DISTINCT FROM file_hash || ':' || %s")
+        params.append(version)
+    if firm_id:
+        conditions.append("firm_id = %s")
+        params.append(firm_id)
+    if template_ids:
+        conditions.append("id = ANY(%s)")
+        params.append(list(template_ids))
+    return conditions, params
+
+
+def count_templates_needing_preprocess(version: str, firm_id: str = None,
+                                       template_ids: List[int] = None, force: bool = False) -> int:
+    conditions, params = _preprocess_conditions(version, firm_id, template_ids, force)
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(f"SELECT COUNT(*) AS n FROM templates WHERE {' AND '.join(conditions)}", params)
+        return cur.fetchone()["n"]
+
+
+def stream_templates_needing_preprocess(version: str, firm_id: str = None,
+                                        template_ids: List[int] = None, limit: int = None,
+                                        force: bool = False) -> Iterator[Dict]:
+    """Active templates not yet preprocessed at ``version`` (all of them with ``force``).
+
+    Streamed from a server-side cursor, PREPROCESS_STREAM_BATCH rows at a
+    time: dicts with id, firm_id, name, file_content (bytes) and file_hash.
+    """
+    from db.streaming import stream_rows
+
+    conditions, params = _preprocess_conditions(version, firm_id, template_ids, force)
+    query = (
+        "SELECT id, firm_id, name, file_content, file_hash FROM templates "
+        f"WHERE {' AND '.join(conditions)} ORDER BY id"
+    )
+    if limit:
+        query += " LIMIT %s"
+        params.append(limit)
+    for row in stream_rows(query, params, batch_size=PREPROCESS_STREAM_BATCH, dict_rows=True):
+        row = dict(row)
+        if hasattr(row["file_content"], "tobytes"):
+            row["file_content"] = row["file_content"].tobytes()
+        yield row
+
+
+def save_preprocessed_template(template_id: int, source_hash: str, content: bytes,
+                               version: str, variables: List[str] = None) -> bool:
+    """Replace a template's content with its preprocessed form.
+
+    ``source_hash`` is the sha256 of the content that was preprocessed;
+    no-op (returns False) if the template's file changed in the meantime.
+    """
+    import hashlib
+    import json
+
+    file_hash = hashlib.sha256(content).hexdigest()
+    assignments = ["file_content = %s", "file_hash = %s", "file_size = %s", "preprocessed_key = %s"]
+    params: list = [content, file_hash, len(content), f"{file_hash}:{version}"]
+    if variables is not None:
+        assignments.append("variables = %s")
+        params.append(json.dumps(variables))
+    params += [template_id, source_hash]
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            f"""
+            UPDATE templates SET {', '.join(assignments)}
+            WHERE id = %s AND (file_hash = %s OR file_hash IS NULL)
+            """,
+            params,
+        )
+        return cur.rowcount > 0
+
+
+def mark_template_preprocessed(template_id: int, source_hash: str, version: str) -> bool:
+    """Record that the content with ``source_hash`` needed no changes at ``version``.
+
+    Rows imported before file_hash was tracked get it filled in here.
+    """
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            """
+            UPDATE templates
+            SET preprocessed_key = %s, file_hash = COALESCE(file_hash, %s)
+            WHERE id = %s AND (file_hash = %s OR file_hash IS NULL)
+            """,
+            (f"{source_hash}:{version}", source_hash, template_id, source_hash),
+        )
+        return cur.rowcount > 0
+
+
+# Near-duplicate signatures (template_dedup) follow the same scheme, keyed
+# by "<file_hash>:<minhash version>".
+
+def save_template_minhash(template_id: int, file_hash: str, version: str,
+                          signature: Optional[List[int]]) -> bool:
+    """Store the MinHash signature of the file with ``file_hash``.
+
+    No-op (returns False) if the template's file changed in the meantime.
+    """
+    import json
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            """
+            UPDATE templates
+            SET minhash = %s, minhash_key = %s,
+                file_hash = COALESCE(file_hash, %s)
+            WHERE id = %s AND (file_hash = %s OR file_hash IS NULL)
+            """,
+            (json.dumps(signature) if signature is not None else None,
+             f"{file_hash}:{version}", file_hash, template_id, file_hash),
+        )
+        return cur.rowcount > 0
+
+
+def stream_templates_needing_minhash(version: str, firm_id: str = None,
+                                     template_ids: List[int] = None,
+                                     limit: int = None) -> Iterator[Dict]:
+    """Active templates whose stored signature is missing or stale, streamed like
+    stream_templates_needing_preprocess()."""
+    from db.streaming import stream_rows
+
+    conditions = [
+        "is_active = TRUE",
+        "file_content IS NOT NULL",
+        "minhash_key IS DISTINCT FROM file_hash || ':' || %s",
+    ]
+    params: list = [version]
+    if firm_id:
+        conditions.append("firm_id = %s")
+        params.append(firm_id)
+    if template_ids:
+        conditions.append("id = ANY(%s)")
+        params.append(list(template_ids))
+    query = (
+        "SELECT id, firm_id, name, file_content, file_hash FROM templates "
+        f"WHERE {' AND '.join(conditions)} ORDER BY id"
+    )
+    if limit:
+        query += " LIMIT %s"
+        params.append(limit)
+    for row in stream_rows(query, params, batch_size=PREPROCESS_STREAM_BATCH, dict_rows=True):
+        row = dict(row)
+        if hasattr(row["file_content"], "tobytes"):
+            row["file_content"] = row["file_content"].tobytes()
+        yield row
+
+
+def get_template_minhashes(firm_id: str, version: str) -> List[Dict]:
+    """id, name, usage_count and minhash of a firm's active templates with a current signature."""
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            """
+            SELECT id, name, usage_count, minhash FROM templates
+            WHERE firm_id = %s AND is_active = TRUE AND minhash IS NOT NULL
+              AND minhash_key = file_hash || ':' || %s
+            ORDER BY id
+            """,
+            (firm_id, version),
+        )
+        return [dict(r) for r in cur.fetchall()]
+
+
+def deactivate_templates(firm_id: str, template_ids: List[int]) -> int:
+    if not template_ids:
+        return 0
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            "UPDATE templates SET is_active = FALSE WHERE firm_id = %s AND id = ANY(%s)",
+            (firm_id, list(template_ids)),
+        )
+        return cur.rowcount
+
+
 # ── Generated Documents ───────────────────────────────────────
 
 def record_generated_document(
@@ -348,6 +766,37 @@ def record_generated_document(
         return row["id"] if row else 0
 
 
+def record_generated_documents(firm_id: str, template_id: int, template_name: str,
+                               documents: List[Dict], generated_by: str = None) -> int:
+    """Record a batch of generated documents ({case_id, client_name, variables_used,
+    output_filename} dicts) in one statement."""
+    if not documents:
+        return 0
+    import json
+    from psycopg2.extras import execute_values
+
+    with get_connection() as conn:
+        cur = conn.cursor()
+        execute_values(
+            cur,
+            """
+            INSERT INTO generated_documents
+                (firm_id, template_id, template_name, case_id, client_name,
+                 variables_used, generated_by, output_filename)
+            VALUES %s
+            """,
+            [(firm_id, template_id, template_name, d.get("case_id"), d.get("client_name"),
+              json.dumps(d.get("variables_used") or {}), generated_by, d.get("output_filename"))
+             for d in documents],
+            page_size=500,
+        )
+        cur.execute(
+            "UPDATE templates SET usage_count = usage_count + %s, last_used = CURRENT_TIMESTAMP WHERE id = %s",
+            (len(documents), template_id),
+        )
+    return len(documents)
+
+
 def get_generated_documents(firm_id: str, case_id: str = None, limit: int = 50) -> List[Dict]:
     with get_connection() as conn:
         cur = conn.cursor()
@@ -0,0 +1,420 @@
+"""
+Dunning Queue — Incrementally Maintained, PostgreSQL Multi-Tenant
+
+One row per open invoice (balance > 0, has a due date) with everything the
+dunning page, /api/dunning/run and /api/dunning/export need: case, attorney,
+billing contact + email, balances, latest aging-upload amounts and the last
+notice sent. Reads become a single indexed scan of this table instead of a
+join across cached_invoices/cases/clients/contacts/dunning_notices.
+
+Maintenance:
+- Statement-level triggers on cached_invoices, cached_payments, cached_cases,
+  cached_clients, cached_contacts and dunning_notices refresh just the
+  affected invoices, so every writer (sync, sync_mt, webhooks, dashboard
+  notice sends) keeps the queue current without code changes.
+- Aging uploads record their batch as the firm's latest_aging_batch in
+  dunning_queue_state (so refreshes don't re-aggregate the upload history)
+  and call refresh_dunning_queue(firm_id) once per upload.
+- Trigger failures are downgraded to warnings so a queue problem can never
+  block a sync, but they also mark the firm stale in dunning_queue_state;
+  the next dashboard read rebuilds a stale firm (refresh_if_stale), and
+  `collections rebuild-queue` (scheduled daily) reconciles every firm.
+
+The dunning stage is not stored: it advances with the calendar, so readers
+derive it from due_date with STAGE_SQL.
+"""
+import logging
+from typing import Dict, List, Optional
+
+from db.connection import get_connection
+
+logger = logging.getLogger(__name__)
+
+
+# ============================================================
+# Schema
+# ============================================================
+
+DUNNING_QUEUE_SCHEMA = """
+-- Aging report rows uploaded via /api/aging-upload (amount actually due now)
+CREATE TABLE IF NOT EXISTS aging_invoice_uploads (
+    id SERIAL PRIMARY KEY,
+    firm_id VARCHAR(36) NOT NULL,
+    invoice_number TEXT NOT NULL,
+    client_name TEXT,
+    case_name TEXT,
+    amount_overdue REAL,
+    invoice_total REAL,
+    amount_paid REAL,
+    due_date DATE,
+    status TEXT,
+    days_aging INTEGER,
+    upload_batch_id TEXT NOT NULL,
+    uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_aging_uploads_batch
+    ON aging_invoice_uploads(firm_id, upload_batch_id, invoice_number);
+
+CREATE TABLE IF NOT EXISTS dunning_queue (
+    firm_id VARCHAR(36) NOT NULL,
+    invoice_id INTEGER NOT NULL,
+    invoice_number TEXT,
+    case_id INTEGER,
+    case_name TEXT,
+    lead_attorney_name TEXT,
+    case_status TEXT NOT NULL DEFAULT 'open',
+    contact_name TEXT,
+    contact_email TEXT,
+    balance_due REAL NOT NULL,
+    due_date DATE NOT NULL,
+    aging_amount_due REAL,
+    aging_invoice_total REAL,
+    last_notice_level INTEGER,
+    last_notice_at TIMESTAMP,
+    refreshed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (firm_id, invoice_id)
+);
+-- Matches DashboardData.DUNNING_QUEUE_ORDER so keyset pages are index range scans
+DROP INDEX IF EXISTS idx_dq_firm_due;
+CREATE INDEX IF NOT EXISTS idx_dq_firm_page
+    ON dunning_queue(firm_id, due_date, balance_due DESC, invoice_id DESC);
+
+-- Per-firm queue bookkeeping: the aging batch refreshes join against (set by
+-- the upload merge) and, when a trigger refresh failed, since when the
+-- firm's queue has been stale
+CREATE TABLE IF NOT EXISTS dunning_queue_state (
+    firm_id VARCHAR(36) PRIMARY KEY,
+    latest_aging_batch TEXT,
+    stale_since TIMESTAMP,
+    last_error TEXT
+);
+
+-- Rebuild queue rows for one firm: all invoices when p_invoice_ids is NULL,
+-- otherwise just the listed ones. Returns rows upserted. A full rebuild
+-- clears the firm's stale flag.
+CREATE OR REPLACE FUNCTION refresh_dunning_queue(p_firm_id VARCHAR, p_invoice_ids INTEGER[])
+RETURNS INTEGER AS $$
+DECLARE
+    v_started TIMESTAMP := clock_timestamp();
+    v_batch TEXT;
+    v_count INTEGER;
+BEGIN
+    SELECT latest_aging_batch INTO v_batch
+    FROM dunning_queue_state
+    WHERE firm_id = p_firm_id;
+
+    INSERT INTO dunning_queue (
+        firm_id, invoice_id, invoice_number, case_id, case_name, lead_attorney_name,
+        case_status, contact_name, contact_email, balance_due, due_date,
+        aging_amount_due, aging_invoice_total, last_notice_level, last_notice_at,
+        refreshed_at
+    )
+    SELECT
+        i.firm_id, i.id, i.invoice_number, i.case_id, c.name, c.lead_attorney_name,
+        LOWER(COALESCE(c.status, 'open')),
+        COALESCE(cl.first_name || ' ' || cl.last_name, ct.name),
+        COALESCE(cl.email, ct.email),
+        i.balance_due, i.due_date,
+        ag.amount_overdue, ag.invoice_total,
+        dn.notice_level, dn.sent_at,
+        CURRENT_TIMESTAMP
+    FROM cached_invoices i
+    LEFT JOIN cached_cases c ON i.case_id = c.id AND i.firm_id = c.firm_id
+    LEFT JOIN cached_clients cl
+        ON cl.id = (c.data_json::jsonb -> 'billing_contact' ->> 'id')::integer
+        AND cl.firm_id = i.firm_id
+    LEFT JOIN cached_contacts ct ON i.contact_id = ct.id AND i.firm_id = ct.firm_id
+    LEFT JOIN LATERAL (
+        SELECT a.amount_overdue, a.invoice_total
+        FROM aging_invoice_uploads a
+        WHERE a.firm_id = i.firm_id
+          AND a.upload_batch_id = v_batch
+          AND a.invoice_number = i.invoice_number
+        ORDER BY a.id DESC
+        LIMIT 1
+    ) ag ON true
+    LEFT JOIN LATERAL (
+        SELECT MAX(notice_level) AS notice_level, MAX(sent_at) AS sent_at
+        FROM dunning_notices
+        WHERE firm_id = i.firm_id AND invoice_id = i.id
+    ) dn ON true
+    WHERE i.firm_id = p_firm_id
+      AND i.balance_due > 0
+      AND i.due_date IS NOT NULL
+      AND (p_invoice_ids IS NULL OR i.id = ANY(p_invoice_ids))
+    ON CONFLICT (firm_id, invoice_id) DO UPDATE SET
+        invoice_number = EXCLUDED.invoice_number,
+        case_id = EXCLUDED.case_id,
+        case_name = EXCLUDED.case_name,
+        lead_attorney_name = EXCLUDED.lead_attorney_name,
+        case_status = EXCLUDED.case_status,
+        contact_name = EXCLUDED.contact_name,
+        contact_email = EXCLUDED.contact_email,
+        balance_due = EXCLUDED.balance_due,
+        due_date = EXCLUDED.due_date,
+        aging_amount_due = EXCLUDED.aging_amount_due,
+        aging_invoice_total = EXCLUDED.aging_invoice_total,
+        last_notice_level = EXCLUDED.last_notice_level,
+        last_notice_at = EXCLUDED.last_notice_at,
+        refreshed_at = EXCLUDED.refreshed_at;
+    GET DIAGNOSTICS v_count = ROW_COUNT;
+
+    -- Drop rows for invoices that were paid off or removed
+    DELETE FROM dunning_queue q
+    WHERE q.firm_id = p_firm_id
+      AND (p_invoice_ids IS NULL OR q.invoice_id = ANY(p_invoice_ids))
+      AND NOT EXISTS (
+          SELECT 1 FROM cached_invoices i
+          WHERE i.firm_id = q.firm_id AND i.id = q.invoice_id
+            AND i.balance_due > 0 AND i.due_date IS NOT NULL
+      );
+
+    IF p_invoice_ids IS NULL THEN
+        UPDATE dunning_queue_state SET stale_since = NULL, last_error = NULL
+        WHERE firm_id = p_firm_id AND stale_since <= v_started;
+    END IF;
+
+    RETURN v_count;
+END
+$$ LANGUAGE plpgsql;
+
+-- Called from the trigger exception handlers; must never raise itself
+CREATE OR REPLACE FUNCTION dunning_queue_mark_stale(p_firm_ids VARCHAR[], p_error TEXT)
+RETURNS void AS $$
+BEGIN
+    INSERT INTO dunning_queue_state (firm_id, stale_since, last_error)
+    SELECT DISTINCT f, clock_timestamp(), p_error FROM unnest(p_firm_ids) f
+    ON CONFLICT (firm_id) DO UPDATE SET
+        stale_since = EXCLUDED.stale_since,
+        last_error = EXCLUDED.last_error;
+EXCEPTION WHEN OTHERS THEN
+    RAISE WARNING 'dunning_queue stale flag not recorded: %', SQLERRM;
+END
+$$ LANGUAGE plpgsql;
+
+-- Trigger functions: map changed source rows to affected invoice ids.
+-- Each reads the statement's transition table (changed_rows).
+CREATE OR REPLACE FUNCTION dunning_queue_from_invoices() RETURNS trigger AS $$
+BEGIN
+    PERFORM refresh_dunning_queue(firm_id, array_agg(DISTINCT id))
+    FROM changed_rows GROUP BY firm_id;
+    RETURN NULL;
+EXCEPTION WHEN OTHERS THEN
+    RAISE WARNING 'dunning_queue refresh from % skipped: %', TG_TABLE_NAME, SQLERRM;
+    PERFORM dunning_queue_mark_stale(ARRAY(SELECT DISTINCT firm_id FROM changed_rows),
+                                     TG_TABLE_NAME || ': ' || SQLERRM);
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION dunning_queue_from_invoice_refs() RETURNS trigger AS $$
+BEGIN
+    -- cached_payments and dunning_notices both carry invoice_id
+    PERFORM refresh_dunning_queue(firm_id, array_agg(DISTINCT invoice_id))
+    FROM changed_rows WHERE invoice_id IS NOT NULL GROUP BY firm_id;
+    RETURN NULL;
+EXCEPTION WHEN OTHERS THEN
+    RAISE WARNING 'dunning_queue refresh from % skipped: %', TG_TABLE_NAME, SQLERRM;
+    PERFORM dunning_queue_mark_stale(ARRAY(SELECT DISTINCT firm_id FROM changed_rows),
+                                     TG_TABLE_NAME || ': ' || SQLERRM);
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION dunning_queue_from_cases() RETURNS trigger AS $$
+BEGIN
+    PERFORM refresh_dunning_queue(i.firm_id, array_agg(i.id))
+    FROM cached_invoices i
+    JOIN (SELECT DISTINCT firm_id, id FROM changed_rows) ch
+        ON i.firm_id = ch.firm_id AND i.case_id = ch.id
+    WHERE i.balance_due > 0
+    GROUP BY i.firm_id;
+    RETURN NULL;
+EXCEPTION WHEN OTHERS THEN
+    RAISE WARNING 'dunning_queue refresh from % skipped: %', TG_TABLE_NAME, SQLERRM;
+    PERFORM dunning_queue_mark_stale(ARRAY(SELECT DISTINCT firm_id FROM changed_rows),
+                                     TG_TABLE_NAME || ': ' || SQLERRM);
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION dunning_queue_from_contacts() RETURNS trigger AS $$
+BEGIN
+    PERFORM refresh_dunning_queue(q.firm_id, array_agg(q.invoice_id))
+    FROM dunning_queue q
+    JOIN cached_invoices i ON i.firm_id = q.firm_id AND i.id = q.invoice_id
+    JOIN (SELECT DISTINCT firm_id, id FROM changed_rows) ch
+        ON i.firm_id = ch.firm_id AND i.contact_id = ch.id
+    GROUP BY q.firm_id;
+    RETURN NULL;
+EXCEPTION WHEN OTHERS THEN
+    RAISE WARNING 'dunning_queue refresh from % skipped: %', TG_TABLE_NAME, SQLERRM;
+    PERFORM dunning_queue_mark_stale(ARRAY(SELECT DISTINCT firm_id FROM changed_rows),
+                                     TG_TABLE_NAME || ': ' || SQLERRM);
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION dunning_queue_from_clients() RETURNS trigger AS $$
+BEGIN
+    -- Clients reach invoices through the case's billing_contact
+    PERFORM refresh_dunning_queue(q.firm_id, array_agg(q.invoice_id))
+    FROM dunning_queue q
+    JOIN cached_cases c ON c.firm_id = q.firm_id AND c.id = q.case_id
+    JOIN (SELECT DISTINCT firm_id, id FROM changed_rows) ch
+        ON c.firm_id = ch.firm_id
+        AND (c.data_json::jsonb -> 'billing_contact' ->> 'id')::integer = ch.id
+    GROUP BY q.firm_id;
+    RETURN NULL;
+EXCEPTION WHEN OTHERS THEN
+    RAISE WARNING 'dunning_queue refresh from % skipped: %', TG_TABLE_NAME, SQLERRM;
+    PERFORM dunning_queue_mark_stale(ARRAY(SELECT DISTINCT firm_id FROM changed_rows),
+                                     TG_TABLE_NAME || ': ' || SQLERRM);
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+"""
+
+# Run by the aging upload merge (db/ingest.py) in the merge's transaction
+SET_LATEST_AGING_BATCH_SQL = """
+    INSERT INTO dunning_queue_state (firm_id, latest_aging_batch)
+    VALUES (%(firm_id)s, %(batch_id)s)
+    ON CONFLICT (firm_id) DO UPDATE SET latest_aging_batch = EXCLUDED.latest_aging_batch
+"""
+
+# One-time seed from upload history for deployments that predate the state table
+BACKFILL_LATEST_AGING_BATCH_SQL = """
+    INSERT INTO dunning_queue_state (firm_id, latest_aging_batch)
+    SELECT DISTINCT ON (firm_id) firm_id, upload_batch_id
+    FROM aging_invoice_uploads
+    ORDER BY firm_id, uploaded_at DESC, id DESC
+    ON CONFLICT (firm_id) DO UPDATE SET latest_aging_batch = EXCLUDED.latest_aging_batch
+    WHERE dunning_queue_state.latest_aging_batch IS NULL
+"""
+
+# (source table, trigger function). Each gets one statement-level trigger per
+# event because a trigger with transition tables can only fire on one event.
+_QUEUE_TRIGGERS = [
+    ("cached_invoices", "dunning_queue_from_invoices"),
+    ("cached_payments", "dunning_queue_from_invoice_refs"),
+    ("dunning_notices", "dunning_queue_from_invoice_refs"),
+    ("cached_cases", "dunning_queue_from_cases"),
+    ("cached_contacts", "dunning_queue_from_contacts"),
+    ("cached_clients", "dunning_queue_from_clients"),
+]
+
+# Stage from days overdue, read-time twin of ARDataMixin._compute_dunning_stage.
+# Stage 4 (NOIW) requires an open case; closed cases cap at stage 3.
+STAGE_SQL = """
+    CASE
+        WHEN (CURRENT_DATE - q.due_date) >= 60 AND q.case_status = 'open' THEN 4
+        WHEN (CURRENT_DATE - q.due_date) >= 30 THEN 3
+        WHEN (CURRENT_DATE - q.due_date) >= 15 THEN 2
+        WHEN (CURRENT_DATE - q.due_date) >= 5 THEN 1
+        ELSE 0
+    END
+"""
+
+
+def _ensure_queue_triggers(cur):
+    for table, func in _QUEUE_TRIGGERS:
+        for event, transition in (("INSERT", "NEW"), ("UPDATE", "NEW"), ("DELETE", "OLD")):
+            name = f"trg_dq_{table}_{event.lower()}"
+            cur.execute(f"""
+                DO $$
+                BEGIN
+                    IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = '{name}') THEN
+                        CREATE TRIGGER {name}
+                        AFTER {event} ON {table}
+                        REFERENCING {transition} TABLE AS changed_rows
+                        FOR EACH STATEMENT EXECUTE FUNCTION {func}();
+                    END IF;
+                END
+                $$;
+            """)
+
+
+def ensure_dunning_queue_tables():
+    """Create the dunning queue, its refresh function and source triggers.
+
+    Must run after the cache and tracking tables exist. Backfills the queue
+    the first time it is created.
+    """
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(DUNNING_QUEUE_SCHEMA)
+        _ensure_queue_triggers(cur)
+
+        cur.execute("SELECT EXISTS (SELECT 1 FROM dunning_queue_state "
+                    "WHERE latest_aging_batch IS NOT NULL) AS populated")
+        if not cur.fetchone()["populated"]:
+            cur.execute(BACKFILL_LATEST_AGING_BATCH_SQL)
+
+        cur.execute("SELECT EXISTS (SELECT 1 FROM dunning_queue) AS populated")
+        if not cur.fetchone()["populated"]:
+            cur.execute("""
+                SELECT COALESCE(SUM(refresh_dunning_queue(firm_id, NULL)), 0) AS n
+                FROM (SELECT DISTINCT firm_id FROM cached_invoices) f
+            """)
+            logger.info("Dunning queue backfilled with %s rows", cur.fetchone()["n"])
+    logger.info("Dunning queue tables ensured")
+
+
+# ============================================================
+# Maintenance
+# ============================================================
+
+def refresh_dunning_queue(firm_id: str, invoice_ids: Optional[List[int]] = None) -> int:
+    """Rebuild queue rows for a firm (all invoices, or just ``invoice_ids``).
+
+    Triggers handle routine changes; call this after aging uploads and for
+    the daily reconcile.
+    """
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            "SELECT refresh_dunning_queue(%s, %s::INTEGER[]) AS n",
+            (firm_id, list(invoice_ids) if invoice_ids is not None else None),
+        )
+        row = cur.fetchone()
+        return row["n"] if row else 0
+
+
+def refresh_if_stale(firm_id: str) -> bool:
+    """Rebuild the firm's queue if a trigger refresh failed since the last rebuild.
+
+    Readers call this first so a failed trigger costs one slower read instead
+    of a wrong queue until the daily reconcile.
+    """
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            "SELECT stale_since, last_error FROM dunning_queue_state "
+            "WHERE firm_id = %s AND stale_since IS NOT NULL",
+            (firm_id,),
+        )
+        row = cur.fetchone()
+    if not row:
+        return False
+    logger.warning("Dunning queue for %s stale since %s (%s); rebuilding",
+                   firm_id, row["stale_since"], row["last_error"])
+    refresh_dunning_queue(firm_id)
+    return True
+
+
+def refresh_all_dunning_queues() -> Dict[str, int]:
+    """Rebuild the queue for every firm with invoices or queue rows.
+
+    Firms that only have queue rows left (all invoices removed) are included
+    so their stale rows get dropped. Returns rows upserted per firm.
+    """
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT firm_id FROM cached_invoices
+            UNION
+            SELECT firm_id FROM dunning_queue
+            ORDER BY firm_id
+        """)
+        firm_ids = [row["firm_id"] for row in cur.fetchall()]
+    return {firm_id: refresh_dunning_queue(firm_id) for firm_id in firm_ids}
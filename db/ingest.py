@@ -0,0 +1,328 @@
+"""
+Staged Upload Ingestion — PostgreSQL Multi-Tenant
+
+Spreadsheet uploads (aging reports, trust ledgers) are loaded in two steps:
+
+1. Stage: parsed rows are COPYed in chunks into an UNLOGGED staging table
+   keyed by job_id. One COPY per chunk instead of one INSERT per row.
+2. Merge: a background job moves the staged rows into the real table with
+   set-based SQL (including trust ledger case matching), then clears the
+   staging rows.
+
+Every upload gets an upload_jobs row so the browser can poll progress:
+staging -> staged -> merging -> completed | failed.
+
+Usage:
+    from db.ingest import create_upload_job, copy_staging_rows, merge_upload_job
+
+    job_id = create_upload_job(firm_id, "aging", filename)
+    copy_staging_rows(job_id, "aging", rows)      # iterable of tuples
+    merge_upload_job(job_id)                       # usually in a thread
+"""
+import csv
+import io
+import logging
+import uuid
+from typing import Dict, Iterable, Optional
+
+from db.connection import get_connection
+
+logger = logging.getLogger(__name__)
+
+COPY_CHUNK_ROWS = 5000
+
+
+# ============================================================
+# Schema
+# ============================================================
+
+INGEST_SCHEMA = """
+CREATE TABLE IF NOT EXISTS upload_jobs (
+    id VARCHAR(36) PRIMARY KEY,
+    firm_id VARCHAR(36) NOT NULL,
+    kind TEXT NOT NULL,
+    filename TEXT,
+    status TEXT NOT NULL DEFAULT 'staging',
+    rows_staged INTEGER DEFAULT 0,
+    rows_imported INTEGER,
+    rows_matched INTEGER,
+    batch_id VARCHAR(36),
+    error TEXT,
+    created_by TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_upload_jobs_firm ON upload_jobs(firm_id, created_at);
+
+-- Staging tables are UNLOGGED: rows live for seconds and can be re-uploaded
+CREATE UNLOGGED TABLE IF NOT EXISTS aging_upload_staging (
+    job_id VARCHAR(36) NOT NULL,
+    line_no INTEGER NOT NULL,
+    invoice_number TEXT,
+    client_name TEXT,
+    case_name TEXT,
+    amount_overdue REAL,
+    invoice_total REAL,
+    amount_paid REAL,
+    due_date DATE,
+    status TEXT,
+    days_aging INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_aging_staging_job ON aging_upload_staging(job_id);
+
+CREATE UNLOGGED TABLE IF NOT EXISTS trust_upload_staging (
+    job_id VARCHAR(36) NOT NULL,
+    line_no INTEGER NOT NULL,
+    case_number TEXT,
+    case_name TEXT,
+    client_name TEXT,
+    trust_balance NUMERIC(12, 2)
+);
+CREATE INDEX IF NOT EXISTS idx_trust_staging_job ON trust_upload_staging(job_id);
+"""
+
+STAGING_COLUMNS = {
+    "aging": ("aging_upload_staging",
+              ["invoice_number", "client_name", "case_name", "amount_overdue",
+               "invoice_total", "amount_paid", "due_date", "status", "days_aging"]),
+    "trust": ("trust_upload_staging",
+              ["case_number", "case_name", "client_name", "trust_balance"]),
+}
+
+
+def ensure_ingest_tables():
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(INGEST_SCHEMA)
+
+
+# ============================================================
+# Jobs
+# ============================================================
+
+def create_upload_job(firm_id: str, kind: str, filename: str = None,
+                      created_by: str = None) -> str:
+    """Register a new upload and return its job_id."""
+    if kind not in STAGING_COLUMNS:
+        raise ValueError(f"Unknown upload kind: {kind}")
+    job_id = str(uuid.uuid4())
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            INSERT INTO upload_jobs (id, firm_id, kind, filename, created_by)
+            VALUES (%s, %s, %s, %s, %s)
+        """, (job_id, firm_id, kind, filename, created_by))
+    return job_id
+
+
+def update_upload_job(job_id: str, **fields):
+    if not fields:
+        return
+    assignments = ", ".join(f"{k} = %s" for k in fields)
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            f"UPDATE upload_jobs SET {assignments}, updated_at = CURRENT_TIMESTAMP WHERE id = %s",
+            list(fields.values()) + [job_id],
+        )
+
+
+def get_upload_job(firm_id: str, job_id: str) -> Optional[Dict]:
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT id, kind, filename, status, rows_staged, rows_imported,
+                   rows_matched, batch_id, error, created_at, updated_at
+            FROM upload_jobs
+            WHERE firm_id = %s AND id = %s
+        """, (firm_id, job_id))
+        row = cur.fetchone()
+        return dict(row) if row else None
+
+
+# ============================================================
+# Stage
+# ============================================================
+
+def _csv_buffer(job_id: str, start: int, rows) -> io.StringIO:
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    for offset, row in enumerate(rows):
+        writer.writerow([job_id, start + offset] + ["" if v is None else v for v in row])
+    buf.seek(0)
+    return buf
+
+
+def copy_staging_rows(job_id: str, kind: str, rows: Iterable[tuple],
+                      chunk_rows: int = COPY_CHUNK_ROWS) -> int:
+    """COPY ``rows`` (tuples in STAGING_COLUMNS order) into staging. Returns row count.
+
+    Empty strings load as NULL. Progress (rows_staged) is recorded per chunk.
+    """
+    table, columns = STAGING_COLUMNS[kind]
+    copy_sql = (f"COPY {table} (job_id, line_no, {', '.join(columns)}) "
+                f"FROM STDIN WITH (FORMAT csv, NULL '')")
+    total = 0
+    chunk = []
+    with get_connection() as conn:
+        cur = conn.cursor()
+
+        def flush():
+            nonlocal total
+            cur.copy_expert(copy_sql, _csv_buffer(job_id, total, chunk))
+            total += len(chunk)
+            chunk.clear()
+            cur.execute(
+                "UPDATE upload_jobs SET rows_staged = %s, updated_at = CURRENT_TIMESTAMP WHERE id = %s",
+                (total, job_id),
+            )
+
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= chunk_rows:
+                flush()
+        if chunk:
+            flush()
+        cur.execute(
+            "UPDATE upload_jobs SET status = 'staged', updated_at = CURRENT_TIMESTAMP WHERE id = %s",
+            (job_id,),
+        )
+    return total
+
+
+# ============================================================
+# Merge
+# ============================================================
+
+AGING_MERGE_SQL = """
+    INSERT INTO aging_invoice_uploads
+        (firm_id, invoice_number, client_name, case_name,
+         amount_overdue, invoice_total, amount_paid,
+         due_date, status, days_aging, upload_batch_id)
+    SELECT %(firm_id)s, TRIM(s.invoice_number), COALESCE(TRIM(s.client_name), ''),
+           COALESCE(TRIM(s.case_name), ''), s.amount_overdue, s.invoice_total,
+           s.amount_paid, s.due_date, COALESCE(TRIM(s.status), ''), s.days_aging,
+           %(batch_id)s
+    FROM aging_upload_staging s
+    WHERE s.job_id = %(job_id)s
+      AND COALESCE(TRIM(s.invoice_number), '') <> ''
+    ORDER BY s.line_no
+"""
+
+# Same precedence as the old per-row matcher: exact case number, then exact
+# case name, then client name contained in an open case's name.
+TRUST_MERGE_SQL = """
+    WITH open_cases AS (
+        SELECT id, LOWER(TRIM(case_number)) AS number_key, LOWER(TRIM(name)) AS name_key
+        FROM cached_cases
+        WHERE firm_id = %(firm_id)s AND status = 'open'
+    ),
+    staged AS (
+        SELECT s.line_no,
+               NULLIF(TRIM(s.case_number), '') AS case_number,
+               NULLIF(TRIM(s.case_name), '') AS case_name,
+               NULLIF(TRIM(s.client_name), '') AS client_name,
+               s.trust_balance
+        FROM trust_upload_staging s
+        WHERE s.job_id = %(job_id)s
+          AND s.trust_balance IS NOT NULL AND s.trust_balance <> 0
+    ),
+    matched AS (
+        SELECT st.*,
+               by_number.id AS number_case_id,
+               by_name.id AS name_case_id,
+               by_client.id AS client_case_id
+        FROM staged st
+        LEFT JOIN LATERAL (
+            SELECT oc.id FROM open_cases oc
+            WHERE st.case_number IS NOT NULL AND oc.number_key = LOWER(st.case_number)
+            ORDER BY oc.id DESC LIMIT 1
+        ) by_number ON true
+        LEFT JOIN LATERAL (
+            SELECT oc.id FROM open_cases oc
+            WHERE by_number.id IS NULL AND st.case_name IS NOT NULL
+              AND oc.name_key = LOWER(st.case_name)
+            ORDER BY oc.id DESC LIMIT 1
+        ) by_name ON true
+        LEFT JOIN LATERAL (
+            SELECT oc.id FROM open_cases oc
+            WHERE by_number.id IS NULL AND by_name.id IS NULL AND st.client_name IS NOT NULL
+              AND STRPOS(oc.name_key, LOWER(st.client_name)) > 0
+            ORDER BY oc.id LIMIT 1
+        ) by_client ON true
+    )
+    INSERT INTO trust_ledger_uploads
+        (firm_id, upload_batch_id, case_id, case_number,
+         case_name, client_name, trust_balance, match_method)
+    SELECT %(firm_id)s, %(batch_id)s,
+           COALESCE(number_case_id, name_case_id, client_case_id),
+           case_number, case_name, client_name, trust_balance,
+           CASE WHEN number_case_id IS NOT NULL THEN 'case_number'
+                WHEN name_case_id IS NOT NULL THEN 'case_name'
+                WHEN client_case_id IS NOT NULL THEN 'client_name_fuzzy'
+           END
+    FROM matched
+    ORDER BY line_no
+    RETURNING case_id
+"""
+
+
+def merge_upload_job(job_id: str) -> Dict:
+    """Merge a staged job into its target table. Records progress and errors on the job.
+
+    Returns the final job fields (status, rows_imported, rows_matched, batch_id).
+    """
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT firm_id, kind FROM upload_jobs WHERE id = %s", (job_id,))
+        job = cur.fetchone()
+    if not job:
+        raise ValueError(f"Unknown upload job: {job_id}")
+    firm_id, kind = job["firm_id"], job["kind"]
+    table = STAGING_COLUMNS[kind][0]
+
+    update_upload_job(job_id, status="merging")
+    batch_id = str(uuid.uuid4())
+    params = {"firm_id": firm_id, "job_id": job_id, "batch_id": batch_id}
+    try:
+        with get_connection() as conn:
+            cur = conn.cursor()
+            if kind == "aging":
+                cur.execute(AGING_MERGE_SQL, params)
+                imported, matched = cur.rowcount, None
+                if imported:
+                    from db.dunning_queue import SET_LATEST_AGING_BATCH_SQL
+                    cur.execute(SET_LATEST_AGING_BATCH_SQL, params)
+            else:
+                cur.execute(TRUST_MERGE_SQL, params)
+                case_ids = [r["case_id"] for r in cur.fetchall()]
+                imported, matched = len(case_ids), sum(1 for c in case_ids if c)
+            cur.execute(f"DELETE FROM {table} WHERE job_id = %s", (job_id,))
+    except Exception as e:
+        logger.error("Upload job %s (%s) failed to merge: %s", job_id, kind, e)
+        update_upload_job(job_id, status="failed", error=str(e)[:500])
+        discard_staging_rows(job_id, kind)
+        return {"status": "failed", "error": str(e)}
+
+    result = {"status": "completed", "rows_imported": imported,
+              "rows_matched": matched, "batch_id": batch_id}
+    update_upload_job(job_id, **result)
+
+    if kind == "aging":
+        # New batch changes amount_now_due for every queued invoice
+        try:
+            from db.dunning_queue import refresh_dunning_queue
+            refresh_dunning_queue(firm_id)
+        except Exception as e:
+            logger.warning("Dunning queue refresh after aging upload failed: %s", e)
+    return result
+
+
+def discard_staging_rows(job_id: str, kind: str):
+    """Drop a job's staged rows (after a failed parse or merge)."""
+    try:
+        with get_connection() as conn:
+            cur = conn.cursor()
+            cur.execute(f"DELETE FROM {STAGING_COLUMNS[kind][0]} WHERE job_id = %s", (job_id,))
+    except Exception as e:
+        logger.warning("Could not clear staging rows for job %s: %s", job_id, e)
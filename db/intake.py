@@ -14,6 +14,7 @@ from datetime import datetime, date, timedelta
 from typing import Dict, List, Optional
 
 from db.connection import get_connection
+from db.pagination import Page, paginate
 
 logger = logging.getLogger(__name__)
 
@@ -623,17 +624,15 @@ def get_pipeline_board(firm_id: str, include_archived: bool = False) -> Dict:
     return {"stages": board, "stats": stats}
 
 
-def get_leads_list(
+def _leads_query(
     firm_id: str,
     stage: str = None,
     source: str = None,
     assigned_to: str = None,
     search: str = None,
     include_archived: bool = False,
-    limit: int = 100,
-    offset: int = 0,
-) -> List[Dict]:
-    """Get leads with optional filters."""
+) -> tuple:
+    """Build the (sql, params) for a filtered, unordered leads query."""
     conditions = ["l.firm_id = %s"]
     params = [firm_id]
 
@@ -657,21 +656,59 @@ def get_leads_list(
         params.extend([search_param] * 4)
 
     where = " AND ".join(conditions)
+    return f"""
+        SELECT l.*, ps.color as stage_color
+        FROM intake_leads l
+        LEFT JOIN intake_pipeline_stages ps
+            ON ps.firm_id = l.firm_id AND ps.stage_name = l.stage_name
+        WHERE {where}
+    """, tuple(params)
+
+
+def get_leads_list(
+    firm_id: str,
+    stage: str = None,
+    source: str = None,
+    assigned_to: str = None,
+    search: str = None,
+    include_archived: bool = False,
+    limit: int = 100,
+    offset: int = 0,
+) -> List[Dict]:
+    """Get leads with optional filters."""
+    sql, params = _leads_query(firm_id, stage, source, assigned_to, search, include_archived)
 
     with get_connection() as conn:
         cur = conn.cursor()
         cur.execute(f"""
-            SELECT l.*, ps.color as stage_color
-            FROM intake_leads l
-            LEFT JOIN intake_pipeline_stages ps
-                ON ps.firm_id = l.firm_id AND ps.stage_name = l.stage_name
-            WHERE {where}
+            {sql}
             ORDER BY l.created_at DESC
             LIMIT %s OFFSET %s
         """, (*params, limit, offset))
         return [dict(row) for row in cur.fetchall()]
 
 
+def get_leads_page(
+    firm_id: str,
+    stage: str = None,
+    source: str = None,
+    assigned_to: str = None,
+    search: str = None,
+    include_archived: bool = False,
+    cursor: str = None,
+    page_size: int = None,
+) -> Page:
+    """Get one keyset page of leads, newest first. Same filters as get_leads_list()."""
+    sql, params = _leads_query(firm_id, stage, source, assigned_to, search, include_archived)
+
+    with get_connection() as conn:
+        cur = conn.cursor()
+        page = paginate(cur, sql, params, [("created_at", "DESC"), ("id", "DESC")],
+                        cursor=cursor, page_size=page_size)
+        page.items = [dict(row) for row in page.items]
+        return page
+
+
 # ============================================================
 # Activity Log
 # ============================================================
@@ -0,0 +1,182 @@
+"""
+LLM Call Telemetry — PostgreSQL Multi-Tenant
+
+One compact row per model invocation (written in batches by skills.llm):
+feature, firm, model, token usage including prompt-cache reads/writes,
+latency, time to first token, SDK retries, error class and an estimated
+cost. llm_usage_daily rolls rows up per day, firm, feature and model.
+
+Usage:
+    from db.llm_telemetry import get_llm_usage, get_llm_usage_daily
+
+    get_llm_usage(days=7)                    # heaviest feature/firm/model first
+    get_llm_usage_daily(firm_id, days=30)    # trend per day and feature
+"""
+import logging
+import os
+from typing import Dict, List, Optional
+
+from db.connection import get_connection
+
+logger = logging.getLogger(__name__)
+
+LLM_TELEMETRY_RETENTION_DAYS = int(os.environ.get("LLM_TELEMETRY_RETENTION_DAYS", "90"))
+
+# USD per million tokens: (input, output). Cache reads bill at 10% of the
+# input rate, cache writes at 125%. Matched by longest model-name prefix.
+MODEL_PRICES = {
+    "claude-opus-4-7": (5.0, 25.0),
+    "claude-opus-4-6": (5.0, 25.0),
+    "claude-opus-4-5": (5.0, 25.0),
+    "claude-opus-4": (15.0, 75.0),
+    "claude-sonnet-4": (3.0, 15.0),
+    "claude-haiku-4": (1.0, 5.0),
+    "claude-3-5-haiku": (0.8, 4.0),
+}
+
+
+LLM_TELEMETRY_SCHEMA = """
+CREATE TABLE IF NOT EXISTS llm_calls (
+    id BIGSERIAL PRIMARY KEY,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    firm_id VARCHAR(36),
+    feature TEXT NOT NULL,
+    model TEXT,
+    input_tokens INTEGER NOT NULL DEFAULT 0,
+    output_tokens INTEGER NOT NULL DEFAULT 0,
+    cache_read_tokens INTEGER NOT NULL DEFAULT 0,
+    cache_write_tokens INTEGER NOT NULL DEFAULT 0,
+    latency_ms INTEGER,
+    first_token_ms INTEGER,
+    retries SMALLINT NOT NULL DEFAULT 0,
+    error TEXT,
+    cost_usd NUMERIC(12, 6)
+);
+CREATE INDEX IF NOT EXISTS idx_llm_calls_created ON llm_calls(created_at);
+CREATE INDEX IF NOT EXISTS idx_llm_calls_firm_feature ON llm_calls(firm_id, feature, created_at);
+
+CREATE OR REPLACE VIEW llm_usage_daily AS
+SELECT
+    date_trunc('day', created_at)::date AS day,
+    firm_id,
+    feature,
+    model,
+    COUNT(*) AS calls,
+    COUNT(error) AS errors,
+    SUM(retries) AS retries,
+    SUM(input_tokens) AS input_tokens,
+    SUM(output_tokens) AS output_tokens,
+    SUM(cache_read_tokens) AS cache_read_tokens,
+    SUM(cache_write_tokens) AS cache_write_tokens,
+    ROUND(AVG(latency_ms)) AS avg_latency_ms,
+    PERCENTILE_CONT(0.95) WITHIN GROUP (ORDER BY latency_ms) AS p95_latency_ms,
+    ROUND(AVG(first_token_ms)) AS avg_first_token_ms,
+    SUM(cost_usd) AS cost_usd
+FROM llm_calls
+GROUP BY 1, 2, 3, 4;
+"""
+
+
+def ensure_llm_telemetry_tables():
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(LLM_TELEMETRY_SCHEMA)
+
+
+def estimate_cost(model: Optional[str], input_tokens: int, output_tokens: int,
+                  cache_read_tokens: int = 0, cache_write_tokens: int = 0) -> Optional[float]:
+    """Estimated USD cost of one call, or None for an unpriced model."""
+    name = (model or "").split("anthropic.")[-1]
+    prefix = max((p for p in MODEL_PRICES if name.startswith(p)), key=len, default=None)
+    if prefix is None:
+        return None
+    input_rate, output_rate = MODEL_PRICES[prefix]
+    return round((input_tokens * input_rate
+                  + cache_read_tokens * input_rate * 0.1
+                  + cache_write_tokens * input_rate * 1.25
+                  + output_tokens * output_rate) / 1_000_000, 6)
+
+
+def record_llm_calls(rows: List[Dict]) -> int:
+    """Insert a batch of call records (dicts with the llm_calls column names)."""
+    if not rows:
+        return 0
+    from psycopg2.extras import execute_values
+
+    values = []
+    for r in rows:
+        values.append((
+            r.get("created_at"), r.get("firm_id"), r.get("feature") or "other", r.get("model"),
+            r.get("input_tokens", 0), r.get("output_tokens", 0),
+            r.get("cache_read_tokens", 0), r.get("cache_write_tokens", 0),
+            r.get("latency_ms"), r.get("first_token_ms"), r.get("retries", 0), r.get("error"),
+            estimate_cost(r.get("model"), r.get("input_tokens", 0), r.get("output_tokens", 0),
+                          r.get("cache_read_tokens", 0), r.get("cache_write_tokens", 0)),
+        ))
+    with get_connection() as conn:
+        cur = conn.cursor()
+        execute_values(cur, """
+            INSERT INTO llm_calls
+                (created_at, firm_id, feature, model, input_tokens, output_tokens,
+                 cache_read_tokens, cache_write_tokens, latency_ms, first_token_ms,
+                 retries, error, cost_usd)
+            VALUES %s
+        """, values, page_size=500)
+    return len(values)
+
+
+def get_llm_usage(days: int = 7, firm_id: Optional[str] = None) -> List[Dict]:
+    """Totals per feature, firm and model over the last ``days``, costliest first."""
+    params: list = [days]
+    firm_clause = ""
+    if firm_id:
+        firm_clause = "AND firm_id = %s"
+        params.append(firm_id)
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(f"""
+            SELECT feature, firm_id, model,
+                   SUM(calls) AS calls, SUM(errors) AS errors, SUM(retries) AS retries,
+                   SUM(input_tokens) AS input_tokens, SUM(output_tokens) AS output_tokens,
+                   SUM(cache_read_tokens) AS cache_read_tokens,
+                   SUM(cache_write_tokens) AS cache_write_tokens,
+                   ROUND(SUM(avg_latency_ms * calls) / NULLIF(SUM(calls), 0)) AS avg_latency_ms,
+                   MAX(p95_latency_ms) AS max_daily_p95_latency_ms,
+                   SUM(cost_usd) AS cost_usd
+            FROM llm_usage_daily
+            WHERE day >= CURRENT_DATE - %s::int {firm_clause}
+            GROUP BY feature, firm_id, model
+            ORDER BY SUM(cost_usd) DESC NULLS LAST, SUM(calls) DESC
+        """, params)
+        return [dict(r) for r in cur.fetchall()]
+
+
+def get_llm_usage_daily(firm_id: Optional[str] = None, days: int = 30,
+                        feature: Optional[str] = None) -> List[Dict]:
+    """Rollup rows for the last ``days``, newest day first."""
+    conditions = ["day >= CURRENT_DATE - %s::int"]
+    params: list = [days]
+    if firm_id:
+        conditions.append("firm_id = %s")
+        params.append(firm_id)
+    if feature:
+        conditions.append("feature = %s")
+        params.append(feature)
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(f"""
+            SELECT * FROM llm_usage_daily
+            WHERE {' AND '.join(conditions)}
+            ORDER BY day DESC, cost_usd DESC NULLS LAST
+        """, params)
+        return [dict(r) for r in cur.fetchall()]
+
+
+def purge_llm_calls(retention_days: int = LLM_TELEMETRY_RETENTION_DAYS) -> int:
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            "DELETE FROM llm_calls WHERE created_at < CURRENT_TIMESTAMP - make_interval(days => %s)",
+            (retention_days,),
+        )
+        return cur.rowcount
@@ -0,0 +1,242 @@
+"""
+Keyset Pagination Helpers
+
+Shared cursor-based paging for the dashboard's large list queries. Instead of
+LIMIT/OFFSET (which re-reads every skipped row), each page resumes strictly
+after the sort key of the previous page's last row, so page N costs the same
+as page 1.
+
+Usage:
+    from db.pagination import paginate
+
+    page = paginate(
+        cur,
+        "SELECT id, created_at, ... FROM call_events WHERE firm_id = %s",
+        (firm_id,),
+        order_by=[("created_at", "DESC"), ("id", "DESC")],
+        cursor=request_cursor,
+        page_size=50,
+    )
+    page.items        # rows for this page (same shape the cursor returns)
+    page.next_cursor  # opaque token for the following page, or None
+
+The base query is wrapped as a subquery, so ``order_by`` expressions refer to
+its output column names. The final ``order_by`` entry must be unique (usually
+the primary key) so ties never straddle a page boundary. Order by plain
+stored columns backed by a matching index, not computed values (e.g.
+due_date rather than CURRENT_DATE - due_date); otherwise every page is a
+full scan plus a top-N sort.
+"""
+import base64
+import json
+import logging
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE_DEFAULT = 50
+PAGE_SIZE_MAX = 200
+
+# Totals are counted exactly up to this many rows; beyond that the planner's
+# row estimate is used so the first page of a huge list stays cheap.
+COUNT_EXACT_CAP = 10000
+
+
+@dataclass
+class Page:
+    """One page of a keyset-paginated result."""
+    items: List[Any] = field(default_factory=list)
+    next_cursor: Optional[str] = None
+    cursor: Optional[str] = None          # token this page was fetched with
+    page_size: int = PAGE_SIZE_DEFAULT
+    total_estimate: Optional[int] = None
+
+    @property
+    def has_more(self) -> bool:
+        return self.next_cursor is not None
+
+    def to_dict(self) -> dict:
+        """JSON-friendly paging metadata (without items)."""
+        return {
+            "next_cursor": self.next_cursor,
+            "page_size": self.page_size,
+            "total_estimate": self.total_estimate,
+            "has_more": self.has_more,
+        }
+
+
+def clamp_page_size(page_size: Optional[int], default: int = PAGE_SIZE_DEFAULT) -> int:
+    """Clamp a requested page size to 1..PAGE_SIZE_MAX."""
+    try:
+        size = int(page_size) if page_size is not None else default
+    except (TypeError, ValueError):
+        size = default
+    return max(1, min(size, PAGE_SIZE_MAX))
+
+
+# ============================================================
+# Cursor Tokens
+# ============================================================
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {"t": value.isoformat()}
+    if isinstance(value, date):
+        return {"d": value.isoformat()}
+    if isinstance(value, Decimal):
+        return {"n": str(value)}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict):
+        if "t" in value:
+            return datetime.fromisoformat(value["t"])
+        if "d" in value:
+            return date.fromisoformat(value["d"])
+        if "n" in value:
+            return Decimal(value["n"])
+    return value
+
+
+def encode_cursor(keys: Sequence, total_estimate: Optional[int] = None) -> str:
+    """Encode a sort key (plus the first page's total) as an opaque URL-safe token."""
+    payload = {"k": [_encode_value(v) for v in keys]}
+    if total_estimate is not None:
+        payload["n"] = total_estimate
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token: Optional[str], width: int) -> Optional[dict]:
+    """Decode a cursor token. Returns None (start from the first page) if invalid."""
+    if not token:
+        return None
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        keys = [_decode_value(v) for v in payload["k"]]
+        if len(keys) != width:
+            raise ValueError(f"expected {width} keys, got {len(keys)}")
+        return {"keys": keys, "total": payload.get("n")}
+    except Exception as e:
+        logger.warning("Ignoring invalid page cursor: %s", e)
+        return None
+
+
+# ============================================================
+# Query Building
+# ============================================================
+
+def keyset_predicate(order_by: Sequence[Tuple[str, str]], keys: Sequence) -> Tuple[str, tuple]:
+    """Build the WHERE fragment selecting rows strictly after ``keys``.
+
+    Uses a row comparison when every column sorts the same way (index
+    friendly); otherwise expands to the equivalent OR-of-ANDs form, behind a
+    non-strict bound on the first column so an index on the sort columns
+    can start the scan at the cursor instead of filtering from the top.
+    """
+    directions = {d.upper() for _, d in order_by}
+    if len(directions) == 1:
+        op = "<" if directions == {"DESC"} else ">"
+        cols = ", ".join(expr for expr, _ in order_by)
+        marks = ", ".join(["%s"] * len(order_by))
+        return f"({cols}) {op} ({marks})", tuple(keys)
+
+    clauses, params = [], []
+    for i, (expr, direction) in enumerate(order_by):
+        op = "<" if direction.upper() == "DESC" else ">"
+        parts = [f"{e} = %s" for e, _ in order_by[:i]] + [f"{expr} {op} %s"]
+        params.extend(keys[:i])
+        params.append(keys[i])
+        clauses.append("(" + " AND ".join(parts) + ")")
+    first, direction = order_by[0]
+    bound = f"{first} {'<=' if direction.upper() == 'DESC' else '>='} %s"
+    return f"({bound} AND (" + " OR ".join(clauses) + "))", (keys[0], *params)
+
+
+def estimate_count(cur, sql: str, params: Sequence = ()) -> int:
+    """Count the rows of ``sql`` exactly up to COUNT_EXACT_CAP, else ask the planner."""
+    cur.execute(
+        f"SELECT COUNT(*) FROM (SELECT 1 FROM ({sql}) AS src LIMIT %s) AS capped",
+        (*params, COUNT_EXACT_CAP + 1),
+    )
+    row = cur.fetchone()
+    count = (row["count"] if isinstance(row, dict) else row[0]) or 0
+    if count <= COUNT_EXACT_CAP:
+        return count
+
+    cur.execute(f"EXPLAIN (FORMAT JSON) {sql}", tuple(params))
+    row = cur.fetchone()
+    plan = row["QUERY PLAN"] if isinstance(row, dict) else row[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return max(int(plan[0]["Plan"]["Plan Rows"]), count)
+
+
+def paginate(
+    cur,
+    sql: str,
+    params: Sequence,
+    order_by: Sequence[Tuple[str, str]],
+    cursor: Optional[str] = None,
+    page_size: Optional[int] = None,
+    with_total: bool = True,
+) -> Page:
+    """Fetch one page of ``sql`` ordered by ``order_by``, resuming after ``cursor``.
+
+    Works with both tuple and RealDictCursor cursors; ``Page.items`` holds rows
+    in whichever shape the cursor returns. The total is computed on the first
+    page only and carried forward inside the cursor token.
+    """
+    size = clamp_page_size(page_size)
+    state = decode_cursor(cursor, len(order_by))
+
+    key_cols = ", ".join(f"{expr} AS _page_k{i}" for i, (expr, _) in enumerate(order_by))
+    order_sql = ", ".join(f"{expr} {direction}" for expr, direction in order_by)
+    where_sql, where_params = "", ()
+    if state:
+        pred, where_params = keyset_predicate(order_by, state["keys"])
+        where_sql = f"WHERE {pred}"
+
+    cur.execute(f"""
+        SELECT page_src.*, {key_cols}
+        FROM ({sql}) AS page_src
+        {where_sql}
+        ORDER BY {order_sql}
+        LIMIT %s
+    """, (*params, *where_params, size + 1))
+    rows = cur.fetchall()
+
+    has_more = len(rows) > size
+    rows = rows[:size]
+    width = len(order_by)
+    items, last_keys = [], None
+    for row in rows:
+        if isinstance(row, dict):
+            row = dict(row)
+            last_keys = [row.pop(f"_page_k{i}") for i in range(width)]
+            items.append(row)
+        else:
+            last_keys = list(row[-width:])
+            items.append(tuple(row[:-width]))
+
+    if state:
+        total = state["total"]
+    elif not has_more:
+        total = len(items)
+    elif with_total:
+        total = estimate_count(cur, sql, params)
+    else:
+        total = None
+
+    return Page(
+        items=items,
+        next_cursor=encode_cursor(last_keys, total) if has_more else None,
+        cursor=cursor if state else None,
+        page_size=size,
+        total_estimate=total,
+    )
@@ -13,6 +13,7 @@ from datetime import datetime
 from typing import Optional
 
 from db.connection import get_connection
+from db.pagination import Page, paginate
 
 logger = logging.getLogger(__name__)
 
@@ -218,6 +219,17 @@ def log_call_event(
         return cur.fetchone()['id']
 
 
+def _call_events_where(firm_id: str, matched_only: bool, unmatched_only: bool) -> tuple:
+    where = ["firm_id = %s"]
+    params = [firm_id]
+
+    if matched_only:
+        where.append("matched_client_id IS NOT NULL")
+    elif unmatched_only:
+        where.append("matched_client_id IS NULL")
+    return " AND ".join(where), tuple(params)
+
+
 def get_call_events(
     firm_id: str,
     limit: int = 50,
@@ -226,25 +238,38 @@ def get_call_events(
     unmatched_only: bool = False,
 ) -> list:
     """Get recent call events for a firm."""
-    where = ["firm_id = %s"]
-    params = [firm_id]
-
-    if matched_only:
-        where.append("matched_client_id IS NOT NULL")
-    elif unmatched_only:
-        where.append("matched_client_id IS NULL")
+    where, params = _call_events_where(firm_id, matched_only, unmatched_only)
 
     with get_connection() as conn:
         cur = conn.cursor()
         cur.execute(f"""
             SELECT * FROM call_events
-            WHERE {' AND '.join(where)}
+            WHERE {where}
             ORDER BY created_at DESC
             LIMIT %s OFFSET %s
         """, (*params, limit, offset))
         return [dict(r) for r in cur.fetchall()]
 
 
+def get_call_events_page(
+    firm_id: str,
+    cursor: str = None,
+    page_size: int = None,
+    matched_only: bool = False,
+    unmatched_only: bool = False,
+) -> Page:
+    """Get one keyset page of call events, newest first."""
+    where, params = _call_events_where(firm_id, matched_only, unmatched_only)
+
+    with get_connection() as conn:
+        cur = conn.cursor()
+        page = paginate(cur, f"SELECT * FROM call_events WHERE {where}", params,
+                        [("created_at", "DESC"), ("id", "DESC")],
+                        cursor=cursor, page_size=page_size)
+        page.items = [dict(r) for r in page.items]
+        return page
+
+
 def get_call_stats(firm_id: str, days: int = 30) -> dict:
     """Get call event statistics for a firm."""
     with get_connection() as conn:
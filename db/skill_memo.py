@@ -0,0 +1,162 @@
+"""
+Skill Result Memo Store — PostgreSQL Multi-Tenant
+
+Content-addressed memoization for AI skills. A result is stored under a
+SHA-256 of everything that determines it:
+
+    firm, skill name, skill version, model, normalized input, context
+
+so re-running a skill on the same charging document or the same case
+context returns the stored result without an LLM call. Bumping a skill's
+``version`` (prompt or parser change) orphans its old entries; they
+expire after their TTL.
+
+Also stores rendered artifacts (e.g. .docx bytes for generated document
+content) so identical content isn't rendered twice.
+
+Usage:
+    from db.skill_memo import memo_key, get_memo, put_memo, invalidate_memo
+
+    key = memo_key(firm_id, "charge_extraction", "1", model, text, None)
+    hit = get_memo(key)
+    if hit is None:
+        put_memo(key, firm_id, "charge_extraction", result=result_dict)
+"""
+import hashlib
+import json
+import logging
+import os
+from typing import Any, Dict, Optional
+
+import psycopg2
+
+from db.connection import get_connection
+
+logger = logging.getLogger(__name__)
+
+SKILL_MEMO_TTL_HOURS = float(os.environ.get("SKILL_MEMO_TTL_HOURS", str(7 * 24)))
+
+
+SKILL_MEMO_SCHEMA = """
+CREATE TABLE IF NOT EXISTS skill_memo (
+    key CHAR(64) PRIMARY KEY,
+    firm_id VARCHAR(36),
+    skill TEXT NOT NULL,
+    skill_version TEXT,
+    model TEXT,
+    result JSONB,
+    blob BYTEA,
+    hits INTEGER DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    expires_at TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_skill_memo_skill ON skill_memo(firm_id, skill);
+CREATE INDEX IF NOT EXISTS idx_skill_memo_expires ON skill_memo(expires_at);
+"""
+
+
+def ensure_skill_memo_tables():
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(SKILL_MEMO_SCHEMA)
+
+
+# ============================================================
+# Keys
+# ============================================================
+
+def normalize_input(value: Any) -> Any:
+    """Canonical form of a skill input for hashing.
+
+    Dicts/lists are key-sorted JSON; text has line endings unified and
+    trailing whitespace removed (layout-only edits don't change the key).
+    """
+    if isinstance(value, str):
+        lines = value.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+        return "\n".join(line.rstrip() for line in lines).strip()
+    if isinstance(value, (dict, list, tuple)):
+        return json.loads(json.dumps(value, sort_keys=True, default=str))
+    if isinstance(value, bytes):
+        return hashlib.sha256(value).hexdigest()
+    return value
+
+
+def memo_key(*parts: Any) -> str:
+    """SHA-256 hex digest of the normalized parts."""
+    canonical = json.dumps([normalize_input(p) for p in parts], sort_keys=True,
+                           separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+# ============================================================
+# Lookup / store
+# ============================================================
+
+def get_memo(key: str) -> Optional[Dict]:
+    """Return {"result": dict|None, "blob": bytes|None} for a live entry, else None."""
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            UPDATE skill_memo SET hits = hits + 1
+            WHERE key = %s AND (expires_at IS NULL OR expires_at > CURRENT_TIMESTAMP)
+            RETURNING result, blob
+        """, (key,))
+        row = cur.fetchone()
+    if row is None:
+        return None
+    result = row["result"]
+    if isinstance(result, str):
+        result = json.loads(result)
+    blob = bytes(row["blob"]) if row["blob"] is not None else None
+    return {"result": result, "blob": blob}
+
+
+def put_memo(key: str, firm_id: Optional[str], skill: str, result: Optional[dict] = None,
+             blob: Optional[bytes] = None, skill_version: str = None, model: str = None,
+             ttl_hours: float = None):
+    """Store (or replace) a memo entry. ``ttl_hours`` <= 0 means no expiry."""
+    ttl = SKILL_MEMO_TTL_HOURS if ttl_hours is None else ttl_hours
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            INSERT INTO skill_memo
+                (key, firm_id, skill, skill_version, model, result, blob, expires_at)
+            VALUES (%s, %s, %s, %s, %s, %s, %s,
+                    CASE WHEN %s > 0 THEN CURRENT_TIMESTAMP + make_interval(secs => %s) END)
+            ON CONFLICT (key) DO UPDATE SET
+                result = EXCLUDED.result,
+                blob = EXCLUDED.blob,
+                created_at = CURRENT_TIMESTAMP,
+                expires_at = EXCLUDED.expires_at
+        """, (key, firm_id, skill, skill_version, model,
+              json.dumps(result, default=str) if result is not None else None,
+              psycopg2.Binary(blob) if blob is not None else None,
+              ttl, ttl * 3600))
+
+
+def invalidate_memo(firm_id: Optional[str] = None, skill: Optional[str] = None,
+                    key: Optional[str] = None) -> int:
+    """Delete memo entries by key, or by firm and/or skill. Returns rows removed."""
+    clauses, params = [], []
+    if key:
+        clauses.append("key = %s")
+        params.append(key)
+    if firm_id:
+        clauses.append("firm_id = %s")
+        params.append(firm_id)
+    if skill:
+        clauses.append("skill = %s")
+        params.append(skill)
+    if not clauses:
+        raise ValueError("invalidate_memo needs a key, firm_id or skill")
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(f"DELETE FROM skill_memo WHERE {' AND '.join(clauses)}", params)
+        return cur.rowcount
+
+
+def purge_expired_memos() -> int:
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("DELETE FROM skill_memo WHERE expires_at <= CURRENT_TIMESTAMP")
+        return cur.rowcount
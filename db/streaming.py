@@ -0,0 +1,54 @@
+"""
+Server-Side Cursor Streaming
+
+Iterate over large result sets without materializing them. Rows are pulled
+from a PostgreSQL named (server-side) cursor in batches of ``itersize``, so
+memory stays flat no matter how many rows the query returns and the first
+row is available as soon as the database produces it.
+
+Usage:
+    from db.streaming import stream_rows
+
+    for row in stream_rows("SELECT * FROM cached_invoices WHERE firm_id = %s", (firm_id,)):
+        ...
+
+The pooled connection is held until the generator is exhausted or closed.
+Always consume or close() it (StreamingResponse does this for you).
+"""
+import logging
+import uuid
+from typing import Iterator, Sequence
+
+import psycopg2.extensions
+from psycopg2.extras import RealDictCursor
+
+from db.connection import get_connection
+
+logger = logging.getLogger(__name__)
+
+STREAM_BATCH_SIZE = 2000
+
+
+def stream_rows(
+    sql: str,
+    params: Sequence = (),
+    batch_size: int = STREAM_BATCH_SIZE,
+    dict_rows: bool = False,
+) -> Iterator:
+    """Yield rows of ``sql`` from a server-side cursor, ``batch_size`` at a time.
+
+    Rows are tuples by default, or dicts when ``dict_rows`` is True.
+    """
+    factory = RealDictCursor if dict_rows else psycopg2.extensions.cursor
+    with get_connection() as conn:
+        cur = conn.cursor(name=f"stream_{uuid.uuid4().hex[:12]}", cursor_factory=factory)
+        cur.itersize = batch_size
+        try:
+            cur.execute(sql, tuple(params))
+            for row in cur:
+                yield row
+        finally:
+            try:
+                cur.close()
+            except Exception:
+                pass  # transaction already aborted; rollback releases it
@@ -0,0 +1,142 @@
+"""
+Sync Progress Events (PostgreSQL LISTEN/NOTIFY)
+
+Sync runs (Celery sync_firm_task, the dashboard's "Sync Now" thread, the CLI)
+publish progress on a single NOTIFY channel; web workers LISTEN once and fan
+the events out to their SSE subscribers. Browsers subscribe instead of polling
+/api/sync/status, so idle tabs cost nothing and nothing reads sync tables on a
+timer.
+
+Events are small JSON objects:
+
+    {"firm_id": "jcs_law", "event": "started",   "entities": [...], "ts": ...}
+    {"firm_id": "jcs_law", "event": "entity",    "entity": "invoices",
+     "index": 5, "total": 10, "inserted": 3, "updated": 12, "error": null, "ts": ...}
+    {"firm_id": "jcs_law", "event": "completed", "total_changes": 41, "total_errors": 0, "ts": ...}
+    {"firm_id": "jcs_law", "event": "failed",    "error": "...", "ts": ...}
+
+Publishing never raises: a missed progress event must not fail a sync.
+"""
+import json
+import logging
+import select
+import threading
+import time
+from typing import Callable, Optional
+
+import psycopg2
+import psycopg2.extensions
+
+from db.connection import get_connection, _get_database_url
+
+logger = logging.getLogger(__name__)
+
+SYNC_EVENTS_CHANNEL = "sync_events"
+
+# NOTIFY payloads are capped at 8000 bytes; errors are trimmed well below that.
+MAX_ERROR_CHARS = 500
+
+
+# ============================================================
+# Publishing
+# ============================================================
+
+def publish_sync_event(firm_id: str, event: str, **data) -> bool:
+    """Publish a sync event for ``firm_id``. Returns False if it could not be sent."""
+    if not firm_id:
+        return False
+    if data.get("error"):
+        data["error"] = str(data["error"])[:MAX_ERROR_CHARS]
+    payload = json.dumps({"firm_id": firm_id, "event": event, "ts": time.time(), **data},
+                         default=str)
+    try:
+        with get_connection() as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT pg_notify(%s, %s)", (SYNC_EVENTS_CHANNEL, payload))
+        return True
+    except Exception as e:
+        logger.warning("Could not publish sync event %s for %s: %s", event, firm_id, e)
+        return False
+
+
+def publish_sync_results(firm_id: str, results: dict) -> bool:
+    """Publish the "completed" event for a finished sync_all() result dict."""
+    return publish_sync_event(
+        firm_id, "completed",
+        total_changes=sum(r.inserted + r.updated for r in results.values()),
+        total_errors=sum(1 for r in results.values() if r.error),
+    )
+
+
+# ============================================================
+# Listening
+# ============================================================
+
+class SyncEventListener(threading.Thread):
+    """
+    Background thread holding one dedicated LISTEN connection.
+
+    Calls ``callback(event_dict)`` (on this thread) for every notification.
+    Reconnects with backoff if the connection drops, e.g. during a managed
+    database failover.
+    """
+
+    def __init__(self, callback: Callable[[dict], None],
+                 channel: str = SYNC_EVENTS_CHANNEL, poll_seconds: float = 5.0):
+        super().__init__(name="sync-events-listener", daemon=True)
+        self.callback = callback
+        self.channel = channel
+        self.poll_seconds = poll_seconds
+        self._stopping = threading.Event()
+
+    def stop(self):
+        self._stopping.set()
+
+    def run(self):
+        backoff = 1.0
+        while not self._stopping.is_set():
+            conn = None
+            try:
+                conn = psycopg2.connect(_get_database_url())
+                conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                conn.cursor().execute(f"LISTEN {self.channel}")
+                logger.info("Listening for sync events on '%s'", self.channel)
+                backoff = 1.0
+                self._drain(conn)
+            except Exception as e:
+                if self._stopping.is_set():
+                    break
+                logger.warning("Sync event listener disconnected (%s); retrying in %.0fs", e, backoff)
+                self._stopping.wait(backoff)
+                backoff = min(backoff * 2, 60.0)
+            finally:
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+
+    def _drain(self, conn):
+        while not self._stopping.is_set():
+            if select.select([conn], [], [], self.poll_seconds) == ([], [], []):
+                continue
+            conn.poll()
+            while conn.notifies:
+                event = parse_event(conn.notifies.pop(0).payload)
+                if event is None:
+                    continue
+                try:
+                    self.callback(event)
+                except Exception as e:
+                    logger.warning("Sync event callback failed: %s", e)
+
+
+def parse_event(payload: str) -> Optional[dict]:
+    """Decode a NOTIFY payload; None if it isn't a well-formed sync event."""
+    try:
+        event = json.loads(payload)
+    except (TypeError, ValueError):
+        return None
+    if not isinstance(event, dict) or not event.get("firm_id") or not event.get("event"):
+        return None
+    return event
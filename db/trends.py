@@ -25,6 +25,19 @@ CREATE TABLE IF NOT EXISTS kpi_snapshots (
     UNIQUE(firm_id, snapshot_date, metric_name)
 );
 CREATE INDEX IF NOT EXISTS idx_kpi_date ON kpi_snapshots(firm_id, snapshot_date, metric_name);
+
+CREATE TABLE IF NOT EXISTS attorney_kpi_snapshots (
+    id SERIAL PRIMARY KEY,
+    firm_id VARCHAR(36) NOT NULL,
+    snapshot_date DATE NOT NULL,
+    attorney_name TEXT NOT NULL,
+    metric_name TEXT NOT NULL,
+    metric_value REAL NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE(firm_id, snapshot_date, attorney_name, metric_name)
+);
+CREATE INDEX IF NOT EXISTS idx_attorney_kpi_series
+    ON attorney_kpi_snapshots(firm_id, attorney_name, metric_name, snapshot_date);
 """
 
 
@@ -62,6 +75,73 @@ def record_snapshot(
         return row["id"] if row else 0
 
 
+def record_attorney_snapshots(firm_id: str, snapshot_date: date = None) -> int:
+    """Write one day of per-attorney KPI values in a single grouped pass.
+
+    Aggregates invoices and overdue tasks by the case's lead attorney and
+    unpivots the result into attorney_kpi_snapshots. Re-running for the same
+    day overwrites that day's values. Returns the number of rows written.
+    """
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            """
+            WITH inv AS (
+                SELECT c.lead_attorney_name AS attorney_name,
+                       COALESCE(SUM(i.balance_due) FILTER (
+                           WHERE i.balance_due > 0), 0) AS total_ar,
+                       COALESCE(SUM(i.balance_due) FILTER (
+                           WHERE i.balance_due > 0
+                             AND CURRENT_DATE - i.due_date > 60), 0) AS ar_over_60,
+                       COALESCE(SUM(i.total_amount) FILTER (
+                           WHERE i.invoice_date >= CURRENT_DATE - INTERVAL '30 days'), 0)
+                           AS total_billed_30d
+                FROM cached_invoices i
+                JOIN cached_cases c ON i.case_id = c.id AND i.firm_id = c.firm_id
+                WHERE i.firm_id = %s
+                  AND c.lead_attorney_name IS NOT NULL AND c.lead_attorney_name != ''
+                GROUP BY c.lead_attorney_name
+            ),
+            tasks AS (
+                SELECT c.lead_attorney_name AS attorney_name,
+                       COUNT(*) AS overdue_tasks
+                FROM cached_tasks t
+                JOIN cached_cases c ON t.case_id = c.id AND t.firm_id = c.firm_id
+                WHERE t.firm_id = %s
+                  AND t.due_date < CURRENT_DATE
+                  AND t.due_date >= CURRENT_DATE - INTERVAL '200 days'
+                  AND (t.completed = false OR t.completed IS NULL)
+                  AND c.lead_attorney_name IS NOT NULL AND c.lead_attorney_name != ''
+                GROUP BY c.lead_attorney_name
+            ),
+            per_attorney AS (
+                SELECT attorney_name,
+                       COALESCE(inv.total_ar, 0) AS total_ar,
+                       CASE WHEN COALESCE(inv.total_ar, 0) > 0
+                            THEN ROUND((inv.ar_over_60 / inv.total_ar * 100)::numeric, 1)
+                            ELSE 0 END AS ar_over_60_pct,
+                       COALESCE(tasks.overdue_tasks, 0) AS overdue_tasks,
+                       COALESCE(inv.total_billed_30d, 0) AS total_billed_30d
+                FROM inv FULL OUTER JOIN tasks USING (attorney_name)
+            )
+            INSERT INTO attorney_kpi_snapshots
+                (firm_id, snapshot_date, attorney_name, metric_name, metric_value)
+            SELECT %s, COALESCE(%s, CURRENT_DATE), p.attorney_name, m.metric_name, m.metric_value
+            FROM per_attorney p
+            CROSS JOIN LATERAL (VALUES
+                ('total_ar', p.total_ar::real),
+                ('ar_over_60_pct', p.ar_over_60_pct::real),
+                ('overdue_tasks', p.overdue_tasks::real),
+                ('total_billed_30d', p.total_billed_30d::real)
+            ) AS m(metric_name, metric_value)
+            ON CONFLICT (firm_id, snapshot_date, attorney_name, metric_name) DO UPDATE SET
+                metric_value = EXCLUDED.metric_value
+            """,
+            (firm_id, firm_id, firm_id, snapshot_date),
+        )
+        return cur.rowcount
+
+
 def get_metric_history(
     firm_id: str, metric_name: str, days: int = 30
 ) -> List[Dict]:
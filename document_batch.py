@@ -0,0 +1,261 @@
+"""
+Batch Document Generation
+
+Fills one template for many cases (a round of letters, notices, entries of
+appearance) and streams the documents into a single .zip as they finish.
+
+- Values per case come from the synced case cache (case_prefill), with
+  batch-wide values (e.g. a new hearing date) applied on top, then the
+  same attorney/alias/date handling as document chat.
+- The template is compiled once (template_compiler); workers only render.
+- Rendering runs in a billiard process pool (Celery's multiprocessing fork,
+  which also works inside a prefork worker) for batches of at least
+  DOC_BATCH_POOL_MIN documents. A compiled fill takes about a millisecond
+  and pool startup/teardown about a second, so smaller batches render
+  inline. If the pool returns nothing for DOC_BATCH_CHUNK_TIMEOUT seconds
+  (a dead worker), the outstanding documents are reported as failed.
+- Each document goes into the archive as soon as its worker returns it;
+  progress(done, total) is reported along the way.
+
+Runs as the tasks.generate_document_batch Celery task; archives are written
+to data/generated/batches/ and purged after DOC_BATCH_RETENTION_HOURS.
+
+Usage:
+    from document_batch import generate_batch
+
+    result = generate_batch("jcs_law", template_id=42, case_ids=[101, 102, 103],
+                            values={"hearing_date": "March 3, 2026"})
+    # {"batch_id": ..., "path": ".../batches/<id>.zip", "documents": 3, "failed": [], ...}
+"""
+import logging
+import os
+import re
+import time
+import uuid
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from config import DATA_DIR
+
+logger = logging.getLogger(__name__)
+
+BATCH_DIR = DATA_DIR / "generated" / "batches"
+DOC_BATCH_WORKERS = int(os.environ.get("DOC_BATCH_WORKERS", str(min(os.cpu_count() or 1, 8))))
+DOC_BATCH_POOL_MIN = int(os.environ.get("DOC_BATCH_POOL_MIN", "200"))
+DOC_BATCH_RETENTION_HOURS = float(os.environ.get("DOC_BATCH_RETENTION_HOURS", "24"))
+# Longest wait for the next chunk before the pool is presumed dead
+DOC_BATCH_CHUNK_TIMEOUT = float(os.environ.get("DOC_BATCH_CHUNK_TIMEOUT", "120"))
+
+# Case lookups are Postgres round trips; run a few at once
+_PREFILL_THREADS = 8
+
+# Set in each pool worker by _init_worker
+_worker_template = None
+
+
+def _init_worker(compiled: Dict, package: bytes):
+    global _worker_template
+    from template_compiler import CompiledTemplate
+
+    _worker_template = CompiledTemplate.from_dict(compiled)
+    _worker_template.package = package
+
+
+def _render_chunk(chunk, template=None):
+    """[(index, replacements)] -> [(index, docx bytes or None, error)].
+
+    Pool workers render with the template set up by _init_worker.
+    """
+    template = template or _worker_template
+    results = []
+    for index, replacements in chunk:
+        try:
+            results.append((index, template.render(replacements), None))
+        except Exception as e:
+            results.append((index, None, str(e)))
+    return results
+
+
+def _render_in_pool(compiled, work: list, workers: int, timeout: float = None):
+    """Yield rendered chunks from a process pool in completion order.
+
+    If no chunk finishes within ``timeout`` seconds (a worker died or hung),
+    the chunks still outstanding are yielded as failed and the pool is
+    terminated.
+    """
+    import queue
+    from billiard import Pool
+
+    timeout = DOC_BATCH_CHUNK_TIMEOUT if timeout is None else timeout
+    chunksize = max(1, min(16, len(work) // (workers * 4)))
+    chunks = [work[i:i + chunksize] for i in range(0, len(work), chunksize)]
+    finished = queue.Queue()
+    pending = set(range(len(chunks)))
+    pool = Pool(workers, initializer=_init_worker, initargs=(compiled.to_dict(), compiled.package))
+    try:
+        for n, chunk in enumerate(chunks):
+            pool.apply_async(
+                _render_chunk, (chunk,), callback=lambda r, n=n: finished.put((n, r)),
+                error_callback=lambda e, n=n, chunk=chunk: finished.put((n, [(i, None, str(e)) for i, _ in chunk])),
+            )
+        while pending:
+            try:
+                n, results = finished.get(timeout=timeout)
+            except queue.Empty:
+                logger.error("Batch render pool stalled; failing %d outstanding chunks", len(pending))
+                for n in sorted(pending):
+                    yield [(i, None, "Render worker timed out") for i, _ in chunks[n]]
+                return
+            pending.discard(n)
+            yield results
+        pool.close()
+        pool.join()
+    finally:
+        pool.terminate()
+
+
+def _safe_filename(text: str) -> str:
+    return re.sub(r"[^\w\-]", "_", str(text)).strip("_")
+
+
+def prepare_jobs(firm_id: str, case_ids: List[int], values: Dict[str, str] = None,
+                 attorney_id: int = None, attorney_name_override: str = None) -> tuple:
+    """Replacement maps for each case.
+
+    Returns (jobs, failed): jobs are {"case_id", "case_number", "client_name",
+    "values", "replacements"} dicts in case_ids order; failed are
+    {"case_id", "error"} for cases not in the firm's cache.
+    """
+    from case_prefill import resolve_case_prefill
+    from document_chat import DetectedVariable, DocumentChatEngine, DocumentSession
+
+    engine = DocumentChatEngine(firm_id=firm_id, attorney_id=attorney_id,
+                                attorney_name_override=attorney_name_override)
+
+    def prefill(case_id):
+        try:
+            return resolve_case_prefill(firm_id, case_id)
+        except Exception as e:
+            logger.warning("Prefill failed for case %s: %s", case_id, e)
+            return {}
+
+    with ThreadPoolExecutor(max_workers=max(1, min(_PREFILL_THREADS, len(case_ids)))) as pool:
+        case_values = list(pool.map(prefill, case_ids))
+
+    jobs, failed = [], []
+    for case_id, found in zip(case_ids, case_values):
+        if not found:
+            failed.append({"case_id": case_id, "error": "Case not found in cache"})
+            continue
+        merged = dict(found, **(values or {}))
+        session = DocumentSession(session_id=f"batch_{case_id}", firm_id=firm_id)
+        session.detected_variables = [
+            DetectedVariable(name, name, "", "", value=str(value)) for name, value in merged.items()
+        ]
+        jobs.append({
+            "case_id": case_id,
+            "case_number": found.get("case_number"),
+            "client_name": found.get("client_name"),
+            "values": merged,
+            "replacements": engine._build_fill_replacements(session),
+        })
+    return jobs, failed
+
+
+def generate_batch(firm_id: str, template_id: int, case_ids: List[int],
+                   values: Dict[str, str] = None, attorney_id: int = None,
+                   attorney_name_override: str = None, generated_by: str = None,
+                   output_path: Path = None, workers: int = None,
+                   progress: Optional[Callable[[int, int], None]] = None) -> Dict:
+    """Fill ``template_id`` for every case in ``case_ids`` into one .zip archive.
+
+    Raises ValueError if the template doesn't belong to ``firm_id``.
+    """
+    from db.documents import get_template_meta, record_generated_documents
+    from template_cache import get_template_cache
+
+    started = time.monotonic()
+    template = get_template_meta(template_id)
+    if template is None or template["firm_id"] != firm_id:
+        raise ValueError(f"Template {template_id} not found")
+
+    cache = get_template_cache()
+    content = cache.load(template_id)
+    if content is None:
+        raise ValueError(f"Template {template_id} has no content")
+    compiled = cache.compiled(template_id, content)
+
+    jobs, failed = prepare_jobs(firm_id, list(dict.fromkeys(case_ids)), values,
+                                attorney_id, attorney_name_override)
+
+    batch_id = uuid.uuid4().hex
+    output_path = Path(output_path or BATCH_DIR / f"{batch_id}.zip")
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    partial = output_path.with_suffix(".partial")
+
+    total = len(jobs)
+    step = max(1, total // 50)
+    template_name = _safe_filename(template["name"]) or "document"
+    used_names = set()
+    written = []
+
+    def add(archive, index, data, error):
+        job = jobs[index]
+        if data is None:
+            failed.append({"case_id": job["case_id"], "error": error})
+            return
+        name = f"{template_name}_{_safe_filename(job['case_number'] or job['case_id'])}.docx"
+        if name in used_names:
+            name = f"{name[:-5]}_{job['case_id']}.docx"
+        used_names.add(name)
+        # .docx parts are already deflated; store them as-is
+        archive.writestr(name, data, compress_type=zipfile.ZIP_STORED)
+        written.append({"case_id": str(job["case_id"]), "client_name": job["client_name"],
+                        "variables_used": job["values"], "output_filename": name})
+
+    workers = workers or DOC_BATCH_WORKERS
+    work = [(i, job["replacements"]) for i, job in enumerate(jobs)]
+    with zipfile.ZipFile(partial, "w") as archive:
+        if workers > 1 and total >= DOC_BATCH_POOL_MIN:
+            results = _render_in_pool(compiled, work, workers)
+        else:
+            results = (_render_chunk([item], compiled) for item in work)
+        done = 0
+        for chunk in results:
+            for index, data, error in chunk:
+                add(archive, index, data, error)
+                done += 1
+                if progress and (done % step == 0 or done == total):
+                    progress(done, total)
+    partial.replace(output_path)
+
+    try:
+        record_generated_documents(firm_id, template_id, template["name"], written, generated_by)
+    except Exception as e:
+        logger.warning("Could not record batch %s documents: %s", batch_id, e)
+
+    return {
+        "batch_id": batch_id,
+        "firm_id": firm_id,
+        "template_id": template_id,
+        "path": str(output_path),
+        "filename": output_path.name,
+        "documents": len(written),
+        "failed": failed,
+        "seconds": round(time.monotonic() - started, 2),
+    }
+
+
+def purge_batches(max_age_hours: float = DOC_BATCH_RETENTION_HOURS) -> int:
+    """Delete batch archives (and abandoned partial ones) older than ``max_age_hours``."""
+    if not BATCH_DIR.exists():
+        return 0
+    cutoff = time.time() - max_age_hours * 3600
+    deleted = 0
+    for path in list(BATCH_DIR.glob("*.zip")) + list(BATCH_DIR.glob("*.partial")):
+        if path.stat().st_mtime < cutoff:
+            path.unlink(missing_ok=True)
+            deleted += 1
+    return deleted
@@ -19,9 +19,10 @@ import os
 import io
 import re
 import json
+from contextvars import ContextVar
 from datetime import datetime, date
 from pathlib import Path
-from typing import List, Dict, Optional, Any, Tuple
+from typing import Callable, List, Dict, Optional, Any, Tuple
 from dataclasses import dataclass, field
 from enum import Enum
 
@@ -38,12 +39,14 @@ except ImportError:
 # so document_chat.py routes through the same Bedrock + Opus 4.7 path as the
 # rest of LawMetrics. Falls back to direct Anthropic when LLM_PROVIDER=claude.
 try:
-    from skills.base import get_claude_client, resolve_bedrock_model
+    from skills.base import resolve_bedrock_model
+    from skills.llm import complete as llm_complete, get_shared_claude_client
     SHARED_CLIENT_AVAILABLE = True
 except ImportError:
     SHARED_CLIENT_AVAILABLE = False
-    get_claude_client = None
+    get_shared_claude_client = None
     resolve_bedrock_model = None
+    llm_complete = None
 
 try:
     from docx import Document
@@ -55,6 +58,10 @@ except ImportError:
 
 from config import DATA_DIR
 
+# Callback receiving draft text as it streams, set for the duration of one
+# chat() call so concurrent streams on a shared engine don't cross
+_on_text: ContextVar[Optional[Callable[[str], None]]] = ContextVar("document_chat_on_text", default=None)
+
 
 # ============================================================================
 # Missouri Document Type Registry
@@ -955,6 +962,10 @@ class DocumentSession:
     detected_variables: List[DetectedVariable] = field(default_factory=list)
     collected_values: Dict[str, str] = field(default_factory=dict)
 
+    # Case the document is for (cached_cases.id); its values prefill variables
+    case_id: Optional[int] = None
+    case_prefilled: bool = False
+
     # Draft
     draft_content: str = ""
     draft_document: Optional[bytes] = None
@@ -975,6 +986,50 @@ class DocumentSession:
             return [v for v in missing if v.required]
         return missing
 
+    def to_state(self) -> Dict[str, Any]:
+        """JSON-serializable state. Template and draft bytes are left out;
+        callers persist them separately (see dashboard/doc_sessions.py)."""
+        return {
+            "session_id": self.session_id,
+            "firm_id": self.firm_id,
+            "state": self.state.value,
+            "original_request": self.original_request,
+            "document_type": self.document_type,
+            "jurisdiction": self.jurisdiction,
+            "template_id": self.template_id,
+            "template_name": self.template_name,
+            "detected_variables": [vars(v) for v in self.detected_variables],
+            "collected_values": self.collected_values,
+            "case_id": self.case_id,
+            "case_prefilled": self.case_prefilled,
+            "draft_content": self.draft_content,
+            "output_path": str(self.output_path) if self.output_path else None,
+            "messages": self.messages,
+        }
+
+    @classmethod
+    def from_state(cls, state: Dict[str, Any], template_content: Optional[bytes] = None,
+                   draft_document: Optional[bytes] = None) -> "DocumentSession":
+        return cls(
+            session_id=state["session_id"],
+            firm_id=state["firm_id"],
+            state=ConversationState(state.get("state", ConversationState.INITIAL.value)),
+            original_request=state.get("original_request", ""),
+            document_type=state.get("document_type", ""),
+            jurisdiction=state.get("jurisdiction", ""),
+            template_id=state.get("template_id"),
+            template_name=state.get("template_name", ""),
+            template_content=template_content,
+            detected_variables=[DetectedVariable(**v) for v in state.get("detected_variables", [])],
+            collected_values=state.get("collected_values") or {},
+            case_id=state.get("case_id"),
+            case_prefilled=state.get("case_prefilled", False),
+            draft_content=state.get("draft_content", ""),
+            draft_document=draft_document,
+            output_path=Path(state["output_path"]) if state.get("output_path") else None,
+            messages=state.get("messages") or [],
+        )
+
     def get_variables_with_placeholders(self) -> Dict[str, str]:
         """Get all variables, using placeholders for missing ones."""
         result = {}
@@ -987,6 +1042,42 @@ class DocumentSession:
         return result
 
 
+# Bump when the variable-analysis prompt or parsing changes; stored analyses
+# from older versions are then recomputed on next use.
+VARIABLE_ANALYSIS_VERSION = "1"
+
+
+def _load_variable_analysis(template_id: int) -> Optional[List[DetectedVariable]]:
+    """Stored analysis for the template's current file, or None."""
+    try:
+        from db.documents import get_variable_analysis
+        stored = get_variable_analysis(template_id, VARIABLE_ANALYSIS_VERSION)
+    except Exception as e:
+        import logging
+        logging.getLogger(__name__).warning(f"Variable analysis lookup failed for template {template_id}: {e}")
+        return None
+    if stored is None:
+        return None
+    return [DetectedVariable(**v) for v in stored]
+
+
+def _store_variable_analysis(template_id: int, template_content: bytes,
+                             variables: List[DetectedVariable]) -> bool:
+    try:
+        import hashlib
+        from db.documents import save_variable_analysis
+        return save_variable_analysis(
+            template_id,
+            hashlib.sha256(template_content).hexdigest(),
+            VARIABLE_ANALYSIS_VERSION,
+            [vars(v) for v in variables],
+        )
+    except Exception as e:
+        import logging
+        logging.getLogger(__name__).warning(f"Could not store variable analysis for template {template_id}: {e}")
+        return False
+
+
 class DocumentChatEngine:
     """
     AI-powered conversational document generation.
@@ -1036,11 +1127,13 @@ class DocumentChatEngine:
 
         # Default to Bedrock (LLM_PROVIDER=bedrock); fall back to direct Anthropic API
         # when LLM_PROVIDER=claude is set explicitly. Mirrors skills/base.py.
+        # The shared client (skills/llm.py) reuses connections across engines and
+        # applies the per-firm concurrency limit, timeouts and retries.
         provider = os.environ.get("LLM_PROVIDER", "bedrock").lower()
         if provider == "bedrock" and SHARED_CLIENT_AVAILABLE:
-            self.client = get_claude_client()
+            self.client = get_shared_claude_client()
             # Default model for document generation. Resolved once per engine
-            # instance — every messages.create() call reuses self.model_id.
+            # instance — every completion reuses self.model_id.
             self.model_id = resolve_bedrock_model("claude-opus-4-7")
         else:
             if not self.api_key:
@@ -1050,6 +1143,34 @@ class DocumentChatEngine:
             self.client = Anthropic(api_key=self.api_key)
             self.model_id = "claude-opus-4-7"
 
+    def _complete(self, prompt: str, max_tokens: int, on_text=None, system: str = None) -> str:
+        """Single-prompt completion through the shared LLM transport.
+
+        ``system`` holds the static instructions; it is sent as a cached
+        prompt prefix so repeat calls only pay full price for ``prompt``.
+        """
+        if llm_complete is None:
+            params = {}
+            if system:
+                params["system"] = system
+            response = self.client.messages.create(
+                model=self.model_id,
+                max_tokens=max_tokens,
+                messages=[{"role": "user", "content": prompt}],
+                **params
+            )
+            return response.content[0].text
+        return llm_complete(
+            self.firm_id,
+            [{"role": "user", "content": prompt}],
+            system=system,
+            model=self.model_id,
+            max_tokens=max_tokens,
+            on_text=on_text,
+            client=self.client,
+            feature="document_chat",
+        )
+
     def new_session(self) -> str:
         """Start a new document generation session."""
         session_id = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -1067,12 +1188,21 @@ class DocumentChatEngine:
             sid = self.new_session()
         return self.sessions[sid]
 
-    def chat(self, user_message: str, session_id: str = None) -> str:
+    def chat(self, user_message: str, session_id: str = None,
+             on_text: Callable[[str], None] = None) -> str:
         """
         Process a user message and return response.
 
         This is the main entry point for the conversational interface.
+        ``on_text`` receives draft text as the model writes it.
         """
+        token = _on_text.set(on_text)
+        try:
+            return self._chat(user_message, session_id)
+        finally:
+            _on_text.reset(token)
+
+    def _chat(self, user_message: str, session_id: str = None) -> str:
         session = self.get_session(session_id)
         session.add_message("user", user_message)
 
@@ -1121,12 +1251,15 @@ class DocumentChatEngine:
             session.template_name,
             session.template_content,
             session.document_type,
-            document_type_key=document_type_key
+            document_type_key=document_type_key,
+            template_id=session.template_id,
         )
 
         session.state = ConversationState.TEMPLATE_SELECTED
 
-        # Check if user already provided some values in their request
+        # Fill what the case record already knows, then ask the model only
+        # for values still missing from the request
+        prefilled = self._prefill_from_case(session, message)
         self._extract_values_from_message(session, message)
 
         # Build response asking for missing variables
@@ -1144,6 +1277,12 @@ class DocumentChatEngine:
         if session.jurisdiction and session.jurisdiction.lower() not in session.template_name.lower():
             response += f" for {session.jurisdiction}"
         response += ".\n\n"
+        if prefilled:
+            response += (
+                "From the case record: "
+                + ", ".join(f"{v.display_name}: {v.value}" for v in prefilled)
+                + ".\n\n"
+            )
 
         # Check if there are any required variables missing
         required_missing = session.get_missing_variables(required_only=True)
@@ -1196,7 +1335,9 @@ class DocumentChatEngine:
                 missing[0].value = "N/A"
                 missing[0].required = False  # Mark as not required
 
-        # Extract values from the message
+        # Extract values from the message (a newly mentioned case number
+        # fills from the case record first)
+        self._prefill_from_case(session, message)
         self._extract_values_from_message(session, message)
 
         missing = session.get_missing_variables()
@@ -1250,300 +1391,28 @@ class DocumentChatEngine:
             return "Would you like me to export this document? Say 'yes' to approve, or tell me what changes you'd like."
 
     def _identify_template(self, request: str) -> Dict[str, Any]:
-        """Use AI to identify which template the user wants."""
+        """Identify which template the user wants.
 
-        # First, try to find template in database
-        from document_engine import get_engine
-        engine = get_engine()
+        One lookup in the firm's template index (template_index); the model
+        is asked only when no template shares a word with the request.
+        """
+        from template_index import get_template_index, reconcile_document_type
 
-        # Search for matching templates
         try:
-            templates = engine.search_templates(self.firm_id, request, limit=5)
+            match = get_template_index(self.firm_id).lookup(request)
         except Exception as e:
             import logging
             logging.getLogger(__name__).error(f"Template search failed: {e}")
-            templates = []
-
-        if templates:
-            # Use the best match
-            template = templates[0]
-
-            # Detect document_type_key from template name
-            template_name_lower = template.name.lower()
-            document_type_key = None
-
-            # Map template names to DOCUMENT_TYPES keys
-            if 'filing fee' in template_name_lower:
-                document_type_key = 'filing_fee_memo'
-            elif 'bond assignment' in template_name_lower or 'cash bond' in template_name_lower:
-                document_type_key = 'bond_assignment'
-            elif 'motion to dismiss' in template_name_lower:
-                if 'failure to state' in template_name_lower:
-                    document_type_key = 'motion_to_dismiss_failure_to_state_claim'
-                elif 'jurisdiction' in template_name_lower:
-                    document_type_key = 'motion_to_dismiss_lack_jurisdiction'
-                elif 'venue' in template_name_lower:
-                    document_type_key = 'motion_to_dismiss_improper_venue'
-                elif 'dor' in template_name_lower or 'director of revenue' in template_name_lower:
-                    document_type_key = 'motion_to_dismiss_dor'
-                else:
-                    document_type_key = 'motion_to_dismiss_general'
-            elif 'arraignment' in template_name_lower and 'waiver' in template_name_lower:
-                document_type_key = 'waiver_of_arraignment'
-            elif 'entry of appearance' in template_name_lower and 'arraignment' not in template_name_lower:
-                if 'muni' in template_name_lower:
-                    document_type_key = 'entry_of_appearance_muni'
-                elif 'state' in template_name_lower:
-                    document_type_key = 'entry_of_appearance_state'
-                else:
-                    document_type_key = 'entry_of_appearance_state'  # Default to state
-            elif 'motion' in template_name_lower and 'continu' in template_name_lower:
-                document_type_key = 'motion_for_continuance'
-            elif 'recall warrant' in template_name_lower or 'motion to recall' in template_name_lower:
-                document_type_key = 'motion_to_recall_warrant'
-            elif 'stay order' in template_name_lower or 'proposed stay' in template_name_lower:
-                document_type_key = 'proposed_stay_order'
-            elif 'preservation' in template_name_lower and 'supplemental' in template_name_lower:
-                document_type_key = 'preservation_supplemental_letter'
-            elif 'preservation' in template_name_lower:
-                document_type_key = 'preservation_letter'
-            elif 'potential prosecution' in template_name_lower or 'prosecution letter' in template_name_lower:
-                document_type_key = 'potential_prosecution_letter'
-            elif 'request for discovery' in template_name_lower or 'discovery request' in template_name_lower:
-                document_type_key = 'request_for_discovery'
-            elif 'disposition' in template_name_lower or 'dispo' in template_name_lower:
-                document_type_key = 'disposition_letter'
-            # Batch 3 template name detection
-            elif 'change of judge' in template_name_lower or 'coj' in template_name_lower:
-                document_type_key = 'motion_for_coj'
-            elif 'notice of hearing' in template_name_lower and 'withdraw' in template_name_lower:
-                document_type_key = 'notice_of_hearing_mtw'
-            elif 'notice of hearing' in template_name_lower:
-                document_type_key = 'notice_of_hearing'
-            elif 'petition for review' in template_name_lower or template_name_lower.startswith('pfr'):
-                document_type_key = 'petition_for_review'
-            elif 'after supplemental' in template_name_lower or 'supplemental disclosure' in template_name_lower:
-                document_type_key = 'after_supplemental_disclosure_letter'
-            elif 'deposition' in template_name_lower:
-                document_type_key = 'notice_to_take_deposition'
-            elif 'bond reduction' in template_name_lower:
-                document_type_key = 'motion_for_bond_reduction'
-            elif 'certify' in template_name_lower and 'jury' in template_name_lower:
-                document_type_key = 'motion_to_certify'
-            elif 'ltr to dor' in template_name_lower and 'pfr' in template_name_lower:
-                document_type_key = 'ltr_to_dor_with_pfr'
-            elif 'ltr to dor' in template_name_lower and 'stay' in template_name_lower:
-                document_type_key = 'ltr_to_dor_with_stay_order'
-            elif 'ltr to dor' in template_name_lower and 'judgment' in template_name_lower:
-                document_type_key = 'ltr_to_dor_with_judgment'
-            elif 'dor' in template_name_lower and 'motion to dismiss' in template_name_lower:
-                document_type_key = 'dor_motion_to_dismiss'
-            elif 'shorten time' in template_name_lower:
-                document_type_key = 'motion_to_shorten_time'
-            elif 'webex' in template_name_lower or 'web ex' in template_name_lower:
-                document_type_key = 'motion_to_appear_via_webex'
-            elif 'place on docket' in template_name_lower:
-                document_type_key = 'motion_to_place_on_docket'
-            elif 'change of address' in template_name_lower:
-                document_type_key = 'notice_of_change_of_address'
-            elif 'supplemental discovery' in template_name_lower:
-                document_type_key = 'request_for_supplemental_discovery'
-            elif 'amend bond' in template_name_lower:
-                document_type_key = 'motion_to_amend_bond_conditions'
-            elif 'client with discovery' in template_name_lower or 'ltr to client' in template_name_lower:
-                document_type_key = 'ltr_to_client_with_discovery'
-            elif 'compel' in template_name_lower:
-                document_type_key = 'motion_to_compel'
-            elif 'terminate probation' in template_name_lower:
-                document_type_key = 'motion_to_terminate_probation'
-            elif 'jury trial' in template_name_lower:
-                document_type_key = 'request_for_jury_trial'
-            elif 'reinstatement' in template_name_lower and ('dl' in template_name_lower or 'license' in template_name_lower or 'driver' in template_name_lower):
-                document_type_key = 'dl_reinstatement_letter'
-            elif 'request for rec' in template_name_lower or 'recommendation' in template_name_lower and 'letter' in template_name_lower:
-                document_type_key = 'request_for_rec_letter'
-            # Batch 4 template name detection
-            elif 'entry (generic)' in template_name_lower or (template_name_lower.startswith('entry') and 'appearance' not in template_name_lower):
-                document_type_key = 'entry_generic'
-            elif 'plea of guilty' in template_name_lower:
-                document_type_key = 'plea_of_guilty'
-            elif 'request for stay order' in template_name_lower:
-                document_type_key = 'request_for_stay_order'
-            elif 'waiver of preliminary' in template_name_lower:
-                document_type_key = 'waiver_of_preliminary_hearing'
-            elif 'request for transcript' in template_name_lower:
-                document_type_key = 'request_for_transcripts'
-            elif 'withdraw guilty plea' in template_name_lower:
-                document_type_key = 'motion_to_withdraw_guilty_plea'
-            elif template_name_lower.startswith('ph waiver'):
-                document_type_key = 'ph_waiver'
-            elif 'answer for request to produce' in template_name_lower:
-                document_type_key = 'answer_for_request_to_produce'
-            elif 'available court dates' in template_name_lower:
-                document_type_key = 'available_court_dates'
-            elif 'requirements for' in template_name_lower and 'rec' in template_name_lower:
-                document_type_key = 'requirements_for_rec_letter'
-            elif 'motion to withdraw' in template_name_lower and 'guilty' not in template_name_lower:
-                document_type_key = 'motion_to_withdraw'
-            elif 'closing' in template_name_lower and 'letter' in template_name_lower:
-                document_type_key = 'closing_letter'
-            elif 'closing' in template_name_lower and 'ltr' in template_name_lower:
-                document_type_key = 'closing_letter'
-            # Batch 5 — former .doc templates
-            elif 'admin continuance' in template_name_lower:
-                document_type_key = 'admin_continuance_request'
-            elif 'admin hearing' in template_name_lower:
-                document_type_key = 'admin_hearing_request'
-            elif 'petition for tdn' in template_name_lower or 'trial de novo' in template_name_lower:
-                document_type_key = 'petition_for_tdn'
-            # Batch 6 — final cleanup
-            elif 'noh bond reduction' in template_name_lower or ('notice of hearing' in template_name_lower and 'bond' in template_name_lower):
-                document_type_key = 'noh_bond_reduction'
-            elif 'oop entry' in template_name_lower or 'oop' in template_name_lower:
-                document_type_key = 'oop_entry'
-
-            # Cross-check: if template name matched but user's request suggests a different variant,
-            # override with the correct one. This handles cases where DB search returns a different
-            # variant than what the user actually asked for.
-            if document_type_key:
-                request_lower = request.lower()
-
-                # Bug fix: "motion to dismiss" resolving to DOR when user didn't ask for DOR
-                if document_type_key == 'motion_to_dismiss_dor':
-                    if 'dor' not in request_lower and 'director of revenue' not in request_lower:
-                        document_type_key = 'motion_to_dismiss_general'
-                elif document_type_key == 'motion_to_dismiss_general':
-                    if 'dor' in request_lower or 'director of revenue' in request_lower:
-                        document_type_key = 'motion_to_dismiss_dor'
-
-                # Bug fix: "entry of appearance" resolving to state when user asked for municipal
-                if document_type_key == 'entry_of_appearance_state':
-                    if 'muni' in request_lower or 'municipal' in request_lower:
-                        document_type_key = 'entry_of_appearance_muni'
-                elif document_type_key == 'entry_of_appearance_muni':
-                    if 'state' in request_lower and 'muni' not in request_lower and 'municipal' not in request_lower:
-                        document_type_key = 'entry_of_appearance_state'
-
-            # If template name didn't match a DOCUMENT_TYPES key, try the user's original request
-            if not document_type_key:
-                request_lower = request.lower()
-                if 'entry of appearance' in request_lower or 'eoa' in request_lower:
-                    if 'muni' in request_lower:
-                        document_type_key = 'entry_of_appearance_muni'
-                    else:
-                        document_type_key = 'entry_of_appearance_state'
-                elif 'continu' in request_lower or 'mtc' in request_lower:
-                    document_type_key = 'motion_for_continuance'
-                elif 'supplemental discovery' in request_lower:
-                    document_type_key = 'request_for_supplemental_discovery'
-                elif 'request for discovery' in request_lower or 'rfd' in request_lower:
-                    document_type_key = 'request_for_discovery'
-                elif 'preservation' in request_lower and 'supplemental' in request_lower:
-                    document_type_key = 'preservation_supplemental_letter'
-                elif 'preservation' in request_lower:
-                    document_type_key = 'preservation_letter'
-                elif 'prosecution' in request_lower:
-                    document_type_key = 'potential_prosecution_letter'
-                elif 'recall warrant' in request_lower:
-                    document_type_key = 'motion_to_recall_warrant'
-                elif 'stay order' in request_lower:
-                    document_type_key = 'proposed_stay_order'
-                elif 'dispo' in request_lower:
-                    document_type_key = 'disposition_letter'
-                elif 'change of judge' in request_lower or 'coj' in request_lower:
-                    document_type_key = 'motion_for_coj'
-                elif 'notice of hearing' in request_lower and 'withdraw' in request_lower:
-                    document_type_key = 'notice_of_hearing_mtw'
-                elif 'notice of hearing' in request_lower or 'noh' in request_lower:
-                    document_type_key = 'notice_of_hearing'
-                elif 'petition for review' in request_lower or 'pfr' in request_lower:
-                    document_type_key = 'petition_for_review'
-                elif 'supplemental disclosure' in request_lower:
-                    document_type_key = 'after_supplemental_disclosure_letter'
-                elif 'deposition' in request_lower:
-                    document_type_key = 'notice_to_take_deposition'
-                elif 'bond reduction' in request_lower:
-                    document_type_key = 'motion_for_bond_reduction'
-                elif 'certify' in request_lower and 'jury' in request_lower:
-                    document_type_key = 'motion_to_certify'
-                elif 'dor' in request_lower and 'pfr' in request_lower:
-                    document_type_key = 'ltr_to_dor_with_pfr'
-                elif 'dor' in request_lower and 'stay' in request_lower:
-                    document_type_key = 'ltr_to_dor_with_stay_order'
-                elif 'dor' in request_lower and 'judgment' in request_lower:
-                    document_type_key = 'ltr_to_dor_with_judgment'
-                elif 'dor' in request_lower and 'dismiss' in request_lower:
-                    document_type_key = 'dor_motion_to_dismiss'
-                elif 'shorten time' in request_lower:
-                    document_type_key = 'motion_to_shorten_time'
-                elif 'webex' in request_lower:
-                    document_type_key = 'motion_to_appear_via_webex'
-                elif 'place on docket' in request_lower:
-                    document_type_key = 'motion_to_place_on_docket'
-                elif 'change of address' in request_lower:
-                    document_type_key = 'notice_of_change_of_address'
-                elif 'amend bond' in request_lower:
-                    document_type_key = 'motion_to_amend_bond_conditions'
-                elif 'client with discovery' in request_lower:
-                    document_type_key = 'ltr_to_client_with_discovery'
-                elif 'compel' in request_lower:
-                    document_type_key = 'motion_to_compel'
-                elif 'terminate probation' in request_lower:
-                    document_type_key = 'motion_to_terminate_probation'
-                elif 'jury trial' in request_lower:
-                    document_type_key = 'request_for_jury_trial'
-                elif 'reinstatement' in request_lower or 'reinstate' in request_lower:
-                    document_type_key = 'dl_reinstatement_letter'
-                elif 'arraignment' in request_lower and 'waiver' in request_lower:
-                    document_type_key = 'waiver_of_arraignment'
-                elif 'recommendation' in request_lower or ('request' in request_lower and 'rec' in request_lower and 'pa' in request_lower):
-                    document_type_key = 'request_for_rec_letter'
-                # Batch 4 fallback detection
-                elif 'plea of guilty' in request_lower or 'guilty plea' in request_lower:
-                    if 'withdraw' in request_lower:
-                        document_type_key = 'motion_to_withdraw_guilty_plea'
-                    else:
-                        document_type_key = 'plea_of_guilty'
-                elif 'preliminary hearing' in request_lower and 'waiver' in request_lower:
-                    document_type_key = 'waiver_of_preliminary_hearing'
-                elif 'ph waiver' in request_lower:
-                    document_type_key = 'ph_waiver'
-                elif 'request for stay' in request_lower:
-                    document_type_key = 'request_for_stay_order'
-                elif 'transcript' in request_lower:
-                    document_type_key = 'request_for_transcripts'
-                elif 'answer' in request_lower and 'request to produce' in request_lower:
-                    document_type_key = 'answer_for_request_to_produce'
-                elif 'court dates' in request_lower and 'trial' in request_lower:
-                    document_type_key = 'available_court_dates_for_trial'
-                elif 'requirements' in request_lower and 'rec' in request_lower:
-                    document_type_key = 'requirements_for_rec_letter'
-                elif 'withdraw' in request_lower and 'counsel' in request_lower:
-                    document_type_key = 'motion_to_withdraw'
-                elif 'motion to withdraw' in request_lower and 'guilty' not in request_lower:
-                    document_type_key = 'motion_to_withdraw'
-                elif 'closing letter' in request_lower or 'closing ltr' in request_lower:
-                    document_type_key = 'closing_letter'
-                # Batch 5 — former .doc templates
-                elif 'admin continuance' in request_lower or ('administrative' in request_lower and 'continuance' in request_lower):
-                    document_type_key = 'admin_continuance_request'
-                elif 'admin hearing' in request_lower or ('administrative' in request_lower and 'hearing' in request_lower):
-                    document_type_key = 'admin_hearing_request'
-                elif 'trial de novo' in request_lower or 'tdn' in request_lower:
-                    document_type_key = 'petition_for_tdn'
-                # Batch 6 — final cleanup
-                elif 'noh' in request_lower and 'bond' in request_lower:
-                    document_type_key = 'noh_bond_reduction'
-                elif 'oop' in request_lower and 'entry' in request_lower:
-                    document_type_key = 'oop_entry'
+            match = None
 
+        if match is not None:
             return {
                 "found": True,
-                "template_id": template.id,
-                "template_name": template.name,
-                "document_type": template.category.value,
-                "jurisdiction": template.jurisdiction,
-                "document_type_key": document_type_key,
+                "template_id": match.template_id,
+                "template_name": match.name,
+                "document_type": match.category or "other",
+                "jurisdiction": match.jurisdiction,
+                "document_type_key": reconcile_document_type(match.document_type_key, request),
             }
 
         # If no templates in DB, use AI to understand the request
@@ -1551,9 +1420,9 @@ class DocumentChatEngine:
         doc_type_list = "\n".join([f"- {k}: {v['name']} - {v['description']}"
                                     for k, v in DOCUMENT_TYPES.items()])
 
-        prompt = f"""Analyze this legal document request and extract the document type and jurisdiction.
-
-Request: "{request}"
+        # Static instructions + catalog go in the (cached) system prompt;
+        # only the request itself changes per call
+        system = f"""Analyze the legal document request in the user message and extract the document type and jurisdiction.
 
 KNOWN DOCUMENT TYPES:
 {doc_type_list}
@@ -1587,15 +1456,10 @@ Respond with JSON:
 }}
 """
 
-        response = self.client.messages.create(
-            model=self.model_id,
-            max_tokens=500,
-            messages=[{"role": "user", "content": prompt}]
-        )
+        text = self._complete(f'Request: "{request}"', max_tokens=500, system=system)
 
         try:
             # Extract JSON from response
-            text = response.content[0].text
             json_match = re.search(r'\{[^}]+\}', text, re.DOTALL)
             if json_match:
                 result = json.loads(json_match.group())
@@ -1622,7 +1486,8 @@ Respond with JSON:
         template_name: str,
         template_content: Optional[bytes],
         document_type: str,
-        document_type_key: Optional[str] = None
+        document_type_key: Optional[str] = None,
+        template_id: Optional[int] = None,
     ) -> List[DetectedVariable]:
         """
         Use AI to analyze a template and detect variables.
@@ -1630,6 +1495,10 @@ Respond with JSON:
         This works even when templates have sample data instead of {{variable}} syntax.
         If document_type_key is provided and matches a DOCUMENT_TYPES entry,
         we use the predefined required_vars as the basis.
+
+        For stored templates the analysis is read from the templates row
+        (computed once per file_hash, see precompute_variable_analysis)
+        instead of calling the model on every session.
         """
 
         # If we have a known document type, use its required variables
@@ -1680,6 +1549,28 @@ Respond with JSON:
 
             return variables
 
+        if template_id and template_content:
+            cached = _load_variable_analysis(template_id)
+            if cached is not None:
+                return cached
+
+        variables, reusable = self._detect_template_variables(
+            template_name, template_content, document_type)
+        if template_id and template_content and reusable:
+            _store_variable_analysis(template_id, template_content, variables)
+        return variables
+
+    def _detect_template_variables(
+        self,
+        template_name: str,
+        template_content: Optional[bytes],
+        document_type: str,
+    ) -> Tuple[List[DetectedVariable], bool]:
+        """Detect variables from the template itself.
+
+        Returns (variables, reusable); reusable is False when the model call
+        failed and generic fallback variables were returned.
+        """
         # Extract text from template if we have content
         template_text = ""
         if template_content and DOCX_AVAILABLE:
@@ -1706,16 +1597,16 @@ Respond with JSON:
                         required=True
                     ))
                 if variables:
-                    return variables
+                    return variables, True
 
         # Use AI to detect variables (fallback if no {{placeholders}} found)
-        prompt = f"""Analyze this legal document template and identify all the variable fields that would need to be filled in for each new document.
-
-Document Type: {document_type}
+        prompt = f"""Document Type: {document_type}
 Template Name: {template_name}
 
 {"Template Content:" if template_text else "No template content available."}
-{template_text[:3000] if template_text else ""}
+{template_text[:3000] if template_text else ""}"""
+
+        system = """Analyze the legal document template in the user message and identify all the variable fields that would need to be filled in for each new document.
 
 Identify fields like:
 - Party names (defendant/petitioner, plaintiff/respondent, client)
@@ -1739,7 +1630,7 @@ For other grounds-based dismissals, include the specific argument field.
 
 Respond with JSON array:
 [
-    {{
+    {
         "name": "variable_name_snake_case",
         "display_name": "Human Readable Name",
         "description": "Brief description of what this field is",
@@ -1747,20 +1638,15 @@ Respond with JSON array:
         "var_type": "text|date|case_number|address|currency|choice",
         "required": true,
         "choices": ["option1", "option2"] // only for choice type, e.g., dismissal_type: ["without prejudice", "with prejudice"]
-    }}
+    }
 ]
 
 Focus on the most important 5-10 variables."""
 
-        response = self.client.messages.create(
-            model=self.model_id,
-            max_tokens=2000,
-            messages=[{"role": "user", "content": prompt}]
-        )
+        text = self._complete(prompt, max_tokens=2000, system=system)
 
         variables = []
         try:
-            text = response.content[0].text
             # Find JSON array in response
             json_match = re.search(r'\[[\s\S]*\]', text)
             if json_match:
@@ -1781,8 +1667,9 @@ Focus on the most important 5-10 variables."""
                 DetectedVariable("case_number", "Case Number", "Court case number", "", "case_number"),
                 DetectedVariable("county", "County", "County where case is filed", "", "text"),
             ]
+            return variables, False
 
-        return variables
+        return variables, bool(variables)
 
     def _get_var_description(self, var_name: str, doc_info: Dict) -> str:
         """Get a helpful description for a variable based on its name and context."""
@@ -1854,6 +1741,43 @@ Focus on the most important 5-10 variables."""
         else:
             return "text"
 
+    def select_case(self, case_id: int, session_id: str = None) -> None:
+        """Attach a cached case to the session; its values prefill variables."""
+        session = self.get_session(session_id)
+        if session.case_id != case_id:
+            session.case_id = case_id
+            session.case_prefilled = False
+
+    def _prefill_from_case(self, session: DocumentSession, message: str = "") -> List[DetectedVariable]:
+        """Fill missing variables from the session's case (or a case number
+        mentioned in ``message``) without an LLM call. Returns the variables
+        filled."""
+        missing = session.get_missing_variables()
+        if not missing:
+            return []
+        try:
+            from case_prefill import find_case_id, resolve_case_prefill
+
+            if session.case_id is None:
+                session.case_id = find_case_id(self.firm_id, message)
+            if session.case_id is None or session.case_prefilled:
+                return []
+            values = resolve_case_prefill(self.firm_id, session.case_id, [v.name for v in missing])
+            session.case_prefilled = True
+        except Exception as e:
+            import logging
+            logging.getLogger(__name__).warning(f"Case prefill failed (case={session.case_id}): {e}")
+            return []
+
+        filled = []
+        for var in missing:
+            value = values.get(var.name)
+            if value:
+                var.value = value
+                session.collected_values[var.name] = value
+                filled.append(var)
+        return filled
+
     def _extract_values_from_message(self, session: DocumentSession, message: str) -> None:
         """Use AI to extract variable values from user message."""
 
@@ -1866,11 +1790,13 @@ Focus on the most important 5-10 variables."""
             for v in missing_vars
         ])
 
-        prompt = f"""Extract variable values from this user message.
-
-Variables needed:
+        prompt = f"""Variables needed:
 {var_descriptions}
 
+User message: "{message}\""""
+
+        system = """Extract variable values from the user message below the list of variables needed.
+
 IMPORTANT - Variable name synonyms (use these mappings):
 - "defendant" or "client" → maps to: defendant_name, petitioner_name, client_name (they're the same person)
 - "plaintiff" → maps to: plaintiff_name
@@ -1879,28 +1805,21 @@ IMPORTANT - Variable name synonyms (use these mappings):
 - "drafted by" or "drafter" or "initials" or 2-4 letter abbreviations → maps to: drafted_by
 - Any person's name after "defendant" or "for" typically refers to the client/defendant/petitioner
 
-User message: "{message}"
-
 Extract any values that match these variables. If user says "defendant James Smith",
 that value should be extracted for petitioner_name, defendant_name, OR client_name
 (whichever is in the variables needed list).
 
 Respond with JSON:
-{{
+{
     "variable_name": "extracted value",
     ...
-}}
+}
 
 Only include variables where you found a clear value. If unsure, don't include it."""
 
-        response = self.client.messages.create(
-            model=self.model_id,
-            max_tokens=1000,
-            messages=[{"role": "user", "content": prompt}]
-        )
+        text = self._complete(prompt, max_tokens=1000, system=system)
 
         try:
-            text = response.content[0].text
             # More robust JSON extraction - find opening { and match to closing }
             json_match = re.search(r'\{[\s\S]*\}', text)
             if json_match:
@@ -1994,407 +1913,323 @@ Only include variables where you found a clear value. If unsure, don't include i
         - {{bond_amount}}, {{fine_amount}}, {{amount}}
         - {{firm_name}}, {{firm_address}}, {{firm_city_state_zip}}
         - {{attorney_name}}, {{bar_number}}, {{phone}}, {{email}}, {{fax}}
+
+        Fills the compiled form (template_compiler) by string concatenation;
+        the python-docx walk is the fallback.
         """
-        import io
-        import re
-        from docx import Document
+        from template_cache import get_template_cache
 
+        replacements = self._build_fill_replacements(session)
+        cache = get_template_cache()
         try:
-            doc = Document(io.BytesIO(template_content))
+            return cache.compiled(session.template_id, template_content).render(replacements)
+        except Exception as e:
+            import logging
+            logging.getLogger(__name__).warning(f"Compiled fill failed, using python-docx: {e}")
 
-            # Build replacement map from session variables
-            replacements = {}
-            for v in session.detected_variables:
-                if v.value and v.value != "N/A":
-                    # Normalize key to match placeholder format
-                    key = v.name.lower().replace(' ', '_')
-                    replacements[key] = v.value
-
-            # Add variable aliases (map different names for same concept)
-            # This handles mismatches between DOCUMENT_TYPES and template placeholders
-            VARIABLE_ALIASES = {
-                'petitioner_name': 'defendant_name',  # DOR cases: defendant is petitioner
-                'plaintiff_name': 'defendant_name',
-                'client_name': 'defendant_name',
-                'respondent_name': 'defendant_name',
-                'defendant': 'defendant_name',  # Template uses {{defendant}}, DOCUMENT_TYPES uses defendant_name
-                'current_date': 'original_date',  # Motion to continue: hearing date
-                'hearing_date': 'original_date',
-                'city': 'county',  # Municipal court uses city, circuit uses county
-                'drafter': 'drafted_by',  # Standardize on drafted_by
-            }
-            for alias, canonical in VARIABLE_ALIASES.items():
-                if alias in replacements and canonical not in replacements:
-                    replacements[canonical] = replacements[alias]
-                elif canonical in replacements and alias not in replacements:
-                    replacements[alias] = replacements[canonical]
-
-            # Format monetary values with $ sign
-            for key in ['bond_amount', 'fine_amount', 'amount']:
-                if key in replacements:
-                    val = replacements[key]
-                    if not val.startswith('$'):
-                        try:
-                            amount_float = float(val.replace(',', ''))
-                            replacements[key] = f'${amount_float:,.2f}'
-                        except:
-                            replacements[key] = f'${val}'
-
-            # Add attorney profile values if available
-            if self.attorney_profile:
-                ap = self.attorney_profile
-                replacements['firm_name'] = ap.firm_name or ap.attorney_name
-                replacements['firm_address'] = ap.firm_address
-                replacements['firm_city_state_zip'] = f'{ap.firm_city}, {ap.firm_state} {ap.firm_zip}'
-                replacements['attorney_name'] = ap.attorney_name
-                replacements['bar_number'] = ap.bar_number
-                replacements['phone'] = ap.phone
-                replacements['email'] = ap.email
-                replacements['fax'] = ap.fax or ''
-                replacements['firm_fax'] = ap.fax or ''
-
-                # Map attorney profile fields to consolidated template placeholder names
-                replacements['attorney_bar'] = ap.bar_number
-                replacements['attorney_email'] = ap.email
-                replacements['firm_phone'] = ap.phone
-                replacements['attorney_full_name'] = ap.attorney_name
-                # firm_address_line1 / firm_address_line2 for letter templates
-                replacements['firm_address_line1'] = ap.firm_address
-                replacements['firm_address_line2'] = ''  # single-line address default
-
-                # Auto-fill attorney signature block
-                sig_block = f"""{ap.attorney_name}
+        try:
+            return self._fill_docx_document(
+                cache.parsed(session.template_id, template_content), replacements)
+        except Exception as e:
+            print(f"Error filling docx template: {e}")
+            return None
+
+    def _build_fill_replacements(self, session: DocumentSession) -> Dict[str, str]:
+        """Placeholder name -> value for filling a template from ``session``."""
+        # Build replacement map from session variables
+        replacements = {}
+        for v in session.detected_variables:
+            if v.value and v.value != "N/A":
+                # Normalize key to match placeholder format
+                key = v.name.lower().replace(' ', '_')
+                replacements[key] = v.value
+
+        # Add variable aliases (map different names for same concept)
+        # This handles mismatches between DOCUMENT_TYPES and template placeholders
+        VARIABLE_ALIASES = {
+            'petitioner_name': 'defendant_name',  # DOR cases: defendant is petitioner
+            'plaintiff_name': 'defendant_name',
+            'client_name': 'defendant_name',
+            'respondent_name': 'defendant_name',
+            'defendant': 'defendant_name',  # Template uses {{defendant}}, DOCUMENT_TYPES uses defendant_name
+            'current_date': 'original_date',  # Motion to continue: hearing date
+            'hearing_date': 'original_date',
+            'city': 'county',  # Municipal court uses city, circuit uses county
+            'drafter': 'drafted_by',  # Standardize on drafted_by
+        }
+        for alias, canonical in VARIABLE_ALIASES.items():
+            if alias in replacements and canonical not in replacements:
+                replacements[canonical] = replacements[alias]
+            elif canonical in replacements and alias not in replacements:
+                replacements[alias] = replacements[canonical]
+
+        # Format monetary values with $ sign
+        for key in ['bond_amount', 'fine_amount', 'amount']:
+            if key in replacements:
+                val = replacements[key]
+                if not val.startswith('$'):
+                    try:
+                        amount_float = float(val.replace(',', ''))
+                        replacements[key] = f'${amount_float:,.2f}'
+                    except:
+                        replacements[key] = f'${val}'
+
+        # Add attorney profile values if available
+        if self.attorney_profile:
+            ap = self.attorney_profile
+            replacements['firm_name'] = ap.firm_name or ap.attorney_name
+            replacements['firm_address'] = ap.firm_address
+            replacements['firm_city_state_zip'] = f'{ap.firm_city}, {ap.firm_state} {ap.firm_zip}'
+            replacements['attorney_name'] = ap.attorney_name
+            replacements['bar_number'] = ap.bar_number
+            replacements['phone'] = ap.phone
+            replacements['email'] = ap.email
+            replacements['fax'] = ap.fax or ''
+            replacements['firm_fax'] = ap.fax or ''
+
+            # Map attorney profile fields to consolidated template placeholder names
+            replacements['attorney_bar'] = ap.bar_number
+            replacements['attorney_email'] = ap.email
+            replacements['firm_phone'] = ap.phone
+            replacements['attorney_full_name'] = ap.attorney_name
+            # firm_address_line1 / firm_address_line2 for letter templates
+            replacements['firm_address_line1'] = ap.firm_address
+            replacements['firm_address_line2'] = ''  # single-line address default
+
+            # Auto-fill attorney signature block
+            sig_block = f"""{ap.attorney_name}
 {ap.firm_name}
 {ap.firm_address}
 {ap.firm_city}, {ap.firm_state} {ap.firm_zip}
 Phone: {ap.phone}
 Email: {ap.email}"""
-                replacements['attorney_signature_block'] = sig_block
+            replacements['attorney_signature_block'] = sig_block
 
-                # Also add individual signature block parts
-                replacements['attorney1_signature_block'] = sig_block
-                replacements['attorney2_signature_block'] = ""  # Empty by default for single attorney
-                replacements['attorney1'] = ap.attorney_name  # For Entry of Appearance
-                replacements['attorney2'] = ""  # Empty by default for single attorney
-
-                # Bond Assignment: assignee is the attorney/firm
-                replacements['assignee_name'] = ap.firm_name or ap.attorney_name
-                replacements['assignee_address'] = ap.firm_address
-                replacements['assignee_city_state_zip'] = f"{ap.firm_city}, {ap.firm_state} {ap.firm_zip}"
-
-                # Additional attorney-derived fields used across templates
-                replacements.setdefault('attorney_names', ap.attorney_name)
-                replacements.setdefault('signing_attorney', ap.attorney_name)
-                replacements.setdefault('signing_attorney_bar', ap.bar_number)
-                replacements.setdefault('signing_attorney_email', ap.email)
-                replacements.setdefault('service_signatory', ap.attorney_name)
-
-            # Override attorney name fields if a different attorney is logged in
-            # (e.g., Heidi Leopold logged in but only John Schleiffarth has a full profile)
-            if self.attorney_name_override:
-                override = self.attorney_name_override
-                replacements['attorney_name'] = override
-                replacements['attorney_full_name'] = override
-                replacements['attorney_names'] = override
-                replacements['signing_attorney'] = override
-                replacements['service_signatory'] = override
-                replacements['attorney1'] = override
-                # Update signature block if it was built from the primary profile
-                if self.attorney_profile:
-                    ap = self.attorney_profile
-                    sig_block = f"""{override}
+            # Also add individual signature block parts
+            replacements['attorney1_signature_block'] = sig_block
+            replacements['attorney2_signature_block'] = ""  # Empty by default for single attorney
+            replacements['attorney1'] = ap.attorney_name  # For Entry of Appearance
+            replacements['attorney2'] = ""  # Empty by default for single attorney
+
+            # Bond Assignment: assignee is the attorney/firm
+            replacements['assignee_name'] = ap.firm_name or ap.attorney_name
+            replacements['assignee_address'] = ap.firm_address
+            replacements['assignee_city_state_zip'] = f"{ap.firm_city}, {ap.firm_state} {ap.firm_zip}"
+
+            # Additional attorney-derived fields used across templates
+            replacements.setdefault('attorney_names', ap.attorney_name)
+            replacements.setdefault('signing_attorney', ap.attorney_name)
+            replacements.setdefault('signing_attorney_bar', ap.bar_number)
+            replacements.setdefault('signing_attorney_email', ap.email)
+            replacements.setdefault('service_signatory', ap.attorney_name)
+
+        # Override attorney name fields if a different attorney is logged in
+        # (e.g., Heidi Leopold logged in but only John Schleiffarth has a full profile)
+        if self.attorney_name_override:
+            override = self.attorney_name_override
+            replacements['attorney_name'] = override
+            replacements['attorney_full_name'] = override
+            replacements['attorney_names'] = override
+            replacements['signing_attorney'] = override
+            replacements['service_signatory'] = override
+            replacements['attorney1'] = override
+            # Update signature block if it was built from the primary profile
+            if self.attorney_profile:
+                ap = self.attorney_profile
+                sig_block = f"""{override}
 {ap.firm_name}
 {ap.firm_address}
 {ap.firm_city}, {ap.firm_state} {ap.firm_zip}
 Phone: {ap.phone}
 Email: {ap.email}"""
-                    replacements['attorney_signature_block'] = sig_block
-                    replacements['attorney1_signature_block'] = sig_block
-
-            # Optional fields that should be empty (omitted) if not provided
-            for blank_field in [
-                'second_attorney_name', 'second_attorney_bar', 'second_attorney_email',
-            ]:
-                replacements.setdefault(blank_field, '')
-
-            # Auto-fill dates with today's date if not provided
-            from datetime import datetime
-            today = datetime.now()
-            today_formatted = today.strftime('%B %d, %Y')  # "February 4, 2026"
-            if 'service_date' not in replacements:
-                replacements['service_date'] = today_formatted
-            if 'date' not in replacements:
-                replacements['date'] = today_formatted
-
-            def replace_placeholders(text: str, paragraph_text: str = None) -> str:
-                """Replace all {{placeholder}} and [Bracket Placeholder] patterns with values."""
-                if not text:
-                    return text
-
-                # Use paragraph_text for context if available (for case detection)
-                context = paragraph_text or text
-
-                # First: replace {{variable_name}} patterns
-                pattern = r'\{\{([^}]+)\}\}'
-
-                def _is_uppercase_context(match_obj, ctx: str) -> bool:
-                    """Detect if a placeholder appears in an ALL CAPS context.
-
-                    Checks the alpha characters in the ~40 chars before and after
-                    the placeholder in the full paragraph text. If those characters
-                    are all uppercase (and at least 4 chars), the value should be
-                    uppercased to match.
-
-                    Examples that return True:
-                      "IN THE CIRCUIT COURT OF {{county}} COUNTY"
-                      "CITY OF {{city}},"
-                      "STATE OF MISSOURI{{petitioner_name}},"
-                    Examples that return False:
-                      "I, {{defendant_name}}, Defendant, do hereby state"
-                      "Address: {{firm_address}}"
-                    """
-                    # Find placeholder position in paragraph context
-                    placeholder_text = match_obj.group(0)
-                    pos = ctx.find(placeholder_text)
-                    if pos == -1:
-                        return False
-                    before = ctx[max(0, pos - 40):pos]
-                    after = ctx[pos + len(placeholder_text):pos + len(placeholder_text) + 40]
-                    # Strip everything except letters
-                    nearby_alpha = re.sub(r'[^A-Za-z]', '', before + after)
-                    return len(nearby_alpha) >= 4 and nearby_alpha == nearby_alpha.upper()
-
-                def replacer(match):
-                    placeholder = match.group(1).lower().strip()
-                    if placeholder in replacements:
-                        value = replacements[placeholder]
-                        # If the placeholder itself is UPPERCASE (e.g. {{COUNTY}}),
-                        # always uppercase the value
-                        if match.group(1).strip() == match.group(1).strip().upper():
-                            return value.upper()
-                        # If surrounding paragraph text is ALL CAPS, uppercase the value
-                        if _is_uppercase_context(match, context):
-                            return value.upper()
-                        return value
-                    # Leave unmatched placeholders as-is for visibility
-                    return match.group(0)
-
-                text = re.sub(pattern, replacer, text)
-
-                # Cleanup: remove orphaned "#" when bar number was blanked
-                # e.g., "#{{second_attorney_bar}}" → "#" after replacement → ""
-                text = re.sub(r'\s*#\s*$', '', text)  # trailing "#" at end of run
-                text = re.sub(r'^\s*#\s*$', '', text)  # run that is just "#"
-
-                # Second: replace [Bracket Placeholder] patterns from signature blocks
-                # These are produced by _get_signature_block_template() when the attorney
-                # profile wasn't loaded at generation time, or by AI-generated documents
-                BRACKET_REPLACEMENTS = {
-                    '[Firm Name]': 'firm_name',
-                    '[Attorney Name]': 'attorney_name',
-                    '[Bar Number]': 'bar_number',
-                    '[Firm Address]': 'firm_address',
-                    '[City, State ZIP]': 'firm_city_state_zip',
-                    '[Phone]': 'phone',
-                    '[Email]': 'email',
-                    '[Fax]': 'fax',
-                }
-                for bracket, key in BRACKET_REPLACEMENTS.items():
-                    if bracket in text and key in replacements:
-                        text = text.replace(bracket, replacements[key])
-
-                return text
-
-            def replace_in_paragraph(paragraph):
-                """Replace placeholders in a paragraph while preserving formatting.
-
-                Strategy: try run-level replacement first (preserves tabs & formatting
-                across runs). Only fall back to full-paragraph replacement if a
-                placeholder spans multiple runs.
-
-                IMPORTANT: paragraph.text includes text from <w:hyperlink> children,
-                but paragraph.runs does NOT include hyperlink runs. We must only
-                operate on runs-accessible text here; hyperlink placeholders are
-                handled by the XML-level post-processing pass.
-                """
-                # Use runs-only text to avoid seeing hyperlink placeholders
-                # (paragraph.text includes hyperlink text, causing double replacement)
-                runs_text = ''.join(r.text for r in paragraph.runs)
-                if not runs_text or '{{' not in runs_text:
-                    return
-
-                # Full paragraph text for uppercase context detection
-                full_text = paragraph.text
-
-                # --- Pass 1: try replacing within individual runs ---
-                runs_changed = False
-                for run in paragraph.runs:
-                    if '{{' in run.text:
-                        new_run_text = replace_placeholders(run.text, full_text)
-                        if new_run_text != run.text:
-                            run.text = new_run_text
-                            runs_changed = True
-
-                # Check if all placeholders in runs are resolved
-                remaining_runs_text = ''.join(r.text for r in paragraph.runs)
-                if '{{' not in remaining_runs_text:
-                    return  # All done — formatting fully preserved
-
-                # --- Pass 2: placeholder spans multiple runs ---
-                # Build a map of character positions → (run_index, offset_in_run)
-                # so we can surgically replace only the affected runs.
-                new_full_text = replace_placeholders(remaining_runs_text, full_text)
-                if new_full_text == remaining_runs_text:
-                    return  # Nothing more to replace
-
-                # Fallback: redistribute text across runs.
-                # Preserve leading runs that don't contain '{{' (keeps tabs/format).
-                runs = paragraph.runs
-                if not runs:
-                    paragraph.text = new_full_text
-                    return
-
-                # Find which runs are "before" the first placeholder
-                char_offset = 0
-                first_placeholder_pos = remaining_runs_text.find('{{')
-                safe_prefix_runs = []
-                prefix_chars = 0
-
-                for i, run in enumerate(runs):
-                    run_end = char_offset + len(run.text)
-                    if run_end <= first_placeholder_pos:
-                        safe_prefix_runs.append(i)
-                        prefix_chars += len(run.text)
-                    else:
-                        break
-                    char_offset = run_end
-
-                if safe_prefix_runs:
-                    # Keep prefix runs unchanged, put the rest into the next run
-                    first_affected = safe_prefix_runs[-1] + 1
-                    if first_affected < len(runs):
-                        runs[first_affected].text = new_full_text[prefix_chars:]
-                        for j in range(first_affected + 1, len(runs)):
-                            runs[j].text = ''
+                replacements['attorney_signature_block'] = sig_block
+                replacements['attorney1_signature_block'] = sig_block
+
+        # Optional fields that should be empty (omitted) if not provided
+        for blank_field in [
+            'second_attorney_name', 'second_attorney_bar', 'second_attorney_email',
+        ]:
+            replacements.setdefault(blank_field, '')
+
+        # Auto-fill dates with today's date if not provided
+        from datetime import datetime
+        today = datetime.now()
+        today_formatted = today.strftime('%B %d, %Y')  # "February 4, 2026"
+        if 'service_date' not in replacements:
+            replacements['service_date'] = today_formatted
+        if 'date' not in replacements:
+            replacements['date'] = today_formatted
+
+        return replacements
+
+    def _fill_docx_document(self, parsed, replacements: Dict[str, str]) -> bytes:
+        """Fill a template through python-docx (fallback for _fill_docx_template).
+
+        ``parsed`` is the template_cache.ParsedTemplate; only the paragraphs its
+        placeholder map lists are visited.
+        """
+        import io
+        import re
+        from template_compiler import fill_placeholders, is_empty_label, is_uppercase_context, \
+            normalize_signature_text
+
+        doc = parsed.new_document()
+
+        def replace_in_paragraph(paragraph):
+            """Replace placeholders in a paragraph while preserving formatting.
+
+            Strategy: try run-level replacement first (preserves tabs & formatting
+            across runs). Only fall back to full-paragraph replacement if a
+            placeholder spans multiple runs.
+
+            IMPORTANT: paragraph.text includes text from <w:hyperlink> children,
+            but paragraph.runs does NOT include hyperlink runs. We must only
+            operate on runs-accessible text here; hyperlink placeholders are
+            handled by the XML-level post-processing pass.
+            """
+            # Use runs-only text to avoid seeing hyperlink placeholders
+            # (paragraph.text includes hyperlink text, causing double replacement)
+            runs_text = ''.join(r.text for r in paragraph.runs)
+            if not runs_text or '{{' not in runs_text:
+                return
+
+            # Full paragraph text for uppercase context detection
+            full_text = paragraph.text
+
+            # --- Pass 1: try replacing within individual runs ---
+            runs_changed = False
+            for run in paragraph.runs:
+                if '{{' in run.text:
+                    new_run_text = fill_placeholders(run.text, replacements, full_text)
+                    if new_run_text != run.text:
+                        run.text = new_run_text
+                        runs_changed = True
+
+            # Check if all placeholders in runs are resolved
+            remaining_runs_text = ''.join(r.text for r in paragraph.runs)
+            if '{{' not in remaining_runs_text:
+                return  # All done — formatting fully preserved
+
+            # --- Pass 2: placeholder spans multiple runs ---
+            # Build a map of character positions → (run_index, offset_in_run)
+            # so we can surgically replace only the affected runs.
+            new_full_text = fill_placeholders(remaining_runs_text, replacements, full_text)
+            if new_full_text == remaining_runs_text:
+                return  # Nothing more to replace
+
+            # Fallback: redistribute text across runs.
+            # Preserve leading runs that don't contain '{{' (keeps tabs/format).
+            runs = paragraph.runs
+            if not runs:
+                paragraph.text = new_full_text
+                return
+
+            # Find which runs are "before" the first placeholder
+            char_offset = 0
+            first_placeholder_pos = remaining_runs_text.find('{{')
+            safe_prefix_runs = []
+            prefix_chars = 0
+
+            for i, run in enumerate(runs):
+                run_end = char_offset + len(run.text)
+                if run_end <= first_placeholder_pos:
+                    safe_prefix_runs.append(i)
+                    prefix_chars += len(run.text)
                 else:
-                    # No safe prefix — put everything in first run, clear rest
-                    runs[0].text = new_full_text
-                    for run in runs[1:]:
-                        run.text = ''
-
-            # Process all paragraphs
-            for paragraph in doc.paragraphs:
-                replace_in_paragraph(paragraph)
-
-            # Process tables (important for court captions)
-            for table in doc.tables:
-                for row in table.rows:
-                    for cell in row.cells:
-                        for paragraph in cell.paragraphs:
-                            replace_in_paragraph(paragraph)
-
-            # Post-process: normalize /s/ signature lines
-            # After filling, /s/ lines may have excessive underscores that cause
-            # wrapping or ugly JUSTIFY stretching. Trim to a clean format.
-            def normalize_signature_lines(paragraph):
-                text = paragraph.text
-                if '/s/' not in text:
-                    return
-                # Paragraph-level: strip trailing underscores and excess spaces
-                # from ALL runs in a /s/ paragraph, since the /s/ prefix IS
-                # the electronic signature — underscore lines are unnecessary.
+                    break
+                char_offset = run_end
+
+            if safe_prefix_runs:
+                # Keep prefix runs unchanged, put the rest into the next run
+                first_affected = safe_prefix_runs[-1] + 1
+                if first_affected < len(runs):
+                    runs[first_affected].text = new_full_text[prefix_chars:]
+                    for j in range(first_affected + 1, len(runs)):
+                        runs[j].text = ''
+            else:
+                # No safe prefix — put everything in first run, clear rest
+                runs[0].text = new_full_text
+                for run in runs[1:]:
+                    run.text = ''
+
+        # Process only the paragraphs (body and table cells, e.g. court
+        # captions) the cached placeholder map says contain {{...}}
+        for paragraph in parsed.placeholder_paragraphs(doc):
+            replace_in_paragraph(paragraph)
+        fixup_paragraphs = parsed.fixup_paragraphs(doc)
+
+        # Post-process: normalize /s/ signature lines
+        # After filling, /s/ lines may have excessive underscores that cause
+        # wrapping or ugly JUSTIFY stretching. Trim to a clean format.
+        def normalize_signature_lines(paragraph):
+            text = paragraph.text
+            if '/s/' not in text:
+                return
+            # Paragraph-level: strip trailing underscores and excess spaces
+            # from ALL runs in a /s/ paragraph, since the /s/ prefix IS
+            # the electronic signature — underscore lines are unnecessary.
+            for run in paragraph.runs:
+                new_rt = normalize_signature_text(run.text)
+                if new_rt != run.text:
+                    run.text = new_rt
+
+        for paragraph in fixup_paragraphs:
+            normalize_signature_lines(paragraph)
+
+        # Cleanup: remove paragraphs that are just a label with empty value
+        # e.g., "Facsimile: " when firm_fax is blank
+        for paragraph in fixup_paragraphs:
+            full = ''.join(r.text for r in paragraph.runs)
+            if not full:
+                full = paragraph.text
+            if is_empty_label(full):
+                # Clear all runs so paragraph is empty
                 for run in paragraph.runs:
-                    rt = run.text
-                    # Remove blocks of 4+ underscores
-                    new_rt = re.sub(r'_{4,}', '', rt)
-                    # Collapse trailing whitespace (but keep leading tabs)
-                    new_rt = re.sub(r'  +$', '', new_rt)
-                    new_rt = re.sub(r'  +(?=[^ ])', ' ', new_rt)
-                    if new_rt != rt:
-                        run.text = new_rt
-
-            for paragraph in doc.paragraphs:
-                normalize_signature_lines(paragraph)
-            for table in doc.tables:
-                for row in table.rows:
-                    for cell in row.cells:
-                        for paragraph in cell.paragraphs:
-                            normalize_signature_lines(paragraph)
-
-            # Cleanup: remove paragraphs that are just a label with empty value
-            # e.g., "Facsimile: " when firm_fax is blank
-            EMPTY_LABEL_PATTERNS = [
-                re.compile(r'^\s*Facsimile:\s*$'),
-                re.compile(r'^\s*Fax:\s*$'),
-                re.compile(r'^\s*Second Attorney:\s*$'),
-            ]
-            def remove_empty_label_paragraphs(paragraphs_parent):
-                for paragraph in paragraphs_parent.paragraphs:
-                    full = ''.join(r.text for r in paragraph.runs)
-                    if not full:
-                        full = paragraph.text
-                    for pat in EMPTY_LABEL_PATTERNS:
-                        if pat.match(full):
-                            # Clear all runs so paragraph is empty
-                            for run in paragraph.runs:
-                                run.text = ''
-                            break
+                    run.text = ''
 
-            remove_empty_label_paragraphs(doc)
-            for table in doc.tables:
-                for row in table.rows:
-                    for cell in row.cells:
-                        remove_empty_label_paragraphs(cell)
+        output = io.BytesIO()
+        doc.save(output)
+        filled = output.getvalue()
 
-            # Process hyperlink-enclosed placeholders (python-docx para.runs
-            # doesn't include runs inside <w:hyperlink> elements)
-            output = io.BytesIO()
-            doc.save(output)
-            filled = output.getvalue()
+        # Process hyperlink-enclosed placeholders (python-docx para.runs
+        # doesn't include runs inside <w:hyperlink> elements). Templates
+        # without any such placeholders skip the unzip/rezip.
+        if not parsed.needs_xml_pass:
+            return filled
 
-            # Do a final XML-level pass for any remaining {{placeholders}}
-            try:
-                import zipfile
-                buf = io.BytesIO(filled)
-                with zipfile.ZipFile(buf, 'r') as zin:
-                    parts = {}
-                    for item in zin.infolist():
-                        data = zin.read(item.filename)
-                        if item.filename == 'word/document.xml':
-                            xml_str = data.decode('utf-8')
-                            # Build tag-stripped version for context detection
-                            clean_xml = re.sub(r'<[^>]+>', '', xml_str)
-                            # Replace placeholders in raw XML text nodes
-                            def xml_replacer(m):
-                                key = m.group(1).strip().lower()
-                                if key not in replacements:
-                                    return m.group(0)
-                                value = replacements[key]
-                                # Uppercase detection: find placeholder in clean text
-                                ph_text = m.group(0)
-                                cpos = clean_xml.find(ph_text)
-                                if cpos >= 0:
-                                    before = clean_xml[max(0, cpos - 40):cpos]
-                                    after = clean_xml[cpos + len(ph_text):cpos + len(ph_text) + 40]
-                                    nearby = re.sub(r'[^A-Za-z]', '', before + after)
-                                    if len(nearby) >= 4 and nearby == nearby.upper():
-                                        return value.upper()
-                                return value
-                            xml_str = re.sub(r'\{\{([^}]+)\}\}', xml_replacer, xml_str)
-                            data = xml_str.encode('utf-8')
-                        parts[item.filename] = data
-                # Repack
-                out = io.BytesIO()
-                with zipfile.ZipFile(out, 'w', zipfile.ZIP_DEFLATED) as zout:
-                    for fname, data in parts.items():
-                        zout.writestr(fname, data)
-                return out.getvalue()
-            except Exception:
-                return filled
-
-        except Exception as e:
-            print(f"Error filling docx template: {e}")
-            return None
+        # Do a final XML-level pass for any remaining {{placeholders}}
+        try:
+            import zipfile
+            buf = io.BytesIO(filled)
+            with zipfile.ZipFile(buf, 'r') as zin:
+                parts = {}
+                for item in zin.infolist():
+                    data = zin.read(item.filename)
+                    if item.filename == 'word/document.xml':
+                        xml_str = data.decode('utf-8')
+                        # Build tag-stripped version for context detection
+                        clean_xml = re.sub(r'<[^>]+>', '', xml_str)
+                        # Replace placeholders in raw XML text nodes
+                        def xml_replacer(m):
+                            key = m.group(1).strip().lower()
+                            if key not in replacements:
+                                return m.group(0)
+                            value = replacements[key]
+                            # Uppercase detection: find placeholder in clean text
+                            if is_uppercase_context(m.group(0), clean_xml):
+                                return value.upper()
+                            return value
+                        xml_str = re.sub(r'\{\{([^}]+)\}\}', xml_replacer, xml_str)
+                        data = xml_str.encode('utf-8')
+                    parts[item.filename] = data
+            # Repack
+            out = io.BytesIO()
+            with zipfile.ZipFile(out, 'w', zipfile.ZIP_DEFLATED) as zout:
+                for fname, data in parts.items():
+                    zout.writestr(fname, data)
+            return out.getvalue()
+        except Exception:
+            return filled
 
     def _fill_template_variables(self, template_text: str, session: DocumentSession) -> str:
         """Fill {{placeholder}} variables with collected values.
@@ -2681,9 +2516,7 @@ For Waiver documents:
 - May require defendant signature line
 """
 
-        prompt = f"""Generate a professional Missouri legal document draft.
-
-Document Type: {session.template_name}
+        prompt = f"""Document Type: {session.template_name}
 Jurisdiction: {session.jurisdiction or "Missouri"}
 
 Variables:
@@ -2692,7 +2525,11 @@ Variables:
 {firm_info}
 
 {doc_instructions}
-{placeholder_instruction}
+{placeholder_instruction}"""
+
+        # The layout and signature block are the same for every draft this
+        # engine writes, so they form the cached system prompt
+        system = f"""Generate a professional Missouri legal document draft from the document type, variables and instructions in the user message.
 
 Generate the complete document using this EXACT format:
 
@@ -2719,13 +2556,9 @@ v.                                      )
 
 Use the exact formatting shown. Keep the document concise and professional."""
 
-        response = self.client.messages.create(
-            model=self.model_id,
-            max_tokens=4000,
-            messages=[{"role": "user", "content": prompt}]
-        )
+        draft_text = self._complete(prompt, max_tokens=4000, on_text=_on_text.get(), system=system)
 
-        session.draft_content = response.content[0].text
+        session.draft_content = draft_text
         session.state = ConversationState.DRAFT_READY
 
         # Create preview
@@ -2772,14 +2605,9 @@ What variable values should be changed? Respond with JSON:
 
 Only include variables that need to change."""
 
-        response = self.client.messages.create(
-            model=self.model_id,
-            max_tokens=500,
-            messages=[{"role": "user", "content": prompt}]
-        )
+        text = self._complete(prompt, max_tokens=500)
 
         try:
-            text = response.content[0].text
             json_match = re.search(r'\{[^}]*\}', text, re.DOTALL)
             if json_match:
                 return json.loads(json_match.group())
@@ -2850,15 +2678,58 @@ You can now:
 Would you like to generate another document?"""
 
     def _load_template_content(self, template_id: int) -> Optional[bytes]:
-        """Load template content from database."""
+        """Load template content, from the parsed-template cache when current."""
         try:
-            from document_engine import get_engine
-            engine = get_engine()
-            return engine.get_template_content(template_id)
+            from template_cache import get_template_cache
+            return get_template_cache().load(template_id)
         except:
             return None
 
 
+# ============================================================================
+# Bulk Variable Analysis
+# ============================================================================
+
+def precompute_variable_analysis(firm_id: str = None, template_ids: List[int] = None,
+                                 limit: int = None) -> Dict[str, int]:
+    """
+    Analyze templates whose stored variable analysis is missing or stale.
+
+    Called after template import/preprocessing so starting a document
+    session is a single read instead of a model round-trip. Only templates
+    that need it are analyzed, so re-running is cheap.
+
+    Returns counts: {"analyzed", "failed"}.
+    """
+    from db.documents import get_templates_needing_analysis
+
+    rows = get_templates_needing_analysis(
+        VARIABLE_ANALYSIS_VERSION, firm_id=firm_id, template_ids=template_ids, limit=limit)
+    counts = {"analyzed": 0, "failed": 0}
+    engines: Dict[str, DocumentChatEngine] = {}
+
+    for row in rows:
+        content = row["file_content"]
+        if hasattr(content, "tobytes"):
+            content = content.tobytes()
+        try:
+            engine = engines.get(row["firm_id"])
+            if engine is None:
+                engine = engines[row["firm_id"]] = DocumentChatEngine(firm_id=row["firm_id"])
+            variables, reusable = engine._detect_template_variables(
+                row["name"], content, row.get("category") or "")
+            if reusable and _store_variable_analysis(row["id"], content, variables):
+                counts["analyzed"] += 1
+            else:
+                counts["failed"] += 1
+        except Exception as e:
+            import logging
+            logging.getLogger(__name__).warning(f"Variable analysis failed for template {row['name']}: {e}")
+            counts["failed"] += 1
+
+    return counts
+
+
 # ============================================================================
 # CLI Interface for Testing
 # ============================================================================
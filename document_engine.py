@@ -394,17 +394,34 @@ class DocumentEngine:
             file_size=len(file_content),
         )
 
+        # Near-duplicate signature; template_dedup.compute_signatures backfills failures
+        from template_dedup import MINHASH_VERSION, docx_signature
+        try:
+            db_docs.save_template_minhash(template_id, file_hash, MINHASH_VERSION,
+                                          docx_signature(file_content))
+        except Exception as e:
+            print(f"Could not sign template {template_id}: {e}")
+
+        from template_index import invalidate_template_index
+        invalidate_template_index(firm_id)
+
         return template_id, detected_vars
 
     def import_folder(
         self,
         firm_id: str,
         folder_path: Path,
-        recursive: bool = True
+        recursive: bool = True,
+        analyze_variables: bool = True,
     ) -> Dict[str, Any]:
         """
         Import all templates from a folder.
 
+        With analyze_variables, the document-chat variable analysis for each
+        new or changed template is computed and stored now, so sessions on
+        these templates don't pay for it. Imported templates are also
+        compiled for filling (template_compiler).
+
         Returns summary of import operation.
         """
         results = {
@@ -446,6 +463,22 @@ class DocumentEngine:
                 results['errors'].append(f"{file_path.name}: {str(e)}")
                 results['skipped'] += 1
 
+        if analyze_variables and results['templates']:
+            try:
+                from document_chat import precompute_variable_analysis
+                results['analysis'] = precompute_variable_analysis(
+                    firm_id, template_ids=[t['id'] for t in results['templates']])
+            except Exception as e:
+                results['errors'].append(f"variable analysis: {e}")
+
+        if results['templates']:
+            try:
+                from template_compiler import compile_templates
+                results['compiled'] = compile_templates(
+                    firm_id, template_ids=[t['id'] for t in results['templates']])
+            except Exception as e:
+                results['errors'].append(f"template compile: {e}")
+
         return results
 
     # =========================================================================
@@ -515,7 +548,11 @@ class DocumentEngine:
         # - Stop word removal
         # - PostgreSQL full-text search with tsvector
         # - Fallback to ILIKE search if FTS fails
-        results = db_docs.search_templates(firm_id, query, limit=limit)
+        # Near-duplicate variants collapse into their best-ranked one, so
+        # fetch extra rows to still fill the page.
+        from template_dedup import collapse_near_duplicates
+        results = db_docs.search_templates(firm_id, query, limit=limit * 2)
+        results = collapse_near_duplicates(results)[:limit]
         return [self._row_to_template(row) for row in results]
 
     def list_templates(
@@ -4,15 +4,21 @@ phone/lookup.py — Client Lookup by Phone Number
 Given a normalized phone number and firm_id, find the matching client
 and their active cases, last payment, and balance due.
 """
+import json
 import logging
+from datetime import datetime
 from typing import Optional
 
+from db.case_bundle import load_case_bundles
 from db.connection import get_connection
 from phone.normalize import normalize_phone, format_display
 from phone.events import ScreenPopPayload
 
 logger = logging.getLogger(__name__)
 
+# Related entities a screen pop needs from each of the caller's cases
+SCREEN_POP_RELATIONS = ("invoices", "payments", "phase_history")
+
 
 def lookup_client_by_phone(firm_id: str, phone_normalized: str) -> Optional[dict]:
     """
@@ -47,9 +53,9 @@ def lookup_client_by_phone(firm_id: str, phone_normalized: str) -> Optional[dict
         return dict(row) if row else None
 
 
-def get_client_active_cases(firm_id: str, client_id: int) -> list:
+def get_client_case_ids(firm_id: str, client_id: int) -> list:
     """
-    Get active cases for a client.
+    Get IDs of all cases (open or closed) for a client, newest first.
 
     Uses the billing_contact JSONB path in cached_cases to match
     client ID (since cached_invoices.contact_id is NULL).
@@ -57,79 +63,55 @@ def get_client_active_cases(firm_id: str, client_id: int) -> list:
     with get_connection() as conn:
         cur = conn.cursor()
         cur.execute("""
-            SELECT
-                c.id,
-                c.name,
-                c.case_number,
-                c.practice_area,
-                c.status,
-                c.lead_attorney_name,
-                cph.current_phase
+            SELECT c.id
             FROM cached_cases c
-            LEFT JOIN (
-                SELECT DISTINCT ON (case_id, firm_id)
-                    case_id, firm_id, phase_name as current_phase
-                FROM case_phase_history
-                WHERE exited_at IS NULL
-                ORDER BY case_id, firm_id, entered_at DESC
-            ) cph ON c.id = cph.case_id AND c.firm_id = cph.firm_id
             WHERE c.firm_id = %s
-              AND c.status = 'open'
               AND (
                   c.data_json::jsonb -> 'billing_contact' ->> 'id' = %s
                   OR c.data_json::jsonb -> 'clients' @> %s::jsonb
               )
             ORDER BY c.created_at DESC
-        """, (firm_id, str(client_id),
-              __import__('json').dumps([{"id": client_id}])))
-        return [dict(r) for r in cur.fetchall()]
-
-
-def get_client_last_payment(firm_id: str, client_id: int) -> Optional[dict]:
-    """Get the most recent payment for a client."""
-    with get_connection() as conn:
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT p.amount, p.created_at as payment_date
-            FROM cached_payments p
-            JOIN cached_invoices i ON p.invoice_id = i.id AND p.firm_id = i.firm_id
-            JOIN cached_cases c ON i.case_id = c.id AND i.firm_id = c.firm_id
-            WHERE p.firm_id = %s
-              AND (
-                  c.data_json::jsonb -> 'billing_contact' ->> 'id' = %s
-                  OR c.data_json::jsonb -> 'clients' @> %s::jsonb
-              )
-            ORDER BY p.created_at DESC
-            LIMIT 1
-        """, (firm_id, str(client_id),
-              __import__('json').dumps([{"id": client_id}])))
-        row = cur.fetchone()
-        if row:
-            return {
-                "amount": float(row['amount']) if row['amount'] else 0,
-                "date": row['payment_date'].strftime('%b %d, %Y') if row['payment_date'] else None,
-            }
+        """, (firm_id, str(client_id), json.dumps([{"id": client_id}])))
+        return [r['id'] for r in cur.fetchall()]
+
+
+def get_client_case_bundles(firm_id: str, client_id: int) -> list:
+    """Load the client's cases with invoices, payments and phases (newest case first)."""
+    case_ids = get_client_case_ids(firm_id, client_id)
+    bundles = load_case_bundles(firm_id, case_ids, include=SCREEN_POP_RELATIONS)
+    return [bundles[i] for i in case_ids if i in bundles]
+
+
+def get_client_active_cases(firm_id: str, client_id: int, bundles: list = None) -> list:
+    """Get active cases for a client, with their current phase."""
+    if bundles is None:
+        bundles = get_client_case_bundles(firm_id, client_id)
+    return [{
+        "id": b.id,
+        "name": b.case['name'],
+        "case_number": b.case['case_number'],
+        "practice_area": b.case['practice_area'],
+        "status": b.case['status'],
+        "lead_attorney_name": b.case['lead_attorney_name'],
+        "current_phase": b.current_phase,
+    } for b in bundles if b.case['status'] == 'open']
+
+
+def get_client_last_payment(bundles: list) -> Optional[dict]:
+    """Most recent payment across a client's case bundles."""
+    payments = [b.last_payment for b in bundles if b.last_payment]
+    if not payments:
         return None
+    row = max(payments, key=lambda p: p['created_at'] or datetime.min)
+    return {
+        "amount": float(row['amount']) if row['amount'] else 0,
+        "date": row['created_at'].strftime('%b %d, %Y') if row['created_at'] else None,
+    }
 
 
-def get_client_balance_due(firm_id: str, client_id: int) -> float:
-    """Get total outstanding balance for a client across all open invoices."""
-    with get_connection() as conn:
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT COALESCE(SUM(i.balance_due), 0) as total_balance
-            FROM cached_invoices i
-            JOIN cached_cases c ON i.case_id = c.id AND i.firm_id = c.firm_id
-            WHERE i.firm_id = %s
-              AND i.balance_due > 0
-              AND (
-                  c.data_json::jsonb -> 'billing_contact' ->> 'id' = %s
-                  OR c.data_json::jsonb -> 'clients' @> %s::jsonb
-              )
-        """, (firm_id, str(client_id),
-              __import__('json').dumps([{"id": client_id}])))
-        row = cur.fetchone()
-        return float(row['total_balance']) if row else 0.0
+def get_client_balance_due(bundles: list) -> float:
+    """Total outstanding balance across a client's case bundles."""
+    return float(sum(b.balance_due for b in bundles))
 
 
 def _get_mycase_client_url(firm_id: str, client_id: int) -> Optional[str]:
@@ -213,8 +195,6 @@ def build_screen_pop(
     This is the main entry point — called after a webhook is received
     and the call event is logged.
     """
-    from datetime import datetime
-
     # Look up client
     client = lookup_client_by_phone(firm_id, caller_number_normalized)
 
@@ -236,14 +216,12 @@ def build_screen_pop(
     # Build MyCase deep link URL
     mycase_url = _get_mycase_client_url(firm_id, client_id)
 
-    # Get active cases
-    cases = get_client_active_cases(firm_id, client_id)
-
-    # Get last payment
-    last_payment = get_client_last_payment(firm_id, client_id)
-
-    # Get total balance
-    balance_due = get_client_balance_due(firm_id, client_id)
+    # Load all of the client's cases with invoices, payments and phases
+    # in one pass, then derive active cases, last payment and balance
+    bundles = get_client_case_bundles(firm_id, client_id)
+    cases = get_client_active_cases(firm_id, client_id, bundles)
+    last_payment = get_client_last_payment(bundles)
+    balance_due = get_client_balance_due(bundles)
 
     # Build case list for payload
     case_list = [{
@@ -15,13 +15,19 @@ GENERALIZED APPROACH:
 - Fixed entities (STATE OF MISSOURI, etc.) are never replaced
 - Works with any firm's templates without requiring specific variable strings
 
+Re-runs are incremental: each template records the file_hash and
+PREPROCESSOR_VERSION it was preprocessed at, and only templates changed since
+are read (streamed from a server-side cursor) and processed, in a worker pool.
+
 Run with:
     python preprocess_templates_pg.py --dry-run    # Preview changes without updating
     python preprocess_templates_pg.py --update     # Actually update the database
     python preprocess_templates_pg.py --firm jcs_law --update  # Update specific firm only
+    python preprocess_templates_pg.py --update --force  # Reprocess every template
 """
 
 import os
+import hashlib
 import io
 import re
 import sys
@@ -69,6 +75,12 @@ PG_CONFIG = {
     'sslmode': os.getenv('PG_SSLMODE', 'require')
 }
 
+# Bump when the detection rules change so every template is preprocessed again
+PREPROCESSOR_VERSION = "preprocess_templates_pg-1"
+
+# Templates per server-side cursor fetch; each row carries its .docx
+STREAM_BATCH = 20
+
 # Standard placeholders we want to use
 PLACEHOLDERS = {
     'defendant_name': '{{defendant_name}}',
@@ -600,6 +612,12 @@ def main():
     parser.add_argument('--limit', type=int, default=0, help='Limit number of templates to process')
     parser.add_argument('--verbose', '-v', action='store_true', help='Show detailed output')
     parser.add_argument('--show-names', action='store_true', help='Show detected names for each template')
+    parser.add_argument('--skip-analysis', action='store_true',
+                        help='Do not precompute variable analysis for updated templates')
+    parser.add_argument('--force', action='store_true',
+                        help='Reprocess templates already preprocessed at this version')
+    parser.add_argument('--workers', type=int, default=0,
+                        help='Worker processes (default: PREPROCESS_WORKERS or CPU count)')
     args = parser.parse_args()
 
     if not args.dry_run and not args.update:
@@ -621,43 +639,69 @@ def main():
         print(f"✗ Failed to connect: {e}")
         return
 
-    # Fetch templates
-    with conn.cursor() as cur:
-        query = "SELECT id, name, file_content FROM templates WHERE is_active = TRUE"
-        params = []
-
-        if args.firm:
-            query += " AND firm_id = %s"
-            params.append(args.firm)
-
-        query += " ORDER BY id"
+    from template_preprocessor import PREPROCESS_WORKERS, process_stream
 
-        if args.limit:
-            query += " LIMIT %s"
-            params.append(args.limit)
-
-        cur.execute(query, params)
-        templates = cur.fetchall()
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT 1 FROM information_schema.columns
+            WHERE table_name = 'templates' AND column_name = 'preprocessed_key'
+        """)
+        incremental = cur.fetchone() is not None
+        if not incremental and args.update:
+            cur.execute("ALTER TABLE templates ADD COLUMN IF NOT EXISTS preprocessed_key TEXT")
+            conn.commit()
+            incremental = True
+
+    # Select templates not yet preprocessed at this version
+    conditions = ["is_active = TRUE", "file_content IS NOT NULL"]
+    params = []
+    if incremental and not args.force:
+        conditions.append("preprocessed_key IS DISTINCT FROM file_hash || ':' || %s")
+        params.append(PREPROCESSOR_VERSION)
+    if args.firm:
+        conditions.append("firm_id = %s")
+        params.append(args.firm)
+    where = " AND ".join(conditions)
 
-    print(f"\nFound {len(templates)} templates to process")
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT COUNT(*) FROM templates WHERE {where}", params)
+        pending = cur.fetchone()[0]
+    if args.limit:
+        pending = min(pending, args.limit)
+
+    print(f"\nFound {pending} templates to process")
+
+    # Stream them from a server-side cursor; a separate connection takes the writes
+    query = f"SELECT id, name, file_content FROM templates WHERE {where} ORDER BY id"
+    if args.limit:
+        query += " LIMIT %s"
+        params.append(args.limit)
+    read_cur = conn.cursor(name="preprocess_templates")
+    read_cur.itersize = STREAM_BATCH
+    read_cur.execute(query, params)
+    write_conn = get_pg_connection() if args.update else None
+
+    def templates():
+        for template_id, name, content in read_cur:
+            # Handle memoryview from PostgreSQL
+            if hasattr(content, 'tobytes'):
+                content = content.tobytes()
+            yield template_id, name, content, args.show_names
 
     # Process templates
-    results = []
+    var_counts = {}
+    processed = 0
     updated = 0
+    updated_ids = []
     errors = 0
     skipped = 0
+    workers = max(1, min(args.workers or PREPROCESS_WORKERS, pending))
 
-    for i, (template_id, name, content) in enumerate(templates):
-        if content is None:
-            skipped += 1
-            continue
-
-        # Handle memoryview from PostgreSQL
-        if hasattr(content, 'tobytes'):
-            content = content.tobytes()
-
-        result = process_template(template_id, name, content, verbose=args.show_names)
-        results.append(result)
+    for (template_id, name, content, _), result in process_stream(process_template, templates(), workers):
+        processed += 1
+        source_hash = hashlib.sha256(content).hexdigest()
+        for v in result.variables_found:
+            var_counts[v] = var_counts.get(v, 0) + 1
 
         if result.error:
             errors += 1
@@ -670,42 +714,74 @@ def main():
                 print(f"  ✓ {name}: {result.replacements_made} replacements, vars: {result.variables_found}")
 
             if args.update and result.processed_content:
-                # Update the database
-                with conn.cursor() as cur:
+                # Update the database, unless the template changed since it was read
+                new_hash = hashlib.sha256(result.processed_content).hexdigest()
+                with write_conn.cursor() as cur:
                     cur.execute(
-                        "UPDATE templates SET file_content = %s WHERE id = %s",
-                        (psycopg2.Binary(result.processed_content), template_id)
+                        """
+                        UPDATE templates SET file_content = %s, file_hash = %s, preprocessed_key = %s
+                        WHERE id = %s AND (file_hash = %s OR file_hash IS NULL)
+                        """,
+                        (psycopg2.Binary(result.processed_content), new_hash,
+                         f"{new_hash}:{PREPROCESSOR_VERSION}", template_id, source_hash)
                     )
-                updated += 1
+                    if cur.rowcount:
+                        updated_ids.append(template_id)
+                        updated += 1
         else:
             skipped += 1
             if args.verbose:
                 print(f"  - {name}: no changes needed")
 
-        # Progress indicator
-        if (i + 1) % 100 == 0:
-            print(f"  Progress: {i + 1}/{len(templates)}")
+            if args.update:
+                with write_conn.cursor() as cur:
+                    cur.execute(
+                        """
+                        UPDATE templates
+                        SET preprocessed_key = %s, file_hash = COALESCE(file_hash, %s)
+                        WHERE id = %s AND (file_hash = %s OR file_hash IS NULL)
+                        """,
+                        (f"{source_hash}:{PREPROCESSOR_VERSION}", source_hash, template_id, source_hash)
+                    )
 
-    if args.update:
-        conn.commit()
+        # Progress indicator
+        if processed % 100 == 0:
+            print(f"  Progress: {processed}/{pending}")
+            if write_conn is not None:
+                write_conn.commit()
 
+    read_cur.close()
     conn.close()
+    if write_conn is not None:
+        write_conn.commit()
+        write_conn.close()
+
+    # Precompute document-chat variable analysis for the rewritten templates
+    if args.update and updated_ids and not args.skip_analysis:
+        from document_chat import precompute_variable_analysis
+        analysis = precompute_variable_analysis(template_ids=updated_ids)
+        print(f"\nVariable analysis: {analysis['analyzed']} analyzed, {analysis['failed']} failed")
+
+    # Compile the rewritten templates for fast filling (no LLM calls)
+    if args.update and updated_ids:
+        from template_compiler import compile_templates
+        compiled = compile_templates(template_ids=updated_ids)
+        print(f"Compiled templates: {compiled['compiled']} compiled, {compiled['failed']} failed")
+
+        # Their near-duplicate signatures changed with the text
+        from template_dedup import compute_signatures
+        signed = compute_signatures(template_ids=updated_ids)
+        print(f"Signatures: {signed['computed']} computed, {signed['failed']} failed")
 
     # Summary
     print("\n" + "=" * 60)
     print("SUMMARY")
     print("=" * 60)
-    print(f"Total templates:     {len(templates)}")
+    print(f"Total templates:     {processed}")
     print(f"Updated:             {updated}")
     print(f"Skipped (no change): {skipped}")
     print(f"Errors:              {errors}")
 
-    # Variable usage stats
-    var_counts = {}
-    for r in results:
-        for v in r.variables_found:
-            var_counts[v] = var_counts.get(v, 0) + 1
-
     if var_counts:
         print("\nVariables found:")
         for var, count in sorted(var_counts.items(), key=lambda x: -x[1]):
@@ -74,6 +74,22 @@ DAILY_TASKS = [
         run_at=time(6, 20),  # 6:20 AM - after main sync
         timeout=300,  # 5 minute timeout
     ),
+    ScheduledTask(
+        name="kpi_snapshot",
+        description="Record daily firm-wide and per-attorney KPI snapshots for trends",
+        frequency=TaskFrequency.DAILY,
+        command="trends record",
+        run_at=time(6, 25),  # 6:25 AM - after sync and phase sync
+        timeout=300,
+    ),
+    ScheduledTask(
+        name="dunning_queue_reconcile",
+        description="Reconcile the trigger-maintained dunning queue with cached invoices",
+        frequency=TaskFrequency.DAILY,
+        command="collections rebuild-queue",
+        run_at=time(6, 27),  # 6:27 AM - after sync
+        timeout=300,
+    ),
     ScheduledTask(
         name="events_report",
         description="Send daily upcoming events report to managing partner",
@@ -6,7 +6,7 @@ Provides AI-enhanced triage, risk assessment, briefing generation,
 and document generation from templates.
 """
 
-from .base import LegalSkill, SkillManager, SkillResult, Classification
+from .base import LegalSkill, SkillManager, SkillResult, BatchItemResult, Classification
 from .case_triage import CaseTriageSkill
 from .collections_risk import CollectionsRiskSkill
 from .briefing import BriefingSkill
@@ -17,6 +17,7 @@ __all__ = [
     'LegalSkill',
     'SkillManager',
     'SkillResult',
+    'BatchItemResult',
     'Classification',
     'CaseTriageSkill',
     'CollectionsRiskSkill',
@@ -15,15 +15,23 @@ The legacy ANTHROPIC_API_KEY direct path is gated by LLM_PROVIDER=claude.
 import json
 import logging
 import os
+import threading
+import time
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass, field
 from enum import Enum
-from typing import Any, Optional
+from typing import Any, Callable, Optional
 
 import anthropic
 
 logger = logging.getLogger(__name__)
 
+# Concurrent skill calls per batch (further capped by LLM_FIRM_CONCURRENCY)
+SKILL_BATCH_PARALLELISM = int(os.environ.get("SKILL_BATCH_PARALLELISM", "4"))
+# Reuse stored results for identical inputs (db/skill_memo.py); SKILL_MEMO=0 disables
+SKILL_MEMO_ENABLED = os.environ.get("SKILL_MEMO", "1") != "0"
+
 
 # ============================================================================
 # Bedrock Model ID Mapping
@@ -106,6 +114,43 @@ class SkillResult:
             "metadata": self.metadata
         }
 
+    @classmethod
+    def from_dict(cls, data: dict) -> "SkillResult":
+        return cls(
+            classification=Classification(data["classification"]),
+            score=data.get("score"),
+            summary=data.get("summary", ""),
+            issues=list(data.get("issues") or []),
+            recommendations=list(data.get("recommendations") or []),
+            escalation_required=data.get("escalation_required", False),
+            escalation_reason=data.get("escalation_reason"),
+            raw_response=data.get("raw_response", ""),
+            metadata=dict(data.get("metadata") or {}),
+        )
+
+
+@dataclass
+class BatchItemResult:
+    """Outcome of one item in SkillManager.run_batch()."""
+    index: int
+    status: str = "ok"                      # ok | failed | cancelled
+    result: Optional[SkillResult] = None
+    error: Optional[BaseException] = None
+    seconds: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.status == "ok"
+
+    def to_dict(self) -> dict:
+        return {
+            "index": self.index,
+            "status": self.status,
+            "result": self.result.to_dict() if self.result else None,
+            "error": str(self.error) if self.error else None,
+            "seconds": round(self.seconds, 3),
+        }
+
 
 @dataclass
 class LegalSkill(ABC):
@@ -124,6 +169,8 @@ class LegalSkill(ABC):
     # Bedrock by default — matches ClientShield. Override per-skill if needed.
     model: str = "claude-opus-4-7"
     max_tokens: int = 2048
+    # Bump when the prompt or parser changes so memoized results are not reused
+    version: str = "1"
 
     # Standard disclaimer - should appear in all legal-adjacent skills
     DISCLAIMER = """
@@ -160,6 +207,13 @@ before being relied upon for legal decisions.
 
         return prompt
 
+    def build_system_blocks(self, additional_context: Optional[str] = None) -> list:
+        """System prompt as content blocks: the skill's static prompt is a
+        cacheable prefix, per-call context follows it (see skills.llm)."""
+        from skills.llm import prompt_blocks
+        context = f"## Additional Context\n{additional_context}" if additional_context else None
+        return prompt_blocks(self.system_prompt, context)
+
     @abstractmethod
     def parse_response(self, response: str) -> SkillResult:
         """Parse Claude's response into a structured SkillResult."""
@@ -176,14 +230,20 @@ class SkillManager:
         result = manager.execute("case_triage", case_data)
     """
 
-    def __init__(self, api_key: Optional[str] = None):
+    def __init__(self, api_key: Optional[str] = None, firm_id: Optional[str] = None,
+                 memoize: bool = SKILL_MEMO_ENABLED):
         # api_key kept for backwards compatibility but ignored when LLM_PROVIDER=bedrock
         # (the default). To force the direct Anthropic API, set LLM_PROVIDER=claude
         # and pass api_key here or set ANTHROPIC_API_KEY in the environment.
+        # Otherwise the process-wide client from skills.llm is reused.
+        from skills.llm import get_shared_claude_client
         if api_key and os.environ.get("LLM_PROVIDER", "bedrock").lower() != "bedrock":
             self.client = anthropic.Anthropic(api_key=api_key)
         else:
-            self.client = get_claude_client()
+            self.client = get_shared_claude_client()
+        # Firm whose LLM concurrency slots these calls count against
+        self.firm_id = firm_id
+        self.memoize = memoize
         self.skills: dict[str, LegalSkill] = {}
 
     def register(self, skill: LegalSkill) -> None:
@@ -197,66 +257,207 @@ class SkillManager:
             for s in self.skills.values()
         ]
 
+    def _prepare(self, skill_name: str, input_data: Any) -> tuple[LegalSkill, str]:
+        if skill_name not in self.skills:
+            raise ValueError(f"Unknown skill: {skill_name}")
+
+        # Prepare input
+        if isinstance(input_data, dict):
+            user_content = json.dumps(input_data, indent=2, default=str)
+        else:
+            user_content = str(input_data)
+        return self.skills[skill_name], user_content
+
+    def _finish(self, skill: LegalSkill, skill_name: str, response_text: str, model_id: str) -> SkillResult:
+        result = skill.parse_response(response_text)
+        result.raw_response = response_text
+        result.metadata["model"] = skill.model
+        result.metadata["model_id_invoked"] = model_id
+        result.metadata["skill"] = skill_name
+        return result
+
+    # ------------------------------------------------------------------
+    # Memoization (db/skill_memo.py). Failures never block execution.
+    # ------------------------------------------------------------------
+
+    def _memo_key(self, skill: LegalSkill, input_data: Any, context: Optional[str]) -> str:
+        from db.skill_memo import memo_key
+        return memo_key(self.firm_id, skill.name, skill.version, skill.model, input_data, context)
+
+    def _memo_get(self, key: str) -> Optional[SkillResult]:
+        from db.skill_memo import get_memo
+        try:
+            hit = get_memo(key)
+        except Exception as e:
+            logger.debug("Skill memo lookup failed: %s", e)
+            return None
+        if not hit or not hit["result"]:
+            return None
+        result = SkillResult.from_dict(hit["result"])
+        result.metadata["memoized"] = True
+        return result
+
+    def _memo_put(self, key: str, skill: LegalSkill, result: SkillResult):
+        from db.skill_memo import put_memo
+        try:
+            put_memo(key, self.firm_id, skill.name,
+                     result={**result.to_dict(), "raw_response": result.raw_response},
+                     skill_version=skill.version, model=skill.model)
+        except Exception as e:
+            logger.debug("Skill memo store failed: %s", e)
+
+    def invalidate(self, skill_name: Optional[str] = None) -> int:
+        """Drop memoized results for this manager's firm and/or one skill."""
+        from db.skill_memo import invalidate_memo
+        return invalidate_memo(firm_id=self.firm_id, skill=skill_name)
+
     def execute(
         self,
         skill_name: str,
         input_data: Any,
-        context: Optional[str] = None
+        context: Optional[str] = None,
+        refresh: bool = False,
     ) -> SkillResult:
         """
         Execute a skill with the given input data.
 
+        Identical calls (same firm, skill version, model, input and context)
+        return the memoized result without an LLM call; pass refresh=True to
+        recompute. Blocks for the whole completion; from async code use
+        aexecute().
+
         Args:
             skill_name: Name of the registered skill
             input_data: Data to process (will be JSON-serialized if dict)
             context: Optional additional context for the system prompt
+            refresh: Ignore (and replace) any memoized result
 
         Returns:
             SkillResult with classification, issues, and recommendations
         """
-        if skill_name not in self.skills:
-            raise ValueError(f"Unknown skill: {skill_name}")
+        from skills.llm import complete, model_id_for
 
-        skill = self.skills[skill_name]
-
-        # Prepare input
-        if isinstance(input_data, dict):
-            user_content = json.dumps(input_data, indent=2, default=str)
-        else:
-            user_content = str(input_data)
+        skill, user_content = self._prepare(skill_name, input_data)
+        key = self._memo_key(skill, input_data, context) if self.memoize else None
+        if key and not refresh:
+            memoized = self._memo_get(key)
+            if memoized is not None:
+                return memoized
 
         # Execute — resolve to Bedrock inference profile ID when applicable
-        model_id = (
-            resolve_bedrock_model(skill.model)
-            if isinstance(self.client, anthropic.AnthropicBedrock)
-            else skill.model
+        response_text = complete(
+            self.firm_id,
+            [{"role": "user", "content": user_content}],
+            system=skill.build_system_blocks(context),
+            model=skill.model,
+            max_tokens=skill.max_tokens,
+            client=self.client,
+            feature=f"skill:{skill_name}",
         )
-        message = self.client.messages.create(
-            model=model_id,
+        result = self._finish(skill, skill_name, response_text, model_id_for(self.client, skill.model))
+        if key:
+            self._memo_put(key, skill, result)
+        return result
+
+    async def aexecute(
+        self,
+        skill_name: str,
+        input_data: Any,
+        context: Optional[str] = None,
+        refresh: bool = False,
+    ) -> SkillResult:
+        """Async execute() on the shared async client; safe to await from routes."""
+        import asyncio
+        from skills.llm import acomplete, get_async_claude_client, model_id_for
+
+        skill, user_content = self._prepare(skill_name, input_data)
+        key = self._memo_key(skill, input_data, context) if self.memoize else None
+        if key and not refresh:
+            memoized = await asyncio.to_thread(self._memo_get, key)
+            if memoized is not None:
+                return memoized
+
+        response_text = await acomplete(
+            self.firm_id,
+            [{"role": "user", "content": user_content}],
+            system=skill.build_system_blocks(context),
+            model=skill.model,
             max_tokens=skill.max_tokens,
-            system=skill.build_system_prompt(context),
-            messages=[{"role": "user", "content": user_content}]
+            feature=f"skill:{skill_name}",
         )
+        result = self._finish(skill, skill_name, response_text,
+                              model_id_for(get_async_claude_client(), skill.model))
+        if key:
+            await asyncio.to_thread(self._memo_put, key, skill, result)
+        return result
+
+    def run_batch(
+        self,
+        skill_name: str,
+        items: list[Any],
+        context: Optional[str] = None,
+        max_parallel: Optional[int] = None,
+        cancel_event: Optional[threading.Event] = None,
+        on_item: Optional[Callable[[BatchItemResult], None]] = None,
+    ) -> list[BatchItemResult]:
+        """
+        Execute a skill on many items concurrently.
 
-        response_text = message.content[0].text
+        Up to ``max_parallel`` items run at once (default SKILL_BATCH_PARALLELISM,
+        never more than the firm's LLM concurrency limit); request starts also
+        respect the provider rate budget in skills.llm. A failing item doesn't
+        stop the others. Setting ``cancel_event`` marks every item that hasn't
+        started yet as cancelled. ``on_item`` is called (from a worker thread)
+        as each item finishes.
 
-        # Parse and return
-        result = skill.parse_response(response_text)
-        result.raw_response = response_text
-        result.metadata["model"] = skill.model
-        result.metadata["model_id_invoked"] = model_id
-        result.metadata["skill"] = skill_name
+        Returns one BatchItemResult per item, in input order, with timing.
+        """
+        from skills.llm import LLM_FIRM_CONCURRENCY
 
-        return result
+        if skill_name not in self.skills:
+            raise ValueError(f"Unknown skill: {skill_name}")
+        workers = max(1, min(max_parallel or SKILL_BATCH_PARALLELISM, LLM_FIRM_CONCURRENCY, len(items) or 1))
+
+        def run(index: int, item: Any) -> BatchItemResult:
+            if cancel_event is not None and cancel_event.is_set():
+                outcome = BatchItemResult(index=index, status="cancelled")
+            else:
+                start = time.monotonic()
+                try:
+                    outcome = BatchItemResult(index=index, result=self.execute(skill_name, item, context))
+                except Exception as e:
+                    logger.warning("Skill %s failed on batch item %d: %s", skill_name, index, e)
+                    outcome = BatchItemResult(index=index, status="failed", error=e)
+                outcome.seconds = time.monotonic() - start
+            if on_item is not None:
+                on_item(outcome)
+            return outcome
+
+        start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"skill-{skill_name}") as pool:
+            futures = [pool.submit(run, i, item) for i, item in enumerate(items)]
+            outcomes = [f.result() for f in futures]
+        logger.info(
+            "Skill batch %s: %d items, %d failed, %d cancelled in %.1fs (parallel=%d)",
+            skill_name, len(outcomes), sum(o.status == "failed" for o in outcomes),
+            sum(o.status == "cancelled" for o in outcomes), time.monotonic() - start, workers,
+        )
+        return outcomes
 
     def batch_execute(
         self,
         skill_name: str,
         items: list[Any],
-        context: Optional[str] = None
+        context: Optional[str] = None,
+        max_parallel: Optional[int] = None,
     ) -> list[SkillResult]:
-        """Execute a skill on multiple items."""
-        return [
-            self.execute(skill_name, item, context)
-            for item in items
-        ]
+        """Execute a skill on multiple items concurrently; results in input order.
+
+        Raises the first item's error if any item failed. Use run_batch() to
+        keep partial results.
+        """
+        outcomes = self.run_batch(skill_name, items, context, max_parallel=max_parallel)
+        for outcome in outcomes:
+            if outcome.error is not None:
+                raise outcome.error
+        return [outcome.result for outcome in outcomes]
@@ -17,6 +17,7 @@ Usage:
 """
 
 import json
+import logging
 import re
 import subprocess
 import tempfile
@@ -27,6 +28,8 @@ from typing import Any, Dict, List, Optional
 
 from .base import LegalSkill, SkillResult, Classification
 
+logger = logging.getLogger(__name__)
+
 
 @dataclass
 class DocumentGenerationSkill(LegalSkill):
@@ -419,6 +422,21 @@ class DocumentGenerator:
         filename = f"{safe_name}{case_part}_{timestamp}.docx"
         output_path = output_dir / filename
 
+        # Identical content renders to identical bytes — reuse a stored docx-js
+        # render instead of spawning node again (db/skill_memo.py). Only docx-js
+        # output is stored; a python-docx fallback is cheap and shouldn't stand
+        # in for it.
+        render_key = None
+        try:
+            from db.skill_memo import memo_key, get_memo
+            render_key = memo_key("docx_render", "docx-js", content)
+            hit = get_memo(render_key)
+            if hit and hit["blob"]:
+                output_path.write_bytes(hit["blob"])
+                return output_path
+        except Exception as e:
+            logger.debug("Render memo lookup skipped: %s", e)
+
         # Try docx-js first (better formatting support)
         js_generated = self._generate_with_docxjs(content, output_path)
 
@@ -426,6 +444,13 @@ class DocumentGenerator:
             # Fallback to python-docx
             self._generate_with_python_docx(content, output_path)
 
+        if render_key and js_generated:
+            try:
+                from db.skill_memo import put_memo
+                put_memo(render_key, None, "docx_render", blob=output_path.read_bytes())
+            except Exception as e:
+                logger.debug("Render memo store skipped: %s", e)
+
         return output_path
 
     def _generate_with_docxjs(self, content: str, output_path: Path) -> bool:
@@ -0,0 +1,547 @@
+"""
+Shared LLM transport for dashboard AI features.
+
+Every AI feature (dashboard chat, document chat, skills) goes through this
+module instead of building its own client:
+
+- Connection reuse: one sync and one async client per process, each with
+  its own pooled HTTP connections (see skills.base.get_claude_client for
+  provider selection).
+- Timeouts and retries: LLM_TIMEOUT_SECONDS per request; the SDK retries
+  rate limits, overloads and connection errors LLM_MAX_RETRIES times with
+  backoff.
+- Per-firm concurrency: at most LLM_FIRM_CONCURRENCY requests in flight per
+  firm and process. Callers wait up to LLM_QUEUE_TIMEOUT_SECONDS for a slot,
+  then get LLMBusy, so one firm's burst of document drafts can't hold every
+  connection.
+- Rate budget: with LLM_REQUESTS_PER_MINUTE set, request starts to the
+  provider are spaced out to stay under that rate (per process), so batch
+  jobs don't trip provider throttling.
+- Streaming: astream() yields text as it arrives; complete(on_text=...)
+  does the same for sync callers running in a worker thread.
+- Prompt caching: prompts are split into a static prefix (schema, skill
+  instructions, document type catalog) and a per-call suffix with
+  prompt_blocks(). The prefix is marked for provider prompt caching, so
+  repeat calls within the cache TTL (~5 minutes) are billed at the cached
+  input rate and start streaming sooner. A plain string system prompt is
+  cached as a whole. Set LLM_PROMPT_CACHE=0 to turn caching off.
+- Metrics: token usage (including cache reads/writes), latency, time to
+  first token, errors and SDK retries are tallied per feature in-process
+  (get_llm_stats()) and, unless LLM_TELEMETRY=0, written per call with firm
+  and model to the llm_calls table in background batches (db/llm_telemetry.py
+  has the daily rollup and cost estimates).
+
+Async routes use acomplete()/astream() and never block the event loop.
+Sync code (DocumentChatEngine, SkillManager.execute) uses complete() and
+must be run off the loop (run_in_threadpool).
+
+Usage:
+    from skills.llm import acomplete, astream, complete
+
+    text = await acomplete(firm_id, [{"role": "user", "content": q}], system=PROMPT,
+                           feature="chat")
+    async for chunk in astream(firm_id, messages):
+        ...
+"""
+
+import asyncio
+import atexit
+import logging
+import os
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import AsyncIterator, Callable, Optional
+
+import anthropic
+
+from skills.base import resolve_bedrock_model
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = "claude-opus-4-7"
+LLM_TIMEOUT_SECONDS = float(os.environ.get("LLM_TIMEOUT_SECONDS", "120"))
+LLM_MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", "3"))
+LLM_FIRM_CONCURRENCY = int(os.environ.get("LLM_FIRM_CONCURRENCY", "4"))
+LLM_QUEUE_TIMEOUT_SECONDS = float(os.environ.get("LLM_QUEUE_TIMEOUT_SECONDS", "30"))
+LLM_PROMPT_CACHE = os.environ.get("LLM_PROMPT_CACHE", "1") != "0"
+LLM_REQUESTS_PER_MINUTE = int(os.environ.get("LLM_REQUESTS_PER_MINUTE", "0"))   # 0 = no budget
+LLM_RATE_BURST = int(os.environ.get("LLM_RATE_BURST", "5"))
+LLM_TELEMETRY = os.environ.get("LLM_TELEMETRY", "1") != "0"
+LLM_TELEMETRY_FLUSH_SECONDS = float(os.environ.get("LLM_TELEMETRY_FLUSH_SECONDS", "10"))
+
+
+class LLMBusy(RuntimeError):
+    """No concurrency slot freed up for the firm in time; the message is user-facing."""
+
+
+# ============================================================================
+# Clients
+# ============================================================================
+
+_clients: dict = {}
+_clients_lock = threading.Lock()
+
+
+def _client_kwargs() -> tuple[bool, dict]:
+    """(use_bedrock, constructor kwargs) for the configured provider."""
+    common = {"timeout": LLM_TIMEOUT_SECONDS, "max_retries": LLM_MAX_RETRIES}
+    provider = os.environ.get("LLM_PROVIDER", "bedrock").lower()
+    if provider == "bedrock":
+        kwargs = {"aws_region": os.environ.get("AWS_DEFAULT_REGION", "us-east-1"), **common}
+        access_key = os.environ.get("AWS_ACCESS_KEY_ID", "")
+        secret_key = os.environ.get("AWS_SECRET_ACCESS_KEY", "")
+        if access_key and secret_key:
+            kwargs["aws_access_key"] = access_key
+            kwargs["aws_secret_key"] = secret_key
+        return True, kwargs
+    api_key = os.environ.get("ANTHROPIC_API_KEY")
+    if not api_key:
+        raise RuntimeError(
+            "LLM_PROVIDER=claude but ANTHROPIC_API_KEY is not set. "
+            "Either set the API key or unset LLM_PROVIDER to use Bedrock."
+        )
+    return False, {"api_key": api_key, **common}
+
+
+# Highest SDK retry number seen for the call running in this context; the
+# SDK sends it on every attempt as x-stainless-retry-count
+_attempts: ContextVar[Optional[list]] = ContextVar("llm_attempts", default=None)
+
+
+def _note_attempt(request):
+    box = _attempts.get()
+    if box is not None:
+        try:
+            box[0] = max(box[0], int(request.headers.get("x-stainless-retry-count", "0")))
+        except ValueError:
+            pass
+
+
+async def _anote_attempt(request):
+    _note_attempt(request)
+
+
+def get_shared_claude_client():
+    """Process-wide sync client (AnthropicBedrock or Anthropic), created once."""
+    with _clients_lock:
+        if "sync" not in _clients:
+            bedrock, kwargs = _client_kwargs()
+            cls = anthropic.AnthropicBedrock if bedrock else anthropic.Anthropic
+            kwargs["http_client"] = anthropic.DefaultHttpxClient(event_hooks={"request": [_note_attempt]})
+            _clients["sync"] = cls(**kwargs)
+            logger.info("Initialized shared %s client", cls.__name__)
+        return _clients["sync"]
+
+
+def get_async_claude_client():
+    """Process-wide async client (AsyncAnthropicBedrock or AsyncAnthropic), created once."""
+    with _clients_lock:
+        if "async" not in _clients:
+            bedrock, kwargs = _client_kwargs()
+            cls = anthropic.AsyncAnthropicBedrock if bedrock else anthropic.AsyncAnthropic
+            kwargs["http_client"] = anthropic.DefaultAsyncHttpxClient(
+                event_hooks={"request": [_anote_attempt]})
+            _clients["async"] = cls(**kwargs)
+            logger.info("Initialized shared %s client", cls.__name__)
+        return _clients["async"]
+
+
+def model_id_for(client, model: str = DEFAULT_MODEL) -> str:
+    """Resolve ``model`` to a Bedrock inference profile ID when ``client`` is Bedrock."""
+    if isinstance(client, (anthropic.AnthropicBedrock, anthropic.AsyncAnthropicBedrock)):
+        return resolve_bedrock_model(model)
+    return model
+
+
+async def close_async_client():
+    """Close the shared async client's connection pool (app shutdown)."""
+    with _clients_lock:
+        client = _clients.pop("async", None)
+    if client is not None:
+        await client.close()
+
+
+# ============================================================================
+# Per-firm concurrency
+# ============================================================================
+
+_thread_slots: dict[str, threading.BoundedSemaphore] = {}
+_async_slots: dict[str, tuple] = {}   # firm -> (loop, asyncio.Semaphore)
+_slots_lock = threading.Lock()
+
+
+def _busy(firm_id: str) -> LLMBusy:
+    logger.warning("LLM concurrency limit reached for firm %s", firm_id)
+    return LLMBusy("The AI assistant is busy with other requests from your firm. "
+                   "Please try again in a moment.")
+
+
+@contextmanager
+def firm_slot(firm_id: Optional[str], timeout: float = None):
+    """Hold one of the firm's LLM slots (thread callers). Raises LLMBusy on timeout."""
+    key = firm_id or "_default"
+    with _slots_lock:
+        sem = _thread_slots.setdefault(key, threading.BoundedSemaphore(LLM_FIRM_CONCURRENCY))
+    if not sem.acquire(timeout=LLM_QUEUE_TIMEOUT_SECONDS if timeout is None else timeout):
+        raise _busy(key)
+    try:
+        yield
+    finally:
+        sem.release()
+
+
+@asynccontextmanager
+async def afirm_slot(firm_id: Optional[str], timeout: float = None):
+    """Hold one of the firm's LLM slots (event-loop callers). Raises LLMBusy on timeout."""
+    key = firm_id or "_default"
+    loop = asyncio.get_running_loop()
+    with _slots_lock:
+        entry = _async_slots.get(key)
+        if entry is None or entry[0] is not loop:
+            entry = (loop, asyncio.Semaphore(LLM_FIRM_CONCURRENCY))
+            _async_slots[key] = entry
+    sem = entry[1]
+    try:
+        await asyncio.wait_for(sem.acquire(),
+                               LLM_QUEUE_TIMEOUT_SECONDS if timeout is None else timeout)
+    except asyncio.TimeoutError:
+        raise _busy(key)
+    try:
+        yield
+    finally:
+        sem.release()
+
+
+# ============================================================================
+# Provider rate budget
+# ============================================================================
+
+class RateBudget:
+    """Spaces request starts to ``per_minute`` with bursts of up to ``burst``.
+
+    reserve() books the next start slot and returns how long the caller
+    must wait before using it, so sync and async callers share one budget.
+    """
+
+    def __init__(self, per_minute: int, burst: int = 1):
+        self.interval = 60.0 / per_minute
+        self.burst = max(1, burst)
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        with self._lock:
+            now = time.monotonic()
+            theoretical = max(self._next, now)
+            start = max(now, theoretical - (self.burst - 1) * self.interval)
+            self._next = theoretical + self.interval
+            return start - now
+
+
+_budgets: dict[str, RateBudget] = {}
+
+
+def _rate_delay() -> float:
+    """Seconds to wait before the next request to the configured provider."""
+    if LLM_REQUESTS_PER_MINUTE <= 0:
+        return 0.0
+    provider = os.environ.get("LLM_PROVIDER", "bedrock").lower()
+    with _slots_lock:
+        budget = _budgets.get(provider)
+        if budget is None:
+            budget = _budgets[provider] = RateBudget(LLM_REQUESTS_PER_MINUTE, LLM_RATE_BURST)
+    return budget.reserve()
+
+
+# ============================================================================
+# Prompt structure
+# ============================================================================
+
+def prompt_blocks(static: str, dynamic: Optional[str] = None) -> list:
+    """Content blocks for a prompt: a cacheable static prefix, then the per-call part.
+
+    Usable as ``system`` or as a message's ``content``. Prefixes shorter than
+    the provider's minimum (about 1024 tokens) are simply not cached.
+    """
+    first = {"type": "text", "text": static}
+    if LLM_PROMPT_CACHE:
+        first["cache_control"] = {"type": "ephemeral"}
+    blocks = [first]
+    if dynamic:
+        blocks.append({"type": "text", "text": dynamic})
+    return blocks
+
+
+# ============================================================================
+# Metrics
+# ============================================================================
+
+_USAGE_FIELDS = ("input_tokens", "output_tokens",
+                 "cache_creation_input_tokens", "cache_read_input_tokens")
+# (firm_id, feature) -> running totals; tallied per firm so a firm only sees its own
+_stats: dict[tuple, dict] = {}
+_stats_lock = threading.Lock()
+
+
+def _usage_value(usage, name: str) -> int:
+    value = getattr(usage, name, None)
+    return value if isinstance(value, int) else 0
+
+
+class _TelemetryWriter:
+    """Buffers per-call rows and writes them to llm_calls from a daemon
+    thread, so telemetry never adds a database round-trip to a model call."""
+
+    MAX_BUFFER = 5000
+    BATCH = 200
+
+    def __init__(self):
+        self._rows: list = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def add(self, row: dict):
+        with self._lock:
+            if len(self._rows) >= self.MAX_BUFFER:
+                del self._rows[0]   # database unreachable for a while; keep the newest
+            self._rows.append(row)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="llm-telemetry", daemon=True)
+                self._thread.start()
+            if len(self._rows) >= self.BATCH:
+                self._wake.set()
+
+    def flush(self) -> int:
+        with self._lock:
+            rows, self._rows = self._rows, []
+        if not rows:
+            return 0
+        try:
+            from db.llm_telemetry import record_llm_calls
+            return record_llm_calls(rows)
+        except Exception as e:
+            logger.warning("Could not write %d LLM telemetry rows: %s", len(rows), e)
+            return 0
+
+    def _run(self):
+        while True:
+            self._wake.wait(LLM_TELEMETRY_FLUSH_SECONDS)
+            self._wake.clear()
+            self.flush()
+
+
+_telemetry = _TelemetryWriter()
+
+
+def flush_llm_telemetry() -> int:
+    """Write buffered call records now (shutdown, tests). Returns rows written."""
+    return _telemetry.flush()
+
+
+atexit.register(flush_llm_telemetry)
+
+
+def _empty_stats() -> dict:
+    return {
+        "calls": 0, "errors": 0, "retries": 0, "latency_seconds": 0.0,
+        "streamed_calls": 0, "first_token_seconds": 0.0,
+        **{f: 0 for f in _USAGE_FIELDS},
+    }
+
+
+def _record(feature: Optional[str], usage, latency: float, first_token: Optional[float] = None,
+            firm_id: Optional[str] = None, model: Optional[str] = None, retries: int = 0,
+            error: Optional[str] = None):
+    key = feature or "other"
+    with _stats_lock:
+        entry = _stats.setdefault((firm_id, key), _empty_stats())
+        entry["calls"] += 1
+        entry["latency_seconds"] += latency
+        entry["retries"] += retries
+        if error:
+            entry["errors"] += 1
+        if first_token is not None:
+            entry["streamed_calls"] += 1
+            entry["first_token_seconds"] += first_token
+        for f in _USAGE_FIELDS:
+            entry[f] += _usage_value(usage, f)
+    logger.debug(
+        "LLM %s: %d in (%d cached, %d written), %d out, %.2fs, %d retries%s",
+        key, _usage_value(usage, "input_tokens"), _usage_value(usage, "cache_read_input_tokens"),
+        _usage_value(usage, "cache_creation_input_tokens"), _usage_value(usage, "output_tokens"),
+        latency, retries, f", {error}" if error else "",
+    )
+    if LLM_TELEMETRY:
+        _telemetry.add({
+            "created_at": datetime.now(),
+            "firm_id": firm_id,
+            "feature": key,
+            "model": model,
+            "input_tokens": _usage_value(usage, "input_tokens"),
+            "output_tokens": _usage_value(usage, "output_tokens"),
+            "cache_read_tokens": _usage_value(usage, "cache_read_input_tokens"),
+            "cache_write_tokens": _usage_value(usage, "cache_creation_input_tokens"),
+            "latency_ms": int(latency * 1000),
+            "first_token_ms": int(first_token * 1000) if first_token is not None else None,
+            "retries": retries,
+            "error": error,
+        })
+
+
+@contextmanager
+def _tracked(firm_id: Optional[str], feature: Optional[str], model: str):
+    """Time one model invocation and record it on exit, failed or not.
+
+    The body sets ``call["usage"]`` and, when streaming, calls
+    ``call["mark_first_token"]()`` on the first chunk.
+    """
+    box = [0]
+    _attempts.set(box)
+    start = time.monotonic()
+    call = {"usage": None, "first_token": None}
+
+    def mark_first_token():
+        if call["first_token"] is None:
+            call["first_token"] = time.monotonic() - start
+
+    call["mark_first_token"] = mark_first_token
+    error = None
+    try:
+        yield call
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        _record(feature, call["usage"], time.monotonic() - start, call["first_token"],
+                firm_id=firm_id, model=model, retries=box[0], error=error)
+
+
+def get_llm_stats(firm_id: Optional[str] = None) -> dict:
+    """Per-feature LLM usage for this process, with prompt cache hit rates.
+
+    With ``firm_id``, only that firm's calls; otherwise all firms combined.
+    """
+    snapshot: dict[str, dict] = {}
+    with _stats_lock:
+        for (firm, feature), totals in _stats.items():
+            if firm_id is not None and firm != firm_id:
+                continue
+            entry = snapshot.setdefault(feature, _empty_stats())
+            for field, value in totals.items():
+                entry[field] += value
+    for entry in snapshot.values():
+        prompt_tokens = (entry["input_tokens"] + entry["cache_read_input_tokens"]
+                         + entry["cache_creation_input_tokens"])
+        # Share of prompt tokens served from the provider's cache
+        entry["cache_hit_rate"] = round(entry["cache_read_input_tokens"] / prompt_tokens, 3) if prompt_tokens else 0.0
+        entry["avg_latency_seconds"] = round(entry["latency_seconds"] / entry["calls"], 3)
+        entry["avg_first_token_seconds"] = (
+            round(entry["first_token_seconds"] / entry["streamed_calls"], 3)
+            if entry["streamed_calls"] else None
+        )
+    return snapshot
+
+
+def reset_llm_stats():
+    with _stats_lock:
+        _stats.clear()
+
+
+# ============================================================================
+# Calls
+# ============================================================================
+
+def _request(client, messages: list, system, model: str, max_tokens: int) -> dict:
+    params = {"model": model_id_for(client, model), "max_tokens": max_tokens, "messages": messages}
+    if isinstance(system, str):
+        system = prompt_blocks(system) if LLM_PROMPT_CACHE else system
+    if system:
+        params["system"] = system
+    return params
+
+
+def _text(message) -> str:
+    return "".join(getattr(block, "text", "") for block in message.content)
+
+
+async def acomplete(
+    firm_id: Optional[str],
+    messages: list,
+    system=None,
+    model: str = DEFAULT_MODEL,
+    max_tokens: int = 1024,
+    feature: Optional[str] = None,
+) -> str:
+    """Run one completion on the shared async client and return its text.
+
+    ``system`` is a string or prompt_blocks(); ``feature`` labels metrics.
+    """
+    client = get_async_claude_client()
+    async with afirm_slot(firm_id):
+        await asyncio.sleep(_rate_delay())
+        with _tracked(firm_id, feature, model) as call:
+            message = await client.messages.create(**_request(client, messages, system, model, max_tokens))
+            call["usage"] = getattr(message, "usage", None)
+    return _text(message)
+
+
+async def astream(
+    firm_id: Optional[str],
+    messages: list,
+    system=None,
+    model: str = DEFAULT_MODEL,
+    max_tokens: int = 1024,
+    feature: Optional[str] = None,
+) -> AsyncIterator[str]:
+    """Yield text chunks of one completion as the model produces them."""
+    client = get_async_claude_client()
+    async with afirm_slot(firm_id):
+        await asyncio.sleep(_rate_delay())
+        with _tracked(firm_id, feature, model) as call:
+            async with client.messages.stream(**_request(client, messages, system, model, max_tokens)) as stream:
+                async for chunk in stream.text_stream:
+                    call["mark_first_token"]()
+                    yield chunk
+                final = await stream.get_final_message()
+            call["usage"] = getattr(final, "usage", None)
+
+
+def complete(
+    firm_id: Optional[str],
+    messages: list,
+    system=None,
+    model: str = DEFAULT_MODEL,
+    max_tokens: int = 1024,
+    on_text: Optional[Callable[[str], None]] = None,
+    client=None,
+    feature: Optional[str] = None,
+) -> str:
+    """Run one completion from a worker thread and return its text.
+
+    With ``on_text`` the response is streamed and each chunk is passed to
+    the callback as it arrives. ``client`` overrides the shared client.
+    """
+    client = client or get_shared_claude_client()
+    params = _request(client, messages, system, model, max_tokens)
+    with firm_slot(firm_id):
+        delay = _rate_delay()
+        if delay:
+            time.sleep(delay)
+        with _tracked(firm_id, feature, model) as call:
+            if on_text is None:
+                message = client.messages.create(**params)
+                call["usage"] = getattr(message, "usage", None)
+                return _text(message)
+            chunks = []
+            with client.messages.stream(**params) as stream:
+                for chunk in stream.text_stream:
+                    call["mark_first_token"]()
+                    chunks.append(chunk)
+                    on_text(chunk)
+                final = stream.get_final_message()
+            call["usage"] = getattr(final, "usage", None)
+            return "".join(chunks)
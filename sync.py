@@ -28,6 +28,7 @@ from db.cache import (
     update_sync_status,
 )
 from db.connection import get_connection
+from db.sync_events import publish_sync_event, publish_sync_results
 
 
 @dataclass
@@ -130,7 +131,9 @@ class SyncManager:
         to_sync = entities or all_entities
 
         results = {}
-        for entity_type in to_sync:
+        publish_sync_event(self.firm_id, 'started', entities=list(to_sync))
+
+        for index, entity_type in enumerate(to_sync, start=1):
             print(f"\n{'='*50}")
             print(f"Syncing {entity_type}...")
             print('='*50)
@@ -159,6 +162,13 @@ class SyncManager:
                     error=str(e)
                 )
 
+            result = results[entity_type]
+            publish_sync_event(
+                self.firm_id, 'entity', entity=entity_type, index=index, total=len(to_sync),
+                inserted=result.inserted, updated=result.updated, error=result.error,
+            )
+
+        publish_sync_results(self.firm_id, results)
         return results
 
     def sync_entity(
@@ -20,6 +20,7 @@ from api_client_mt import get_client_for_firm, MyCaseClient
 from cache_mt import get_cache, MyCaseCache, initialize_firm_cache
 from platform_db import get_platform_db
 from tenant import TenantContextManager
+from db.sync_events import publish_sync_event, publish_sync_results
 
 
 @dataclass
@@ -102,7 +103,9 @@ class SyncManager:
         if update_platform_status:
             db.update_sync_status(self.firm_id, 'running')
 
-        for entity_type in to_sync:
+        publish_sync_event(self.firm_id, 'started', entities=list(to_sync))
+
+        for index, entity_type in enumerate(to_sync, start=1):
             print(f"\n{'='*50}")
             print(f"[{self.firm_id}] Syncing {entity_type}...")
             print('='*50)
@@ -132,6 +135,12 @@ class SyncManager:
                     error=str(e)
                 )
 
+            result = results[entity_type]
+            publish_sync_event(
+                self.firm_id, 'entity', entity=entity_type, index=index, total=len(to_sync),
+                inserted=result.inserted, updated=result.updated, error=result.error,
+            )
+
         # Update platform DB with completion status (skip if Celery manages this)
         if update_platform_status:
             errors = [r.error for r in results.values() if r.error]
@@ -147,6 +156,7 @@ class SyncManager:
                     records_synced=total_records
                 )
 
+        publish_sync_results(self.firm_id, results)
         return results
 
     def sync_entity(
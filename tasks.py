@@ -6,6 +6,7 @@ Task categories:
 2. Token management    - refresh_firm_tokens, refresh_expiring_tokens
 3. Report generation   - dispatch_daily_reports, generate_firm_reports
 4. Maintenance         - detect_stale_syncs, cleanup_sync_history
+5. Manual / API        - manual_sync, generate_document_batch
 """
 import logging
 from datetime import datetime, timedelta
@@ -91,6 +92,7 @@ def sync_firm_task(self, firm_id: str, triggered_by: str = "scheduler",
     """
     from platform_db import get_platform_db
     from tenant import TenantContextManager
+    from db.sync_events import publish_sync_event
 
     db = get_platform_db()
     started_at = datetime.utcnow()
@@ -177,6 +179,7 @@ def sync_firm_task(self, firm_id: str, triggered_by: str = "scheduler",
         logger.error(f"Sync timed out for firm {firm_id}")
         db.update_sync_status(firm_id, "failed", error_message="Sync timed out (30 min limit)")
         db.record_sync_failure(firm_id, error="Sync timed out")
+        publish_sync_event(firm_id, "failed", error="Sync timed out")
         db.schedule_next_sync(firm_id, delay_minutes=30)
         return {"status": "timeout", "firm_id": firm_id}
 
@@ -184,6 +187,7 @@ def sync_firm_task(self, firm_id: str, triggered_by: str = "scheduler",
         logger.error(f"Sync failed for firm {firm_id}: {e}", exc_info=True)
         db.update_sync_status(firm_id, "failed", error_message=str(e)[:500])
         db.record_sync_failure(firm_id, error=str(e)[:500])
+        publish_sync_event(firm_id, "failed", error=str(e))
 
         retry_delay = 300 * (2 ** self.request.retries)
         db.schedule_next_sync(firm_id, delay_minutes=retry_delay // 60)
@@ -495,6 +499,62 @@ def cleanup_sync_history():
         raise
 
 
+@shared_task(name="tasks.purge_skill_memos")
+def purge_skill_memos():
+    """Remove expired memoized skill results and renders."""
+    from db.skill_memo import purge_expired_memos
+
+    try:
+        deleted = purge_expired_memos()
+        logger.info(f"Purged {deleted} expired skill memo entries")
+        return {"deleted": deleted}
+    except Exception as e:
+        logger.error(f"purge_skill_memos failed: {e}", exc_info=True)
+        raise
+
+
+@shared_task(name="tasks.purge_doc_sessions")
+def purge_doc_sessions():
+    """Remove expired document chat sessions and unreferenced draft blobs."""
+    from db.doc_sessions import purge_expired_doc_sessions
+
+    try:
+        result = purge_expired_doc_sessions()
+        logger.info(f"Purged {result['sessions']} document sessions, {result['blobs']} blobs")
+        return result
+    except Exception as e:
+        logger.error(f"purge_doc_sessions failed: {e}", exc_info=True)
+        raise
+
+
+@shared_task(name="tasks.purge_llm_telemetry")
+def purge_llm_telemetry():
+    """Remove LLM call records older than LLM_TELEMETRY_RETENTION_DAYS."""
+    from db.llm_telemetry import purge_llm_calls
+
+    try:
+        deleted = purge_llm_calls()
+        logger.info(f"Purged {deleted} LLM call records")
+        return {"deleted": deleted}
+    except Exception as e:
+        logger.error(f"purge_llm_telemetry failed: {e}", exc_info=True)
+        raise
+
+
+@shared_task(name="tasks.purge_document_batches")
+def purge_document_batches():
+    """Remove batch document archives older than DOC_BATCH_RETENTION_HOURS."""
+    from document_batch import purge_batches
+
+    try:
+        deleted = purge_batches()
+        logger.info(f"Purged {deleted} batch document archives")
+        return {"deleted": deleted}
+    except Exception as e:
+        logger.error(f"purge_document_batches failed: {e}", exc_info=True)
+        raise
+
+
 # =============================================================================
 # 5. MANUAL / API-TRIGGERED TASKS
 # =============================================================================
@@ -513,3 +573,30 @@ def manual_sync(firm_id: str, user_id: str = None, entities: List[str] = None):
         args=[firm_id],
         kwargs={"triggered_by": "manual", "entities": entities},
     )
+
+
+@shared_task(name="tasks.generate_document_batch", bind=True)
+def generate_document_batch(self, firm_id: str, template_id: int, case_ids: List[int],
+                            values: Dict[str, str] = None, attorney_id: int = None,
+                            attorney_name_override: str = None, username: str = None):
+    """Fill one template for many cases into a .zip archive.
+
+    Reports state PROGRESS with {"firm_id", "done", "total"} while running.
+    """
+    from document_batch import generate_batch
+
+    def progress(done: int, total: int):
+        self.update_state(state="PROGRESS", meta={"firm_id": firm_id, "done": done, "total": total})
+
+    try:
+        result = generate_batch(
+            firm_id, template_id, case_ids, values=values, attorney_id=attorney_id,
+            attorney_name_override=attorney_name_override, generated_by=username,
+            progress=progress,
+        )
+        logger.info(f"Batch {result['batch_id']} for {firm_id}: {result['documents']} documents, "
+                    f"{len(result['failed'])} failed in {result['seconds']}s")
+        return result
+    except Exception as e:
+        logger.error(f"generate_document_batch failed for {firm_id}: {e}", exc_info=True)
+        raise
@@ -0,0 +1,274 @@
+"""
+Parsed Template Cache
+
+Process-level LRU of .docx templates for document filling, keyed by
+(template_id, file_hash). A hit skips the BYTEA fetch (only file_hash is
+read to validate the entry) and any re-parse. An entry holds, as used:
+
+- the compiled form (template_compiler) that fills by string concatenation
+- a parsed python-docx Document for the fallback fill; each fill works on a
+  deep copy of the cached, never-modified Document
+
+The parsed form also records where the fill has work to do, so it visits those
+paragraphs instead of walking the whole document:
+
+- placeholders: paragraphs whose run text contains "{{"
+- fixups: paragraphs with "/s/" signature lines or a bare "Label:" (the
+  post-fill cleanup candidates)
+- needs_xml_pass: "{{" text python-docx runs can't reach (hyperlinks, text
+  boxes, nested tables); only then is the XML-level pass over
+  word/document.xml required
+
+Memory is bounded by TEMPLATE_CACHE_MAX_BYTES, estimated from the package
+size plus its uncompressed XML (held as parsed trees) and compiled segments.
+
+Usage:
+    from template_cache import get_template_cache
+
+    cache = get_template_cache()
+    content = cache.load(template_id)              # fetched from Postgres only on a miss
+    filled = cache.compiled(template_id, content).render(replacements)
+    parsed = cache.parsed(template_id, content)    # ParsedTemplate
+    doc = parsed.new_document()
+    for paragraph in parsed.placeholder_paragraphs(doc):
+        ...
+"""
+import copy
+import hashlib
+import io
+import logging
+import os
+import re
+import threading
+import zipfile
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+TEMPLATE_CACHE_MAX_BYTES = int(os.environ.get("TEMPLATE_CACHE_MAX_BYTES", str(128 * 1024 * 1024)))
+
+# Parsed lxml trees take several times their serialized size
+_XML_OVERHEAD = 4
+
+_LABEL_RE = re.compile(r"^\s*[A-Za-z ]+:\s*$")
+
+
+@dataclass
+class ParsedTemplate:
+    template_id: Optional[int]
+    file_hash: str
+    content: bytes
+    document: object                      # pristine python-docx Document; never filled
+    placeholders: Tuple[int, ...]         # indexes into the body's w:p elements, fill order
+    fixups: Tuple[int, ...]
+    needs_xml_pass: bool
+    size: int                             # estimated memory of the parsed trees
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def new_document(self):
+        """A fresh, fillable copy of the template."""
+        with self._lock:
+            return copy.deepcopy(self.document)
+
+    def placeholder_paragraphs(self, doc) -> list:
+        """Paragraphs of ``doc`` (a new_document() copy) that contain placeholders."""
+        return self._paragraphs(doc, self.placeholders)
+
+    def fixup_paragraphs(self, doc) -> list:
+        """Paragraphs of ``doc`` that post-fill cleanup may touch."""
+        return self._paragraphs(doc, tuple(dict.fromkeys(self.placeholders + self.fixups)))
+
+    @staticmethod
+    def _paragraphs(doc, indexes) -> list:
+        from docx.oxml.ns import qn
+        from docx.text.paragraph import Paragraph
+
+        if not indexes:
+            return []
+        elements = list(doc.element.body.iter(qn("w:p")))
+        return [Paragraph(elements[i], doc) for i in indexes]
+
+
+def _fill_order_paragraphs(doc) -> list:
+    """Paragraphs in the order _fill_docx_template visits them: body, then table cells."""
+    paragraphs = list(doc.paragraphs)
+    for table in doc.tables:
+        for row in table.rows:
+            for cell in row.cells:
+                paragraphs.extend(cell.paragraphs)
+    return paragraphs
+
+
+def parse_template(template_id: Optional[int], content: bytes,
+                   file_hash: Optional[str] = None) -> ParsedTemplate:
+    """Parse a .docx and precompute its placeholder map. Raises on invalid content."""
+    from docx import Document
+    from docx.oxml.ns import qn
+
+    doc = Document(io.BytesIO(content))
+    elements = list(doc.element.body.iter(qn("w:p")))
+    position = {id(p): i for i, p in enumerate(elements)}
+
+    placeholders, fixups, reached = [], [], {}
+    for paragraph in _fill_order_paragraphs(doc):
+        index = position[id(paragraph._p)]
+        if index in reached:
+            continue
+        runs_text = "".join(r.text for r in paragraph.runs)
+        reached[index] = runs_text.count("{{")
+        if reached[index]:
+            placeholders.append(index)
+        elif "/s/" in runs_text or _LABEL_RE.match(runs_text or paragraph.text):
+            fixups.append(index)
+
+    needs_xml_pass = False
+    for index, p in enumerate(elements):
+        xml_text = "".join(t.text or "" for t in p.iter(qn("w:t")))
+        if xml_text.count("{{") > reached.get(index, 0):
+            needs_xml_pass = True
+            break
+
+    with zipfile.ZipFile(io.BytesIO(content)) as z:
+        xml_bytes = sum(i.file_size for i in z.infolist() if i.filename.endswith((".xml", ".rels")))
+
+    return ParsedTemplate(
+        template_id=template_id,
+        file_hash=file_hash or hashlib.sha256(content).hexdigest(),
+        content=content,
+        document=doc,
+        placeholders=tuple(placeholders),
+        fixups=tuple(fixups),
+        needs_xml_pass=needs_xml_pass,
+        size=_XML_OVERHEAD * xml_bytes,
+    )
+
+
+@dataclass
+class _Entry:
+    content: bytes
+    parsed: Optional[ParsedTemplate] = None
+    compiled: Optional[object] = None        # template_compiler.CompiledTemplate
+    charged: int = 0                         # bytes counted against the cache bound
+
+    @property
+    def size(self) -> int:
+        return (len(self.content) + (self.parsed.size if self.parsed else 0)
+                + (self.compiled.size if self.compiled else 0))
+
+
+class TemplateCache:
+    """Byte-bounded LRU of templates keyed by (template_id, file_hash).
+
+    Each entry holds the template bytes and, once used, its ParsedTemplate
+    (python-docx fill) and CompiledTemplate (template_compiler fill).
+    """
+
+    def __init__(self, max_bytes: int = None):
+        self.max_bytes = TEMPLATE_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        self._entries: "OrderedDict[Tuple[Optional[int], str], _Entry]" = OrderedDict()
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._lock = threading.Lock()
+
+    def load(self, template_id: int) -> Optional[bytes]:
+        """Template bytes, fetching the BYTEA only when no current entry exists."""
+        try:
+            from db.documents import get_template_file_hash
+            file_hash = get_template_file_hash(template_id)
+        except Exception as e:
+            logger.warning("Template hash lookup failed for %s: %s", template_id, e)
+            file_hash = None
+
+        if file_hash:
+            entry = self._get((template_id, file_hash))
+            if entry is not None:
+                return entry.content
+
+        from document_engine import get_engine
+        content = get_engine().get_template_content(template_id)
+        if content is None:
+            return None
+        self._entry(template_id, content)
+        return content
+
+    def parsed(self, template_id: Optional[int], content: bytes) -> ParsedTemplate:
+        """Cached ParsedTemplate for ``content``, parsing it on a miss."""
+        key, entry = self._entry(template_id, content)
+        if entry.parsed is None:
+            entry.parsed = parse_template(template_id, content, key[1])
+            self._charge(key, entry)
+        return entry.parsed
+
+    def compiled(self, template_id: Optional[int], content: bytes):
+        """Cached CompiledTemplate for ``content``: stored form if current, else compiled now."""
+        from template_compiler import compile_template, load_compiled
+
+        key, entry = self._entry(template_id, content)
+        if entry.compiled is None:
+            if template_id is not None:
+                entry.compiled = load_compiled(template_id, content, key[1])
+            else:
+                entry.compiled = compile_template(content, key[1])
+            self._charge(key, entry)
+        return entry.compiled
+
+    def invalidate(self, template_id: Optional[int] = None):
+        """Drop entries for one template, or everything."""
+        with self._lock:
+            for key in [k for k in self._entries if template_id is None or k[0] == template_id]:
+                self._bytes -= self._entries.pop(key).charged
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "templates": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+            }
+
+    def _get(self, key) -> Optional[_Entry]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._hits += 1
+            return entry
+
+    def _entry(self, template_id: Optional[int], content: bytes) -> Tuple[tuple, _Entry]:
+        key = (template_id, hashlib.sha256(content).hexdigest())
+        entry = self._get(key)
+        if entry is not None:
+            return key, entry
+        with self._lock:
+            self._misses += 1
+            entry = self._entries.setdefault(key, _Entry(content))
+            self._charge_locked(key, entry)
+        return key, entry
+
+    def _charge(self, key, entry: _Entry):
+        with self._lock:
+            self._charge_locked(key, entry)
+
+    def _charge_locked(self, key, entry: _Entry):
+        if self._entries.get(key) is entry:
+            size = entry.size
+            self._bytes += size - entry.charged
+            entry.charged = size
+        while self._entries and self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.charged
+
+
+_cache: Optional[TemplateCache] = None
+
+
+def get_template_cache() -> TemplateCache:
+    global _cache
+    if _cache is None:
+        _cache = TemplateCache()
+    return _cache
@@ -0,0 +1,440 @@
+"""
+Compiled Templates
+
+Offline compile step for .docx templates. word/document.xml is normalized
+once (runs that split a {{placeholder}} are merged into the first run) and
+serialized into static XML segments around "run slots": the runs whose text
+can change when the template is filled. Filling a compiled template is then
+string concatenation plus one zip write, with no python-docx object model
+and no per-paragraph regex walk:
+
+    segment[0] run[0] segment[1] run[1] ... segment[n]
+
+A run slot keeps its original XML (emitted verbatim if its text doesn't
+change), its opening tag with run properties, its text, and the paragraph it
+belongs to, so the paragraph-level cleanups (signature lines, empty labels)
+apply exactly as in the python-docx path.
+
+The compiled form is stored on the templates row, keyed by
+"<file_hash>:<COMPILER_VERSION>" like the variable analysis, and computed on
+import/preprocessing or on first use.
+
+Usage:
+    from template_compiler import compile_template
+
+    compiled = compile_template(docx_bytes)
+    filled_docx = compiled.render({"defendant_name": "John Doe"})
+"""
+import hashlib
+import io
+import logging
+import re
+import zipfile
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+from xml.sax.saxutils import escape
+
+logger = logging.getLogger(__name__)
+
+COMPILER_VERSION = "1"
+
+DOCUMENT_PART = "word/document.xml"
+
+PLACEHOLDER_RE = re.compile(r"\{\{([^}]+)\}\}")
+
+# [Bracket Placeholder] patterns from signature blocks, produced by
+# _get_signature_block_template() when the attorney profile wasn't loaded
+# at generation time, or by AI-generated documents
+BRACKET_REPLACEMENTS = {
+    '[Firm Name]': 'firm_name',
+    '[Attorney Name]': 'attorney_name',
+    '[Bar Number]': 'bar_number',
+    '[Firm Address]': 'firm_address',
+    '[City, State ZIP]': 'firm_city_state_zip',
+    '[Phone]': 'phone',
+    '[Email]': 'email',
+    '[Fax]': 'fax',
+}
+
+# Paragraphs that are just a label with an empty value (e.g. "Facsimile: "
+# when firm_fax is blank) are cleared after filling
+EMPTY_LABEL_PATTERNS = [
+    re.compile(r'^\s*Facsimile:\s*$'),
+    re.compile(r'^\s*Fax:\s*$'),
+    re.compile(r'^\s*Second Attorney:\s*$'),
+]
+
+# Any "Label:" paragraph; compiled as a slot so the cleanup above can apply
+_LABEL_CANDIDATE_RE = re.compile(r"^\s*[A-Za-z ]+:\s*$")
+
+_INVALID_XML_CHARS_RE = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+_SLOT_RE = re.compile(r"<\?slot (\d+)\?>")
+
+
+# ============================================================================
+# Text rules (shared with DocumentChatEngine._fill_docx_template)
+# ============================================================================
+
+def is_uppercase_context(placeholder_text: str, context: str) -> bool:
+    """Whether a placeholder sits in ALL CAPS text.
+
+    Checks the alpha characters in the ~40 chars before and after the
+    placeholder in the full paragraph text. If those are all uppercase (and
+    at least 4 chars), the value should be uppercased to match.
+
+    True:  "IN THE CIRCUIT COURT OF {{county}} COUNTY", "CITY OF {{city}},"
+    False: "I, {{defendant_name}}, Defendant, do hereby state"
+    """
+    pos = context.find(placeholder_text)
+    if pos == -1:
+        return False
+    before = context[max(0, pos - 40):pos]
+    after = context[pos + len(placeholder_text):pos + len(placeholder_text) + 40]
+    nearby_alpha = re.sub(r'[^A-Za-z]', '', before + after)
+    return len(nearby_alpha) >= 4 and nearby_alpha == nearby_alpha.upper()
+
+
+def fill_placeholders(text: str, replacements: Dict[str, str], context: str = None) -> str:
+    """Replace {{placeholder}} and [Bracket Placeholder] patterns in one run's text.
+
+    ``context`` is the full paragraph text, used for uppercase detection.
+    Unknown placeholders are left as-is for visibility.
+    """
+    if not text:
+        return text
+    context = context or text
+
+    def replacer(match):
+        placeholder = match.group(1).lower().strip()
+        if placeholder not in replacements:
+            return match.group(0)
+        value = replacements[placeholder]
+        # {{COUNTY}} or an ALL CAPS line both uppercase the value
+        if match.group(1).strip() == match.group(1).strip().upper():
+            return value.upper()
+        if is_uppercase_context(match.group(0), context):
+            return value.upper()
+        return value
+
+    text = PLACEHOLDER_RE.sub(replacer, text)
+
+    # Remove an orphaned "#" when a bar number was blanked
+    # e.g., "#{{second_attorney_bar}}" -> "#" -> ""
+    text = re.sub(r'\s*#\s*$', '', text)
+    text = re.sub(r'^\s*#\s*$', '', text)
+
+    for bracket, key in BRACKET_REPLACEMENTS.items():
+        if bracket in text and key in replacements:
+            text = text.replace(bracket, replacements[key])
+    return text
+
+
+def normalize_signature_text(text: str) -> str:
+    """Trim a run in a /s/ signature paragraph: the /s/ IS the signature, so
+    underscore lines go and runs of spaces collapse (leading tabs are kept)."""
+    text = re.sub(r'_{4,}', '', text)
+    text = re.sub(r'  +$', '', text)
+    return re.sub(r'  +(?=[^ ])', ' ', text)
+
+
+def is_empty_label(text: str) -> bool:
+    return any(pat.match(text) for pat in EMPTY_LABEL_PATTERNS)
+
+
+# ============================================================================
+# Compiled form
+# ============================================================================
+
+@dataclass
+class CompiledTemplate:
+    file_hash: str
+    segments: List[str]               # len(runs) + 1 static XML strings
+    runs: List[Dict]                  # {"open", "text", "raw", "para", "direct"}
+    contexts: List[str]               # original text of each slotted paragraph
+    version: str = COMPILER_VERSION
+    package: Optional[bytes] = field(default=None, repr=False)   # every part but document.xml
+
+    def to_dict(self) -> Dict:
+        return {
+            "version": self.version,
+            "file_hash": self.file_hash,
+            "segments": self.segments,
+            "runs": self.runs,
+            "contexts": self.contexts,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict, content: bytes = None) -> "CompiledTemplate":
+        return cls(
+            file_hash=data["file_hash"],
+            segments=data["segments"],
+            runs=data["runs"],
+            contexts=data["contexts"],
+            version=data.get("version", COMPILER_VERSION),
+            package=package_without_document(content) if content is not None else None,
+        )
+
+    @property
+    def placeholders(self) -> List[str]:
+        """Placeholder names used by the template (lower-cased, sorted)."""
+        names = {m.group(1).strip().lower() for run in self.runs
+                 for m in PLACEHOLDER_RE.finditer(run["text"])}
+        return sorted(names)
+
+    @property
+    def size(self) -> int:
+        return (sum(len(s) for s in self.segments)
+                + sum(len(r["raw"]) + len(r["open"]) + len(r["text"]) for r in self.runs)
+                + sum(len(c) for c in self.contexts) + len(self.package or b""))
+
+    def render_xml(self, replacements: Dict[str, str]) -> str:
+        """word/document.xml with ``replacements`` filled in."""
+        texts = [
+            fill_placeholders(run["text"], replacements, self.contexts[run["para"]])
+            if "{{" in run["text"] else run["text"]
+            for run in self.runs
+        ]
+
+        by_para: Dict[int, List[int]] = {}
+        for i, run in enumerate(self.runs):
+            by_para.setdefault(run["para"], []).append(i)
+        for indexes in by_para.values():
+            direct = [i for i in indexes if self.runs[i]["direct"]]
+            if "/s/" in "".join(texts[i] for i in indexes):
+                for i in direct:
+                    texts[i] = normalize_signature_text(texts[i])
+            full = "".join(texts[i] for i in direct) or "".join(texts[i] for i in indexes)
+            if is_empty_label(full):
+                for i in direct:
+                    texts[i] = ""
+
+        parts = [self.segments[0]]
+        for run, text, segment in zip(self.runs, texts, self.segments[1:]):
+            if text == run["text"]:
+                parts.append(run["raw"])
+            else:
+                parts.append(run["open"] + _text_xml(text) + "</w:r>")
+            parts.append(segment)
+        return "".join(parts)
+
+    def render(self, replacements: Dict[str, str]) -> bytes:
+        """The filled .docx."""
+        if self.package is None:
+            raise ValueError("Compiled template has no package; load it with its content")
+        out = io.BytesIO(self.package)
+        out.seek(0, io.SEEK_END)
+        with zipfile.ZipFile(out, "a", zipfile.ZIP_DEFLATED) as z:
+            z.writestr(DOCUMENT_PART, self.render_xml(replacements).encode("utf-8"))
+        return out.getvalue()
+
+
+def _text_xml(text: str) -> str:
+    """Run content for ``text``, as python-docx's Run.text setter writes it."""
+    out = []
+    for piece in re.split(r"([\t\r\n])", _INVALID_XML_CHARS_RE.sub("", text)):
+        if piece == "\t":
+            out.append("<w:tab/>")
+        elif piece in ("\r", "\n"):
+            out.append("<w:br/>")
+        elif piece:
+            out.append(f'<w:t xml:space="preserve">{escape(piece)}</w:t>')
+    return "".join(out)
+
+
+def package_without_document(content: bytes) -> bytes:
+    """Zip of every part of ``content`` except word/document.xml, in order."""
+    out = io.BytesIO()
+    with zipfile.ZipFile(io.BytesIO(content)) as zin, \
+            zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as zout:
+        for item in zin.infolist():
+            if item.filename != DOCUMENT_PART:
+                zout.writestr(item.filename, zin.read(item.filename))
+    return out.getvalue()
+
+
+# ============================================================================
+# Compilation
+# ============================================================================
+
+def _paragraph_runs(p) -> list:
+    """(run, is_direct_child) for a paragraph's runs and hyperlink runs, in order."""
+    from docx.oxml.ns import qn
+
+    runs = []
+    for child in p.iterchildren():
+        if child.tag == qn("w:r"):
+            runs.append((child, True))
+        elif child.tag == qn("w:hyperlink"):
+            runs.extend((r, False) for r in child.iterchildren(qn("w:r")))
+    return runs
+
+
+def merge_split_placeholders(body) -> int:
+    """Merge runs so that no {{placeholder}} spans runs; returns merges done.
+
+    The merged run keeps the first run's properties (what the python-docx
+    path's cross-run fallback does at fill time).
+    """
+    from docx.oxml.ns import qn
+
+    merges = 0
+    for container in body.iter(qn("w:p"), qn("w:hyperlink")):
+        while True:
+            runs = list(container.iterchildren(qn("w:r")))
+            texts = [r.text for r in runs]
+            starts, pos = [], 0
+            for text in texts:
+                starts.append(pos)
+                pos += len(text)
+            joined = "".join(texts)
+            span = None
+            for m in PLACEHOLDER_RE.finditer(joined):
+                first = max(i for i, s in enumerate(starts) if s <= m.start())
+                last = max(i for i, s in enumerate(starts) if s < m.end())
+                if last > first:
+                    span = (first, last)
+                    break
+            if span is None:
+                break
+            first, last = span
+            runs[first].text = "".join(texts[first:last + 1])
+            for r in runs[first + 1:last + 1]:
+                container.remove(r)
+            merges += 1
+    return merges
+
+
+def _strip_inherited_ns(xml: str, nsmap: Dict) -> str:
+    """Drop xmlns declarations on the element's start tag that the root already makes."""
+    end = xml.index(">")
+    tag = xml[:end]
+    for prefix, uri in nsmap.items():
+        attr = f' xmlns:{prefix}="{uri}"' if prefix else f' xmlns="{uri}"'
+        tag = tag.replace(attr, "")
+    return tag + xml[end:]
+
+
+def _run_open_tag(r, nsmap: Dict) -> str:
+    """<w:r ...><w:rPr>...</w:rPr> for a run, without its content."""
+    import copy
+    from docx.oxml.ns import qn
+    from lxml import etree
+
+    shell = copy.deepcopy(r)
+    for child in list(shell):
+        if child.tag != qn("w:rPr"):
+            shell.remove(child)
+    xml = _strip_inherited_ns(etree.tostring(shell, encoding="unicode"), nsmap)
+    if xml.endswith("/>") and xml.count("<") == 1:
+        return xml[:-2] + ">"
+    return xml[:-len("</w:r>")]
+
+
+def compile_template(content: bytes, file_hash: str = None) -> CompiledTemplate:
+    """Normalize and compile a .docx. Raises on content python-docx can't open."""
+    from docx import Document
+    from docx.oxml.ns import qn
+    from docx.text.paragraph import Paragraph
+    from lxml import etree
+
+    doc = Document(io.BytesIO(content))
+    root = doc.element
+    body = root.body
+    merge_split_placeholders(body)
+
+    runs_by_slot: List[Dict] = []
+    contexts: List[str] = []
+    marked = []
+    for p in list(body.iter(qn("w:p"))):
+        runs = [(r, direct) for r, direct in _paragraph_runs(p) if r.find(".//" + qn("w:p")) is None]
+        texts = [r.text for r, _ in runs]
+        runs_text = "".join(t for t, (_, direct) in zip(texts, runs) if direct)
+        if not ("{{" in "".join(texts) or "/s/" in "".join(texts)
+                or _LABEL_CANDIDATE_RE.match(runs_text or "".join(texts))):
+            continue
+        para = len(contexts)
+        contexts.append(Paragraph(p, None).text)
+        for (r, direct), text in zip(runs, texts):
+            runs_by_slot.append({
+                "open": _run_open_tag(r, root.nsmap),
+                "text": text,
+                "raw": _strip_inherited_ns(etree.tostring(r, encoding="unicode"), root.nsmap),
+                "para": para,
+                "direct": direct,
+            })
+            marked.append(r)
+
+    for slot, r in enumerate(marked):
+        r.getparent().replace(r, etree.ProcessingInstruction("slot", str(slot)))
+
+    xml = etree.tostring(root, encoding="UTF-8", xml_declaration=True, standalone=True).decode("utf-8")
+    pieces = _SLOT_RE.split(xml)
+    segments = pieces[0::2]
+    runs = [runs_by_slot[int(slot)] for slot in pieces[1::2]]
+
+    return CompiledTemplate(
+        file_hash=file_hash or hashlib.sha256(content).hexdigest(),
+        segments=segments,
+        runs=runs,
+        contexts=contexts,
+        package=package_without_document(content),
+    )
+
+
+# ============================================================================
+# Stored compiled forms
+# ============================================================================
+
+def load_compiled(template_id: int, content: bytes, file_hash: str = None) -> Optional[CompiledTemplate]:
+    """Stored compiled form of ``content``, compiling (and storing) it on a miss."""
+    file_hash = file_hash or hashlib.sha256(content).hexdigest()
+    try:
+        from db.documents import get_compiled_template
+        stored = get_compiled_template(template_id, COMPILER_VERSION)
+        if stored is not None and stored.get("file_hash") == file_hash:
+            return CompiledTemplate.from_dict(stored, content)
+    except Exception as e:
+        logger.warning("Compiled template lookup failed for %s: %s", template_id, e)
+
+    compiled = compile_template(content, file_hash)
+    try:
+        from db.documents import save_compiled_template
+        save_compiled_template(template_id, file_hash, COMPILER_VERSION, compiled.to_dict())
+    except Exception as e:
+        logger.warning("Could not store compiled template %s: %s", template_id, e)
+    return compiled
+
+
+def compile_templates(firm_id: str = None, template_ids: List[int] = None,
+                      limit: int = None) -> Dict[str, int]:
+    """Compile every active template whose stored compiled form is missing or stale."""
+    from db.documents import get_templates_needing_compile, save_compiled_template
+
+    counts = {"compiled": 0, "failed": 0}
+    for row in get_templates_needing_compile(COMPILER_VERSION, firm_id=firm_id,
+                                             template_ids=template_ids, limit=limit):
+        content = row["file_content"]
+        if hasattr(content, "tobytes"):
+            content = content.tobytes()
+        file_hash = row.get("file_hash") or hashlib.sha256(content).hexdigest()
+        try:
+            compiled = compile_template(content, file_hash)
+            if save_compiled_template(row["id"], file_hash, COMPILER_VERSION, compiled.to_dict()):
+                counts["compiled"] += 1
+        except Exception as e:
+            logger.warning("Could not compile template %s (%s): %s", row["id"], row.get("name"), e)
+            counts["failed"] += 1
+    return counts
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Compile stored .docx templates for fast filling")
+    parser.add_argument("--firm", help="Only this firm_id")
+    parser.add_argument("--limit", type=int, help="Compile at most this many templates")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    print(json.dumps(compile_templates(firm_id=args.firm, limit=args.limit)))
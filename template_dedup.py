@@ -0,0 +1,244 @@
+"""
+Near-Duplicate Template Detection
+
+Firms accumulate many variants of the same motion or letter that differ by a
+few words, which exact hashes can't group. Templates are compared by the
+Jaccard similarity of their word shingles, estimated with MinHash and
+clustered through locality-sensitive hashing in sub-quadratic time:
+
+- the document text is normalized and cut into SHINGLE_WORDS-word shingles
+- a NUM_PERM-value MinHash signature summarizes the shingle set; it's
+  computed at import (document_engine.import_template) and stored on the
+  templates row, keyed by "<file_hash>:<MINHASH_VERSION>"
+- LSH splits each signature into LSH_BANDS bands; templates that share a
+  band bucket are candidates, kept when their estimated similarity is at
+  least NEAR_DUPLICATE_THRESHOLD, and joined into clusters (union-find)
+
+Usage:
+    python template_dedup.py --firm jcs_law               # sign missing templates, list clusters
+    python template_dedup.py --firm jcs_law --deactivate  # keep the most used template per cluster
+
+    from template_dedup import find_duplicate_clusters
+    clusters = find_duplicate_clusters("jcs_law")
+"""
+import hashlib
+import io
+import logging
+import os
+import re
+import zipfile
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MINHASH_VERSION = "1"
+
+SHINGLE_WORDS = 4
+NUM_PERM = 128
+LSH_BANDS = 16
+LSH_ROWS = NUM_PERM // LSH_BANDS
+# 16 bands of 8 rows make pairs above ~0.7 similarity likely candidates
+NEAR_DUPLICATE_THRESHOLD = float(os.environ.get("NEAR_DUPLICATE_THRESHOLD", "0.8"))
+
+DOCUMENT_PART = "word/document.xml"
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+_WORD_RE = re.compile(r"\{\{[^}]+\}\}|[a-z0-9]+(?:['.][a-z0-9]+)*")
+
+# Universal hashing ((a * x + b) mod p) over a Mersenne prime; fixed seed so
+# stored signatures stay comparable
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+_rng = np.random.RandomState(1)
+_PERM_A = _rng.randint(1, _MERSENNE_PRIME, size=NUM_PERM, dtype=np.uint64)
+_PERM_B = _rng.randint(0, _MERSENNE_PRIME, size=NUM_PERM, dtype=np.uint64)
+del _rng
+
+
+def extract_text(content: bytes) -> str:
+    """Paragraph text of a .docx body (tables included), one line per paragraph."""
+    from lxml import etree
+
+    with zipfile.ZipFile(io.BytesIO(content)) as z:
+        root = etree.fromstring(z.read(DOCUMENT_PART))
+    lines = []
+    for p in root.iter(f"{_W}p"):
+        text = "".join(t.text or "" for t in p.iter(f"{_W}t")).strip()
+        if text:
+            lines.append(text)
+    return "\n".join(lines)
+
+
+def shingles(text: str, size: int = SHINGLE_WORDS) -> set:
+    """Word ``size``-grams of the lowercased text; a short text is one shingle."""
+    words = _WORD_RE.findall(text.lower())
+    if len(words) <= size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def minhash(shingle_set: Iterable[str]) -> Optional[List[int]]:
+    """NUM_PERM-value MinHash signature of a shingle set (None if it's empty)."""
+    hashes = np.fromiter(
+        (int.from_bytes(hashlib.blake2b(s.encode(), digest_size=4).digest(), "little")
+         for s in shingle_set),
+        dtype=np.uint64,
+    )
+    if not hashes.size:
+        return None
+    permuted = ((np.outer(hashes, _PERM_A) + _PERM_B) % _MERSENNE_PRIME) & _MAX_HASH
+    return permuted.min(axis=0).tolist()
+
+
+def text_signature(text: str) -> Optional[List[int]]:
+    return minhash(shingles(text))
+
+
+def docx_signature(content: bytes) -> Optional[List[int]]:
+    return text_signature(extract_text(content))
+
+
+def similarity(a: Sequence[int], b: Sequence[int]) -> float:
+    """Estimated Jaccard similarity of the shingle sets behind two signatures."""
+    return float(np.mean(np.asarray(a, dtype=np.uint64) == np.asarray(b, dtype=np.uint64)))
+
+
+def cluster_signatures(signatures: Dict[int, Sequence[int]],
+                       threshold: float = NEAR_DUPLICATE_THRESHOLD) -> List[List[int]]:
+    """Groups of keys whose signatures are near duplicates, largest first.
+
+    Each band bucket is checked against its first member only, so the work
+    stays linear in the number of signatures even when one template has
+    hundreds of clones; chains of variants are still joined through the
+    other bands.
+    """
+    parent = {key: key for key in signatures}
+
+    def find(key):
+        while parent[key] != key:
+            parent[key] = parent[parent[key]]
+            key = parent[key]
+        return key
+
+    arrays = {key: np.asarray(sig, dtype=np.uint64) for key, sig in signatures.items()
+              if sig is not None and len(sig) == NUM_PERM}
+    for band in range(LSH_BANDS):
+        buckets: Dict[bytes, list] = {}
+        start = band * LSH_ROWS
+        for key, sig in arrays.items():
+            buckets.setdefault(sig[start:start + LSH_ROWS].tobytes(), []).append(key)
+        for members in buckets.values():
+            first = members[0]
+            for key in members[1:]:
+                root_a, root_b = find(first), find(key)
+                if root_a != root_b and np.mean(arrays[first] == arrays[key]) >= threshold:
+                    parent[root_b] = root_a
+
+    groups: Dict[int, List[int]] = {}
+    for key in arrays:
+        groups.setdefault(find(key), []).append(key)
+    return sorted((g for g in groups.values() if len(g) > 1), key=lambda g: (-len(g), g[0]))
+
+
+def collapse_near_duplicates(rows: List[Dict], threshold: float = NEAR_DUPLICATE_THRESHOLD) -> List[Dict]:
+    """Drop rows whose "minhash" is a near duplicate of an earlier row's.
+
+    Meant for ranked search results (a few dozen rows), so the best-ranked
+    variant of each template stands in for its clones.
+    """
+    kept, kept_signatures = [], []
+    for row in rows:
+        signature = row.get("minhash")
+        if signature is not None:
+            signature = np.asarray(signature, dtype=np.uint64)
+            if any(np.mean(signature == other) >= threshold for other in kept_signatures):
+                continue
+            kept_signatures.append(signature)
+        kept.append(row)
+    return kept
+
+
+def compute_signatures(firm_id: str = None, template_ids: List[int] = None,
+                       limit: int = None) -> Dict[str, int]:
+    """Sign every active template whose stored signature is missing or stale."""
+    from db.documents import save_template_minhash, stream_templates_needing_minhash
+
+    counts = {"computed": 0, "failed": 0}
+    for row in stream_templates_needing_minhash(MINHASH_VERSION, firm_id=firm_id,
+                                                template_ids=template_ids, limit=limit):
+        content = row["file_content"]
+        file_hash = row.get("file_hash") or hashlib.sha256(content).hexdigest()
+        try:
+            if save_template_minhash(row["id"], file_hash, MINHASH_VERSION, docx_signature(content)):
+                counts["computed"] += 1
+        except Exception as e:
+            logger.warning("Could not sign template %s (%s): %s", row["id"], row.get("name"), e)
+            counts["failed"] += 1
+    return counts
+
+
+@dataclass
+class DuplicateCluster:
+    """Near-duplicate templates; ``keep`` is the most used one."""
+    keep: int
+    template_ids: List[int] = field(default_factory=list)
+    template_names: List[str] = field(default_factory=list)
+    similarity: float = 1.0   # lowest estimated similarity to the kept template
+
+
+def find_duplicate_clusters(firm_id: str, threshold: float = NEAR_DUPLICATE_THRESHOLD) -> List[DuplicateCluster]:
+    """Near-duplicate clusters among a firm's active templates with current signatures."""
+    from db.documents import get_template_minhashes
+
+    rows = {row["id"]: row for row in get_template_minhashes(firm_id, MINHASH_VERSION)}
+    clusters = []
+    for ids in cluster_signatures({i: row["minhash"] for i, row in rows.items()}, threshold):
+        ids.sort(key=lambda i: (-(rows[i].get("usage_count") or 0), i))
+        keep = ids[0]
+        clusters.append(DuplicateCluster(
+            keep=keep,
+            template_ids=ids,
+            template_names=[rows[i]["name"] for i in ids],
+            similarity=min(similarity(rows[keep]["minhash"], rows[i]["minhash"]) for i in ids[1:]),
+        ))
+    return clusters
+
+
+def deactivate_duplicates(firm_id: str, clusters: List[DuplicateCluster]) -> int:
+    """Deactivate every template in ``clusters`` except each cluster's kept one."""
+    from db.documents import deactivate_templates
+    from template_index import invalidate_template_index
+
+    deactivated = deactivate_templates(firm_id, [i for c in clusters for i in c.template_ids if i != c.keep])
+    invalidate_template_index(firm_id)
+    return deactivated
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Find near-duplicate templates")
+    parser.add_argument("--firm", required=True, help="firm_id")
+    parser.add_argument("--threshold", type=float, default=NEAR_DUPLICATE_THRESHOLD,
+                        help="Minimum estimated similarity (default %(default)s)")
+    parser.add_argument("--deactivate", action="store_true",
+                        help="Deactivate all but the most used template of each cluster")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    counts = compute_signatures(firm_id=args.firm)
+    print(f"Signatures: {counts['computed']} computed, {counts['failed']} failed")
+
+    clusters = find_duplicate_clusters(args.firm, args.threshold)
+    print(f"{len(clusters)} near-duplicate clusters, "
+          f"{sum(len(c.template_ids) - 1 for c in clusters)} redundant templates")
+    for i, cluster in enumerate(clusters, 1):
+        print(f"\nCluster {i} ({len(cluster.template_ids)} templates, similarity >= {cluster.similarity:.2f}):")
+        for template_id, name in zip(cluster.template_ids, cluster.template_names):
+            print(f"  {'*' if template_id == cluster.keep else '-'} [{template_id}] {name}")
+
+    if args.deactivate and clusters:
+        print(f"\nDeactivated {deactivate_duplicates(args.firm, clusters)} templates")
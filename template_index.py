@@ -0,0 +1,461 @@
+"""
+Template Identification Index
+
+Maps a document request ("mtc for Jefferson County", "entry of appearance
+muni") to one of the firm's templates and its DOCUMENT_TYPES key with an
+in-memory lookup, instead of a full-text query per request followed by a
+chain of substring checks on the template name.
+
+- TEMPLATE_NAME_RULES / REQUEST_RULES map template names and bare requests
+  to DOCUMENT_TYPES keys. They are plain data, compiled once at import.
+- TemplateIndex holds, per firm, each active template's normalized name
+  tokens (abbreviations expanded: "NOH" -> notice hearing, "DOR" -> director
+  revenue), its tags as aliases, and its document_type_key, resolved once
+  when the index is built. Inverted maps token -> templates and character
+  trigram -> token let a lookup score only the templates that share a token
+  with the request, with trigram similarity covering misspellings
+  ("continuence") and word forms ("letters").
+- Indexes are built on first use per firm and rebuilt when the firm's
+  template signature (active ids, names, tags) changes, checked at most
+  every TEMPLATE_INDEX_CHECK_SECONDS.
+
+Usage:
+    from template_index import get_template_index, reconcile_document_type
+
+    match = get_template_index("jcs_law").lookup("motion to dismiss for DOR")
+    # TemplateMatch(template_id=12, name="DOR Motion to Dismiss",
+    #               document_type_key="motion_to_dismiss_dor", score=0.91, ...)
+    key = reconcile_document_type(match.document_type_key, request)
+"""
+import logging
+import math
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+TEMPLATE_INDEX_CHECK_SECONDS = float(os.environ.get("TEMPLATE_INDEX_CHECK_SECONDS", "30"))
+
+# Minimum trigram similarity for a request word to count as a template word
+_FUZZY_THRESHOLD = 0.5
+# Words shorter than this only match exactly (too few trigrams to compare)
+_FUZZY_MIN_LENGTH = 4
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+_STOP_WORDS = {
+    "i", "me", "my", "need", "want", "looking", "for", "please", "the", "a", "an",
+    "to", "of", "in", "is", "it", "can", "you", "do", "get", "make", "create",
+    "give", "find", "show", "help", "with", "this", "that", "and", "or", "on",
+    "by", "from", "new", "draft", "prepare", "write", "up",
+}
+
+# Abbreviations used in template names and requests, expanded on both sides
+ABBREVIATIONS = {
+    "mtd": "motion dismiss",
+    "mtc": "motion continuance",
+    "mtw": "motion withdraw",
+    "eoa": "entry appearance",
+    "noh": "notice hearing",
+    "coj": "change judge",
+    "pfr": "petition review",
+    "dor": "director revenue",
+    "tdn": "trial de novo",
+    "ph": "preliminary hearing",
+    "dl": "driver license",
+    "drivers": "driver",
+    "rfd": "request discovery",
+    "rfp": "request production",
+    "rfa": "request admission",
+    "rog": "interrogatories",
+    "rogs": "interrogatories",
+    "ltr": "letter",
+    "rec": "recommendation",
+    "muni": "municipal",
+    "admin": "administrative",
+    "continue": "continuance",
+    "webex": "webex",
+}
+
+# (document_type_key, alternatives). An alternative is a tuple of terms that
+# must all hold for the lowercased text: "term" is a substring, "!term" must
+# be absent and "^term" must start the text. The first matching rule wins,
+# so more specific rules come first.
+TEMPLATE_NAME_RULES = (
+    ("filing_fee_memo", [("filing fee",)]),
+    ("bond_assignment", [("bond assignment",), ("cash bond",)]),
+    ("motion_to_dismiss_failure_to_state_claim", [("motion to dismiss", "failure to state")]),
+    ("motion_to_dismiss_lack_jurisdiction", [("motion to dismiss", "jurisdiction")]),
+    ("motion_to_dismiss_improper_venue", [("motion to dismiss", "venue")]),
+    ("motion_to_dismiss_dor", [("motion to dismiss", "dor"), ("motion to dismiss", "director of revenue")]),
+    ("motion_to_dismiss_general", [("motion to dismiss",)]),
+    ("waiver_of_arraignment", [("arraignment", "waiver")]),
+    ("entry_of_appearance_muni", [("entry of appearance", "!arraignment", "muni")]),
+    ("entry_of_appearance_state", [("entry of appearance", "!arraignment")]),
+    ("motion_for_continuance", [("motion", "continu")]),
+    ("motion_to_recall_warrant", [("recall warrant",), ("motion to recall",)]),
+    ("proposed_stay_order", [("stay order",), ("proposed stay",)]),
+    ("preservation_supplemental_letter", [("preservation", "supplemental")]),
+    ("preservation_letter", [("preservation",)]),
+    ("potential_prosecution_letter", [("potential prosecution",), ("prosecution letter",)]),
+    ("request_for_discovery", [("request for discovery",), ("discovery request",)]),
+    ("disposition_letter", [("disposition",), ("dispo",)]),
+    # Batch 3
+    ("motion_for_coj", [("change of judge",), ("coj",)]),
+    ("notice_of_hearing_mtw", [("notice of hearing", "withdraw")]),
+    ("notice_of_hearing", [("notice of hearing",)]),
+    ("petition_for_review", [("petition for review",), ("^pfr",)]),
+    ("after_supplemental_disclosure_letter", [("after supplemental",), ("supplemental disclosure",)]),
+    ("notice_to_take_deposition", [("deposition",)]),
+    ("motion_for_bond_reduction", [("bond reduction",)]),
+    ("motion_to_certify", [("certify", "jury")]),
+    ("ltr_to_dor_with_pfr", [("ltr to dor", "pfr"), ("letter to dor", "pfr")]),
+    ("ltr_to_dor_with_stay_order", [("ltr to dor", "stay"), ("letter to dor", "stay")]),
+    ("ltr_to_dor_with_judgment", [("ltr to dor", "judgment"), ("letter to dor", "judgment")]),
+    ("dor_motion_to_dismiss", [("dor", "motion to dismiss")]),
+    ("motion_to_shorten_time", [("shorten time",)]),
+    ("motion_to_appear_via_webex", [("webex",), ("web ex",)]),
+    ("motion_to_place_on_docket", [("place on docket",)]),
+    ("notice_of_change_of_address", [("change of address",)]),
+    ("request_for_supplemental_discovery", [("supplemental discovery",)]),
+    ("motion_to_amend_bond_conditions", [("amend bond",)]),
+    ("ltr_to_client_with_discovery", [("client with discovery",), ("ltr to client",)]),
+    ("motion_to_compel", [("compel",)]),
+    ("motion_to_terminate_probation", [("terminate probation",)]),
+    ("request_for_jury_trial", [("jury trial",)]),
+    ("dl_reinstatement_letter", [("reinstatement", "dl"), ("reinstatement", "license"),
+                                 ("reinstatement", "driver")]),
+    ("request_for_rec_letter", [("request for rec",), ("recommendation", "letter")]),
+    # Batch 4
+    ("entry_generic", [("entry (generic)",), ("^entry", "!appearance")]),
+    ("plea_of_guilty", [("plea of guilty",)]),
+    ("request_for_stay_order", [("request for stay order",)]),
+    ("waiver_of_preliminary_hearing", [("waiver of preliminary",)]),
+    ("request_for_transcripts", [("request for transcript",)]),
+    ("motion_to_withdraw_guilty_plea", [("withdraw guilty plea",)]),
+    ("ph_waiver", [("^ph waiver",)]),
+    ("answer_for_request_to_produce", [("answer for request to produce",)]),
+    ("available_court_dates", [("available court dates",)]),
+    ("requirements_for_rec_letter", [("requirements for", "rec")]),
+    ("motion_to_withdraw", [("motion to withdraw", "!guilty")]),
+    ("closing_letter", [("closing", "letter"), ("closing", "ltr")]),
+    # Batch 5 — former .doc templates
+    ("admin_continuance_request", [("admin continuance",)]),
+    ("admin_hearing_request", [("admin hearing",)]),
+    ("petition_for_tdn", [("petition for tdn",), ("trial de novo",)]),
+    # Batch 6 — final cleanup
+    ("noh_bond_reduction", [("noh bond reduction",), ("notice of hearing", "bond")]),
+    ("oop_entry", [("oop entry",), ("oop",)]),
+)
+
+# Keys for requests whose template name maps to no DOCUMENT_TYPES key
+REQUEST_RULES = (
+    ("entry_of_appearance_muni", [("entry of appearance", "muni"), ("eoa", "muni")]),
+    ("entry_of_appearance_state", [("entry of appearance",), ("eoa",)]),
+    ("motion_for_continuance", [("continu",), ("mtc",)]),
+    ("request_for_supplemental_discovery", [("supplemental discovery",)]),
+    ("request_for_discovery", [("request for discovery",), ("rfd",)]),
+    ("preservation_supplemental_letter", [("preservation", "supplemental")]),
+    ("preservation_letter", [("preservation",)]),
+    ("potential_prosecution_letter", [("prosecution",)]),
+    ("motion_to_recall_warrant", [("recall warrant",)]),
+    ("proposed_stay_order", [("stay order",)]),
+    ("disposition_letter", [("dispo",)]),
+    ("motion_for_coj", [("change of judge",), ("coj",)]),
+    ("notice_of_hearing_mtw", [("notice of hearing", "withdraw")]),
+    ("notice_of_hearing", [("notice of hearing",), ("noh",)]),
+    ("petition_for_review", [("petition for review",), ("pfr",)]),
+    ("after_supplemental_disclosure_letter", [("supplemental disclosure",)]),
+    ("notice_to_take_deposition", [("deposition",)]),
+    ("motion_for_bond_reduction", [("bond reduction",)]),
+    ("motion_to_certify", [("certify", "jury")]),
+    ("ltr_to_dor_with_pfr", [("dor", "pfr")]),
+    ("ltr_to_dor_with_stay_order", [("dor", "stay")]),
+    ("ltr_to_dor_with_judgment", [("dor", "judgment")]),
+    ("dor_motion_to_dismiss", [("dor", "dismiss")]),
+    ("motion_to_shorten_time", [("shorten time",)]),
+    ("motion_to_appear_via_webex", [("webex",)]),
+    ("motion_to_place_on_docket", [("place on docket",)]),
+    ("notice_of_change_of_address", [("change of address",)]),
+    ("motion_to_amend_bond_conditions", [("amend bond",)]),
+    ("ltr_to_client_with_discovery", [("client with discovery",)]),
+    ("motion_to_compel", [("compel",)]),
+    ("motion_to_terminate_probation", [("terminate probation",)]),
+    ("request_for_jury_trial", [("jury trial",)]),
+    ("dl_reinstatement_letter", [("reinstatement",), ("reinstate",)]),
+    ("waiver_of_arraignment", [("arraignment", "waiver")]),
+    ("request_for_rec_letter", [("recommendation",), ("request", "rec", "pa")]),
+    # Batch 4 fallback detection
+    ("motion_to_withdraw_guilty_plea", [("plea of guilty", "withdraw"), ("guilty plea", "withdraw")]),
+    ("plea_of_guilty", [("plea of guilty",), ("guilty plea",)]),
+    ("waiver_of_preliminary_hearing", [("preliminary hearing", "waiver")]),
+    ("ph_waiver", [("ph waiver",)]),
+    ("request_for_stay_order", [("request for stay",)]),
+    ("request_for_transcripts", [("transcript",)]),
+    ("answer_for_request_to_produce", [("answer", "request to produce")]),
+    ("available_court_dates_for_trial", [("court dates", "trial")]),
+    ("requirements_for_rec_letter", [("requirements", "rec")]),
+    ("motion_to_withdraw", [("withdraw", "counsel"), ("motion to withdraw", "!guilty")]),
+    ("closing_letter", [("closing letter",), ("closing ltr",)]),
+    # Batch 5 — former .doc templates
+    ("admin_continuance_request", [("admin continuance",), ("administrative", "continuance")]),
+    ("admin_hearing_request", [("admin hearing",), ("administrative", "hearing")]),
+    ("petition_for_tdn", [("trial de novo",), ("tdn",)]),
+    # Batch 6 — final cleanup
+    ("noh_bond_reduction", [("noh", "bond")]),
+    ("oop_entry", [("oop", "entry")]),
+)
+
+
+def _compile_rules(rules) -> List[Tuple[str, List[Tuple[tuple, tuple, tuple]]]]:
+    """Split each alternative into (present, absent, prefixes) term tuples."""
+    compiled = []
+    for key, alternatives in rules:
+        split = []
+        for terms in alternatives:
+            split.append((
+                tuple(t for t in terms if t[0] not in "!^"),
+                tuple(t[1:] for t in terms if t[0] == "!"),
+                tuple(t[1:] for t in terms if t[0] == "^"),
+            ))
+        compiled.append((key, split))
+    return compiled
+
+
+_NAME_RULES = _compile_rules(TEMPLATE_NAME_RULES)
+_REQUEST_RULES = _compile_rules(REQUEST_RULES)
+
+
+def _match_rules(text: str, rules) -> Optional[str]:
+    text = (text or "").lower()
+    for key, alternatives in rules:
+        for present, absent, prefixes in alternatives:
+            if (all(t in text for t in present)
+                    and not any(t in text for t in absent)
+                    and all(text.startswith(t) for t in prefixes)):
+                return key
+    return None
+
+
+def document_type_for_name(template_name: str) -> Optional[str]:
+    """DOCUMENT_TYPES key for a template name, or None."""
+    return _match_rules(template_name, _NAME_RULES)
+
+
+def reconcile_document_type(document_type_key: Optional[str], request: str) -> Optional[str]:
+    """Adjust a template's key to the variant the request asked for.
+
+    Search can land on a sibling variant (DOR vs general motion to dismiss,
+    state vs municipal entry); with no key, derive one from the request.
+    """
+    request_lower = (request or "").lower()
+    asks_dor = "dor" in request_lower or "director of revenue" in request_lower
+    asks_muni = "muni" in request_lower or "municipal" in request_lower
+
+    if document_type_key == "motion_to_dismiss_dor" and not asks_dor:
+        return "motion_to_dismiss_general"
+    if document_type_key == "motion_to_dismiss_general" and asks_dor:
+        return "motion_to_dismiss_dor"
+    if document_type_key == "entry_of_appearance_state" and asks_muni:
+        return "entry_of_appearance_muni"
+    if document_type_key == "entry_of_appearance_muni" and "state" in request_lower and not asks_muni:
+        return "entry_of_appearance_state"
+    if document_type_key:
+        return document_type_key
+    return _match_rules(request_lower, _REQUEST_RULES)
+
+
+def normalize_tokens(text: str) -> List[str]:
+    """Lowercased words with abbreviations expanded and stop words removed."""
+    tokens = []
+    for word in _WORD_RE.findall((text or "").lower()):
+        tokens.extend(ABBREVIATIONS.get(word, word).split())
+    return [t for t in tokens if t not in _STOP_WORDS]
+
+
+def trigrams(word: str) -> set:
+    """pg_trgm-style trigrams: the word padded with two leading and one trailing space."""
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+@dataclass
+class TemplateMatch:
+    template_id: int
+    name: str
+    category: Optional[str]
+    jurisdiction: Optional[str]
+    document_type_key: Optional[str]
+    score: float
+
+
+@dataclass
+class _IndexedTemplate:
+    id: int
+    name: str
+    category: Optional[str]
+    jurisdiction: Optional[str]
+    document_type_key: Optional[str]
+    usage_count: int
+    name_tokens: frozenset
+    tokens: frozenset                     # name tokens plus tag aliases
+
+
+def _tag_words(tags) -> str:
+    if not tags:
+        return ""
+    if isinstance(tags, str):
+        try:
+            import json
+            tags = json.loads(tags)
+        except ValueError:
+            return tags
+    if isinstance(tags, (list, tuple)):
+        return " ".join(str(t) for t in tags)
+    return str(tags)
+
+
+class TemplateIndex:
+    """Token and trigram index over one firm's active templates."""
+
+    def __init__(self, rows: Iterable[Dict], signature: Optional[str] = None):
+        self.signature = signature
+        self.checked_at = time.monotonic()
+        self._templates: List[_IndexedTemplate] = []
+        postings = defaultdict(list)
+        for row in rows:
+            name_tokens = frozenset(normalize_tokens(row["name"]))
+            tokens = name_tokens | frozenset(normalize_tokens(_tag_words(row.get("tags"))))
+            if not tokens:
+                continue
+            position = len(self._templates)
+            self._templates.append(_IndexedTemplate(
+                id=row["id"],
+                name=row["name"],
+                category=row.get("category"),
+                jurisdiction=row.get("jurisdiction"),
+                document_type_key=document_type_for_name(row["name"]),
+                usage_count=row.get("usage_count") or 0,
+                name_tokens=name_tokens,
+                tokens=tokens,
+            ))
+            for token in tokens:
+                postings[token].append(position)
+
+        self._postings: Dict[str, Tuple[int, ...]] = {t: tuple(p) for t, p in postings.items()}
+        total = len(self._templates)
+        self._idf = {t: math.log(1 + total / len(p)) for t, p in self._postings.items()}
+        self._name_weight = [sum(self._idf[t] for t in tpl.name_tokens) or 1.0
+                             for tpl in self._templates]
+        self._trigram_tokens: Dict[str, List[str]] = defaultdict(list)
+        for token in self._postings:
+            if len(token) >= _FUZZY_MIN_LENGTH:
+                for gram in trigrams(token):
+                    self._trigram_tokens[gram].append(token)
+
+    def __len__(self) -> int:
+        return len(self._templates)
+
+    def _similar_tokens(self, word: str) -> Dict[str, float]:
+        """Indexed tokens matching ``word``: itself, else those within trigram similarity."""
+        if word in self._postings:
+            return {word: 1.0}
+        if len(word) < _FUZZY_MIN_LENGTH:
+            return {}
+        grams = trigrams(word)
+        shared = defaultdict(int)
+        for gram in grams:
+            for token in self._trigram_tokens.get(gram, ()):
+                shared[token] += 1
+        similar = {}
+        for token, count in shared.items():
+            similarity = count / (len(grams) + len(trigrams(token)) - count)
+            if similarity >= _FUZZY_THRESHOLD:
+                similar[token] = similarity
+        return similar
+
+    def lookup(self, request: str) -> Optional[TemplateMatch]:
+        """Best template for ``request``, or None if no template shares a word with it.
+
+        Scores how much of the template's name the request covers (IDF
+        weighted, so "motion" counts less than "continuance") and how much of
+        the request the template accounts for; ties go to the most used
+        template, then the shortest name.
+        """
+        words = set(normalize_tokens(request))
+        if not words or not self._templates:
+            return None
+
+        # template position -> {template token: similarity}, {request word}
+        token_hits: Dict[int, Dict[str, float]] = defaultdict(dict)
+        word_hits: Dict[int, set] = defaultdict(set)
+        for word in words:
+            for token, similarity in self._similar_tokens(word).items():
+                for position in self._postings[token]:
+                    hits = token_hits[position]
+                    hits[token] = max(hits.get(token, 0.0), similarity)
+                    word_hits[position].add(word)
+        if not token_hits:
+            return None
+
+        best, best_key = None, None
+        for position, hits in token_hits.items():
+            template = self._templates[position]
+            coverage = sum(self._idf[t] * s for t, s in hits.items()
+                           if t in template.name_tokens) / self._name_weight[position]
+            precision = len(word_hits[position]) / len(words)
+            score = 0.7 * coverage + 0.3 * precision
+            key = (round(score, 6), template.usage_count, -len(template.name), -template.id)
+            if best_key is None or key > best_key:
+                best, best_key = template, key
+
+        return TemplateMatch(
+            template_id=best.id,
+            name=best.name,
+            category=best.category,
+            jurisdiction=best.jurisdiction,
+            document_type_key=best.document_type_key,
+            score=best_key[0],
+        )
+
+
+_indexes: Dict[str, TemplateIndex] = {}
+_lock = threading.Lock()
+
+
+def get_template_index(firm_id: str) -> TemplateIndex:
+    """The firm's index, rebuilt if its templates changed since the last check."""
+    from db.documents import get_template_signature, get_templates
+
+    index = _indexes.get(firm_id)
+    if index is not None and time.monotonic() - index.checked_at < TEMPLATE_INDEX_CHECK_SECONDS:
+        return index
+
+    with _lock:
+        index = _indexes.get(firm_id)
+        if index is not None and time.monotonic() - index.checked_at < TEMPLATE_INDEX_CHECK_SECONDS:
+            return index
+        signature = get_template_signature(firm_id)
+        if index is not None and index.signature == signature:
+            index.checked_at = time.monotonic()
+            return index
+        started = time.monotonic()
+        index = TemplateIndex(get_templates(firm_id), signature)
+        _indexes[firm_id] = index
+        logger.info("Built template index for %s: %d templates in %.1f ms",
+                    firm_id, len(index), (time.monotonic() - started) * 1000)
+        return index
+
+
+def invalidate_template_index(firm_id: Optional[str] = None):
+    """Drop one firm's index (or all) so the next lookup rebuilds it."""
+    with _lock:
+        if firm_id is None:
+            _indexes.clear()
+        else:
+            _indexes.pop(firm_id, None)
@@ -3,7 +3,9 @@ Template Preprocessor
 
 Standardizes all templates by replacing sample data with placeholders.
 This eliminates the need for complex regex pattern matching and enables
-duplicate detection.
+duplicate detection: processed templates are grouped by the MinHash
+similarity of their text (template_dedup), so variants that differ by a few
+words are reported along with exact copies.
 
 Standard Placeholders:
     {{defendant_name}}      {{plaintiff_name}}      {{petitioner_name}}
@@ -13,11 +15,18 @@ Standard Placeholders:
     {{firm_name}}           {{firm_address}}        {{firm_city_state_zip}}
     {{attorney_name}}       {{bar_number}}          {{phone}}
     {{email}}               {{fax}}
+
+Runs are incremental: each template records the file_hash and
+PREPROCESSOR_VERSION it was preprocessed at, and only templates whose file
+changed since (or all of them, with force) are read. Those are streamed
+from a server-side cursor and processed in a process pool, a few at a time.
 """
 
+import os
 import re
 import hashlib
 import io
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
 from pathlib import Path
 from typing import Dict, List, Tuple, Optional, Set
 from dataclasses import dataclass, field
@@ -25,6 +34,7 @@ from datetime import datetime
 from docx import Document
 
 from db.connection import get_connection
+from template_dedup import cluster_signatures, similarity, text_signature
 
 
 # =============================================================================
@@ -104,23 +114,57 @@ MISSOURI_COUNTIES = [
 ]
 
 
+# Bump when the replacement rules change so every template is preprocessed again
+PREPROCESSOR_VERSION = "template_preprocessor-1"
+
+PREPROCESS_WORKERS = int(os.environ.get("PREPROCESS_WORKERS", str(os.cpu_count() or 1)))
+
+
+def process_stream(fn, items, workers: int = None):
+    """Yield (args, fn(*args)) for each args tuple from ``items``, as they finish.
+
+    Runs in a process pool with at most two tasks per worker in flight, so
+    memory stays bounded however many items there are. With one worker,
+    runs inline.
+    """
+    workers = workers or PREPROCESS_WORKERS
+    if workers <= 1:
+        for args in items:
+            yield args, fn(*args)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = {}
+        for args in items:
+            pending[pool.submit(fn, *args)] = args
+            if len(pending) >= workers * 2:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield pending.pop(future), future.result()
+        for future in as_completed(list(pending)):
+            yield pending.pop(future), future.result()
+
+
 @dataclass
 class ProcessedTemplate:
     """A template after preprocessing."""
     id: int
     original_name: str
-    processed_content: bytes  # The docx with placeholders
-    content_hash: str  # Hash for duplicate detection
+    processed_content: Optional[bytes]  # The docx with placeholders; None once stored
+    content_hash: str  # Hash of the normalized text
     variables_found: List[str] = field(default_factory=list)
     replacements_made: Dict[str, str] = field(default_factory=dict)
+    source_hash: Optional[str] = None  # sha256 of the content before preprocessing
+    minhash: Optional[List[int]] = None  # Signature of the normalized text, for duplicate detection
 
 
 @dataclass
 class DuplicateGroup:
-    """A group of templates that are duplicates after normalization."""
-    content_hash: str
+    """A group of templates that are near duplicates after normalization."""
+    content_hash: str  # of the group's first template
     template_ids: List[int] = field(default_factory=list)
     template_names: List[str] = field(default_factory=list)
+    similarity: float = 1.0  # lowest estimated similarity to the first template
 
 
 class TemplatePreprocessor:
@@ -131,52 +175,55 @@ class TemplatePreprocessor:
         self.processed: List[ProcessedTemplate] = []
         self.duplicates: List[DuplicateGroup] = []
 
-    def process_all_templates(self, firm_id: str = None) -> Tuple[int, int]:
+    def process_all_templates(self, firm_id: str = None, update_db: bool = False,
+                              force: bool = False, workers: int = None) -> Tuple[int, int]:
         """
-        Process all templates in the database.
+        Process templates not yet preprocessed at PREPROCESSOR_VERSION.
+
+        Args:
+            update_db: Store each result as it finishes instead of keeping
+                the processed content for update_database()
+            force: Reprocess every active template
+            workers: Worker processes (default PREPROCESS_WORKERS)
 
         Returns:
-            Tuple of (templates_processed, duplicates_found)
+            Tuple of (templates_processed, duplicates_found); duplicates are
+            among the templates processed in this run
         """
-        firm_id = firm_id or self.firm_id
-
-        with get_connection() as conn:
-            with conn.cursor() as cursor:
-                query = "SELECT id, name, file_content FROM templates WHERE status = 'active'"
-                params = []
-                if firm_id:
-                    query += " AND firm_id = %s"
-                    params.append(firm_id)
+        from db.documents import count_templates_needing_preprocess, stream_templates_needing_preprocess
 
-                cursor.execute(query, params)
-                templates = cursor.fetchall()
-
-        print(f"Processing {len(templates)} templates...")
+        firm_id = firm_id or self.firm_id
 
-        hash_to_templates: Dict[str, List[Tuple[int, str]]] = {}
+        pending = count_templates_needing_preprocess(PREPROCESSOR_VERSION, firm_id, force=force)
+        print(f"Processing {pending} templates...")
+        if not pending:
+            return 0, 0
 
-        for template_id, name, content in templates:
-            if not content:
-                continue
+        rows = stream_templates_needing_preprocess(PREPROCESSOR_VERSION, firm_id, force=force)
+        items = ((row["id"], row["name"], row["file_content"]) for row in rows)
 
-            processed = self._process_template(template_id, name, content)
+        for _, processed in process_stream(
+                _process_template_task, items, min(workers or PREPROCESS_WORKERS, pending)):
             if processed:
+                if update_db:
+                    self._store(processed)
+                    processed.processed_content = None
                 self.processed.append(processed)
 
-                # Track for duplicate detection
-                if processed.content_hash not in hash_to_templates:
-                    hash_to_templates[processed.content_hash] = []
-                hash_to_templates[processed.content_hash].append((template_id, name))
-
-        # Find duplicates
-        for content_hash, templates_list in hash_to_templates.items():
-            if len(templates_list) > 1:
-                group = DuplicateGroup(
-                    content_hash=content_hash,
-                    template_ids=[t[0] for t in templates_list],
-                    template_names=[t[1] for t in templates_list]
-                )
-                self.duplicates.append(group)
+        # Find near duplicates (LSH over the MinHash signatures)
+        by_index = dict(enumerate(self.processed))
+        for indexes in cluster_signatures({i: p.minhash for i, p in by_index.items()}):
+            indexes.sort()
+            first = by_index[indexes[0]]
+            self.duplicates.append(DuplicateGroup(
+                content_hash=first.content_hash,
+                template_ids=[by_index[i].id for i in indexes],
+                template_names=[by_index[i].original_name for i in indexes],
+                similarity=min(similarity(first.minhash, by_index[i].minhash) for i in indexes[1:]),
+            ))
+
+        if update_db:
+            self._after_update()
 
         return len(self.processed), len(self.duplicates)
 
@@ -213,7 +260,9 @@ class TemplatePreprocessor:
                 processed_content=processed_content,
                 content_hash=content_hash,
                 variables_found=list(variables_found),
-                replacements_made=replacements
+                replacements_made=replacements,
+                source_hash=hashlib.sha256(content).hexdigest(),
+                minhash=text_signature(text_content),
             )
 
         except Exception as e:
@@ -328,32 +377,54 @@ class TemplatePreprocessor:
         output_dir = output_dir or (DATA_DIR / "processed_templates")
         output_dir.mkdir(parents=True, exist_ok=True)
 
-        for processed in self.processed:
+        saved = [p for p in self.processed if p.processed_content is not None]
+        for processed in saved:
             safe_name = re.sub(r'[^\w\-]', '_', processed.original_name)
             output_path = output_dir / f"{safe_name}.docx"
             with open(output_path, 'wb') as f:
                 f.write(processed.processed_content)
 
-        print(f"Saved {len(self.processed)} processed templates to {output_dir}")
+        print(f"Saved {len(saved)} processed templates to {output_dir}")
 
     def update_database(self):
         """Update the database with processed templates."""
-        with get_connection() as conn:
-            with conn.cursor() as cursor:
-                for processed in self.processed:
-                    cursor.execute("""
-                        UPDATE templates
-                        SET file_content = %s,
-                            variables = %s
-                        WHERE id = %s
-                    """, (
-                        processed.processed_content,
-                        ','.join(processed.variables_found),
-                        processed.id
-                    ))
-            conn.commit()
-
-        print(f"Updated {len(self.processed)} templates in database")
+        stored = 0
+        for processed in self.processed:
+            if processed.processed_content is not None:
+                stored += self._store(processed)
+                processed.processed_content = None
+
+        print(f"Updated {stored} templates in database")
+        self._after_update()
+
+    def _store(self, processed: ProcessedTemplate) -> bool:
+        """Write back a template's new content, or record that it needed none."""
+        from db.documents import mark_template_preprocessed, save_preprocessed_template
+
+        if not processed.variables_found:
+            return mark_template_preprocessed(processed.id, processed.source_hash, PREPROCESSOR_VERSION)
+        return save_preprocessed_template(
+            processed.id, processed.source_hash, processed.processed_content,
+            PREPROCESSOR_VERSION, sorted(processed.variables_found),
+        )
+
+    def _after_update(self):
+        """Refresh the stored variable analysis, compiled form and signature of rewritten templates."""
+        rewritten = [p.id for p in self.processed if p.variables_found]
+        if not rewritten:
+            return
+
+        from document_chat import precompute_variable_analysis
+        counts = precompute_variable_analysis(template_ids=rewritten)
+        print(f"Variable analysis: {counts['analyzed']} analyzed, {counts['failed']} failed")
+
+        from template_compiler import compile_templates
+        counts = compile_templates(template_ids=rewritten)
+        print(f"Compiled: {counts['compiled']} compiled, {counts['failed']} failed")
+
+        from template_dedup import compute_signatures
+        counts = compute_signatures(template_ids=rewritten)
+        print(f"Signatures: {counts['computed']} computed, {counts['failed']} failed")
 
     def print_report(self):
         """Print a summary report."""
@@ -385,18 +456,22 @@ class TemplatePreprocessor:
         print("\n" + "="*60)
 
 
-def preprocess_templates(firm_id: str = None, update_db: bool = False):
-    """Main function to preprocess templates."""
-    preprocessor = TemplatePreprocessor(firm_id=firm_id)
+def _process_template_task(template_id: int, name: str, content: bytes) -> Optional[ProcessedTemplate]:
+    """Pool entry point for TemplatePreprocessor._process_template."""
+    return TemplatePreprocessor()._process_template(template_id, name, content)
 
-    processed, duplicates = preprocessor.process_all_templates(firm_id)
 
-    preprocessor.print_report()
+def preprocess_templates(firm_id: str = None, update_db: bool = False, force: bool = False):
+    """Main function to preprocess templates."""
+    preprocessor = TemplatePreprocessor(firm_id=firm_id)
 
     if update_db:
         confirm = input("\nUpdate database with processed templates? (yes/no): ")
-        if confirm.lower() == 'yes':
-            preprocessor.update_database()
+        update_db = confirm.lower() == 'yes'
+
+    preprocessor.process_all_templates(firm_id, update_db=update_db, force=force)
+
+    preprocessor.print_report()
 
     return preprocessor
 
@@ -404,7 +479,9 @@ def preprocess_templates(firm_id: str = None, update_db: bool = False):
 if __name__ == "__main__":
     import sys
 
-    firm_id = sys.argv[1] if len(sys.argv) > 1 else None
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    firm_id = args[0] if args else None
     update_db = '--update' in sys.argv
+    force = '--force' in sys.argv
 
-    preprocess_templates(firm_id, update_db)
+    preprocess_templates(firm_id, update_db, force)
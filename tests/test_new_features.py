@@ -746,6 +746,96 @@ class TestDashboardTrends:
             assert 'current_value' in comparison
             assert 'current_date' in comparison
 
+    def test_snapshot_scope_by_role(self):
+        """Test firm views read kpi_snapshots and attorney views read their own series."""
+        from dashboard.models import DashboardData
+
+        firm_view = DashboardData(firm_id='test_firm')
+        assert firm_view._snapshot_scope() == ('kpi_snapshots', '', ())
+
+        attorney_view = DashboardData(firm_id='test_firm', attorney_name='Heidi Leopold')
+        table, sql, params = attorney_view._snapshot_scope('s')
+        assert table == 'attorney_kpi_snapshots'
+        assert sql == ' AND s.attorney_name = %s'
+        assert params == ('Heidi Leopold',)
+
+    @pytest.mark.skipif(not os.environ.get('DATABASE_URL'), reason='DATABASE_URL not set')
+    def test_attorney_snapshots_round_trip(self):
+        """Nightly attorney snapshots are read back as the attorney's trend series."""
+        import uuid
+        from contextlib import contextmanager
+        import psycopg2
+        from psycopg2.extras import RealDictCursor
+        from db.trends import TRENDS_SCHEMA, record_attorney_snapshots
+        from dashboard.models import DashboardData
+
+        schema = f"trends_test_{uuid.uuid4().hex[:8]}"
+        conn = psycopg2.connect(os.environ['DATABASE_URL'], cursor_factory=RealDictCursor)
+        conn.autocommit = True
+        cur = conn.cursor()
+
+        @contextmanager
+        def schema_connection(autocommit=False):
+            yield conn
+
+        try:
+            cur.execute(f"CREATE SCHEMA {schema}; SET search_path TO {schema}")
+            cur.execute("""
+                CREATE TABLE cached_invoices (firm_id VARCHAR(36), id INTEGER, case_id INTEGER,
+                    total_amount REAL, balance_due REAL, due_date DATE, invoice_date DATE);
+                CREATE TABLE cached_cases (firm_id VARCHAR(36), id INTEGER, lead_attorney_name TEXT);
+                CREATE TABLE cached_tasks (firm_id VARCHAR(36), id INTEGER, case_id INTEGER,
+                    due_date DATE, completed BOOLEAN);
+            """)
+            cur.execute(TRENDS_SCHEMA)
+            cur.execute("""
+                INSERT INTO cached_cases VALUES ('f1', 10, 'Smith'), ('f1', 20, 'Jones'),
+                    ('f2', 30, 'Smith');
+                INSERT INTO cached_invoices VALUES
+                    ('f1', 1, 10, 1000, 1000, CURRENT_DATE - 90, CURRENT_DATE - 90),
+                    ('f1', 2, 10, 800, 500, CURRENT_DATE - 10, CURRENT_DATE - 10),
+                    ('f2', 3, 30, 9000, 9000, CURRENT_DATE - 90, CURRENT_DATE - 5);
+                INSERT INTO cached_tasks VALUES
+                    ('f1', 1, 20, CURRENT_DATE - 5, false),
+                    ('f1', 2, 20, CURRENT_DATE - 5, true);
+            """)
+            cur.execute("SELECT CURRENT_DATE AS today")
+            today = cur.fetchone()['today']
+
+            with patch('db.trends.get_connection', schema_connection), \
+                    patch('dashboard.models.trends.get_connection', schema_connection):
+                # Jones has only tasks, Smith only invoices: both come out of the FULL OUTER JOIN
+                assert record_attorney_snapshots('f1', today - timedelta(days=7)) == 8
+                cur.execute("UPDATE cached_invoices SET balance_due = 0 WHERE firm_id = 'f1' AND id = 2")
+                assert record_attorney_snapshots('f1') == 8
+
+                cur.execute("""
+                    SELECT attorney_name, metric_name, metric_value FROM attorney_kpi_snapshots
+                    WHERE snapshot_date = %s ORDER BY attorney_name, metric_name
+                """, (today - timedelta(days=7),))
+                values = {(r['attorney_name'], r['metric_name']): r['metric_value']
+                          for r in cur.fetchall()}
+                assert values[('Smith', 'total_ar')] == 1500
+                assert values[('Smith', 'ar_over_60_pct')] == pytest.approx(66.7, abs=0.01)
+                assert values[('Smith', 'total_billed_30d')] == 800
+                assert values[('Smith', 'overdue_tasks')] == 0
+                assert values[('Jones', 'total_ar')] == 0
+                assert values[('Jones', 'overdue_tasks')] == 1
+
+                smith = DashboardData(firm_id='f1', attorney_name='Smith')
+                assert [p['value'] for p in smith.get_kpi_trends('total_ar')] == [1500, 1000]
+                summary = {m['name']: m for m in smith.get_trends_summary()['metrics']}
+                assert summary['total_ar']['value'] == 1000
+                assert summary['total_ar']['previous_value'] == 1500
+                assert summary['total_ar']['direction'] == 'down'
+                assert smith.get_metric_comparison('total_ar')['wow_value'] == 1500
+
+                # The firm-wide view does not read the attorney series
+                assert DashboardData(firm_id='f1').get_kpi_trends('total_ar') == []
+        finally:
+            cur.execute(f"DROP SCHEMA {schema} CASCADE")
+            conn.close()
+
 
 # ============================================================================
 # License Deadline SMS Tests
@@ -1143,6 +1233,183 @@ class TestDashboardDunning:
             assert 'count' in stage_data
             assert 'total' in stage_data
 
+    def test_dunning_queue_reads_maintained_table(self):
+        """The queue reads dunning_queue, filtering stage and sent status in SQL."""
+        from dashboard.models import DashboardData
+
+        data = DashboardData(firm_id='firm-1')
+        sql, params = data._dunning_queue_query(stage=2, include_sent=False)
+
+        assert 'FROM dunning_queue q' in sql
+        assert 'cached_invoices' not in sql
+        assert 'AND stage = %s' in sql and 'AND NOT already_sent' in sql
+        assert params == ('firm-1', 2)
+
+    def test_dunning_queue_triggers_cover_all_sources(self):
+        """Every table feeding the queue has a maintenance trigger."""
+        from db.dunning_queue import _QUEUE_TRIGGERS
+
+        sources = {table for table, _ in _QUEUE_TRIGGERS}
+        assert sources == {'cached_invoices', 'cached_payments', 'dunning_notices',
+                           'cached_cases', 'cached_contacts', 'cached_clients'}
+
+    def test_stale_queue_is_rebuilt_on_read(self):
+        """A firm flagged by a failed trigger is rebuilt before the next read."""
+        from db import dunning_queue
+        from dashboard.models import DashboardData
+
+        cur = MagicMock()
+        cur.fetchone.side_effect = [{'stale_since': '2026-10-18', 'last_error': 'boom'}, None]
+        conn = MagicMock()
+        conn.__enter__.return_value.cursor.return_value = cur
+        with patch.object(dunning_queue, 'get_connection', return_value=conn), \
+             patch.object(dunning_queue, 'refresh_dunning_queue') as refresh:
+            assert dunning_queue.refresh_if_stale('f1') is True
+            refresh.assert_called_once_with('f1')
+            assert dunning_queue.refresh_if_stale('f1') is False
+            assert refresh.call_count == 1
+
+        data = DashboardData(firm_id='f1')
+        with patch('dashboard.models.ar.refresh_if_stale') as check, \
+             patch('dashboard.models.ar.get_connection', side_effect=RuntimeError('no db')):
+            data.get_dunning_page(stage=1)
+            data.get_dunning_summary()
+        assert [c.args for c in check.call_args_list] == [('f1',), ('f1',)]
+
+    def test_queue_triggers_flag_failures(self):
+        """Every trigger's exception handler records the firm as stale."""
+        from db.dunning_queue import DUNNING_QUEUE_SCHEMA
+
+        handlers = DUNNING_QUEUE_SCHEMA.split("EXCEPTION WHEN OTHERS THEN")[1:]
+        trigger_handlers = [h for h in handlers if "TG_TABLE_NAME" in h]
+        assert len(trigger_handlers) == 5
+        assert all("dunning_queue_mark_stale" in h.split("END")[0] for h in trigger_handlers)
+        assert "GROUP BY upload_batch_id" not in DUNNING_QUEUE_SCHEMA
+
+    def test_rebuild_queue_cli_reconciles_every_firm(self):
+        """rebuild-queue refreshes all firms unless --firm narrows it."""
+        from click.testing import CliRunner
+        from agent import cli
+
+        runner = CliRunner()
+        with patch('db.dunning_queue.ensure_dunning_queue_tables'), \
+             patch('db.dunning_queue.refresh_all_dunning_queues',
+                   return_value={'firm-a': 3, 'firm-b': 2}) as refresh_all, \
+             patch('db.dunning_queue.refresh_dunning_queue', return_value=4) as refresh_one:
+            result = runner.invoke(cli, ['collections', 'rebuild-queue'])
+            assert result.exit_code == 0, result.output
+            refresh_all.assert_called_once_with()
+            refresh_one.assert_not_called()
+            assert '5 open invoices across 2 firms' in result.output
+
+            result = runner.invoke(cli, ['collections', 'rebuild-queue', '--firm', 'firm-b'])
+            assert result.exit_code == 0, result.output
+            refresh_one.assert_called_once_with('firm-b')
+
+    def test_refresh_all_dunning_queues_includes_queue_only_firms(self):
+        """Firms whose invoices are gone are still refreshed so stale rows drop."""
+        from db import dunning_queue
+
+        cur = MagicMock()
+        cur.fetchall.return_value = [{'firm_id': 'firm-a'}, {'firm_id': 'firm-gone'}]
+        conn = MagicMock()
+        conn.__enter__.return_value.cursor.return_value = cur
+        with patch.object(dunning_queue, 'get_connection', return_value=conn), \
+             patch.object(dunning_queue, 'refresh_dunning_queue', side_effect=[2, 0]) as refresh:
+            counts = dunning_queue.refresh_all_dunning_queues()
+
+        assert 'UNION' in cur.execute.call_args[0][0]
+        assert 'FROM dunning_queue' in cur.execute.call_args[0][0]
+        assert counts == {'firm-a': 2, 'firm-gone': 0}
+        assert [c.args for c in refresh.call_args_list] == [('firm-a',), ('firm-gone',)]
+
+    @pytest.mark.skipif(not os.environ.get('DATABASE_URL'), reason='DATABASE_URL not set')
+    def test_refresh_dunning_queue_merges_sources(self):
+        """The SQL refresh upserts open invoices with aging/notice data and drops paid ones."""
+        import uuid
+        import psycopg2
+        from psycopg2.extras import RealDictCursor
+        from db.dunning_queue import (
+            BACKFILL_LATEST_AGING_BATCH_SQL, DUNNING_QUEUE_SCHEMA, SET_LATEST_AGING_BATCH_SQL,
+        )
+
+        schema = f"dq_test_{uuid.uuid4().hex[:8]}"
+        conn = psycopg2.connect(os.environ['DATABASE_URL'], cursor_factory=RealDictCursor)
+        conn.autocommit = True
+        cur = conn.cursor()
+        try:
+            cur.execute(f"CREATE SCHEMA {schema}; SET search_path TO {schema}")
+            cur.execute("""
+                CREATE TABLE cached_invoices (firm_id VARCHAR(36), id INTEGER, invoice_number TEXT,
+                    case_id INTEGER, contact_id INTEGER, balance_due REAL, due_date DATE);
+                CREATE TABLE cached_cases (firm_id VARCHAR(36), id INTEGER, name TEXT,
+                    lead_attorney_name TEXT, status TEXT, data_json TEXT);
+                CREATE TABLE cached_clients (firm_id VARCHAR(36), id INTEGER, first_name TEXT,
+                    last_name TEXT, email TEXT);
+                CREATE TABLE cached_contacts (firm_id VARCHAR(36), id INTEGER, name TEXT, email TEXT);
+                CREATE TABLE dunning_notices (firm_id VARCHAR(36), invoice_id INTEGER,
+                    notice_level INTEGER, sent_at TIMESTAMP);
+            """)
+            cur.execute(DUNNING_QUEUE_SCHEMA)
+            cur.execute("""
+                INSERT INTO cached_cases VALUES
+                    ('f1', 10, 'State v. Doe', 'Smith', 'Closed', '{"billing_contact": {"id": 7}}');
+                INSERT INTO cached_clients VALUES ('f1', 7, 'Jane', 'Doe', 'jane@example.com');
+                INSERT INTO cached_contacts VALUES ('f1', 8, 'Contact Only', 'c@example.com');
+                INSERT INTO cached_invoices VALUES
+                    ('f1', 1, 'INV-1', 10, 8, 500, CURRENT_DATE - 40),
+                    ('f1', 2, 'INV-2', NULL, 8, 0, CURRENT_DATE - 40),
+                    ('f1', 3, 'INV-3', NULL, 8, 75, NULL),
+                    ('f2', 1, 'OTHER', NULL, NULL, 900, CURRENT_DATE - 10);
+                INSERT INTO aging_invoice_uploads (firm_id, invoice_number, amount_overdue,
+                    invoice_total, upload_batch_id) VALUES ('f1', 'INV-1', 450, 600, 'b1');
+                INSERT INTO dunning_notices VALUES
+                    ('f1', 1, 1, NOW() - INTERVAL '20 days'), ('f1', 1, 2, NOW() - INTERVAL '5 days');
+            """)
+            cur.execute(BACKFILL_LATEST_AGING_BATCH_SQL)
+            cur.execute("SELECT latest_aging_batch FROM dunning_queue_state WHERE firm_id = 'f1'")
+            assert cur.fetchone()['latest_aging_batch'] == 'b1'
+
+            # A failed trigger marks the firm stale; only a full rebuild clears it
+            cur.execute("SELECT dunning_queue_mark_stale(ARRAY['f1']::VARCHAR[], 'boom')")
+            cur.execute("SELECT refresh_dunning_queue('f1', ARRAY[3]) AS n")
+            cur.execute("SELECT stale_since IS NOT NULL AS stale FROM dunning_queue_state WHERE firm_id = 'f1'")
+            assert cur.fetchone()['stale']
+
+            cur.execute("SELECT refresh_dunning_queue('f1', NULL) AS n")
+            assert cur.fetchone()['n'] == 1
+            cur.execute("SELECT stale_since, last_error FROM dunning_queue_state WHERE firm_id = 'f1'")
+            assert cur.fetchone() == {'stale_since': None, 'last_error': None}
+            cur.execute("SELECT * FROM dunning_queue ORDER BY firm_id, invoice_id")
+            rows = cur.fetchall()
+            assert len(rows) == 1
+            row = rows[0]
+            assert (row['firm_id'], row['invoice_id'], row['case_status']) == ('f1', 1, 'closed')
+            assert row['contact_name'] == 'Jane Doe' and row['contact_email'] == 'jane@example.com'
+            assert (row['aging_amount_due'], row['aging_invoice_total']) == (450, 600)
+            assert row['last_notice_level'] == 2
+
+            # The refresh joins the recorded batch, not the newest upload rows
+            cur.execute("""INSERT INTO aging_invoice_uploads (firm_id, invoice_number, amount_overdue,
+                invoice_total, upload_batch_id) VALUES ('f1', 'INV-1', 100, 600, 'b2')""")
+            cur.execute("SELECT refresh_dunning_queue('f1', NULL) AS n")
+            cur.execute("SELECT aging_amount_due FROM dunning_queue WHERE firm_id = 'f1'")
+            assert cur.fetchone()['aging_amount_due'] == 450
+            cur.execute(SET_LATEST_AGING_BATCH_SQL, {'firm_id': 'f1', 'batch_id': 'b2'})
+            cur.execute("SELECT refresh_dunning_queue('f1', NULL) AS n")
+            cur.execute("SELECT aging_amount_due FROM dunning_queue WHERE firm_id = 'f1'")
+            assert cur.fetchone()['aging_amount_due'] == 100
+
+            # Paying the invoice off removes it on the next (targeted) refresh
+            cur.execute("UPDATE cached_invoices SET balance_due = 0 WHERE firm_id = 'f1' AND id = 1")
+            cur.execute("SELECT refresh_dunning_queue('f1', ARRAY[1]) AS n")
+            assert cur.fetchone()['n'] == 0
+            cur.execute("SELECT COUNT(*) AS n FROM dunning_queue")
+            assert cur.fetchone()['n'] == 0
+        finally:
+            cur.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE")
+            conn.close()
+
     def test_dunning_route_exists(self):
         """Test that /dunning route is defined."""
         from dashboard.app import app
@@ -1186,6 +1453,1739 @@ class TestDashboardDunning:
         assert 'test-email' in result.output
 
 
+# ============================================================================
+# Keyset Pagination Tests
+# ============================================================================
+
+class TestHTTPCacheMiddleware:
+    """Tests for conditional GET and compression (dashboard.middleware.HTTPCacheMiddleware)."""
+
+    BIG = "x" * 4096
+
+    def _client(self, session=None):
+        from starlette.applications import Starlette
+        from starlette.responses import HTMLResponse
+        from starlette.routing import Route
+        from starlette.testclient import TestClient
+        from dashboard.middleware import HTTPCacheMiddleware
+
+        calls = []
+
+        async def page(request):
+            calls.append(request.url.path)
+            return HTMLResponse(request.query_params.get("body", self.BIG))
+
+        class FakeSession:
+            def __init__(self, app):
+                self.app = app
+
+            async def __call__(self, scope, receive, send):
+                scope["session"] = dict(session or {})
+                await self.app(scope, receive, send)
+
+        app = Starlette(routes=[Route("/page", page), Route("/revenue", page)])
+        app.add_middleware(HTTPCacheMiddleware)
+        app.add_middleware(FakeSession)
+        return TestClient(app), calls
+
+    def test_weak_etag_revalidates_with_304(self):
+        from dashboard.middleware import _etag_matches
+
+        client, _ = self._client()
+        first = client.get("/page")
+        etag = first.headers["etag"]
+        assert etag.startswith('W/"c')
+        assert client.get("/page", headers={"If-None-Match": etag}).status_code == 304
+        # Weak comparison: W/ prefixes are ignored, lists are searched
+        assert client.get("/page", headers={"If-None-Match": f'"x", {etag[2:]}'}).status_code == 304
+        assert client.get("/page", headers={"If-None-Match": '"other"'}).status_code == 200
+        assert _etag_matches("*", etag) and not _etag_matches(None, etag)
+
+    def test_encoding_negotiation_honours_q0(self):
+        import dashboard.middleware as middleware
+
+        with patch.object(middleware, "brotli", None):
+            assert middleware._choose_encoding("gzip, deflate, br") == "gzip"
+            assert middleware._choose_encoding("gzip;q=0, br") is None
+        with patch.object(middleware, "brotli", Mock()):
+            assert middleware._choose_encoding("gzip, br") == "br"
+            assert middleware._choose_encoding("gzip, br; q=0.0") == "gzip"
+        assert middleware._choose_encoding("identity") is None
+
+    def test_only_bodies_above_threshold_are_compressed(self):
+        import dashboard.middleware as middleware
+
+        client, _ = self._client()
+        with patch.object(middleware, "brotli", None):
+            small = client.get("/page?body=tiny", headers={"Accept-Encoding": "gzip"})
+            big = client.get("/page", headers={"Accept-Encoding": "gzip"})
+        assert "content-encoding" not in small.headers and small.text == "tiny"
+        assert big.headers["content-encoding"] == "gzip"
+        assert int(big.headers["content-length"]) < len(self.BIG)
+        assert big.text == self.BIG  # the client decodes it
+
+    def test_sync_etag_skips_handler_and_changes_with_build(self):
+        import dashboard.config as config
+        import dashboard.middleware as middleware
+
+        session = {"logged_in": True, "firm_id": "f1", "username": "u"}
+        client, calls = self._client(session)
+        with patch.object(middleware, "cached_sync_generation", return_value=3):
+            etag = client.get("/revenue").headers["etag"]
+            assert etag.startswith('W/"g')
+            assert client.get("/revenue", headers={"If-None-Match": etag}).status_code == 304
+            assert calls == ["/revenue"]
+            with patch.object(config, "APP_BUILD", "next-deploy"):
+                response = client.get("/revenue", headers={"If-None-Match": etag})
+        assert response.status_code == 200 and response.headers["etag"] != etag
+
+    def test_generation_cache_is_bounded(self):
+        import dashboard.config as config
+        import dashboard.middleware as middleware
+
+        with patch.object(middleware, "_generation_cache", type(middleware._generation_cache)()), \
+             patch.object(config, "SYNC_GENERATION_CACHE_MAX", 2), \
+             patch("db.cache.get_sync_generation", side_effect=lambda firm: len(firm)) as lookup:
+            for firm in ("a", "bb", "ccc", "ccc"):
+                middleware.cached_sync_generation(firm)
+            assert list(middleware._generation_cache) == ["bb", "ccc"]
+            assert lookup.call_count == 3
+            middleware.invalidate_sync_generation("ccc")
+            assert list(middleware._generation_cache) == ["bb"]
+
+
+class TestKeysetPagination:
+    """Tests for the shared keyset pagination helpers in db.pagination."""
+
+    def test_cursor_round_trip_preserves_types(self):
+        """Dates, datetimes and Decimals survive encoding."""
+        from decimal import Decimal
+        from db.pagination import encode_cursor, decode_cursor
+
+        keys = [date(2026, 1, 5), datetime(2026, 1, 5, 9, 30), Decimal("12.50"), 42]
+        state = decode_cursor(encode_cursor(keys, total_estimate=900), width=4)
+
+        assert state['keys'] == keys
+        assert state['total'] == 900
+
+    def test_invalid_cursor_restarts_from_first_page(self):
+        """Garbage or wrong-width tokens decode to None."""
+        from db.pagination import encode_cursor, decode_cursor
+
+        assert decode_cursor("not-a-cursor", width=2) is None
+        assert decode_cursor(encode_cursor([1, 2, 3]), width=2) is None
+
+    def test_page_size_is_clamped(self):
+        from db.pagination import clamp_page_size, PAGE_SIZE_DEFAULT, PAGE_SIZE_MAX
+
+        assert clamp_page_size(None) == PAGE_SIZE_DEFAULT
+        assert clamp_page_size(0) == 1
+        assert clamp_page_size(10_000) == PAGE_SIZE_MAX
+
+    def test_keyset_predicate_shapes(self):
+        """Uniform direction uses a row comparison; mixed directions expand."""
+        from db.pagination import keyset_predicate
+
+        sql, params = keyset_predicate([("created_at", "DESC"), ("id", "DESC")], ["t", 7])
+        assert sql == "(created_at, id) < (%s, %s)"
+        assert params == ("t", 7)
+
+        sql, params = keyset_predicate([("days", "ASC"), ("balance", "DESC")], [30, 100])
+        assert sql == "(days >= %s AND ((days > %s) OR (days = %s AND balance < %s)))"
+        assert params == (30, 30, 30, 100)
+
+    def test_paginate_returns_next_cursor_and_strips_keys(self):
+        """One extra row signals another page; sort keys are removed from items."""
+        from db.pagination import paginate, decode_cursor
+
+        cur = MagicMock()
+        cur.fetchall.return_value = [(1, 'a', 1), (2, 'b', 2), (3, 'c', 3)]
+        cur.fetchone.return_value = (3,)
+
+        page = paginate(cur, "SELECT id, name FROM t", (), [("id", "ASC")], page_size=2)
+
+        assert page.items == [(1, 'a'), (2, 'b')]
+        assert page.has_more
+        assert page.total_estimate == 3
+        assert decode_cursor(page.next_cursor, width=1) == {'keys': [2], 'total': 3}
+
+        cur.fetchall.return_value = [{'id': 3, 'name': 'c', '_page_k0': 3}]
+        last = paginate(cur, "SELECT id, name FROM t", (), [("id", "ASC")],
+                        cursor=page.next_cursor, page_size=2)
+        assert last.items == [{'id': 3, 'name': 'c'}]
+        assert not last.has_more
+        assert last.total_estimate == 3
+        assert "(id) > (%s)" in cur.execute.call_args[0][0]
+
+    def test_open_invoice_search_and_aging_filter_in_sql(self):
+        """Filters apply to the query, not the rendered page, so they span all pages."""
+        from dashboard.models.ar import ARDataMixin
+
+        model = ARDataMixin()
+        model.firm_id = "f1"
+        sql, params = model._open_invoices_query(30, search="O'Brien 50%", aging="60-90")
+        assert "ILIKE %s" in sql
+        assert params == ("f1", 30, "%O'Brien 50\\%%", 60, 89)
+        assert model._open_invoices_query()[1] == ("f1", 0)
+        assert model._open_invoices_query(aging="unknown")[1] == ("f1", 0)
+
+    @pytest.mark.skipif(not os.environ.get('DATABASE_URL'), reason='DATABASE_URL not set')
+    def test_deep_ar_pages_use_sort_indexes(self):
+        """A page deep into the open invoice / dunning lists is an index scan, not a sort."""
+        import json
+        import uuid
+        import psycopg2
+        from db.cache import CACHE_SCHEMA
+        from db.dunning_queue import DUNNING_QUEUE_SCHEMA
+        from db.pagination import encode_cursor, paginate
+        from dashboard.models.ar import ARDataMixin
+
+        model = ARDataMixin()
+        model.firm_id = "f1"
+        cursor = encode_cursor([date.today() - timedelta(days=400), 100.0, 5000])
+        queries = []
+        for sql, params, order in (model._open_invoices_query(0) + (model.OPEN_INVOICES_ORDER,),
+                                   model._dunning_queue_query() + (model.DUNNING_QUEUE_ORDER,)):
+            fake = MagicMock()
+            fake.fetchall.return_value = []
+            paginate(fake, sql, params, order, cursor=cursor, page_size=50)
+            queries.append(fake.execute.call_args[0])
+
+        schema = f"page_test_{uuid.uuid4().hex[:8]}"
+        conn = psycopg2.connect(os.environ['DATABASE_URL'])
+        conn.autocommit = True
+        cur = conn.cursor()
+        try:
+            cur.execute(f"CREATE SCHEMA {schema}; SET search_path TO {schema}")
+            cur.execute(CACHE_SCHEMA)
+            cur.execute("CREATE TABLE dunning_notices (firm_id VARCHAR(36), invoice_id INTEGER, "
+                        "notice_level INTEGER, sent_at TIMESTAMP)")
+            cur.execute(DUNNING_QUEUE_SCHEMA)
+            cur.execute("""
+                INSERT INTO cached_invoices (firm_id, id, invoice_number, balance_due, due_date)
+                SELECT f, n, 'INV-' || n, (n % 997) + 1, CURRENT_DATE - (n % 900)
+                FROM generate_series(1, 20000) n, (VALUES ('f1'), ('f2')) firms(f);
+                INSERT INTO dunning_queue (firm_id, invoice_id, balance_due, due_date)
+                SELECT firm_id, id, balance_due, due_date FROM cached_invoices;
+                ANALYZE cached_invoices; ANALYZE dunning_queue;
+            """)
+            for (sql, params), index in zip(queries, ("idx_ci_open_page", "idx_dq_firm_page")):
+                cur.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+                plan = json.dumps(cur.fetchone()[0])
+                assert index in plan, plan
+                assert '"Node Type": "Sort"' not in plan and "Top-N" not in plan, plan
+        finally:
+            cur.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE")
+            conn.close()
+
+    def test_phone_events_still_accept_offset(self):
+        import asyncio
+        import dashboard.routes.phone as phone
+
+        request = Mock(session={"firm_id": "f1"})
+        with patch.object(phone, "is_authenticated", return_value=True), \
+             patch.object(phone, "get_current_role", return_value="admin"), \
+             patch.object(phone, "get_current_firm_id", return_value="f1"), \
+             patch("db.phone.get_call_events", return_value=[{"id": 1}]) as legacy:
+            response = asyncio.run(phone.phone_events_list(request, limit=10, offset=20))
+            assert response.status_code == 200
+            assert response.headers["Deprecation"] == "true"
+            legacy.assert_called_once_with("f1", limit=10, offset=20)
+
+            response = asyncio.run(phone.phone_events_list(request, cursor="abc", offset=20))
+            assert response.status_code == 400
+
+
+class TestStreamingExports:
+    """Tests for dashboard.exports streaming helpers."""
+
+    def test_csv_chunks_header_first_then_rows(self):
+        """The header is its own first chunk; rows are consumed lazily."""
+        from dashboard.exports import csv_chunks
+
+        consumed = []
+
+        def rows():
+            for i in range(3):
+                consumed.append(i)
+                yield [i, f"row {i}"]
+
+        chunks = csv_chunks(["ID", "Name"], rows())
+        assert next(chunks) == b"ID,Name\r\n"
+        assert consumed == []
+        assert b"".join(chunks) == b"0,row 0\r\n1,row 1\r\n2,row 2\r\n"
+
+    def test_unsupported_format_is_rejected(self):
+        from dashboard.exports import export_response
+
+        resp = export_response(["A"], iter([]), "x", fmt="pdf")
+        assert resp.status_code == 400
+
+    def test_trust_csv_export_writes_given_lines(self, tmp_path):
+        """The trust export writes the lines it is given with the shared header."""
+        import csv
+        import trust_transfer
+
+        line = trust_transfer.TrustTransferLine(
+            case_id=7, case_name="State v. Doe", case_type="DWI", client_name="Jane Doe",
+            lead_attorney="Smith", current_phase="discovery", phase_label="Discovery",
+            total_fee=5000.0, paid_to_date=2000.0, pct_paid=40.0, phase_target_pct=50,
+            billing_gap=500.0, outstanding_balance=3000.0, schedule_label="DWI")
+        path = tmp_path / "trust.csv"
+
+        assert trust_transfer.export_trust_report_csv(iter([line, line]), str(path)) == 2
+        with open(path, newline="") as f:
+            rows = list(csv.reader(f))
+        assert rows[0] == trust_transfer.TRUST_EXPORT_HEADER
+        assert rows[1][:3] == ["7", "State v. Doe", "Jane Doe"]
+        assert len(rows) == 3
+
+        empty = tmp_path / "empty.csv"
+        assert trust_transfer.export_trust_report_csv([], str(empty)) == 0
+        assert not empty.exists()
+
+    def test_trust_cli_export_reuses_report_lines(self, tmp_path, monkeypatch):
+        """trust report --export-csv writes the report it already built; no second query."""
+        from click.testing import CliRunner
+        import commands.trust as trust_cmd
+        import trust_transfer
+
+        line = trust_transfer.TrustTransferLine(
+            case_id=7, case_name="State v. Doe", case_type="DWI", client_name="Jane Doe",
+            lead_attorney="Smith", current_phase="discovery", phase_label="Discovery",
+            total_fee=5000.0, paid_to_date=2000.0, pct_paid=40.0, phase_target_pct=50,
+            billing_gap=500.0, outstanding_balance=3000.0, schedule_label="DWI")
+        totals = {"count": 1, "total_fee": 5000.0, "paid": 2000.0, "billing_gap": 500.0}
+        report = {"lines": [line], "summary": {
+            "case_count": 1, "total_fees": 5000.0, "total_paid": 2000.0, "pct_paid": 40.0,
+            "total_billing_gap": 500.0, "total_outstanding": 3000.0,
+            "by_schedule": {"DWI": totals}, "by_phase": {"Discovery": totals},
+        }}
+        monkeypatch.chdir(tmp_path)
+
+        with patch.object(trust_cmd, "generate_trust_transfer_report", return_value=report) as gen, \
+                patch.object(trust_transfer, "iter_trust_transfer_lines") as stream, \
+                patch.object(trust_cmd, "export_trust_report_csv", return_value=1) as export:
+            result = CliRunner().invoke(trust_cmd.trust, ["report", "--firm-id", "f1", "--export"])
+
+        assert result.exit_code == 0, result.output
+        gen.assert_called_once_with("f1")
+        stream.assert_not_called()
+        assert export.call_args[0][0] is report["lines"]
+
+
+class TestLazyPanels:
+    """Tests for lazily loaded page panels (dashboard.panels)."""
+
+    def test_heavy_pages_register_panels(self):
+        import dashboard.routes.main, dashboard.routes.ar  # noqa: F401
+        import dashboard.routes.attorneys, dashboard.routes.trends  # noqa: F401
+        from dashboard.panels import PANELS
+
+        for key in [("home", "sop"), ("home", "key_metrics"), ("ar", "summary"),
+                    ("ar", "open_invoices"), ("attorneys", "table"), ("trends", "overview")]:
+            assert key in PANELS
+        assert "collections" in PANELS[("home", "sop")].deny_roles
+
+    def test_slow_panel_times_out_then_serves_from_cache(self):
+        """An overrunning loader keeps going; the retry gets its cached result."""
+        import asyncio
+        import time
+        from dashboard.panels import Panel, render_panel, cache_key, _inflight
+
+        calls = []
+
+        def slow_loader(data, params):
+            calls.append(1)
+            time.sleep(0.3)
+            return {"status": "error"}
+
+        p = Panel(page="test", name="slow", template="components/panel_status.html",
+                  loader=slow_loader, timeout=0.05, ttl=60)
+        key = cache_key(p, {"firm_id": "f1", "username": "u"}, {}, generation=1)
+
+        status, _ = asyncio.run(render_panel(p, key, None, {}, {}))
+        assert status == "timeout"
+
+        future = _inflight.get(key)
+        if future:
+            future.result()  # let the background build finish
+        status, html = asyncio.run(render_panel(p, key, None, {}, {}))
+        assert status == "ok"
+        assert "could not be loaded" in html
+        assert len(calls) == 1
+
+    def test_cache_key_tracks_sync_generation(self):
+        from dashboard.panels import Panel, cache_key
+
+        p = Panel(page="home", name="sop", template="x.html", loader=dict, timeout=1, ttl=1)
+        session = {"firm_id": "f1", "username": "u", "role": "admin"}
+        assert cache_key(p, session, {"year": "2026"}, 1) != cache_key(p, session, {"year": "2026"}, 2)
+        assert cache_key(p, session, {"year": "2026"}, 1) != cache_key(p, dict(session, firm_id="f2"), {"year": "2026"}, 1)
+
+
+class TestSyncEvents:
+    """Tests for pushed sync progress (db.sync_events, dashboard.sync_events)."""
+
+    def test_publish_is_best_effort(self):
+        from db.sync_events import publish_sync_event
+
+        with patch("db.sync_events.get_connection", side_effect=RuntimeError("db down")):
+            assert publish_sync_event("f1", "started", entities=["cases"]) is False
+        assert publish_sync_event(None, "started") is False
+
+    def test_parse_event_rejects_malformed_payloads(self):
+        from db.sync_events import parse_event
+
+        assert parse_event('{"firm_id": "f1", "event": "completed"}')["firm_id"] == "f1"
+        assert parse_event("not json") is None
+        assert parse_event('{"event": "completed"}') is None
+
+    def test_hub_fans_out_to_firm_and_invalidates_generation(self):
+        import asyncio
+        from dashboard.sync_events import SyncEventHub
+        from dashboard.middleware import _generation_cache
+
+        hub = SyncEventHub()
+        hub._ensure_listener = lambda: None  # no LISTEN connection in tests
+
+        async def scenario():
+            mine, other = hub.subscribe("f1"), hub.subscribe("f2")
+            _generation_cache["f1"] = (float("inf"), 7)
+            hub.handle_event({"firm_id": "f1", "event": "completed", "total_changes": 3})
+            event = await asyncio.wait_for(mine.get(), timeout=1)
+            hub.unsubscribe("f1", mine)
+            return event, other.empty()
+
+        event, other_empty = asyncio.run(scenario())
+        assert event["total_changes"] == 3
+        assert other_empty
+        assert "f1" not in _generation_cache
+        assert hub.latest("f1")["event"] == "completed"
+
+
+class TestCaseBundles:
+    """Tests for the set-based case bundle loader (db.case_bundle)."""
+
+    @staticmethod
+    def _fake_connection(case_ids, executed):
+        from contextlib import contextmanager
+        import db.case_bundle as cb
+
+        class Cursor:
+            def execute(self, sql, params):
+                executed.append(sql)
+                if sql is cb.CASE_SQL:
+                    self.rows = [{"id": i, "status": "open",
+                                  "data_json": '{"clients": [{"id": 9}]}'} for i in case_ids]
+                elif sql is cb.CLIENTS_SQL:
+                    self.rows = [{"id": 9, "name": "Jane Doe"}]
+                elif sql is cb.RELATIONS["invoices"]:
+                    self.rows = [{"case_id": i, "balance_due": 50.0} for i in case_ids]
+                elif sql is cb.RELATIONS["phase_history"]:
+                    self.rows = [{"case_id": i, "phase_name": "Intake", "exited_at": None} for i in case_ids]
+                else:
+                    self.rows = []
+
+            def fetchall(self):
+                return self.rows
+
+        @contextmanager
+        def get_connection():
+            yield Mock(cursor=Cursor)
+
+        return get_connection
+
+    def test_query_count_is_independent_of_case_count(self):
+        import db.case_bundle as cb
+
+        counts = []
+        for case_ids in ([1], list(range(1, 51))):
+            executed = []
+            with patch.object(cb, "get_connection", self._fake_connection(case_ids, executed)):
+                bundles = cb.load_case_bundles("f1", case_ids)
+            assert sorted(bundles) == case_ids
+            counts.append(len(executed))
+        assert counts[0] == counts[1] == len(cb.RELATIONS) + 2
+
+        bundle = bundles[1]
+        assert bundle.balance_due == 50.0
+        assert bundle.current_phase == "Intake"
+        assert bundle.clients == [{"id": 9, "name": "Jane Doe"}]
+
+    def test_include_limits_relations(self):
+        import db.case_bundle as cb
+
+        executed = []
+        with patch.object(cb, "get_connection", self._fake_connection([1], executed)):
+            bundle = cb.load_case_bundle("f1", 1, include=("invoices",))
+        assert len(executed) == 2
+        assert bundle.invoices and not bundle.clients
+        with pytest.raises(ValueError):
+            cb.load_case_bundles("f1", [1], include=("notes",))
+
+
+class TestStagedUploads:
+    """Tests for COPY-based upload staging (dashboard.ingest, db.ingest)."""
+
+    def test_csv_upload_is_normalized_for_staging(self):
+        import io
+        import dashboard.ingest as ingest
+
+        staged = []
+
+        def fake_copy(job_id, kind, rows):
+            staged.extend(rows)
+            return len(staged)
+
+        csv_bytes = ("\ufeffInvoice Number,Client,Balance Due,Due Date,Days\n"
+                     "INV-1,Jane Doe,\"$1,234.50\",01/15/2026,45\n"
+                     ",No Invoice,$5,,\n").encode("utf-8")
+        with patch.object(ingest, "copy_staging_rows", fake_copy):
+            count = ingest.stage_upload("job-1", "aging", io.BytesIO(csv_bytes), "aging.csv")
+
+        assert count == 2  # blank invoice numbers are dropped by the merge, not the parser
+        assert staged[0][:4] == ("INV-1", "Jane Doe", "", 1234.5)
+        assert staged[0][6] == "2026-01-15"
+        assert staged[0][8] == 45
+
+    def test_rejects_unsupported_file_types(self):
+        import io
+        from dashboard.ingest import stage_upload, UploadError
+
+        with pytest.raises(UploadError):
+            stage_upload("job-1", "trust", io.BytesIO(b"x"), "ledger.pdf")
+
+    def test_copy_runs_once_per_chunk(self):
+        from contextlib import contextmanager
+        import db.ingest as db_ingest
+
+        cursor = MagicMock()
+
+        @contextmanager
+        def get_connection():
+            yield Mock(cursor=lambda: cursor)
+
+        rows = [("C-%d" % i, "Case", "Client", 10.0) for i in range(25)]
+        with patch.object(db_ingest, "get_connection", get_connection):
+            assert db_ingest.copy_staging_rows("job-1", "trust", rows, chunk_rows=10) == 25
+        assert cursor.copy_expert.call_count == 3
+        first_chunk = cursor.copy_expert.call_args_list[0][0][1].getvalue().splitlines()
+        assert first_chunk[0] == "job-1,0,C-0,Case,Client,10.0"
+
+    def test_aging_merge_records_latest_batch(self):
+        """The merge stores its batch for dunning refreshes, then refreshes the firm."""
+        import db.ingest as db_ingest
+        from db.dunning_queue import SET_LATEST_AGING_BATCH_SQL
+
+        cursor = MagicMock()
+        cursor.fetchone.return_value = {"firm_id": "f1", "kind": "aging"}
+        cursor.rowcount = 12
+        conn = MagicMock()
+        conn.__enter__.return_value.cursor.return_value = cursor
+        with patch.object(db_ingest, "get_connection", return_value=conn), \
+             patch.object(db_ingest, "update_upload_job"), \
+             patch("db.dunning_queue.refresh_dunning_queue") as refresh:
+            result = db_ingest.merge_upload_job("job-1")
+
+        statements = [c.args for c in cursor.execute.call_args_list]
+        batch = [params for sql, *params in statements if sql == SET_LATEST_AGING_BATCH_SQL]
+        assert batch == [[{"firm_id": "f1", "job_id": "job-1", "batch_id": result["batch_id"]}]]
+        refresh.assert_called_once_with("f1")
+
+
+class TestChatQuerySandbox:
+    """Tests for the chat SQL sandbox (db.chat_sandbox)."""
+
+    @staticmethod
+    def _fake_sandbox(cost, rows, executed):
+        from contextlib import contextmanager
+
+        class Cursor:
+            description = [("n",)]
+            itersize = 0
+
+            def __init__(self):
+                self._rows = list(rows)
+
+            def execute(self, sql, params=None):
+                executed.append(str(sql))
+
+            def fetchone(self):
+                return ([{"Plan": {"Total Cost": cost}}],)
+
+            def fetchmany(self, n):
+                batch, self._rows = self._rows[:n], self._rows[n:]
+                return batch
+
+            def close(self):
+                pass
+
+        @contextmanager
+        def sandbox():
+            yield Mock(cursor=lambda *a, **k: Cursor())
+
+        return sandbox
+
+    def test_only_single_select_statements(self):
+        from db.chat_sandbox import normalize_chat_sql, ChatQueryRejected
+
+        assert normalize_chat_sql("SELECT 1;") == "SELECT 1"
+        assert normalize_chat_sql(" with t as (select 1) select * from t").startswith("with")
+        for bad in ("DELETE FROM cached_cases", "SELECT 1; DROP TABLE x", "", None):
+            with pytest.raises(ChatQueryRejected):
+                normalize_chat_sql(bad)
+
+    def test_expensive_queries_rejected_before_execution(self):
+        import db.chat_sandbox as sandbox
+
+        executed = []
+        with patch.object(sandbox, "_sandbox_connection", self._fake_sandbox(1e9, [], executed)):
+            with pytest.raises(sandbox.ChatQueryRejected):
+                sandbox.run_chat_query("SELECT * FROM cached_invoices", "f1")
+        assert executed[-1].startswith("EXPLAIN")
+        assert not any(q == "SELECT * FROM cached_invoices" for q in executed)
+
+    def test_rows_are_capped_and_firm_is_scoped(self):
+        import db.chat_sandbox as sandbox
+
+        executed = []
+        rows = [(i,) for i in range(50)]
+        with patch.object(sandbox, "_sandbox_connection", self._fake_sandbox(10, rows, executed)):
+            result, truncated = sandbox.run_chat_query("SELECT n FROM t", "f1", max_rows=20)
+        assert len(result) == 20 and truncated
+        assert result[0] == {"n": 0}
+        assert "SET TRANSACTION READ ONLY" in executed
+        with pytest.raises(sandbox.ChatQueryRejected):
+            sandbox.run_chat_query("SELECT 1", None)
+
+    def test_firm_setting_cannot_be_overridden(self):
+        import db.chat_sandbox as sandbox
+
+        attempts = (
+            "WITH x AS MATERIALIZED (SELECT set_config('app.firm_id', 'other', true)) "
+            "SELECT * FROM x, cached_invoices",
+            'SELECT * FROM cached_invoices, (SELECT pg_catalog."set_config"(\'app.firm_id\', \'other\', true)) s',
+            "SELECT current_setting('app.firm_id')",
+            "WITH s AS (SELECT * FROM pg_settings) SELECT * FROM s",
+            'SELECT * FROM cached_invoices, (SELECT U&"\\0073et_config"(\'app.firm_id\', \'other\', true)) s',
+        )
+        executed = []
+        with patch.object(sandbox, "_sandbox_connection", self._fake_sandbox(10, [], executed)):
+            for sql in attempts:
+                with pytest.raises(sandbox.ChatQueryRejected):
+                    sandbox.run_chat_query(sql, "f1")
+        assert executed == []
+        assert sandbox.normalize_chat_sql("SELECT settings_page FROM cached_cases")
+
+    def test_chat_route_helper_has_no_default_firm(self, monkeypatch):
+        """Without a session firm the query is refused, not run for the env's firm."""
+        import db.chat_sandbox as sandbox
+        from dashboard.routes.api import execute_chat_query
+
+        monkeypatch.setenv("DASHBOARD_FIRM_ID", "jcs_law")
+        executed = []
+        rows = [(1,)] * (sandbox.CHAT_QUERY_MAX_ROWS + 1)
+        with patch.object(sandbox, "_sandbox_connection", self._fake_sandbox(10, rows, executed)):
+            result, error, truncated = execute_chat_query("SELECT n FROM t", None)
+            assert result == [] and "No firm context" in error and not truncated
+            assert executed == []
+
+            result, error, truncated = execute_chat_query("SELECT n FROM t", "f1")
+        assert error is None and len(result) == sandbox.CHAT_QUERY_MAX_ROWS and truncated
+
+
+class TestChatAnswerCache:
+    """Tests for the per-firm chat answer cache (db.chat_cache)."""
+
+    def test_near_duplicates_match_but_numbers_must_agree(self):
+        from db.chat_cache import normalize_question, question_similarity
+
+        a = normalize_question("What's our AR over 90 days?")
+        assert a == normalize_question("what is our A/R over 90 days")
+        b = normalize_question("Tell me AR older than 90 days please")
+        assert question_similarity(a, b) == 1.0
+        assert question_similarity(a, normalize_question("AR over 60 days")) == 0.0
+
+    def test_count_list_and_total_questions_do_not_collide(self):
+        from db.chat_cache import normalize_question, question_similarity
+
+        count = normalize_question("How many invoices are over 90 days?")
+        listing = normalize_question("Show invoices over 90 days")
+        total = normalize_question("How much is invoiced over 90 days?")
+        assert len({count, listing, total}) == 3
+        assert question_similarity(count, listing) == 0.0
+        assert question_similarity(listing, total) == 0.0
+        assert listing == normalize_question("list invoices older than 90 days")
+
+    def test_cached_answer_reused_until_sync_generation_changes(self):
+        import dashboard.routes.api as api
+
+        hit = {"id": 1, "sql": "SELECT 1 AS n", "explanation": "", "response": "old", "sync_generation": 5}
+        with patch("db.chat_cache.lookup_chat_answer", return_value=hit), \
+             patch("db.chat_cache.refresh_chat_answer") as refresh, \
+             patch("dashboard.middleware.cached_sync_generation", return_value=5), \
+             patch.object(api, "execute_chat_query") as run:
+            assert api._cached_chat_answer("f1", "q") == ("old", 5)
+            run.assert_not_called()
+
+        with patch("db.chat_cache.lookup_chat_answer", return_value=hit), \
+             patch("db.chat_cache.refresh_chat_answer") as refresh, \
+             patch("dashboard.middleware.cached_sync_generation", return_value=6), \
+             patch.object(api, "execute_chat_query", return_value=([{"n": 2}], None, False)):
+            response, generation = api._cached_chat_answer("f1", "q")
+        assert "| n |" in response and generation == 6
+        refresh.assert_called_once()
+
+
+class TestSharedLLMClient:
+    """Tests for the shared LLM transport (skills.llm)."""
+
+    @staticmethod
+    def _message(text):
+        return Mock(content=[Mock(text=text)])
+
+    def test_async_completions_run_concurrently(self):
+        import asyncio
+        import time
+        import skills.llm as llm
+
+        async def slow_create(**params):
+            await asyncio.sleep(0.1)
+            return self._message(params["messages"][0]["content"].upper())
+
+        client = Mock()
+        client.messages.create = slow_create
+
+        async def run():
+            return await asyncio.gather(*[
+                llm.acomplete("firm-concurrent", [{"role": "user", "content": q}])
+                for q in ("a", "b", "c")
+            ])
+
+        with patch.object(llm, "get_async_claude_client", return_value=client):
+            start = time.monotonic()
+            assert asyncio.run(run()) == ["A", "B", "C"]
+        assert time.monotonic() - start < 0.25
+
+    def test_firm_concurrency_limit(self):
+        import asyncio
+        import skills.llm as llm
+
+        async def run():
+            async with llm.afirm_slot("firm-limited"):
+                with pytest.raises(llm.LLMBusy):
+                    async with llm.afirm_slot("firm-limited", timeout=0.01):
+                        pass
+                async with llm.afirm_slot("firm-other", timeout=0.01):
+                    pass
+
+        with patch.object(llm, "LLM_FIRM_CONCURRENCY", 1):
+            asyncio.run(run())
+
+    def test_sync_complete_streams_chunks(self):
+        import skills.llm as llm
+
+        stream = MagicMock()
+        stream.__enter__.return_value.text_stream = iter(["Mo", "tion"])
+        client = Mock()
+        client.messages.stream.return_value = stream
+
+        seen = []
+        text = llm.complete("firm-stream", [{"role": "user", "content": "draft"}],
+                            on_text=seen.append, client=client)
+        assert text == "Motion" and seen == ["Mo", "tion"]
+        client.messages.create.assert_not_called()
+
+    def test_document_chat_streams_per_call(self):
+        """Concurrent chat() calls on one engine each stream to their own callback."""
+        import threading
+        import document_chat
+
+        with patch("attorney_profiles.get_primary_attorney", return_value=None):
+            engine = document_chat.DocumentChatEngine(firm_id="f1")
+        barrier = threading.Barrier(2)
+
+        def fake_chat(message, session_id=None):
+            barrier.wait(timeout=5)
+            document_chat._on_text.get()(message)
+            return message
+
+        seen = {"a": [], "b": []}
+        with patch.object(engine, "_chat", side_effect=fake_chat):
+            threads = [threading.Thread(target=engine.chat, args=(key,), kwargs={"on_text": seen[key].append})
+                       for key in seen]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        assert seen == {"a": ["a"], "b": ["b"]}
+        assert document_chat._on_text.get() is None
+
+
+class TestPromptCaching:
+    """Tests for cacheable prompt prefixes and cache-hit metrics (skills.llm)."""
+
+    def test_static_prefix_is_marked_for_caching(self):
+        import skills.llm as llm
+
+        blocks = llm.prompt_blocks("schema and instructions", "per-call context")
+        assert blocks[0]["cache_control"] == {"type": "ephemeral"}
+        assert "cache_control" not in blocks[1]
+
+        params = llm._request(Mock(), [], "plain system prompt", "claude-opus-4-7", 10)
+        assert params["system"][0]["cache_control"] == {"type": "ephemeral"}
+
+    def test_cache_hits_are_recorded(self):
+        import skills.llm as llm
+
+        client = Mock()
+        client.messages.create.side_effect = [
+            Mock(content=[Mock(text="a")], usage=Mock(
+                input_tokens=50, output_tokens=5,
+                cache_creation_input_tokens=2000, cache_read_input_tokens=0)),
+            Mock(content=[Mock(text="b")], usage=Mock(
+                input_tokens=50, output_tokens=5,
+                cache_creation_input_tokens=0, cache_read_input_tokens=2000)),
+        ]
+        llm.reset_llm_stats()
+        for _ in range(2):
+            llm.complete("firm-cache", [{"role": "user", "content": "q"}],
+                         system="x" * 100, client=client, feature="test")
+        stats = llm.get_llm_stats()["test"]
+        assert stats["calls"] == 2
+        assert stats["cache_read_input_tokens"] == 2000
+        assert stats["cache_hit_rate"] == round(2000 / 4100, 3)
+
+
+class TestSkillBatch:
+    """Tests for concurrent SkillManager.run_batch / batch_execute."""
+
+    @staticmethod
+    def _manager():
+        from skills.base import SkillManager, SkillResult, Classification
+
+        with patch("skills.llm.get_shared_claude_client", return_value=Mock()):
+            manager = SkillManager()
+        manager.skills["echo"] = Mock()
+
+        def execute(skill_name, item, context=None):
+            import time
+            time.sleep(0.1)
+            if item == "bad":
+                raise ValueError("unparseable")
+            return SkillResult(classification=Classification.GREEN, summary=item)
+
+        manager.execute = execute
+        return manager
+
+    def test_runs_concurrently_with_partial_failures(self):
+        import time
+
+        manager = self._manager()
+        start = time.monotonic()
+        outcomes = manager.run_batch("echo", ["a", "bad", "c", "d"], max_parallel=4)
+        assert time.monotonic() - start < 0.3
+        assert [o.status for o in outcomes] == ["ok", "failed", "ok", "ok"]
+        assert [o.result.summary for o in outcomes if o.ok] == ["a", "c", "d"]
+        assert all(o.seconds >= 0.1 for o in outcomes)
+
+        with pytest.raises(ValueError):
+            manager.batch_execute("echo", ["a", "bad"])
+
+    def test_cancel_skips_unstarted_items(self):
+        import threading
+
+        cancel = threading.Event()
+        cancel.set()
+        outcomes = self._manager().run_batch("echo", ["a", "b"], cancel_event=cancel)
+        assert [o.status for o in outcomes] == ["cancelled", "cancelled"]
+
+    def test_rate_budget_spaces_requests_after_burst(self):
+        from skills.llm import RateBudget
+
+        budget = RateBudget(per_minute=60, burst=2)
+        delays = [budget.reserve() for _ in range(3)]
+        assert delays[0] == 0 and delays[1] == 0
+        assert 0.9 < delays[2] <= 1.0
+
+
+class TestSkillMemo:
+    """Tests for content-addressed skill result memoization (db.skill_memo)."""
+
+    def test_key_normalizes_inputs(self):
+        from db.skill_memo import memo_key
+
+        a = memo_key("f1", "charge_extraction", "1", "m", {"b": 1, "a": "x"}, None)
+        assert a == memo_key("f1", "charge_extraction", "1", "m", {"a": "x", "b": 1}, None)
+        assert memo_key("doc\r\nline  \n") == memo_key("doc\nline")
+        assert a != memo_key("f1", "charge_extraction", "2", "m", {"a": "x", "b": 1}, None)
+        assert a != memo_key("f2", "charge_extraction", "1", "m", {"a": "x", "b": 1}, None)
+
+    def test_execute_reuses_memoized_result(self):
+        from dataclasses import dataclass
+        from skills.base import LegalSkill, SkillManager, SkillResult, Classification
+
+        @dataclass
+        class EchoSkill(LegalSkill):
+            name: str = "echo"
+            description: str = "echo"
+
+            @property
+            def system_prompt(self):
+                return "Echo"
+
+            def parse_response(self, response):
+                return SkillResult(classification=Classification.GREEN, summary=response)
+
+        store = {}
+        with patch("skills.llm.get_shared_claude_client", return_value=Mock()):
+            manager = SkillManager(firm_id="f1", memoize=True)
+        manager.register(EchoSkill())
+
+        with patch("db.skill_memo.get_memo", side_effect=lambda k: store.get(k)), \
+             patch("db.skill_memo.put_memo",
+                   side_effect=lambda k, *a, result=None, **kw: store.__setitem__(k, {"result": result, "blob": None})), \
+             patch("skills.llm.complete", return_value="charged") as llm_call:
+            first = manager.execute("echo", "Count I: DWI")
+            second = manager.execute("echo", "Count I: DWI  ")
+            manager.execute("echo", "Count I: DWI", refresh=True)
+
+        assert llm_call.call_count == 2
+        assert second.summary == first.summary == "charged"
+        assert second.metadata["memoized"] is True and "memoized" not in first.metadata
+
+    def test_docx_render_memo_skips_fallback_renders(self, tmp_path):
+        """Only docx-js renders are stored, so a python-docx fallback isn't reused."""
+        from skills.document_generation import DocumentGenerator
+
+        generator = DocumentGenerator(templates_db=Mock())
+        store = {}
+
+        def fallback(content, path):
+            path.write_bytes(b"python-docx")
+
+        def docxjs(content, path):
+            path.write_bytes(b"docx-js")
+            return True
+
+        with patch("db.skill_memo.get_memo", side_effect=lambda k: store.get(k)), \
+             patch("db.skill_memo.put_memo",
+                   side_effect=lambda k, *a, blob=None, **kw: store.__setitem__(k, {"blob": blob})), \
+             patch.object(generator, "_generate_with_python_docx", side_effect=fallback):
+            with patch.object(generator, "_generate_with_docxjs", return_value=False):
+                generator._generate_docx("Body", "Motion", 1, None, tmp_path / "a")
+            assert store == {}
+
+            with patch.object(generator, "_generate_with_docxjs", side_effect=docxjs) as js:
+                generator._generate_docx("Body", "Motion", 1, None, tmp_path / "b")
+                path = generator._generate_docx("Body", "Motion", 1, None, tmp_path / "c")
+            assert js.call_count == 1
+            assert path.read_bytes() == b"docx-js"
+
+
+class TestDocSessionStore:
+    """Tests for the shared document chat session store (dashboard.doc_sessions)."""
+
+    def _session(self, sid="s1", **kw):
+        from document_chat import DocumentSession, ConversationState, DetectedVariable
+
+        return DocumentSession(
+            session_id=sid, firm_id="f1", state=ConversationState.COLLECTING_VARIABLES,
+            template_id=7, template_name="Motion", template_content=b"TEMPLATE",
+            detected_variables=[DetectedVariable(
+                name="defendant_name", display_name="Defendant", description="Defendant",
+                sample_value="JOHN DOE")],
+            collected_values={"defendant_name": "John Smith"},
+            messages=[{"role": "user", "content": "motion to dismiss"}], **kw,
+        )
+
+    def test_state_round_trip_excludes_bytes(self):
+        import json
+        from document_chat import DocumentSession
+
+        session = self._session(draft_document=b"DOCX")
+        state = json.loads(json.dumps(session.to_state()))
+        assert "template_content" not in state and "draft_document" not in state
+
+        restored = DocumentSession.from_state(state, b"TEMPLATE", b"DOCX")
+        assert restored.state == session.state
+        assert restored.detected_variables[0].name == "defendant_name"
+        assert restored.collected_values == {"defendant_name": "John Smith"}
+        assert restored.draft_document == b"DOCX"
+
+    def test_eviction_by_entries_and_bytes(self):
+        import time
+        from dashboard.doc_sessions import DocSessionStore, _Entry
+
+        engine = Mock(sessions={})
+        store = DocSessionStore(max_entries=2, max_bytes=10_000, idle_seconds=60)
+        with store._lock:
+            for sid in ("a", "b", "c"):
+                store._put_locked(sid, _Entry(engine, "f1", 1, 100, time.monotonic()))
+        assert list(store._entries) == ["b", "c"]
+
+        with store._lock:
+            store._put_locked("big", _Entry(engine, "f1", 1, 9_950, time.monotonic()))
+        assert list(store._entries) == ["big"]
+        assert store.stats()["session_bytes"] == 9_950
+
+    def test_restore_on_another_worker_shares_template(self):
+        from dashboard.doc_sessions import DocSessionStore
+
+        db = {}
+
+        def save(sid, firm_id, username, state, template_hash, draft_hash):
+            version = db.get(sid, {}).get("version", 0) + 1
+            db[sid] = {"state": state, "template_hash": template_hash,
+                       "draft_hash": draft_hash, "version": version}
+            return version
+
+        with patch("attorney_profiles.get_primary_attorney", return_value=None), \
+             patch("dashboard.doc_sessions.save_doc_session", side_effect=save), \
+             patch("dashboard.doc_sessions.put_blob") as put_blob, \
+             patch("dashboard.doc_sessions.get_blob", return_value=b"DOCX"), \
+             patch("dashboard.doc_sessions.load_doc_session", side_effect=lambda sid, f: db.get(sid)), \
+             patch("dashboard.doc_sessions.get_doc_session_version",
+                   side_effect=lambda sid, f: db[sid]["version"] if sid in db else None), \
+             patch("document_chat.DocumentChatEngine._load_template_content",
+                   return_value=b"TEMPLATE") as load_template:
+            worker_a, worker_b = DocSessionStore(), DocSessionStore()
+            engine, sid = worker_a.create("f1")
+            session = self._session(draft_document=b"DOCX")
+            engine.sessions[session.session_id] = session
+            engine.current_session_id = session.session_id
+            worker_a.save(sid, engine, "alice")
+            assert put_blob.call_count == 1
+            assert "template_content" not in db[sid]["state"]["session"]
+
+            restored = worker_b.get(sid, "f1")
+            assert restored is not engine
+            assert restored.get_session().collected_values == {"defendant_name": "John Smith"}
+            assert restored.get_session().draft_document == b"DOCX"
+            assert worker_b.get(sid, "other_firm") is None
+
+            # A second session on the same template reuses the cached bytes
+            other = restored.get_session()
+            db["s2"] = dict(db[sid])
+            assert worker_b.get("s2", "f1").get_session().template_content is other.template_content
+            assert load_template.call_count == 1
+
+            # worker_a picks up a newer version written by worker_b
+            worker_b.save(sid, restored, "alice")
+            assert worker_a.get(sid, "f1") is not engine
+
+    def test_download_url_uses_session_route(self, tmp_path):
+        """Chat responses link the session download, which works from any worker."""
+        from dashboard.routes.api import _doc_chat_download_url
+
+        session = self._session(draft_document=b"DOCX")
+        engine = Mock(get_session=Mock(return_value=session))
+        assert _doc_chat_download_url(engine, "s1") is None
+
+        session.output_path = tmp_path / "elsewhere" / "Motion.docx"  # written by another worker
+        assert _doc_chat_download_url(engine, "s1") == "/api/documents/download/s1"
+
+
+class TestVariableAnalysisCache:
+    """Tests for stored per-template variable analysis (document_chat)."""
+
+    def _engine(self):
+        from document_chat import DocumentChatEngine
+
+        with patch("attorney_profiles.get_primary_attorney", return_value=None):
+            engine = DocumentChatEngine(firm_id="f1")
+        engine._complete = Mock(return_value=(
+            '[{"name": "defendant_name", "display_name": "Defendant", '
+            '"description": "Name", "sample_value": "JOHN DOE"}]'))
+        return engine
+
+    def test_stored_analysis_skips_model_call(self):
+        engine = self._engine()
+        stored = [{"name": "defendant_name", "display_name": "Defendant", "description": "Name",
+                   "sample_value": "", "var_type": "text", "required": True, "value": None}]
+
+        with patch("db.documents.get_variable_analysis", return_value=stored) as lookup:
+            variables = engine._analyze_template_for_variables(
+                "Motion", b"docx", "Motion", template_id=12)
+
+        lookup.assert_called_once_with(12, "1")
+        engine._complete.assert_not_called()
+        assert [v.name for v in variables] == ["defendant_name"]
+
+    def test_miss_analyzes_once_and_stores_by_hash(self):
+        import hashlib
+
+        engine = self._engine()
+        with patch("db.documents.get_variable_analysis", return_value=None), \
+             patch("db.documents.save_variable_analysis", return_value=True) as save:
+            variables = engine._analyze_template_for_variables(
+                "Motion", b"not a docx", "Motion", template_id=12)
+
+        engine._complete.assert_called_once()
+        template_id, file_hash, version, payload = save.call_args[0]
+        assert (template_id, version) == (12, "1")
+        assert file_hash == hashlib.sha256(b"not a docx").hexdigest()
+        assert payload[0]["name"] == variables[0].name == "defendant_name"
+
+    def test_fallback_variables_not_stored(self):
+        engine = self._engine()
+        engine._complete.return_value = "no json here"
+        with patch("db.documents.get_variable_analysis", return_value=None), \
+             patch("db.documents.save_variable_analysis") as save:
+            variables = engine._analyze_template_for_variables(
+                "Motion", b"docx", "Motion", template_id=12)
+
+        save.assert_not_called()
+        assert variables == []
+
+    def test_precompute_only_stale_templates(self):
+        from document_chat import precompute_variable_analysis
+
+        rows = [{"id": 3, "firm_id": "f1", "name": "Motion", "category": "motion",
+                 "file_content": b"docx", "file_hash": "h"}]
+        with patch("attorney_profiles.get_primary_attorney", return_value=None), \
+             patch("db.documents.get_templates_needing_analysis", return_value=rows) as needing, \
+             patch("document_chat.DocumentChatEngine._complete",
+                   return_value='[{"name": "case_number"}]'), \
+             patch("db.documents.save_variable_analysis", return_value=True) as save:
+            counts = precompute_variable_analysis("f1", template_ids=[3])
+
+        assert needing.call_args[1]["template_ids"] == [3]
+        assert counts == {"analyzed": 1, "failed": 0}
+        assert save.call_args[0][0] == 3
+
+
+class TestCasePrefill:
+    """Tests for deterministic case-context prefill (case_prefill)."""
+
+    def test_find_case_number(self):
+        from case_prefill import find_case_number
+
+        assert find_case_number("motion to dismiss for 26je-cr00123 please") == "26JE-CR00123"
+        assert find_case_number("case 22JE-CC00191-01") == "22JE-CC00191-01"
+        assert find_case_number("no case here, call 314-555-0100") is None
+
+    def test_build_case_values(self):
+        from case_prefill import build_case_values
+        from courts_db import Court
+
+        case = {"id": 1, "case_number": "26JE-CR00123"}
+        clients = [{"first_name": "John", "last_name": "Smith", "address1": "1 Main St",
+                    "city": "Hillsboro", "state": "MO", "zip_code": "63050",
+                    "birthdate": date(1990, 1, 15)}]
+        docket = [
+            {"scheduled_date": date(2026, 1, 5), "scheduled_time": "9:00 AM", "judge": "Old"},
+            {"scheduled_date": date(2026, 3, 2), "scheduled_time": "1:30 PM", "judge": "Hon. Lee"},
+            {"scheduled_date": date(2026, 2, 9), "scheduled_time": "9:00 AM", "judge": "Hon. Ray"},
+        ]
+        court = Court(name="Jefferson County Circuit Court", county="Jefferson County")
+
+        values = build_case_values(case, clients, docket, court, today=date(2026, 2, 1))
+        assert values["defendant_name"] == values["petitioner_name"] == "John Smith"
+        assert values["case_number"] == "26JE-CR00123"
+        assert values["county"] == "Jefferson"
+        assert values["client_city_state_zip"] == "Hillsboro, MO 63050"
+        assert values["dob"] == "01/15/1990"
+        assert values["hearing_date"] == "February 9, 2026"
+        assert values["judge_name"] == "Hon. Ray"
+
+    def test_engine_prefills_before_llm_extraction(self):
+        from document_chat import DocumentChatEngine, DetectedVariable
+
+        with patch("attorney_profiles.get_primary_attorney", return_value=None):
+            engine = DocumentChatEngine(firm_id="f1")
+        session = engine.get_session()
+        session.detected_variables = [
+            DetectedVariable("defendant_name", "Defendant Name", "", ""),
+            DetectedVariable("case_number", "Case Number", "", ""),
+            DetectedVariable("officer_name", "Officer Name", "", ""),
+        ]
+
+        with patch("db.cache.get_case_id_by_number", return_value=42) as by_number, \
+             patch("case_prefill.resolve_case_prefill",
+                   return_value={"defendant_name": "John Smith", "case_number": "26JE-CR00123"}) as resolve:
+            filled = engine._prefill_from_case(session, "for 26JE-CR00123")
+            again = engine._prefill_from_case(session, "officer is Ray")
+
+        by_number.assert_called_once_with("f1", "26JE-CR00123")
+        resolve.assert_called_once_with("f1", 42, ["defendant_name", "case_number", "officer_name"])
+        assert [v.name for v in filled] == ["defendant_name", "case_number"]
+        assert again == []
+        assert [v.name for v in session.get_missing_variables()] == ["officer_name"]
+        assert session.collected_values["case_number"] == "26JE-CR00123"
+
+    def test_chat_routes_reject_non_numeric_case_id(self):
+        import asyncio
+        from unittest.mock import AsyncMock
+        from dashboard.routes import api
+
+        for route in (api.api_documents_chat, api.api_documents_chat_stream):
+            request = Mock(session={"firm_id": "f1"})
+            request.json = AsyncMock(return_value={"message": "draft it", "case_id": "26JE-CR1"})
+            with patch.object(api, "is_authenticated", return_value=True), \
+                 patch.object(api, "_get_doc_chat_engine") as get_engine:
+                response = asyncio.run(route(request))
+            assert response.status_code == 400, route.__name__
+            get_engine.assert_not_called()
+
+
+class TestLLMTelemetry:
+    """Tests for per-call LLM telemetry (skills.llm, db.llm_telemetry)."""
+
+    def test_calls_are_buffered_with_firm_model_and_errors(self):
+        import skills.llm as llm
+
+        client = Mock()
+        client.messages.create.side_effect = [
+            Mock(content=[Mock(text="ok")], usage=Mock(
+                input_tokens=100, output_tokens=20,
+                cache_creation_input_tokens=0, cache_read_input_tokens=900)),
+            RuntimeError("overloaded"),
+        ]
+        added = []
+        with patch.object(llm._telemetry, "add", side_effect=added.append):
+            llm.reset_llm_stats()
+            llm.complete("firm-t", [{"role": "user", "content": "q"}], client=client, feature="test")
+            with pytest.raises(RuntimeError):
+                llm.complete("firm-t", [{"role": "user", "content": "q"}], client=client, feature="test")
+
+        ok, failed = added
+        assert (ok["firm_id"], ok["feature"], ok["model"]) == ("firm-t", "test", llm.DEFAULT_MODEL)
+        assert (ok["input_tokens"], ok["cache_read_tokens"], ok["error"]) == (100, 900, None)
+        assert failed["error"] == "RuntimeError" and failed["input_tokens"] == 0
+        assert llm.get_llm_stats()["test"]["errors"] == 1
+
+    def test_retry_count_comes_from_sdk_header(self):
+        import skills.llm as llm
+
+        def create(**params):
+            for attempt in ("0", "1", "2"):
+                llm._note_attempt(Mock(headers={"x-stainless-retry-count": attempt}))
+            return Mock(content=[Mock(text="ok")], usage=None)
+
+        client = Mock()
+        client.messages.create.side_effect = create
+        added = []
+        with patch.object(llm._telemetry, "add", side_effect=added.append):
+            llm.complete("firm-r", [{"role": "user", "content": "q"}], client=client)
+        assert added[0]["retries"] == 2
+
+    def test_writer_flushes_batches(self):
+        import skills.llm as llm
+
+        writer = llm._TelemetryWriter()
+        writer._thread = Mock()  # don't start the background thread
+        for i in range(3):
+            writer.add({"feature": "test", "latency_ms": i})
+        with patch("db.llm_telemetry.record_llm_calls", side_effect=lambda rows: len(rows)) as record:
+            assert writer.flush() == 3
+            assert writer.flush() == 0
+        assert len(record.call_args[0][0]) == 3
+
+    def test_cost_estimate(self):
+        from db.llm_telemetry import estimate_cost
+
+        # 1M input + 1M output on Sonnet; Bedrock IDs resolve to the same price
+        assert estimate_cost("claude-sonnet-4-5", 1_000_000, 1_000_000) == 18.0
+        assert estimate_cost("us.anthropic.claude-sonnet-4-5-v2-20250929", 1_000_000, 0) == 3.0
+        assert estimate_cost("claude-sonnet-4-5", 0, 0, cache_read_tokens=1_000_000) == 0.3
+        assert estimate_cost("unknown-model", 10, 10) is None
+
+    def test_usage_endpoint_is_scoped_to_session_firm(self):
+        import asyncio
+        import dashboard.routes.api as api
+
+        request = Mock(session={"firm_id": "f1"})
+        with patch.object(api, "is_authenticated", return_value=True), \
+             patch.object(api, "get_current_role", return_value="admin"), \
+             patch("db.llm_telemetry.get_llm_usage", return_value=[]) as usage:
+            response = asyncio.run(api.api_llm_usage(request, days=7))
+        assert response.status_code == 200
+        usage.assert_called_once_with(7, "f1")
+
+    def test_stats_route_returns_only_session_firm(self):
+        import asyncio
+        import json
+        import skills.llm as llm
+        from dashboard.routes import api
+
+        llm.reset_llm_stats()
+        usage = Mock(input_tokens=10, output_tokens=1,
+                     cache_creation_input_tokens=0, cache_read_input_tokens=0)
+        llm._record("chat", usage, 0.5, firm_id="f1")
+        llm._record("chat", usage, 0.5, firm_id="f2")
+        llm._record("chat", usage, 0.5, firm_id="f2")
+
+        request = Mock(session={"firm_id": "f1"})
+        with patch.object(api, "is_authenticated", return_value=True), \
+             patch.object(api, "get_current_role", return_value="admin"):
+            response = asyncio.run(api.api_llm_stats(request))
+        assert json.loads(response.body)["features"]["chat"]["calls"] == 1
+        assert llm.get_llm_stats()["chat"]["calls"] == 3
+        llm.reset_llm_stats()
+
+
+class TestTemplateCache:
+    """Tests for the parsed-template LRU (template_cache)."""
+
+    def _docx(self, caption="IN THE CIRCUIT COURT OF {{county}} COUNTY"):
+        import io
+        from docx import Document
+
+        doc = Document()
+        doc.add_paragraph("No placeholders here.")
+        split = doc.add_paragraph("State v. {{defen")
+        split.add_run("dant_name}}")
+        doc.add_paragraph("Fax:")
+        doc.add_table(rows=1, cols=1).cell(0, 0).paragraphs[0].text = caption
+        out = io.BytesIO()
+        doc.save(out)
+        return out.getvalue()
+
+    def test_placeholder_map(self):
+        from template_cache import parse_template
+
+        parsed = parse_template(5, self._docx())
+        assert parsed.placeholders == (1, 3)
+        assert parsed.fixups == (2,)
+        assert parsed.needs_xml_pass is False
+        doc = parsed.new_document()
+        assert [p.text for p in parsed.placeholder_paragraphs(doc)] == [
+            "State v. {{defendant_name}}", "IN THE CIRCUIT COURT OF {{county}} COUNTY"]
+
+    def test_load_hit_skips_blob_fetch_and_lru_bound(self):
+        import hashlib
+        from template_cache import TemplateCache
+
+        content = self._docx()
+        cache = TemplateCache()
+        engine = MagicMock()
+        engine.get_template_content.return_value = content
+        with patch("db.documents.get_template_file_hash",
+                   return_value=hashlib.sha256(content).hexdigest()), \
+             patch("document_engine.get_engine", return_value=engine):
+            assert cache.load(5) == content
+            assert cache.load(5) == content
+        engine.get_template_content.assert_called_once_with(5)
+        assert cache.stats()["hits"] == 1
+
+        cache.parsed(5, content)
+        cache.max_bytes = cache.stats()["bytes"] + len(content)
+        other = self._docx("{{city}}")
+        cache.parsed(6, other)
+        assert cache.stats()["templates"] == 1
+        assert cache.parsed(6, other) is cache.parsed(6, other)
+
+    def test_fallback_fill_leaves_cached_template_untouched(self):
+        import io
+        from docx import Document
+        from document_chat import DetectedVariable, DocumentChatEngine, DocumentSession
+        from template_cache import get_template_cache
+
+        with patch("attorney_profiles.get_primary_attorney", return_value=None):
+            engine = DocumentChatEngine(firm_id="f1")
+        session = DocumentSession(session_id="s", firm_id="f1", template_id=5)
+        session.detected_variables = [
+            DetectedVariable("defendant_name", "Defendant", "", "", value="John Doe"),
+            DetectedVariable("county", "County", "", "", value="Jefferson"),
+        ]
+        content = self._docx()
+        for _ in range(2):
+            with patch("template_cache.TemplateCache.compiled", side_effect=ValueError("no")):
+                filled = Document(io.BytesIO(engine._fill_docx_template(content, session)))
+            texts = [p.text for p in filled.paragraphs]
+            assert texts[1] == "State v. John Doe"
+            assert texts[2] == ""
+            assert filled.tables[0].cell(0, 0).text == "IN THE CIRCUIT COURT OF JEFFERSON COUNTY"
+
+        pristine = get_template_cache().parsed(5, content).document
+        assert pristine.paragraphs[1].text == "State v. {{defendant_name}}"
+
+
+class TestTemplateCompiler:
+    """Tests for compiled templates (template_compiler)."""
+
+    def _docx(self):
+        import io
+        from docx import Document
+
+        doc = Document()
+        doc.add_paragraph("IN THE CIRCUIT COURT OF {{county}} COUNTY")
+        split = doc.add_paragraph("State v. {{defen")
+        split.add_run("dant_name}}, Bar #{{second_attorney_bar}}").bold = True
+        doc.add_paragraph("Fax: {{fax}}")
+        doc.add_paragraph("/s/ {{attorney_name}}________")
+        doc.add_paragraph("Untouched paragraph.")
+        out = io.BytesIO()
+        doc.save(out)
+        return out.getvalue()
+
+    def test_compile_merges_split_runs_and_renders(self):
+        import io
+        from docx import Document
+        from template_compiler import compile_template
+
+        compiled = compile_template(self._docx())
+        assert len(compiled.segments) == len(compiled.runs) + 1
+        assert "State v. {{defendant_name}}, Bar #{{second_attorney_bar}}" in [r["text"] for r in compiled.runs]
+        assert not any("Untouched" in r["text"] for r in compiled.runs)
+
+        filled = compiled.render({"county": "Jefferson", "defendant_name": "A & B <Co>",
+                                  "second_attorney_bar": "", "fax": "", "attorney_name": "Jane Roe"})
+        texts = [p.text for p in Document(io.BytesIO(filled)).paragraphs]
+        assert texts == ["IN THE CIRCUIT COURT OF JEFFERSON COUNTY", "State v. A & B <Co>, Bar",
+                         "", "/s/ Jane Roe", "Untouched paragraph."]
+        assert Document(io.BytesIO(filled)).paragraphs[1].runs[0].bold is None
+
+    def test_stored_form_used_when_hash_matches(self):
+        import json
+        from template_compiler import compile_template, load_compiled
+
+        content = self._docx()
+        stored = json.loads(json.dumps(compile_template(content).to_dict()))
+        with patch("db.documents.get_compiled_template", return_value=stored), \
+             patch("template_compiler.compile_template") as compile_, \
+             patch("db.documents.save_compiled_template") as save:
+            compiled = load_compiled(9, content)
+        compile_.assert_not_called()
+        save.assert_not_called()
+        assert compiled.render_xml({"county": "x"}) == compile_template(content).render_xml({"county": "x"})
+
+        with patch("db.documents.get_compiled_template", return_value=dict(stored, file_hash="old")), \
+             patch("db.documents.save_compiled_template", return_value=True) as save:
+            load_compiled(9, content)
+        assert save.call_args[0][0] == 9 and save.call_args[0][2] == "1"
+
+    def test_engine_fill_uses_compiled_form(self):
+        import io
+        from docx import Document
+        from document_chat import DetectedVariable, DocumentChatEngine, DocumentSession
+
+        with patch("attorney_profiles.get_primary_attorney", return_value=None):
+            engine = DocumentChatEngine(firm_id="f1")
+        session = DocumentSession(session_id="s", firm_id="f1")
+        session.detected_variables = [DetectedVariable("defendant_name", "Defendant", "", "", value="John Doe")]
+        with patch("template_cache.TemplateCache.parsed") as parsed:
+            filled = engine._fill_docx_template(self._docx(), session)
+        parsed.assert_not_called()
+        assert Document(io.BytesIO(filled)).paragraphs[1].text == "State v. John Doe, Bar"
+
+
+class TestDocumentBatch:
+    """Tests for batch document generation (document_batch)."""
+
+    def _docx(self):
+        import io
+        from docx import Document
+
+        doc = Document()
+        doc.add_paragraph("State v. {{defendant_name}}, Case No. {{case_number}}")
+        doc.add_paragraph("Hearing: {{hearing_date}}")
+        out = io.BytesIO()
+        doc.save(out)
+        return out.getvalue()
+
+    def _run(self, tmp_path, case_ids, firm_id="f1", **kwargs):
+        from template_cache import TemplateCache
+        import document_batch
+
+        def prefill(firm, case_id, names=None):
+            if case_id < 0:
+                return {}
+            return {"defendant_name": f"Client {case_id}", "case_number": f"26JE-CR{case_id:05d}"}
+
+        engine = MagicMock()
+        engine.get_template_content.return_value = self._docx()
+        with patch("template_cache._cache", TemplateCache()), \
+             patch("db.documents.get_template_meta",
+                   return_value={"id": 7, "firm_id": firm_id, "name": "Notice of Hearing"}), \
+             patch("db.documents.get_template_file_hash", return_value=None), \
+             patch("db.documents.get_compiled_template", return_value=None), \
+             patch("db.documents.save_compiled_template"), \
+             patch("db.documents.record_generated_documents") as record, \
+             patch("document_engine.get_engine", return_value=engine), \
+             patch("attorney_profiles.get_primary_attorney", return_value=None), \
+             patch("case_prefill.resolve_case_prefill", side_effect=prefill):
+            result = document_batch.generate_batch(
+                "f1", 7, case_ids, output_path=tmp_path / "batch.zip", **kwargs)
+        return result, record
+
+    def test_batch_fills_each_case_into_zip(self, tmp_path):
+        import io
+        import zipfile
+        from docx import Document
+
+        progress = []
+        result, record = self._run(tmp_path, [1, 2, -3, 2], values={"hearing_date": "March 3, 2026"},
+                                   workers=1, progress=lambda done, total: progress.append((done, total)))
+
+        assert result["documents"] == 2
+        assert result["failed"] == [{"case_id": -3, "error": "Case not found in cache"}]
+        assert progress[-1] == (2, 2)
+        with zipfile.ZipFile(result["path"]) as archive:
+            names = archive.namelist()
+            assert names == ["Notice_of_Hearing_26JE-CR00001.docx", "Notice_of_Hearing_26JE-CR00002.docx"]
+            texts = [p.text for p in Document(io.BytesIO(archive.read(names[1]))).paragraphs]
+        assert texts == ["State v. Client 2, Case No. 26JE-CR00002", "Hearing: March 3, 2026"]
+        assert not (tmp_path / "batch.partial").exists()
+        assert [d["case_id"] for d in record.call_args[0][3]] == ["1", "2"]
+
+    def test_pool_renders_same_documents(self, tmp_path):
+        import zipfile
+
+        with patch("document_batch.DOC_BATCH_POOL_MIN", 2):
+            result, _ = self._run(tmp_path, [1, 2, 3], workers=2)
+        assert result["documents"] == 3
+        with zipfile.ZipFile(result["path"]) as archive:
+            assert sorted(archive.namelist()) == [f"Notice_of_Hearing_26JE-CR0000{i}.docx" for i in (1, 2, 3)]
+
+    def test_other_firms_template_rejected(self, tmp_path):
+        with pytest.raises(ValueError):
+            self._run(tmp_path, [1], firm_id="other")
+        assert not list(tmp_path.iterdir())
+
+    def test_stalled_pool_fails_outstanding_chunks(self):
+        """A worker that never returns fails its documents instead of hanging."""
+        import document_batch
+
+        class StalledPool:
+            def __init__(self, *args, **kwargs):
+                self.terminated = False
+
+            def apply_async(self, func, args, callback, error_callback):
+                chunk = args[0]
+                if chunk[0][0] != 0:  # the chunk starting at index 0 is lost
+                    callback([(i, b"doc", None) for i, _ in chunk])
+
+            def close(self):
+                pass
+
+            def join(self):
+                pass
+
+            def terminate(self):
+                self.terminated = True
+
+        compiled = MagicMock(package=b"")
+        work = [(i, {}) for i in range(4)]
+        with patch("billiard.Pool", StalledPool):
+            chunks = list(document_batch._render_in_pool(compiled, work, workers=2, timeout=0.05))
+
+        results = sorted(r for chunk in chunks for r in chunk)
+        assert [r[0] for r in results] == [0, 1, 2, 3]
+        assert results[0] == (0, None, "Render worker timed out")
+        assert all(data == b"doc" for _, data, _ in results[1:])
+
+    def test_batch_status_hides_other_firms_tasks(self):
+        """Ownership comes from the task id, so failed tasks can't leak across firms."""
+        import asyncio
+        from dashboard.routes import api
+
+        own_id = api._doc_batch_task_id("f1")
+        other_id = api._doc_batch_task_id("f2")
+        request = Mock(session={"firm_id": "f1"})
+        with patch.object(api, "is_authenticated", return_value=True), \
+             patch.object(api, "_doc_batch_result",
+                          return_value=("FAILURE", RuntimeError("boom"))) as result:
+            response = asyncio.run(api.api_documents_batch_status(request, other_id))
+            assert response.status_code == 404
+            result.assert_not_called()
+
+            response = asyncio.run(api.api_documents_batch_status(request, own_id))
+            assert response == {"task_id": own_id, "state": "FAILURE", "error": "boom"}
+
+
+class TestTemplateIndex:
+    """Tests for the template identification index (template_index)."""
+
+    NAMES = [
+        "Motion for Continuance", "Admin Continuance Request", "Entry of Appearance (State)",
+        "Entry of Appearance (Muni)", "Notice of Hearing", "NOH Bond Reduction", "DOR Motion to Dismiss",
+        "Motion to Dismiss (County)", "Petition for Review (PFR)", "Letter to DOR with PFR",
+        "Preservation Letter", "Preservation/Supplemental Discovery Letter",
+    ]
+
+    def _index(self):
+        from template_index import TemplateIndex
+
+        return TemplateIndex([{"id": i + 1, "name": n, "category": "motion", "tags": "[]"}
+                              for i, n in enumerate(self.NAMES)])
+
+    def test_name_and_request_rules(self):
+        from template_index import document_type_for_name, reconcile_document_type
+
+        assert document_type_for_name("Motion to Dismiss (County)") == "motion_to_dismiss_general"
+        assert document_type_for_name("Notice of Hearing - Motion to Withdraw") == "notice_of_hearing_mtw"
+        assert document_type_for_name("Entry (Generic)") == "entry_generic"
+        assert document_type_for_name("Letter to DOR with PFR") == "ltr_to_dor_with_pfr"
+        assert document_type_for_name("Something Else") is None
+
+        assert reconcile_document_type("motion_to_dismiss_dor", "motion to dismiss") == "motion_to_dismiss_general"
+        assert reconcile_document_type("entry_of_appearance_state", "eoa municipal") == "entry_of_appearance_muni"
+        assert reconcile_document_type(None, "eoa for muni court") == "entry_of_appearance_muni"
+        assert reconcile_document_type(None, "withdraw my guilty plea") == "motion_to_withdraw_guilty_plea"
+
+    def test_lookup_expands_abbreviations_and_tolerates_typos(self):
+        index = self._index()
+        cases = {
+            "mtc for Jefferson County": "Motion for Continuance",
+            "motion for continuence": "Motion for Continuance",
+            "eoa muni": "Entry of Appearance (Muni)",
+            "entry of appearance state court": "Entry of Appearance (State)",
+            "noh": "Notice of Hearing",
+            "letter to DOR with PFR": "Letter to DOR with PFR",
+            "pfr": "Petition for Review (PFR)",
+            "preservaton letter": "Preservation Letter",
+        }
+        for request, name in cases.items():
+            assert index.lookup(request).name == name, request
+        assert index.lookup("quarterly revenue") is not None
+        assert index.lookup("xyzzy") is None
+
+    def test_identify_template_uses_cached_index(self):
+        import template_index
+        from document_chat import DocumentChatEngine
+
+        rows = [{"id": 1, "name": "Motion for Continuance", "category": "motion", "jurisdiction": None}]
+        with patch("attorney_profiles.get_primary_attorney", return_value=None):
+            engine = DocumentChatEngine(firm_id="f1")
+        with patch.dict(template_index._indexes, clear=True), \
+             patch("db.documents.get_template_signature", return_value="1:a") as signature, \
+             patch("db.documents.get_templates", return_value=rows) as get_templates, \
+             patch("db.documents.search_templates") as search:
+            first = engine._identify_template("I need a motion to continue")
+            engine._identify_template("mtc")
+            template_index._indexes["f1"].checked_at = 0
+            engine._identify_template("mtc")
+        assert first["template_id"] == 1 and first["document_type_key"] == "motion_for_continuance"
+        assert get_templates.call_count == 1
+        assert signature.call_count == 2
+        search.assert_not_called()
+
+
+class TestTemplatePreprocessing:
+    """Tests for incremental, parallel template preprocessing (template_preprocessor)."""
+
+    def _docx(self, text):
+        import io
+        from docx import Document
+
+        doc = Document()
+        doc.add_paragraph(text)
+        out = io.BytesIO()
+        doc.save(out)
+        return out.getvalue()
+
+    def test_pool_matches_inline(self):
+        from template_preprocessor import _process_template_task, process_stream
+
+        items = [(i, f"t{i}", self._docx(f"Case No. 24SL-CR0012{i} bond of $500")) for i in range(5)]
+        inline = {args[0]: r for args, r in process_stream(_process_template_task, iter(items), 1)}
+        pooled = {args[0]: r for args, r in process_stream(_process_template_task, iter(items), 2)}
+        assert sorted(pooled) == list(range(5))
+        for i in range(5):
+            assert pooled[i].content_hash == inline[i].content_hash
+            assert sorted(pooled[i].variables_found) == ["bond_amount", "case_number"]
+
+    def test_process_stores_results_as_they_finish(self):
+        import hashlib
+        from template_preprocessor import PREPROCESSOR_VERSION, TemplatePreprocessor
+
+        changed, unchanged = self._docx("Case No. 24SL-CR00123"), self._docx("Nothing to replace.")
+        rows = [{"id": 1, "name": "a", "file_content": changed, "file_hash": None},
+                {"id": 2, "name": "b", "file_content": unchanged, "file_hash": None}]
+        with patch("db.documents.count_templates_needing_preprocess", return_value=2), \
+             patch("db.documents.stream_templates_needing_preprocess", return_value=iter(rows)) as stream, \
+             patch("db.documents.save_preprocessed_template", return_value=True) as save, \
+             patch("db.documents.mark_template_preprocessed", return_value=True) as mark, \
+             patch("document_chat.precompute_variable_analysis", return_value={"analyzed": 1, "failed": 0}), \
+             patch("template_compiler.compile_templates", return_value={"compiled": 1, "failed": 0}) as compile_, \
+             patch("template_dedup.compute_signatures", return_value={"computed": 1, "failed": 0}):
+            preprocessor = TemplatePreprocessor("f1")
+            assert preprocessor.process_all_templates(update_db=True, workers=1) == (2, 0)
+
+        assert stream.call_args[1]["force"] is False
+        assert save.call_args[0][:2] == (1, hashlib.sha256(changed).hexdigest())
+        assert save.call_args[0][3:] == (PREPROCESSOR_VERSION, ["case_number"])
+        mark.assert_called_once_with(2, hashlib.sha256(unchanged).hexdigest(), PREPROCESSOR_VERSION)
+        compile_.assert_called_once_with(template_ids=[1])
+        assert all(p.processed_content is None for p in preprocessor.processed)
+
+    def test_nothing_pending_reads_no_templates(self):
+        from db.documents import _preprocess_conditions
+        from template_preprocessor import TemplatePreprocessor
+
+        with patch("db.documents.count_templates_needing_preprocess", return_value=0), \
+             patch("db.documents.stream_templates_needing_preprocess") as stream:
+            assert TemplatePreprocessor().process_all_templates() == (0, 0)
+        stream.assert_not_called()
+
+        conditions, params = _preprocess_conditions("v1", firm_id="f1")
+        assert "preprocessed_key IS DISTINCT FROM file_hash || ':' || %s" in conditions
+        assert params == ["v1", "f1"]
+        conditions, params = _preprocess_conditions("v1", force=True)
+        assert not any("preprocessed_key" in c for c in conditions) and params == []
+
+
+class TestTemplateDedup:
+    """Tests for MinHash/LSH near-duplicate template detection (template_dedup)."""
+
+    LETTER = (
+        "Dear Client, your case has been set for a hearing before the court. Please arrive "
+        "thirty minutes early, dress appropriately and bring a photo identification. If you "
+        "cannot attend you must call our office at least two days before the hearing so that "
+        "we can ask the court for a continuance. Failure to appear may result in a warrant "
+        "being issued for your arrest and the forfeiture of any bond that has been posted."
+    )
+
+    def test_signature_similarity(self):
+        from template_dedup import NUM_PERM, similarity, text_signature
+
+        base = text_signature(self.LETTER)
+        variant = text_signature(self.LETTER.replace("thirty", "fifteen").replace("two days", "three days"))
+        other = text_signature("Motion to dismiss for lack of jurisdiction filed by the defendant "
+                               "pursuant to the applicable rules of criminal procedure.")
+        assert len(base) == NUM_PERM
+        assert similarity(base, text_signature(self.LETTER)) == 1.0
+        assert similarity(base, variant) >= 0.6
+        assert similarity(base, other) < 0.2
+        assert text_signature("") is None
+
+    def test_lsh_clusters_variants(self):
+        from template_dedup import cluster_signatures, text_signature
+
+        words = self.LETTER.split()
+        signatures = {1: text_signature(self.LETTER)}
+        for i in range(2, 6):
+            edited = list(words)
+            edited[i * 10] = "changed"
+            signatures[i] = text_signature(" ".join(edited))
+        signatures[10] = text_signature("Entry of appearance of counsel for the defendant in the "
+                                        "above captioned matter with request for discovery.")
+        signatures[11] = None
+        assert cluster_signatures(signatures) == [[1, 2, 3, 4, 5]]
+        assert cluster_signatures(signatures, threshold=1.0) == []
+
+    def test_search_collapses_clones(self):
+        from document_engine import DocumentEngine
+        from template_dedup import text_signature
+
+        clone = text_signature(self.LETTER)
+        rows = [
+            {"id": 1, "name": "Hearing Letter", "minhash": clone},
+            {"id": 2, "name": "Hearing Letter (2)", "minhash": clone},
+            {"id": 3, "name": "Old Letter", "minhash": None},
+            {"id": 4, "name": "Motion", "minhash": text_signature("Motion to dismiss for lack of jurisdiction.")},
+        ]
+        with patch("db.documents.ensure_documents_tables"), \
+             patch("db.attorneys.ensure_attorneys_tables"), \
+             patch("db.documents.search_templates", return_value=rows) as search:
+            results = DocumentEngine().search_templates("f1", "hearing letter", limit=2)
+        assert search.call_args[1]["limit"] == 4
+        assert [t.id for t in results] == [1, 3]
+
+
 # ============================================================================
 # Run tests
 # ============================================================================
@@ -34,6 +34,9 @@ sys.path.insert(0, str(Path(__file__).parent.parent))
 from dotenv import load_dotenv
 load_dotenv()
 
+# Chat SQL runs in the firm-scoped sandbox; tests pick the firm explicitly
+TEST_FIRM_ID = os.environ.get("DASHBOARD_FIRM_ID") or os.environ.get("FIRM_ID") or "jcs_law"
+
 from dashboard.routes.api import format_query_results, MYCASE_SCHEMA, CHAT_SYSTEM_PROMPT
 
 
@@ -137,6 +140,13 @@ class TestFormatQueryResults:
         result = format_query_results(rows, "Limited")
         assert "Results limited to 20 rows" in result
 
+    def test_truncated_results_note(self):
+        """Rows capped by the sandbox say so, whatever the row count."""
+        rows = [{"name": f"Item {i}", "value": i} for i in range(500)]
+        result = format_query_results(rows, "Capped", truncated=True)
+        assert "Results capped at 500 rows" in result
+        assert "Results limited to 20 rows" not in result
+
     def test_under_twenty_rows_no_limit_note(self):
         """When less than 20 rows, no limit note."""
         rows = [{"name": f"Item {i}", "value": i} for i in range(5)]
@@ -369,8 +379,8 @@ class TestChatE2E:
         if parsed.get("type") == "query":
             sql = parsed.get("sql", "")
             explanation = parsed.get("explanation", "")
-            rows, error = execute_chat_query(sql)
-            formatted = format_query_results(rows, explanation) if not error else None
+            rows, error, truncated = execute_chat_query(sql, TEST_FIRM_ID)
+            formatted = format_query_results(rows, explanation, truncated) if not error else None
             return {
                 "type": "query",
                 "sql": sql,
@@ -500,7 +510,8 @@ class TestSQLExecution:
 
     def _execute(self, sql: str) -> Tuple[list, Optional[str]]:
         from dashboard.routes.api import execute_chat_query
-        return execute_chat_query(sql)
+        rows, error, _truncated = execute_chat_query(sql, TEST_FIRM_ID)
+        return rows, error
 
     def test_basic_count(self):
         """Basic COUNT query should work."""
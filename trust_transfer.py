@@ -15,12 +15,14 @@ per firm. If no DB schedules exist, falls back to hardcoded defaults.
 No money is moved by this system — it produces a report only.
 """
 
+import itertools
 import logging
 from datetime import datetime
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 from dataclasses import dataclass
 
 from db.connection import get_connection
+from db.streaming import stream_rows
 
 logger = logging.getLogger(__name__)
 
@@ -200,6 +202,107 @@ class TrustTransferLine:
     schedule_label: str
 
 
+TRUST_REPORT_SQL = """
+    WITH latest_phase AS (
+        SELECT DISTINCT ON (case_id)
+            case_id, case_name, case_type, phase_code, phase_name, entered_at
+        FROM case_phase_history
+        WHERE firm_id = %s
+        ORDER BY case_id, entered_at DESC
+    ),
+    case_fees AS (
+        SELECT
+            case_id,
+            SUM(total_amount) as total_fee,
+            SUM(paid_amount) as total_paid,
+            SUM(balance_due) as total_balance
+        FROM cached_invoices
+        WHERE firm_id = %s AND total_amount > 0
+        GROUP BY case_id
+    ),
+    case_info AS (
+        SELECT
+            id as case_id,
+            COALESCE(
+                data_json::jsonb -> 'billing_contact' ->> 'name',
+                name
+            ) as client_name,
+            lead_attorney_name,
+            status
+        FROM cached_cases
+        WHERE firm_id = %s
+    )
+    SELECT
+        lp.case_id,
+        lp.case_name,
+        lp.case_type,
+        lp.phase_code,
+        lp.phase_name,
+        lp.entered_at,
+        COALESCE(cf.total_fee, 0) as total_fee,
+        COALESCE(cf.total_paid, 0) as total_paid,
+        COALESCE(cf.total_balance, 0) as total_balance,
+        COALESCE(ci.client_name, '') as client_name,
+        COALESCE(ci.lead_attorney_name, '') as lead_attorney,
+        COALESCE(ci.status, '') as case_status
+    FROM latest_phase lp
+    LEFT JOIN case_fees cf ON lp.case_id = cf.case_id
+    LEFT JOIN case_info ci ON lp.case_id = ci.case_id
+    WHERE COALESCE(ci.status, 'open') = 'open'
+      AND COALESCE(cf.total_fee, 0) > 0
+    ORDER BY lp.case_type, lp.case_name
+"""
+
+
+def _build_trust_line(row: Dict, schedules: Dict, default_schedule: Dict) -> TrustTransferLine:
+    """Turn one TRUST_REPORT_SQL row into a TrustTransferLine."""
+    case_type = row["case_type"] or ""
+    phase_code = row["phase_code"]
+    total_fee = float(row["total_fee"])
+    paid_to_date = float(row["total_paid"])
+
+    schedule = get_schedule_for_case_type(case_type, schedules, default_schedule)
+    phase_target_pct = cumulative_earned_pct(schedule, phase_code)
+
+    # Actual % paid vs total fee
+    pct_paid = round(paid_to_date / total_fee * 100, 1) if total_fee else 0
+
+    # Billing gap: how far behind the phase benchmark (positive = behind)
+    expected_amount = round(total_fee * phase_target_pct / 100, 2)
+    billing_gap = round(max(0, expected_amount - paid_to_date), 2)
+
+    outstanding_balance = round(total_fee - paid_to_date, 2)
+
+    return TrustTransferLine(
+        case_id=row["case_id"],
+        case_name=row["case_name"] or "",
+        case_type=case_type,
+        client_name=row["client_name"],
+        lead_attorney=row["lead_attorney"],
+        current_phase=phase_code,
+        phase_label=PHASE_LABELS.get(phase_code, phase_code),
+        total_fee=total_fee,
+        paid_to_date=paid_to_date,
+        pct_paid=pct_paid,
+        phase_target_pct=phase_target_pct,
+        billing_gap=billing_gap,
+        outstanding_balance=outstanding_balance,
+        schedule_label=schedule["label"],
+    )
+
+
+def iter_trust_transfer_lines(firm_id: str) -> Iterator[TrustTransferLine]:
+    """
+    Stream report lines from a server-side cursor.
+
+    Same rows and order as generate_trust_transfer_report()["lines"], without
+    holding the whole result in memory. Used by the CSV exports.
+    """
+    schedules, default_schedule = load_fee_schedules(firm_id)
+    for row in stream_rows(TRUST_REPORT_SQL, (firm_id, firm_id, firm_id), dict_rows=True):
+        yield _build_trust_line(row, schedules, default_schedule)
+
+
 def generate_trust_transfer_report(firm_id: str) -> Dict:
     """
     Generate the trust transfer report.
@@ -218,95 +321,10 @@ def generate_trust_transfer_report(firm_id: str) -> Dict:
     with get_connection() as conn:
         cur = conn.cursor()
 
-        cur.execute("""
-            WITH latest_phase AS (
-                SELECT DISTINCT ON (case_id)
-                    case_id, case_name, case_type, phase_code, phase_name, entered_at
-                FROM case_phase_history
-                WHERE firm_id = %s
-                ORDER BY case_id, entered_at DESC
-            ),
-            case_fees AS (
-                SELECT
-                    case_id,
-                    SUM(total_amount) as total_fee,
-                    SUM(paid_amount) as total_paid,
-                    SUM(balance_due) as total_balance
-                FROM cached_invoices
-                WHERE firm_id = %s AND total_amount > 0
-                GROUP BY case_id
-            ),
-            case_info AS (
-                SELECT
-                    id as case_id,
-                    COALESCE(
-                        data_json::jsonb -> 'billing_contact' ->> 'name',
-                        name
-                    ) as client_name,
-                    lead_attorney_name,
-                    status
-                FROM cached_cases
-                WHERE firm_id = %s
-            )
-            SELECT
-                lp.case_id,
-                lp.case_name,
-                lp.case_type,
-                lp.phase_code,
-                lp.phase_name,
-                lp.entered_at,
-                COALESCE(cf.total_fee, 0) as total_fee,
-                COALESCE(cf.total_paid, 0) as total_paid,
-                COALESCE(cf.total_balance, 0) as total_balance,
-                COALESCE(ci.client_name, '') as client_name,
-                COALESCE(ci.lead_attorney_name, '') as lead_attorney,
-                COALESCE(ci.status, '') as case_status
-            FROM latest_phase lp
-            LEFT JOIN case_fees cf ON lp.case_id = cf.case_id
-            LEFT JOIN case_info ci ON lp.case_id = ci.case_id
-            WHERE COALESCE(ci.status, 'open') = 'open'
-              AND COALESCE(cf.total_fee, 0) > 0
-            ORDER BY lp.case_type, lp.case_name
-        """, (firm_id, firm_id, firm_id))
-
+        cur.execute(TRUST_REPORT_SQL, (firm_id, firm_id, firm_id))
         rows = cur.fetchall()
 
-    lines = []
-    for row in rows:
-        row = dict(row)
-        case_type = row["case_type"] or ""
-        phase_code = row["phase_code"]
-        total_fee = float(row["total_fee"])
-        paid_to_date = float(row["total_paid"])
-
-        schedule = get_schedule_for_case_type(case_type, schedules, default_schedule)
-        phase_target_pct = cumulative_earned_pct(schedule, phase_code)
-
-        # Actual % paid vs total fee
-        pct_paid = round(paid_to_date / total_fee * 100, 1) if total_fee else 0
-
-        # Billing gap: how far behind the phase benchmark (positive = behind)
-        expected_amount = round(total_fee * phase_target_pct / 100, 2)
-        billing_gap = round(max(0, expected_amount - paid_to_date), 2)
-
-        outstanding_balance = round(total_fee - paid_to_date, 2)
-
-        lines.append(TrustTransferLine(
-            case_id=row["case_id"],
-            case_name=row["case_name"] or "",
-            case_type=case_type,
-            client_name=row["client_name"],
-            lead_attorney=row["lead_attorney"],
-            current_phase=phase_code,
-            phase_label=PHASE_LABELS.get(phase_code, phase_code),
-            total_fee=total_fee,
-            paid_to_date=paid_to_date,
-            pct_paid=pct_paid,
-            phase_target_pct=phase_target_pct,
-            billing_gap=billing_gap,
-            outstanding_balance=outstanding_balance,
-            schedule_label=schedule["label"],
-        ))
+    lines = [_build_trust_line(row, schedules, default_schedule) for row in rows]
 
     # Summary stats
     total_fees = sum(l.total_fee for l in lines)
@@ -355,26 +373,41 @@ def generate_trust_transfer_report(firm_id: str) -> Dict:
     }
 
 
-def export_trust_report_csv(report: Dict, filepath: str):
-    """Export report lines to CSV."""
+TRUST_EXPORT_HEADER = [
+    "Case ID", "Case Name", "Client", "Lead Attorney", "Case Type",
+    "Schedule", "Current Phase",
+    "Total Fee", "Earned (Received)", "% Earned", "Pace Target %",
+    "Behind Pace", "Outstanding",
+]
+
+
+def trust_line_csv_row(l: TrustTransferLine) -> List[str]:
+    """Formatted CSV cells for one report line (matches TRUST_EXPORT_HEADER)."""
+    return [
+        l.case_id, l.case_name, l.client_name, l.lead_attorney,
+        l.case_type, l.schedule_label, l.phase_label,
+        f"${l.total_fee:,.2f}", f"${l.paid_to_date:,.2f}",
+        f"{l.pct_paid:.1f}%", f"{l.phase_target_pct}%",
+        f"${l.billing_gap:,.2f}", f"${l.outstanding_balance:,.2f}",
+    ]
+
+
+def export_trust_report_csv(lines: Iterable[TrustTransferLine], filepath: str) -> int:
+    """Write report lines to CSV. Returns lines written (no file if none).
+
+    Accepts a built report's lines or the iter_trust_transfer_lines() stream.
+    """
     import csv
-    lines = report["lines"]
-    if not lines:
-        return
+    lines = iter(lines)
+    first = next(lines, None)
+    if first is None:
+        return 0
 
+    count = 0
     with open(filepath, "w", newline="") as f:
         writer = csv.writer(f)
-        writer.writerow([
-            "Case ID", "Case Name", "Client", "Lead Attorney", "Case Type",
-            "Schedule", "Current Phase",
-            "Total Fee", "Paid to Date", "% Paid", "Phase Target %",
-            "Billing Gap", "Outstanding Balance"
-        ])
-        for l in lines:
-            writer.writerow([
-                l.case_id, l.case_name, l.client_name, l.lead_attorney,
-                l.case_type, l.schedule_label, l.phase_label,
-                f"${l.total_fee:,.2f}", f"${l.paid_to_date:,.2f}",
-                f"{l.pct_paid:.1f}%", f"{l.phase_target_pct}%",
-                f"${l.billing_gap:,.2f}", f"${l.outstanding_balance:,.2f}",
-            ])
+        writer.writerow(TRUST_EXPORT_HEADER)
+        for l in itertools.chain([first], lines):
+            writer.writerow(trust_line_csv_row(l))
+            count += 1
+    return count